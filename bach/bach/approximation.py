@@ -0,0 +1,115 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Settings and helpers for approximate aggregations, i.e. the aggregations that are called with
+`approx=True`: Series.nunique(), Series.quantile(), Series.value_counts(), DataFrame.describe() and the
+DataFrame versions of these.
+
+Where the database has native approximate aggregation functions, those are used (e.g. BigQuery's
+APPROX_COUNT_DISTINCT and APPROX_QUANTILES). Otherwise the aggregation is calculated over a random sample
+of the data, of which the size is determined by the sample rate (see set_approx_sample_rate()). The
+data is still read completely, but only the sampled values are sorted, hashed or grouped.
+
+The error bound of a sampled result can be calculated with get_count_error_bound() and
+get_quantile_error_bound().
+"""
+import math
+from typing import Optional, TYPE_CHECKING
+
+from sqlalchemy.engine import Dialect
+
+from bach.expression import Expression, NonDeterministicExpression
+from sql_models.util import is_postgres, is_bigquery, is_athena, DatabaseNotSupportedException
+
+if TYPE_CHECKING:
+    from bach.series import Series
+
+
+# z-score of the default confidence level of the error bounds: 95%
+DEFAULT_Z_SCORE = 1.96
+
+# Largest value of Postgres' hashtext() + 1. Its values are in [-2^31, 2^31)
+_HASH_RANGE = 2 ** 31
+
+_sample_rate = 0.01
+
+
+def set_approx_sample_rate(sample_rate: float):
+    """
+    Set the fraction of the rows that approximate aggregations sample, on databases that have no native
+    approximate aggregation functions. Default is 0.01.
+    """
+    global _sample_rate
+    if not 0 < sample_rate <= 1:
+        raise ValueError(f'sample_rate should be larger than 0 and at most 1, got: {sample_rate}')
+    _sample_rate = sample_rate
+
+
+def get_approx_sample_rate() -> float:
+    """ Get the fraction of the rows that approximate aggregations sample. """
+    return _sample_rate
+
+
+def get_sample_condition(dialect: Dialect) -> Expression:
+    """
+    Returns a boolean expression that is true for a random sample of the rows.
+    """
+    if is_postgres(dialect):
+        return NonDeterministicExpression.construct(f'random() < {_sample_rate}')
+    if is_bigquery(dialect) or is_athena(dialect):
+        return NonDeterministicExpression.construct(f'rand() < {_sample_rate}')
+    raise DatabaseNotSupportedException(dialect)
+
+
+def get_sampled_values_expression(series: 'Series', by_value: bool = False) -> Expression:
+    """
+    Returns an expression that gives the value of series for the sampled rows, and NULL for the other rows.
+
+    :param by_value: if True, the rows are sampled by the hash of their value. All rows with the same value
+        are then either in the sample or not, which is needed to estimate the number of unique values.
+    """
+    dialect = series.engine.dialect
+    if not by_value:
+        return Expression.construct('case when {} then {} end', get_sample_condition(dialect), series)
+    if not is_postgres(dialect):
+        raise DatabaseNotSupportedException(dialect)
+    return Expression.construct(
+        f'case when abs(cast(hashtext(cast({{}} as text)) as bigint)) < {int(_sample_rate * _HASH_RANGE)} '
+        f'then {{}} end',
+        series, series,
+    )
+
+
+def get_count_error_bound(
+    estimate: float, sample_rate: Optional[float] = None, z: float = DEFAULT_Z_SCORE,
+) -> float:
+    """
+    Give the error bound of an approximate count that is calculated over a sample: a result of nunique() or
+    value_counts() with approx=True. With the default z-score, the exact count is within
+    `estimate +/- error bound` with 95% confidence.
+
+    :param estimate: the approximate count
+    :param sample_rate: the sample rate that was used. Defaults to the current sample rate.
+    :param z: z-score of the confidence level.
+    """
+    sample_rate = _sample_rate if sample_rate is None else sample_rate
+    # The sampled count has a binomial distribution, with the exact count as number of trials
+    return z * math.sqrt(estimate * (1 - sample_rate) / sample_rate)
+
+
+def get_quantile_error_bound(
+    q: float, count: int, sample_rate: Optional[float] = None, z: float = DEFAULT_Z_SCORE,
+) -> float:
+    """
+    Give the error bound of an approximate quantile that is calculated over a sample, in terms of q. With the
+    default z-score, the result of quantile(q=q, approx=True) is an exact quantile of the data for a value
+    within `q +/- error bound` with 95% confidence.
+
+    :param q: the requested quantile
+    :param count: the number of non-NULL values that the quantile is calculated over
+    :param sample_rate: the sample rate that was used. Defaults to the current sample rate.
+    :param z: z-score of the confidence level.
+    """
+    sample_rate = _sample_rate if sample_rate is None else sample_rate
+    sample_size = max(count * sample_rate, 1)
+    return z * math.sqrt(q * (1 - q) / sample_size)
@@ -0,0 +1,179 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Discovery of the categories (unique values) of Series. DataFrame.unstack() and DataFrame.get_dummies()
+need the categories to know which columns the result has, so they must be known before the rest of the
+query can be built.
+
+Discovered categories can be cached, keyed by the hash of the model that selects the values of the Series.
+Building on the same data again, e.g. when chaining operations or re-running a notebook cell, then doesn't
+query the database. Caching is disabled by default, as cached categories are stale once the data in the
+source tables changes: a category that is added later would silently be missing from the result. Use
+set_category_cache() to enable it.
+
+get_categories() discovers the categories of multiple Series in a single query.
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import pandas
+
+from bach.result_cache import get_engine_url
+
+if TYPE_CHECKING:
+    from bach.dataframe import DataFrame
+    from bach.series import Series
+
+
+class CategoryCacheKey(NamedTuple):
+    engine_url: str
+    # Hash of the model that selects the values of the Series
+    model_hash: str
+
+
+class CategoryCache:
+    """
+    Cache of the categories of Series, so that the database only needs to be queried the first time the
+    categories of a Series are needed.
+
+    Entries expire after `ttl` seconds, as the data in the source tables might change. All methods are
+    thread-safe.
+    """
+    def __init__(self, ttl: Optional[float] = 300):
+        """
+        :param ttl: number of seconds after which cached categories expire. If None, categories never
+            expire.
+        """
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[CategoryCacheKey, Tuple[float, List[Any]]] = {}
+
+    def get(self, key: CategoryCacheKey) -> Optional[List[Any]]:
+        """ Get the cached categories for key, or None if they are not cached or have expired. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, categories = entry
+            if self._ttl is not None and time.time() - created > self._ttl:
+                del self._entries[key]
+                return None
+            return list(categories)
+
+    def put(self, key: CategoryCacheKey, categories: Sequence[Any]):
+        with self._lock:
+            self._entries[key] = (time.time(), list(categories))
+
+    def invalidate(self, engine_url: str = None) -> int:
+        """
+        Remove cached categories. If engine_url is None, all categories are removed.
+
+        :param engine_url: Only remove the categories of Series on the database with this url.
+            See bach.result_cache.get_engine_url().
+        :return: number of removed entries
+        """
+        with self._lock:
+            keys = [key for key in self._entries if engine_url is None or key.engine_url == engine_url]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> int:
+        """ Remove all cached categories. Returns the number of removed entries. """
+        return self.invalidate()
+
+
+_category_cache: Optional[CategoryCache] = None
+
+
+def set_category_cache(cache: Optional[CategoryCache]):
+    """
+    Set the CategoryCache that get_categories() uses. If None (the default), the database is queried every
+    time.
+    """
+    global _category_cache
+    _category_cache = cache
+
+
+def get_category_cache() -> Optional[CategoryCache]:
+    """ Get the CategoryCache that is used, or None if categories are not cached. """
+    return _category_cache
+
+
+def get_categories(series: Sequence['Series'], refresh: bool = False) -> List[List[Any]]:
+    """
+    Give the unique values of each Series, including None if a Series contains NULL values.
+
+    The categories of all Series that are not in the cache are queried at once: Series with the same dtype
+    are combined in a single query.
+
+    :param series: Series to get the categories of. All Series must have the same engine.
+    :param refresh: If True, don't use cached categories, but always query the database.
+    :return: list with the categories of each Series, in the same order as `series`. The order of the
+        categories of a Series is not defined.
+
+    .. note::
+        This function queries the database, unless all categories are cached.
+    """
+    if not series:
+        return []
+    engine = series[0].engine
+    if any(s.engine != engine for s in series):
+        raise ValueError('all series must have the same engine.')
+
+    engine_url = get_engine_url(engine)
+    results: List[Optional[List[Any]]] = [None] * len(series)
+    to_query: Dict[str, List[Tuple[int, 'DataFrame']]] = defaultdict(list)
+    keys: Dict[int, CategoryCacheKey] = {}
+    for idx, s in enumerate(series):
+        df = _get_unique_values_df(s)
+        keys[idx] = CategoryCacheKey(engine_url=engine_url, model_hash=df._get_view_sql_model().hash)
+        cached = None
+        if _category_cache is not None and not refresh:
+            cached = _category_cache.get(keys[idx])
+        if cached is not None:
+            results[idx] = cached
+        else:
+            to_query[s.dtype].append((idx, df))
+
+    for dfs in to_query.values():
+        for idx, categories in _query_categories(dfs).items():
+            if _category_cache is not None:
+                _category_cache.put(keys[idx], categories)
+            results[idx] = categories
+    return [categories if categories is not None else [] for categories in results]
+
+
+def _get_unique_values_df(series: 'Series') -> 'DataFrame':
+    """ Give a DataFrame without index, with the unique values of series in the column `__category`. """
+    df = series.to_frame().reset_index(drop=True)
+    df = df.rename(columns={series.name: '__category'})
+    return df.materialize(node_name='categories', distinct=True)
+
+
+def _query_categories(dfs: List[Tuple[int, 'DataFrame']]) -> Dict[int, List[Any]]:
+    """
+    Query the categories of all DataFrames at once. All DataFrames must have a `__category` column of the
+    same dtype.
+
+    :param dfs: list of tuples of a label and a DataFrame created by _get_unique_values_df()
+    :return: dictionary with the labels as keys, and the categories of the DataFrame as values
+    """
+    from bach.operations.concat import DataFrameConcatOperation
+    labeled_dfs = []
+    for label, df in dfs:
+        df = df.copy()
+        df['__category_label'] = label
+        labeled_dfs.append(df)
+    pdf = DataFrameConcatOperation(objects=labeled_dfs, ignore_index=True)().to_pandas()
+
+    categories: Dict[int, List[Any]] = {label: [] for label, _ in dfs}
+    for label, value in zip(pdf['__category_label'], pdf['__category']):
+        categories[int(label)].append(None if _is_null(value) else value)
+    return categories
+
+
+def _is_null(value: Any) -> bool:
+    return pandas.api.types.is_scalar(value) and pandas.isna(value)
@@ -5,7 +5,7 @@ from copy import copy
 
 from typing import (
     List, Set, Union, Dict, Any, Optional, Tuple,
-    cast, NamedTuple, TYPE_CHECKING, Callable, Hashable, Sequence, overload, Mapping,
+    cast, NamedTuple, TYPE_CHECKING, Callable, Hashable, Sequence, overload, Mapping, Iterator,
 )
 
 import numpy
@@ -14,7 +14,12 @@ import sqlparse
 from sqlalchemy.engine import Engine
 
 from bach.expression import Expression, SingleValueExpression, VariableToken, ColumnReferenceToken
-from bach.from_database import get_dtypes_from_table, get_dtypes_from_model
+from bach.from_database import get_dtypes_from_table, get_dtypes_from_model, invalidate_table_dtypes
+from bach.optimizations import optimize_model, plan_materialization, estimate_query_cost, \
+    MaterializationPlan
+from bach.postgres_copy import supports_copy_to_pandas, copy_to_pandas
+from bach.result_cache import get_result_cache, get_cache_key, get_source_tables, supports_disk_cache
+from bach.session import connect, prepare_model
 from bach.sql_model import BachSqlModel, CurrentNodeSqlModel, get_variable_values_sql
 from bach.types import get_series_type_from_dtype, AllSupportedLiteralTypes, StructuredDtype
 from bach.utils import (
@@ -24,7 +29,7 @@ from sql_models.constants import NotSet, not_set
 from sql_models.graph_operations import update_placeholders_in_graph, get_all_placeholders
 from sql_models.model import SqlModel, Materialization, RefPath, SourceTableModelBuilder
 
-from sql_models.sql_generator import to_sql
+from sql_models.sql_generator import to_sql, to_sql_statements
 from sql_models.util import quote_identifier, is_bigquery, DatabaseNotSupportedException, is_postgres, \
     is_athena
 
@@ -555,7 +560,8 @@ class DataFrame:
         :returns: A DataFrame based on a sql table.
 
         .. note::
-            If all_dtypes is not set, then this will query the database.
+            If all_dtypes is not set, then this will query the database, unless the dtypes of the table are
+            in the schema cache. See :py:func:`bach.from_database.get_dtypes_from_table`.
         """
         if all_dtypes is not None:
             dtypes = all_dtypes
@@ -585,8 +591,8 @@ class DataFrame:
         """
         Instantiate a new DataFrame based on the result of the query defined in `model`.
 
-        If all_dtypes is not specified, then a transaction scoped temporary table will be created with
-        0 result rows from the model. The meta data of this table will be used to deduce the dtypes.
+        If all_dtypes is not specified, then the model's query is executed with `limit 0`, and the column
+        types of the result will be used to deduce the dtypes.
 
         :param engine: a sqlalchemy engine for the database.
         :param model: an SqlModel that specifies the queries to instantiate as DataFrame.
@@ -598,8 +604,8 @@ class DataFrame:
         :returns: A DataFrame based on an SqlModel
 
         .. note::
-            If all_dtypes is not set, then this will query the database and create and remove a temporary
-            table.
+            If all_dtypes is not set, then this will query the database, unless the dtypes of the model are
+            in the schema cache. See :py:func:`bach.from_database.get_dtypes_from_model`.
         """
         if all_dtypes is not None:
             dtypes = all_dtypes
@@ -671,7 +677,9 @@ class DataFrame:
             name: str = 'loaded_data',
             materialization: str = 'cte',
             *,
-            if_exists: str = 'fail'
+            if_exists: str = 'fail',
+            chunksize: Optional[int] = 100_000,
+            max_workers: int = 1
     ) -> 'DataFrame':
         """
         Instantiate a new DataFrame based on the content of a Pandas DataFrame.
@@ -682,8 +690,10 @@ class DataFrame:
 
         How the data is loaded depends on the chosen materialization:
 
-        1. 'table': This will first write the data to a database table using pandas
-           :py:meth:`pandas.DataFrame.to_sql` method.
+        1. 'table': This will first write the data to a database table. The table's columns get the
+           database types of the Bach dtypes. On Postgres the data is uploaded with ``COPY FROM STDIN``, on
+           BigQuery with load jobs, on other databases with pandas :py:meth:`pandas.DataFrame.to_sql`
+           method.
         2. 'cte': The data will be represented using a common table expression of the form
            ``select * from values`` in future queries.
 
@@ -712,6 +722,12 @@ class DataFrame:
             * fail: Raise a ValueError.
             * replace: Drop the table before inserting new values.
             * append: Insert new values to the existing table.
+        :param chunksize: Only applies to `materialization='table'`. Number of rows to upload at a time.
+            If None, all rows are uploaded at once. On databases that are not natively supported for
+            uploading (e.g. Athena) rows are inserted with INSERT statements of at most
+            :py:data:`bach.from_pandas.MAX_INSERT_CHUNKSIZE` rows.
+        :param max_workers: Only applies to `materialization='table'`. Number of chunks to upload in
+            parallel, each over a separate database connection.
         :returns: A DataFrame based on a pandas DataFrame
 
         .. warning::
@@ -726,7 +742,9 @@ class DataFrame:
             convert_objects=convert_objects,
             materialization=materialization,
             name=name,
-            if_exists=if_exists
+            if_exists=if_exists,
+            chunksize=chunksize,
+            max_workers=max_workers
         )
 
     @classmethod
@@ -965,7 +983,8 @@ class DataFrame:
         expressions that you want to evaluate before further expressions are build on top of them. This might
         make sense for very large expressions, or for non-deterministic expressions (e.g. see
         :py:meth:`SeriesUuid.random()`). Additionally, materializing as a temporary table can
-        improve performance in some instances.
+        improve performance in some instances. Within a :py:class:`bach.session.Session` the temporary table
+        is only created once, and reused by all queries in the session.
 
         Note this function does NOT query the database or materializes any data in the database. It merely
         changes the underlying SqlModel graph, which gets executed by data transfer functions (e.g.
@@ -1007,6 +1026,54 @@ class DataFrame:
             return df
         return self._update_self_from_df(df)
 
+    def optimize(
+        self,
+        min_references: int = 2,
+        estimate_costs: bool = False,
+        min_cost: float = 0
+    ) -> Tuple['DataFrame', MaterializationPlan]:
+        """
+        Analyse the SqlModel graph of this DataFrame, and create a copy with a better materialization of the
+        nodes in that graph.
+
+        Nodes that select all columns of their previous node unchanged (e.g. the result of calling
+        materialize() twice in a row) are removed. Nodes that are referenced at least `min_references`
+        times (e.g. after merging a DataFrame with itself) are materialized as temporary table, so that they
+        are calculated once instead of once per reference.
+
+        :param min_references: minimum number of references to a node, to materialize it as temporary
+            table.
+        :param estimate_costs: if True, use the cost estimates of the database's query planner, and only
+            materialize nodes as temporary table if their estimated cost is at least `min_cost`. Only
+            supported on Postgres, on other databases this is ignored.
+        :param min_cost: minimum cost estimate to materialize a node as temporary table.
+        :returns: tuple: the optimized DataFrame, and the plan that explains what was changed and why.
+            Use ``print(plan)`` to get a readable explanation.
+
+        .. note::
+            If `estimate_costs` is True, this function queries the database.
+        """
+        dialect = self.engine.dialect
+        get_cost = None
+        if estimate_costs:
+            self._assert_all_variables_set()
+            placeholder_values = get_variable_values_sql(dialect=dialect, variable_values=self.variables)
+
+            def get_cost(node: SqlModel) -> Optional[float]:
+                node = update_placeholders_in_graph(start_node=node, placeholder_values=placeholder_values)
+                return estimate_query_cost(engine=self.engine, sql=to_sql(dialect=dialect, model=node))
+
+        base_node, plan = plan_materialization(
+            dialect=dialect,
+            model=self.base_node,
+            min_references=min_references,
+            get_cost=get_cost,
+            min_cost=min_cost
+        )
+        if not plan.changed:
+            return self.copy(), plan
+        return self.copy_override_base_node(base_node=base_node), plan
+
     def set_savepoint(self, name: str, materialization: Union[Materialization, str] = Materialization.CTE):
         """
         Set the current state as a savepoint in `self.savepoints`.
@@ -1132,17 +1199,19 @@ class DataFrame:
         model = self.get_current_node(name='database_create_table')
         model = model.copy_set_materialization(Materialization.TABLE)
         model = model.copy_set_materialization_name(materialization_name=table_name)
+        model = optimize_model(dialect=dialect, model=model)
 
         placeholder_values = get_variable_values_sql(dialect=dialect, variable_values=self.variables)
         model = update_placeholders_in_graph(start_node=model, placeholder_values=placeholder_values)
 
-        sql = to_sql(dialect=dialect, model=model)
-        with self.engine.connect() as conn:
+        sql = to_sql(dialect=dialect, model=prepare_model(engine=self.engine, model=model))
+        with connect(self.engine) as conn:
             if if_exists == 'replace':
                 sql = f'DROP TABLE IF EXISTS {quote_identifier(dialect, table_name)}; {sql}'
 
             sql = escape_parameter_characters(conn, sql)
             conn.execute(sql)
+        invalidate_table_dtypes(engine=self.engine, table_name=table_name)
 
         all_dtypes = {**self.index_dtypes, **self.dtypes}
         return self.from_table(
@@ -1977,30 +2046,160 @@ class DataFrame:
 
         return selected_indexes
 
-    def to_pandas(self, limit: Union[int, slice] = None) -> pandas.DataFrame:
+    @overload
+    def to_pandas(self, limit: Union[int, slice] = None, chunksize: None = None) -> pandas.DataFrame:
+        ...
+
+    @overload
+    def to_pandas(self, limit: Union[int, slice] = None, *, chunksize: int) -> Iterator[pandas.DataFrame]:
+        ...
+
+    def to_pandas(self, limit: Union[int, slice] = None, chunksize: int = None):
         """
         Run a SQL query representing the current state of this DataFrame against the database and return the
         resulting data as a Pandas DataFrame.
 
         :param limit: the limit to apply, either as a max amount of rows or a slice of the data.
-        :returns: a pandas DataFrame.
+        :param chunksize: if set, return an iterator of pandas DataFrames with at most this number of rows
+            each, instead of a single pandas DataFrame. See :py:meth:`iter_pandas`.
+        :returns: a pandas DataFrame, or an iterator of pandas DataFrames if chunksize is set.
+
+        On Postgres, if all columns are of type int64, float64 or bool, the data is fetched with
+        `COPY ... TO STDOUT`, which is a lot faster for large results.
+
+        If a result cache is set with :py:func:`bach.result_cache.set_result_cache`, the result is taken from
+        the cache if the same query was executed before. Results of chunked reads are never cached.
+
+        .. note::
+            This function queries the database.
+        """
+        if chunksize is not None:
+            return self.iter_pandas(chunksize=chunksize, limit=limit)
+
+        model = self._get_view_sql_model(limit=limit)
+        dtypes = {name: series.dtype for name, series in self.all_series.items()}
+        result_cache = get_result_cache()
+        if result_cache is not None:
+            cache_key = get_cache_key(engine=self.engine, model=model, limit=limit)
+            cached_df = result_cache.get(cache_key)
+            if cached_df is not None:
+                return cached_df
+
+        # Within a session, create the temporary tables that don't exist yet, and query the existing ones
+        pandas_df = self._model_to_pandas(prepare_model(engine=self.engine, model=model))
+
+        if result_cache is not None:
+            result_cache.put(
+                cache_key,
+                pandas_df,
+                source_tables=get_source_tables(model),
+                persist=supports_disk_cache(dtypes.values())
+            )
+        return pandas_df
+
+    def _model_to_pandas(self, model: SqlModel) -> pandas.DataFrame:
+        """
+        Execute the sql of model, which must give the columns of this DataFrame, and give the result as
+        to_pandas() does. The result cache is not used.
+        """
+        dtypes = {name: series.dtype for name, series in self.all_series.items()}
+        if supports_copy_to_pandas(engine=self.engine, dtypes=dtypes.values()):
+            statements = to_sql_statements(dialect=self.engine.dialect, model=model)
+            pandas_df = copy_to_pandas(
+                engine=self.engine, statements=[statement.sql for statement in statements], dtypes=dtypes
+            )
+        else:
+            with connect(self.engine) as conn:
+                # read_sql_query expects a parameterized query, so we need to escape the parameter characters
+                sql = escape_parameter_characters(conn, to_sql(dialect=self.engine.dialect, model=model))
+                pandas_df = pandas.read_sql_query(sql, conn, dtype=self._get_pandas_dtypes())
+        return self._post_process_pandas_df(pandas_df)
+
+    def iter_pandas(self, chunksize: int, limit: Union[int, slice] = None) -> Iterator[pandas.DataFrame]:
+        """
+        Run a SQL query representing the current state of this DataFrame against the database and yield the
+        resulting data as Pandas DataFrames of at most `chunksize` rows.
+
+        Unlike :py:meth:`to_pandas`, this does not load the complete result into memory at once. On Postgres
+        the rows are fetched with a server-side cursor, on BigQuery and Athena the results are fetched page
+        by page. The index and dtypes of the yielded DataFrames are the same as :py:meth:`to_pandas` gives.
+
+        The database connection is kept open until the iterator is exhausted or discarded.
+
+        :param chunksize: maximum number of rows per yielded DataFrame.
+        :param limit: the limit to apply, either as a max amount of rows or a slice of the data.
+        :returns: an iterator of pandas DataFrames. If the query gives no rows, a single empty DataFrame is
+            yielded. If this DataFrame has no index, then the rows of all yielded DataFrames are numbered
+            consecutively, as in the result of :py:meth:`to_pandas`.
+
+        .. note::
+            This function queries the database.
+        """
+        if chunksize < 1:
+            raise ValueError(f'chunksize must be a positive number, got: {chunksize}')
+        dialect = self.engine.dialect
+        model = prepare_model(engine=self.engine, model=self._get_view_sql_model(limit=limit))
+        statements = to_sql_statements(dialect=dialect, model=model)
+        dtypes = self._get_pandas_dtypes()
+        with connect(self.engine) as conn:
+            # Temporary tables might only exist during the transaction, so we execute all statements in one.
+            with conn.begin():
+                for statement in statements[:-1]:
+                    conn.execute(escape_parameter_characters(conn, statement.sql))
+                sql = escape_parameter_characters(conn, statements[-1].sql)
+                stream_conn = conn.execution_options(stream_results=True)
+                row_count = 0
+                for pandas_df in pandas.read_sql_query(sql, stream_conn, dtype=dtypes, chunksize=chunksize):
+                    if not self.index:
+                        # Number the rows as to_pandas() would, instead of starting at zero for each chunk.
+                        pandas_df.index = pandas.RangeIndex(row_count, row_count + len(pandas_df))
+                    row_count += len(pandas_df)
+                    yield self._post_process_pandas_df(pandas_df)
+
+    def to_parquet(self, path: str, chunksize: int = 100_000, limit: Union[int, slice] = None) -> None:
+        """
+        Run a SQL query representing the current state of this DataFrame against the database and write the
+        resulting data to a parquet file.
+
+        The data is fetched and written in chunks of at most `chunksize` rows, see :py:meth:`iter_pandas`.
+        So the memory usage is bounded by the chunksize, not by the size of the data. The schema of the file
+        is determined by the first chunk.
+
+        :param path: path of the file to write.
+        :param chunksize: maximum number of rows that is kept in memory at once.
+        :param limit: the limit to apply, either as a max amount of rows or a slice of the data.
 
         .. note::
             This function queries the database.
         """
-        sql = self.view_sql(limit=limit)
+        import pyarrow
+        import pyarrow.parquet
 
+        # Without an index, each chunk has a RangeIndex starting at zero, which we don't want to write.
+        preserve_index = len(self.index) > 0
+        writer: Optional[pyarrow.parquet.ParquetWriter] = None
+        try:
+            for pandas_df in self.iter_pandas(chunksize=chunksize, limit=limit):
+                schema = writer.schema if writer is not None else None
+                table = pyarrow.Table.from_pandas(pandas_df, schema=schema, preserve_index=preserve_index)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _get_pandas_dtypes(self) -> Dict[str, Any]:
+        """ Give the dtypes that pandas should use for the columns of the query result, by series name. """
         series_name_to_dtype = {}
         for series in self.all_series.values():
             pandas_info = series.to_pandas_info()
             if pandas_info is not None:
                 series_name_to_dtype[series.name] = pandas_info.dtype
+        return series_name_to_dtype
 
-        with self.engine.connect() as conn:
-            # read_sql_query expects a parameterized query, so we need to escape the parameter characters
-            sql = escape_parameter_characters(conn, sql)
-            pandas_df = pandas.read_sql_query(sql, conn, dtype=series_name_to_dtype)
-
+    def _post_process_pandas_df(self, pandas_df: pandas.DataFrame) -> pandas.DataFrame:
+        """ Convert the result of a query to the pandas DataFrame that to_pandas() gives. """
         # Post-process any columns if needed. e.g. in BigQuery we represent UUIDs as text, so we convert
         # the strings that the query gives us into UUID objects
         for name, series in self.all_series.items():
@@ -2044,7 +2243,10 @@ class DataFrame:
             return Expression.construct('')
 
         dialect = self.engine.dialect
-        all_series_expr = {s.expression.to_sql(dialect): s.name for s in self.all_series.values()}
+        # Only needed for grouped DataFrames. Expression.to_sql() is memoized, so this is cheap.
+        all_series_expr = {}
+        if self.group_by:
+            all_series_expr = {s.expression.to_sql(dialect): s.name for s in self.all_series.values()}
         if (
             self.group_by and
             not all(
@@ -2203,18 +2405,25 @@ class DataFrame:
         :param limit: the limit to apply, either as a max amount of rows or a slice of the data.
         :returns: SQL query
         """
+        sql = to_sql(dialect=self.engine.dialect, model=self._get_view_sql_model(limit=limit))
+        # https://sqlparse.readthedocs.io/en/latest/api/#formatting-of-sql-statements
+        sql = sqlparse.format(sql, reindent_aligned=True, keyword_case='upper')
+        return sql
+
+    def _get_view_sql_model(self, limit: Union[int, slice] = None, optimize: bool = True) -> SqlModel:
+        """
+        Give the model that represents the current state of this DataFrame, as used by :py:meth:`view_sql`.
+        The graph of the model is optimized, unless optimize is False, and all variable values are set.
+        """
         dialect = self.engine.dialect
         # we need to construct each multi-level series, since it should resemble the final result
         model = self.get_current_node('view_sql', limit=limit, construct_multi_levels=True)
         model = model.copy_set_materialization(Materialization.QUERY)
+        if optimize:
+            model = optimize_model(dialect=dialect, model=model)
 
         placeholder_values = get_variable_values_sql(dialect=dialect, variable_values=self.variables)
-        model = update_placeholders_in_graph(start_node=model, placeholder_values=placeholder_values)
-
-        sql = to_sql(dialect=dialect, model=model)
-        # https://sqlparse.readthedocs.io/en/latest/api/#formatting-of-sql-statements
-        sql = sqlparse.format(sql, reindent_aligned=True, keyword_case='upper')
-        return sql
+        return update_placeholders_in_graph(start_node=model, placeholder_values=placeholder_values)
 
     def merge(
         self,
@@ -2524,6 +2733,7 @@ class DataFrame:
         self,
         q: Union[float, List[float]] = 0.5,
         axis=1,
+        approx: bool = False,
         **kwargs,
     ):
         """
@@ -2531,6 +2741,7 @@ class DataFrame:
 
         :param q: value or list of values between 0 and 1.
         :param axis: only ``axis=1`` is supported. This means columns are aggregated.
+        :param approx: if True, approximate quantiles are calculated. See :py:meth:`SeriesFloat64.quantile`.
         :returns: a new DataFrame with the aggregation applied to all selected columns.
         """
         valid_index = (
@@ -2558,6 +2769,7 @@ class DataFrame:
                 exclude_non_applied=True,
                 partition=df.group_by,
                 q=qt,
+                approx=approx,
                 **kwargs,
             )
             initial_series = new_series[0]
@@ -2593,17 +2805,18 @@ class DataFrame:
 
         return result
 
-    def nunique(self, axis=1, skipna=True, **kwargs):
+    def nunique(self, axis=1, skipna=True, approx=False, **kwargs):
         """
         Returns the number of unique values in each column.
 
         :param axis: only ``axis=1`` is supported. This means columns are aggregated.
         :param skipna: only ``skipna=True`` supported. This means NULL values are ignored.
+        :param approx: if True, the number of unique values is approximated. See :py:meth:`Series.nunique`.
         :returns: a new DataFrame with the aggregation applied to all selected columns.
         """
         # deviation from horrible pd.nunique(axis=0, dropna=True)
         return self._aggregate_func('nunique', axis=axis,
-                                    level=None, numeric_only=False, skipna=skipna, **kwargs)
+                                    level=None, numeric_only=False, skipna=skipna, approx=approx, **kwargs)
 
     def round(self, decimals: int = 0):
         """
@@ -2710,6 +2923,7 @@ class DataFrame:
         include: Optional[Union[str, Sequence[str]]] = None,
         exclude: Optional[Union[str, Sequence[str]]] = None,
         datetime_is_numeric: bool = False,
+        approx: bool = False,
     ) -> 'DataFrame':
         """
         Returns descriptive statistics.
@@ -2722,6 +2936,8 @@ class DataFrame:
             numerical columns and on all columns if there are no numerical columns.
         :param exclude: dtypes to be excluded. Either a sequence of dtypes, a single dtype, or None.
         :param datetime_is_numeric: not supported
+        :param approx: if True, nunique and the percentiles are approximated. See :py:meth:`Series.nunique`
+            and :py:meth:`SeriesFloat64.quantile`.
         :returns: a new DataFrame with the descriptive statistics
         """
         from bach.operations.describe import DataFrameDescribeOperation
@@ -2731,6 +2947,7 @@ class DataFrame:
             exclude=exclude,
             datetime_is_numeric=datetime_is_numeric,
             percentiles=percentiles,
+            approx=approx,
         )()
 
     def create_variable(
@@ -2978,6 +3195,7 @@ class DataFrame:
         normalize: bool = False,
         sort: bool = True,
         ascending: bool = False,
+        approx: bool = False,
     ) -> 'Series':
         """
         Returns a series containing counts of each unique row in the DataFrame
@@ -2988,6 +3206,9 @@ class DataFrame:
         :param normalize: returns proportions instead of frequencies
         :param sort: sorts result by frequencies
         :param ascending: sorts values in ascending order if true.
+        :param approx: if True, the counts are estimated from a random sample of the rows, which is faster on
+            large datasets. Rows of which the value is not in the sample are left out of the result. See
+            :py:mod:`bach.approximation` for the sample rate, and the error bound of the counts.
 
         :return: a series containing all counts per unique row.
         """
@@ -3007,9 +3228,24 @@ class DataFrame:
             index={},
             group_by=None,
         )
+        if approx:
+            from bach.approximation import get_sample_condition
+            from bach.series import SeriesBoolean
+            df = df[df.all_series[subset[0]].copy_override_type(SeriesBoolean).copy_override(
+                expression=get_sample_condition(self.engine.dialect)
+            )]
         df['value_counts'] = 1
         df = df.groupby(by=list(subset)).sum()
 
+        if approx and not normalize:
+            from bach.approximation import get_approx_sample_rate
+            value_counts_sum = df['value_counts_sum']
+            df['value_counts_sum'] = value_counts_sum.copy_override(
+                expression=Expression.construct(
+                    f'cast(round({{}} / {get_approx_sample_rate()}) as bigint)', value_counts_sum,
+                ),
+            )
+
         if normalize:
             df = df.materialize()
             df._data['value_counts_sum'] /= df['value_counts_sum'].sum()  # type: ignore
@@ -3353,7 +3589,8 @@ class DataFrame:
         self,
         level: Union[str, int] = -1,
         fill_value: Optional[AllSupportedLiteralTypes] = None,
-        aggregation: str = 'max'
+        aggregation: str = 'max',
+        categories: Optional[Sequence[AllSupportedLiteralTypes]] = None,
     ) -> 'DataFrame':
         """
         Pivot a level of the index labels.
@@ -3368,11 +3605,15 @@ class DataFrame:
             series that is unstacked.
         :param aggregation: method of aggregation, in case of duplicate index values. Supports all aggregation
             methods that :py:meth:`aggregate` supports.
+        :param categories: the values of the unstacked index to create columns for. Rows with other values
+            are ignored. If not set, the unique values of the unstacked index are used.
 
         :return: DataFrame
 
         .. note::
-            This function queries the database.
+            This function queries the database to get the unique values of the unstacked index, unless
+            `categories` is set or the values are cached by a category cache that has been set. See
+            :py:mod:`bach.categories`.
         """
         if len(self.index) <= 1:
             raise NotImplementedError('index must be a multi level index to unstack')
@@ -3393,9 +3634,14 @@ class DataFrame:
         if isinstance(self.index[index_to_unstack], SeriesAbstractMultiLevel):
             raise IndexError(f'"{level}" cannot be unstacked, since it is a MultiLevel series.')
 
-        values = self.index[index_to_unstack].unique(skipna=False).to_numpy()
+        if categories is None:
+            from bach.categories import get_categories
+            values = get_categories([self.index[index_to_unstack]])[0]
+        else:
+            values = list(categories)
 
-        if None in values or numpy.nan in values:
+        # NaN is the only value that does not equal itself
+        if any(value is None or value != value for value in values):
             raise ValueError("index contains empty values, cannot be unstacked")
 
         remaining_indexes = [idx_col for idx_col in self.index_columns if idx_col != index_to_unstack]
@@ -3427,6 +3673,7 @@ class DataFrame:
         dummy_na: bool = False,
         columns: Optional[List[str]] = None,
         dtype: str = 'int64',
+        categories: Optional[Dict[str, List[str]]] = None,
     ) -> 'DataFrame':
         """
         Convert each unique category/value from a string series into a dummy/indicator variable.
@@ -3437,10 +3684,19 @@ class DataFrame:
         :param dummy_na: If true, it will include ``nan`` as a variable.
         :param columns: List of string series to be converted.
         :param dtype: dtype of all new columns
+        :param categories: dictionary with as keys the names of series to be converted, and as values the
+            categories of the series to create a dummy variable for. Other values of the series are
+            ignored. The categories of series that are not in the dictionary are queried from the database,
+            all in a single query.
         :return: DataFrame
 
         .. note::
             DataFrame should contain at least one index level.
+
+        .. note::
+            This function queries the database to get the categories of the series, unless `categories`
+            is set for all series to be converted or the categories are cached by a category cache that has
+            been set. See :py:mod:`bach.categories`.
         """
         if not self.index:
             raise IndexError('DataFrame/Series should have at least one index level.')
@@ -3472,18 +3728,33 @@ class DataFrame:
         categorical_series = []
         from bach.series.series import value_to_series
         df_cp = self.copy()
+        if dummy_na:
+            for col in columns_to_encode:
+                df_cp.loc[df_cp[col].isnull(), col] = 'nan'
+
+        categories_per_col = dict(categories or {})
+        if dummy_na:
+            categories_per_col = {
+                col: values if 'nan' in values else [*values, 'nan']
+                for col, values in categories_per_col.items()
+            }
+        # get the categories of all series without given categories at once
+        columns_to_discover = [col for col in columns_to_encode if col not in categories_per_col]
+        from bach.categories import get_categories
+        discovered = get_categories([df_cp[col] for col in columns_to_discover])
+        for col, values in zip(columns_to_discover, discovered):
+            categories_per_col[col] = [value for value in values if value is not None]
 
         # prepare each series, add prefix to each value (variable identifiers)
+        dummy_categories: List[str] = []
         for col in columns_to_encode:
-            if dummy_na:
-                df_cp.loc[df_cp[col].isnull(), col] = 'nan'
-
             text_series = df_cp[col]
             prefix_val = f'{prefix_per_col.get(col, col)}{prefix_sep}'
             prefix_series = value_to_series(text_series, value=prefix_val, name=col)
             text_series = prefix_series + text_series
 
             categorical_series.append(text_series)
+            dummy_categories.extend(f'{prefix_val}{value}' for value in categories_per_col[col])
 
         from bach.operations.concat import SeriesConcatOperation
         # concat all categorical series into a single series, this way we avoid unstacking per each series
@@ -3491,7 +3762,7 @@ class DataFrame:
         categorical_df = categorical_df.dropna()
         categorical_df['values'] = 1
         categorical_df = categorical_df.set_index(categorical_df.data_columns[0], append=True)
-        dummies_df = categorical_df['values'].unstack()
+        dummies_df = categorical_df['values'].unstack(categories=dummy_categories)
 
         remaining_columns = [dc for dc in self.data_columns if dc not in columns_to_encode]
         dummy_columns = dummies_df.data_columns
@@ -3511,5 +3782,5 @@ def dict_name_series_equals(a: Dict[str, 'Series'], b: Dict[str, 'Series']):
     """
     return (a is None and b is None) or (
             len(a) == len(b) and list(a.keys()) == list(b.keys())
-            and all(ai.equals(bi) for (ai, bi) in zip(a.values(), b.values()))
+            and all(ai is bi or ai.equals(bi) for (ai, bi) in zip(a.values(), b.values()))
     )
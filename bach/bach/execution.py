@@ -0,0 +1,207 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Execution of the queries of multiple DataFrames at once. DataFrames that are built on the same base
+DataFrame share part of their SqlModel graphs. Calling to_pandas() on each of them calculates the shared
+part once per DataFrame. execute_many() calculates the shared part once, and runs the remaining queries
+concurrently.
+"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Set, TYPE_CHECKING
+
+import pandas
+from sqlalchemy.engine import Engine
+
+from bach.optimizations import optimize_model
+from bach.result_cache import get_result_cache, get_cache_key, get_source_tables, supports_disk_cache
+from bach.session import connect, prepare_model, get_active_session
+from bach.utils import escape_parameter_characters
+from sql_models.graph_operations import get_graph_index
+from sql_models.model import SqlModel, Materialization, SourceTableModelBuilder
+from sql_models.sql_generator import to_sql
+from sql_models.util import quote_identifier
+
+if TYPE_CHECKING:
+    from bach.dataframe import DataFrame
+
+
+def execute_many(
+        dfs: Sequence['DataFrame'],
+        max_workers: int = 4,
+        min_references: int = 2
+) -> List[pandas.DataFrame]:
+    """
+    Run the queries of multiple DataFrames, and give the results as :py:meth:`DataFrame.to_pandas` would.
+
+    Nodes in the SqlModel graphs that are used by at least `min_references` of the DataFrames are calculated
+    only once: they are created as tables first, and the queries of the DataFrames select from those tables.
+    Only nodes that are not already a table or view, and that don't select directly from a source table,
+    are considered. The created tables are dropped again before this function returns.
+
+    The queries of the DataFrames are then executed concurrently, each on its own connection of the
+    engine's connection pool. If a :py:class:`bach.session.Session` is active for the engine, the queries
+    are executed one by one on the connection of the session instead.
+
+    If a result cache is set (see :py:func:`bach.result_cache.set_result_cache`), it is used as
+    :py:meth:`DataFrame.to_pandas` uses it.
+
+    :param dfs: DataFrames to execute. All DataFrames must have the same engine.
+    :param max_workers: maximum number of queries to run concurrently.
+    :param min_references: minimum number of DataFrames that must use a node, to calculate it only once.
+    :returns: list of pandas DataFrames, in the same order as `dfs`.
+
+    .. note::
+        This function queries the database, and creates and drops tables.
+    """
+    if max_workers < 1:
+        raise ValueError(f'max_workers must be a positive number, got: {max_workers}')
+    if not dfs:
+        return []
+    engine = dfs[0].engine
+    if any(df.engine is not engine for df in dfs):
+        raise ValueError('All DataFrames must have the same engine.')
+
+    models = [df._get_view_sql_model() for df in dfs]
+    results: List[Optional[pandas.DataFrame]] = [None] * len(dfs)
+    result_cache = get_result_cache()
+    if result_cache is not None:
+        for i, model in enumerate(models):
+            results[i] = result_cache.get(get_cache_key(engine=engine, model=model, limit=None))
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    # Optimizations such as pruning unused columns make the shared nodes different for each DataFrame, so
+    # we find the shared nodes in the graphs before optimization, and optimize the remaining graphs after.
+    unoptimized_models = {i: dfs[i]._get_view_sql_model(optimize=False) for i in pending}
+    shared_hashes = get_shared_nodes(list(unoptimized_models.values()), min_references=min_references)
+    created_tables: List[str] = []
+    try:
+        replaced: Dict[str, SqlModel] = {}
+        query_models = {}
+        for i, model in unoptimized_models.items():
+            model = _replace_shared_nodes(engine, model, shared_hashes, replaced, created_tables)
+            model = optimize_model(dialect=engine.dialect, model=model)
+            query_models[i] = prepare_model(engine=engine, model=model)
+        if get_active_session(engine) is not None:
+            # The connection of the session cannot run multiple queries at the same time.
+            max_workers = 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {i: executor.submit(dfs[i]._model_to_pandas, query_models[i]) for i in pending}
+            for i, future in futures.items():
+                results[i] = future.result()
+    finally:
+        _drop_tables(engine, created_tables)
+
+    if result_cache is not None:
+        for i in pending:
+            result_cache.put(
+                get_cache_key(engine=engine, model=models[i], limit=None),
+                results[i],
+                source_tables=get_source_tables(models[i]),
+                persist=supports_disk_cache(series.dtype for series in dfs[i].all_series.values())
+            )
+    return [result for result in results if result is not None]
+
+
+def get_shared_nodes(models: Sequence[SqlModel], min_references: int = 2) -> Set[str]:
+    """
+    Find the nodes that are worth calculating only once for all models.
+
+    Candidates are the CTE and temporary table nodes with references, that occur in the graphs of at least
+    `min_references` models. A candidate is only selected if it is used directly by at least
+    `min_references` models or other selected nodes, i.e. not only through another selected node.
+
+    :return: the hashes of the selected nodes.
+    """
+    nodes: Dict[str, SqlModel] = {}
+    counts: Dict[str, int] = {}
+    for model in models:
+        model_nodes = {node.hash: node for node in get_graph_index(model).topological_order(model)}
+        for node_hash, node in model_nodes.items():
+            if (
+                    node is not model
+                    and node.materialization in (Materialization.CTE, Materialization.TEMP_TABLE)
+                    and node.references
+            ):
+                nodes[node_hash] = node
+                counts[node_hash] = counts.get(node_hash, 0) + 1
+    selected = {node_hash for node_hash, count in counts.items() if count >= min_references}
+
+    # Removing a node from the selection can make other nodes used directly by more or fewer nodes, so
+    # repeat until all selected nodes are used often enough.
+    while True:
+        usage = {node_hash: 0 for node_hash in selected}
+        consumers = list(models) + [nodes[node_hash] for node_hash in selected]
+        for consumer in consumers:
+            for node_hash in _get_used_selected_nodes(consumer, selected):
+                usage[node_hash] += 1
+        unused = {node_hash for node_hash, count in usage.items() if count < min_references}
+        if not unused:
+            return selected
+        selected -= unused
+
+
+def _get_used_selected_nodes(model: SqlModel, selected: Set[str]) -> Set[str]:
+    """ Give the hashes of the selected nodes that model uses directly, i.e. not through another one. """
+    result: Set[str] = set()
+    visited: Set[str] = set()
+    to_visit = list(model.references.values())
+    while to_visit:
+        node = to_visit.pop()
+        if node.hash in visited:
+            continue
+        visited.add(node.hash)
+        if node.hash in selected:
+            result.add(node.hash)
+        else:
+            to_visit.extend(node.references.values())
+    return result
+
+
+def _replace_shared_nodes(
+        engine: Engine,
+        node: SqlModel,
+        shared_hashes: Set[str],
+        replaced: Dict[str, SqlModel],
+        created_tables: List[str]
+) -> SqlModel:
+    """
+    Return a copy of node, in which all referenced shared nodes are replaced by a reference to a table with
+    the result of the shared node. Tables that don't exist yet are created, and their names are appended
+    to created_tables.
+    :param replaced: model hash -> replacement, for the nodes that are already handled.
+    """
+    new_references = {}
+    for ref_name, reference in node.references.items():
+        if reference.hash not in replaced:
+            replacement = _replace_shared_nodes(engine, reference, shared_hashes, replaced, created_tables)
+            if reference.hash in shared_hashes:
+                replacement = _create_table(engine, replacement, created_tables)
+            replaced[reference.hash] = replacement
+        new_references[ref_name] = replaced[reference.hash]
+    if all(new_references[ref_name] is reference for ref_name, reference in node.references.items()):
+        return node
+    return node.copy_link(new_references=new_references)
+
+
+def _create_table(engine: Engine, node: SqlModel, created_tables: List[str]) -> SqlModel:
+    """ Create a table with the result of node, and return a model that refers to that table. """
+    # The random part makes sure that concurrent calls don't use the same table.
+    table_name = f'bach_shared_{uuid.uuid4().hex[:8]}_{node.hash}'
+    table_model = node.copy_set_materialization(Materialization.TABLE)
+    table_model = table_model.copy_set_materialization_name(table_name)
+    table_model = optimize_model(dialect=engine.dialect, model=table_model)
+    sql = to_sql(dialect=engine.dialect, model=prepare_model(engine=engine, model=table_model))
+    with connect(engine) as conn:
+        conn.execute(escape_parameter_characters(conn, sql))
+    created_tables.append(table_name)
+    return SourceTableModelBuilder(table_name)()
+
+
+def _drop_tables(engine: Engine, table_names: List[str]):
+    """ Drop the tables, in reverse order of creation. """
+    if not table_names:
+        return
+    with connect(engine) as conn:
+        for table_name in reversed(table_names):
+            conn.execute(f'drop table if exists {quote_identifier(engine.dialect, table_name)}')
@@ -3,7 +3,8 @@ Copyright 2021 Objectiv B.V.
 """
 import re
 from dataclasses import dataclass
-from typing import Optional, Union, TYPE_CHECKING, List, Dict, Tuple, Set, Sequence
+from functools import lru_cache
+from typing import Optional, Union, TYPE_CHECKING, List, Dict, Tuple, Set, Sequence, Type, Iterator, Any
 
 from sqlalchemy.engine import Dialect
 
@@ -34,6 +35,22 @@ class ExpressionToken:
         # Not abstract so we can stay a dataclass.
         raise NotImplementedError()
 
+    def get_sql(self, dialect: Dialect) -> str:
+        """
+        Memoized version of to_sql(). Tokens are immutable, so the generated sql only depends on the dialect.
+        """
+        # Tokens are frozen dataclasses, the cache is not a field and does not partake in eq/hash.
+        cache: Optional[Dict[Type[Dialect], str]] = self.__dict__.get('_sql_cache')
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, '_sql_cache', cache)
+        dialect_type = dialect.__class__
+        sql = cache.get(dialect_type)
+        if sql is None:
+            sql = self.to_sql(dialect)
+            cache[dialect_type] = sql
+        return sql
+
 
 @dataclass(frozen=True)
 class RawToken(ExpressionToken):
@@ -92,7 +109,7 @@ class ColumnReferenceToken(ExpressionToken):
                          'Expression.resolve_column_references')
 
     def resolve(self, table_name: Optional[str]) -> TableColumnReferenceToken:
-        return TableColumnReferenceToken(table_name=table_name, column_name=self.column_name)
+        return _get_table_column_reference_token(table_name=table_name, column_name=self.column_name)
 
 
 @dataclass(frozen=True)
@@ -123,6 +140,34 @@ class IdentifierToken(ExpressionToken):
         return escape_raw_sql(quote_identifier(dialect, self.name))
 
 
+@lru_cache(maxsize=4096)
+def _get_raw_token(raw: str) -> RawToken:
+    """
+    Give an interned RawToken. Most raw sql fragments come from a limited set of format strings, by
+    sharing the token instances we also share their memoized sql.
+    """
+    return RawToken(raw)
+
+
+@lru_cache(maxsize=4096)
+def _get_identifier_token(name: str) -> IdentifierToken:
+    """ Give an interned IdentifierToken, e.g. for the column names in `{expression} as {name}`. """
+    return IdentifierToken(name=name)
+
+
+@lru_cache(maxsize=4096)
+def _get_table_column_reference_token(
+        table_name: Optional[str],
+        column_name: str
+) -> TableColumnReferenceToken:
+    """ Give an interned TableColumnReferenceToken, resolved column-references share their memoized sql. """
+    return TableColumnReferenceToken(table_name=table_name, column_name=column_name)
+
+
+_OPEN_PARENTHESIS = _get_raw_token('(')
+_CLOSE_PARENTHESIS = _get_raw_token(')')
+
+
 class Expression:
     """
     Immutable object representing a fragment of SQL as a sequence of sql-tokens or Expressions.
@@ -138,6 +183,8 @@ class Expression:
     needed use-cases. Most sql is simply encoded as a 'raw' token.
 
     For special type Expressions, this class is subclassed to assign special properties to a subexpression.
+
+    As Expressions are immutable, the generated sql is memoized per dialect and table name.
     """
 
     def __init__(self, data: Union['Expression', Sequence[Union[ExpressionToken, 'Expression']]] = None):
@@ -147,19 +194,37 @@ class Expression:
             # if we only got a base Expression, we absorb it.
             data = data.data if type(data) is Expression else [data]
         self._data: Tuple[Union[ExpressionToken, 'Expression'], ...] = tuple(data)
+        self._hash: Optional[int] = None
+        self._structural_key: Optional[Tuple[Any, ...]] = None
+        self._sql_cache: Dict[Tuple[Type[Dialect], Optional[str]], str] = {}
 
     @property
     def data(self) -> List[Union[ExpressionToken, 'Expression']]:
         return list(self._data)
 
     def __eq__(self, other):
-        return isinstance(other, Expression) and self.data == other.data
+        return isinstance(other, Expression) and self._data == other._data
 
     def __repr__(self):
         return f'{self.__class__}({repr(self.data)})'
 
     def __hash__(self):
-        return hash(self._data)
+        if self._hash is None:
+            self._hash = hash(self._data)
+        return self._hash
+
+    @property
+    def structural_key(self) -> Tuple[Any, ...]:
+        """
+        Hashable key of this expression that, unlike equality, also takes the classes of this expression and
+        of its sub-expressions into account. Expressions with the same key generate the same sql and have
+        the same properties (e.g. is_constant, has_aggregate_function).
+        """
+        if self._structural_key is None:
+            self._structural_key = (self.__class__, ) + tuple(
+                d.structural_key if isinstance(d, Expression) else d for d in self._data
+            )
+        return self._structural_key
 
     @classmethod
     def construct(cls, fmt: str, *args: Union['Expression', 'Series']) -> 'Expression':
@@ -190,11 +255,11 @@ class Expression:
                     arg_expr = arg
 
                 if isinstance(arg_expr, NonAtomicExpression):
-                    data.extend([RawToken('('), arg_expr, RawToken(')')])
+                    data.extend([_OPEN_PARENTHESIS, arg_expr, _CLOSE_PARENTHESIS])
                 else:
                     data.append(arg_expr)
             if sub_str != '':
-                data.append(RawToken(raw=sub_str))
+                data.append(_get_raw_token(sub_str))
         return cls(data=data)
 
     @classmethod
@@ -212,7 +277,7 @@ class Expression:
     @classmethod
     def raw(cls, raw: str) -> 'Expression':
         """ Return an expression that contains a single RawToken. """
-        return cls([RawToken(raw)])
+        return cls([_get_raw_token(raw)])
 
     @classmethod
     def variable(cls, dtype: str, name: str) -> 'Expression':
@@ -229,7 +294,7 @@ class Expression:
 
     @classmethod
     def identifier(cls, name: str) -> 'Expression':
-        return cls([IdentifierToken(name=name)])
+        return cls([_get_identifier_token(name)])
 
     @classmethod
     def column_reference(cls, field_name: str) -> 'Expression':
@@ -286,7 +351,7 @@ class Expression:
         True iff we are a AggregateFunctionExpression, or there is at least one in this Expression.
         """
         return isinstance(self, AggregateFunctionExpression) or any(
-            d.has_aggregate_function for d in self.data if isinstance(d, Expression)
+            d.has_aggregate_function for d in self._data if isinstance(d, Expression)
         )
 
     @property
@@ -295,7 +360,16 @@ class Expression:
         True iff we are a WindowFunctionExpression, or there is at least one in this Expression.
         """
         return isinstance(self, WindowFunctionExpression) or any(
-            d.has_windowed_aggregate_function for d in self.data if isinstance(d, Expression)
+            d.has_windowed_aggregate_function for d in self._data if isinstance(d, Expression)
+        )
+
+    @property
+    def has_non_deterministic_function(self) -> bool:
+        """
+        True iff we are a NonDeterministicExpression, or there is at least one in this Expression.
+        """
+        return isinstance(self, NonDeterministicExpression) or any(
+            d.has_non_deterministic_function for d in self._data if isinstance(d, Expression)
         )
 
     @property
@@ -310,19 +384,22 @@ class Expression:
     @property
     def has_multi_level_expressions(self) -> bool:
         return isinstance(self, MultiLevelExpression) or any(
-            d.has_multi_level_expressions for d in self.data if isinstance(d, Expression)
+            d.has_multi_level_expressions for d in self._data if isinstance(d, Expression)
         )
 
     def resolve_column_references(self, dialect: Dialect, table_name: Optional[str]) -> 'Expression':
         """ resolve the table name aliases for all columns in this expression """
         result: List[Union[ExpressionToken, Expression]] = []
-        for data_item in self.data:
+        for data_item in self._data:
             if isinstance(data_item, Expression):
                 result.append(data_item.resolve_column_references(dialect, table_name))
             elif isinstance(data_item, ColumnReferenceToken):
                 result.append(data_item.resolve(table_name))
             else:
                 result.append(data_item)
+        if all(new is old for new, old in zip(result, self._data)):
+            # Nothing to resolve. We are immutable, so we can return ourselves, including memoized sql.
+            return self
         return self.__class__(result)
 
     def replace_column_references(self, old_column_name: str, new_column_name: str) -> 'Expression':
@@ -364,7 +441,7 @@ class Expression:
 
     def get_references(self) -> Dict[str, 'BachSqlModel']:
         rv = {}
-        for data_item in self.data:
+        for data_item in self._data:
             if isinstance(data_item, Expression):
                 rv.update(data_item.get_references())
             elif isinstance(data_item, ModelReferenceToken):
@@ -373,7 +450,7 @@ class Expression:
 
     def get_all_tokens(self) -> List[ExpressionToken]:
         result = []
-        for data_item in self.data:
+        for data_item in self._data:
             if isinstance(data_item, Expression):
                 result.extend(data_item.get_all_tokens())
             else:
@@ -387,10 +464,26 @@ class Expression:
             '"{table_name}"."{column_name}"' instead of just '"{column_name}"'.
         :return SQL representation of the expression.
         """
-        resolved_tables_expression = self.resolve_column_references(dialect, table_name)
-        return ''.join(
-            d.to_sql(dialect=dialect) for d in resolved_tables_expression.data
-        )
+        key = (dialect.__class__, table_name)
+        sql = self._sql_cache.get(key)
+        if sql is None:
+            sql = ''.join(self._get_sql_fragments(dialect, table_name))
+            self._sql_cache[key] = sql
+        return sql
+
+    def _get_sql_fragments(self, dialect: Dialect, table_name: Optional[str]) -> Iterator[str]:
+        """
+        Give the sql of every token or expression in data. Column-references are resolved on the fly, which
+        gives the same result as first calling resolve_column_references(), without creating a copy of the
+        expression tree.
+        """
+        for data_item in self._data:
+            if isinstance(data_item, Expression):
+                yield data_item.to_sql(dialect=dialect, table_name=table_name)
+            elif isinstance(data_item, ColumnReferenceToken):
+                yield data_item.resolve(table_name).get_sql(dialect)
+            else:
+                yield data_item.get_sql(dialect)
 
 
 class NonAtomicExpression(Expression):
@@ -454,6 +547,14 @@ class WindowFunctionExpression(Expression):
         return False
 
 
+class NonDeterministicExpression(Expression):
+    """
+    An expression that gives a different result each time it is evaluated, e.g. `random()`. Such
+    expressions should not be copied to other places in a query, as that evaluates them more than once.
+    """
+    pass
+
+
 class MultiLevelExpression(Expression):
     """
     A MultiLevelExpression contains multiple expressions referencing to different columns.
@@ -461,10 +562,12 @@ class MultiLevelExpression(Expression):
     def to_sql(self, dialect: Dialect, table_name: Optional[str] = None) -> str:
         # same as original function, we just need to join by a comma since parent expression is composed
         # by multiple column references
-        resolved_tables_expression = self.resolve_column_references(dialect, table_name)
-        return ','.join(
-            d.to_sql(dialect=dialect) for d in resolved_tables_expression.data
-        )
+        key = (dialect.__class__, table_name)
+        sql = self._sql_cache.get(key)
+        if sql is None:
+            sql = ','.join(self._get_sql_fragments(dialect, table_name))
+            self._sql_cache[key] = sql
+        return sql
 
 
 def join_expressions(expressions: Sequence[Expression], join_str: str = ', ') -> Expression:
@@ -1,48 +1,259 @@
 """
 Copyright 2022 Objectiv B.V.
 """
-from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple, NamedTuple, Callable
 
 from sqlalchemy.engine import Engine
 
+from bach.result_cache import get_engine_url
+from bach.session import connect, prepare_model
 from bach.types import get_dtype_from_db_dtype, StructuredDtype
 from bach.utils import escape_parameter_characters
 from sql_models.constants import DBDialect
-from sql_models.model import SqlModel, CustomSqlModelBuilder
-from sql_models.sql_generator import to_sql
+from sql_models.model import SqlModel, SelectSqlModelBuilder
+from sql_models.sql_generator import to_sql_statements
 from sql_models.util import is_postgres, DatabaseNotSupportedException, is_bigquery
 
 
-def get_dtypes_from_model(engine: Engine, node: SqlModel) -> Dict[str, StructuredDtype]:
-    """ Create a temporary database table from model and use it to deduce the model's dtypes. """
+class SchemaCacheKey(NamedTuple):
+    engine_url: str
+    # Set for the dtypes of a table
+    table_name: Optional[str]
+    # Set for the dtypes of a model
+    model_hash: Optional[str]
+
+
+class SchemaCache:
+    """
+    Cache of the dtypes of tables and models, so that the database only needs to be queried the first time
+    the dtypes of a table or model are needed.
+
+    Entries expire after `ttl` seconds, as tables might be altered by others. Bach itself invalidates the
+    dtypes of a table when it creates or replaces that table. All methods are thread-safe.
+    """
+    def __init__(self, ttl: Optional[float] = 300, directory: str = None):
+        """
+        :param ttl: number of seconds after which cached dtypes expire. If None, dtypes never expire.
+        :param directory: If set, cached dtypes are also stored in this directory, so they can be used by
+            other processes.
+        """
+        self._ttl = ttl
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._entries: Dict[SchemaCacheKey, Tuple[float, Dict[str, StructuredDtype]]] = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: SchemaCacheKey) -> Optional[Dict[str, StructuredDtype]]:
+        """ Get the cached dtypes for key, or None if they are not cached or have expired. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._read_from_disk(key)
+            if entry is None:
+                return None
+            created, dtypes = entry
+            if self._ttl is not None and time.time() - created > self._ttl:
+                self._remove(key)
+                return None
+            self._entries[key] = entry
+            return dict(dtypes)
+
+    def put(self, key: SchemaCacheKey, dtypes: Dict[str, StructuredDtype]):
+        with self._lock:
+            entry = (time.time(), dict(dtypes))
+            self._entries[key] = entry
+            if self._directory is not None:
+                path = self._get_disk_path(key)
+                temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(temp_path, 'w') as file:
+                    json.dump({'key': list(key), 'created': entry[0], 'dtypes': entry[1]}, file)
+                os.replace(temp_path, path)
+
+    def invalidate(self, engine_url: str = None, table_name: str = None) -> int:
+        """
+        Remove cached dtypes. If both engine_url and table_name are None, all dtypes are removed.
+
+        :param engine_url: Only remove the dtypes of tables and models on the database with this url.
+            See bach.result_cache.get_engine_url().
+        :param table_name: Only remove the dtypes of this table.
+        :return: number of removed entries
+        """
+        def matches(key: SchemaCacheKey) -> bool:
+            return (
+                (engine_url is None or key.engine_url == engine_url) and
+                (table_name is None or key.table_name == table_name)
+            )
+
+        with self._lock:
+            keys = {key for key in self._entries if matches(key)}
+            if self._directory is not None:
+                for file_name in os.listdir(self._directory):
+                    if file_name.endswith('.json'):
+                        entry = self._read_file(os.path.join(self._directory, file_name))
+                        if entry is not None and matches(entry[0]):
+                            keys.add(entry[0])
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> int:
+        """ Remove all cached dtypes. Returns the number of removed entries. """
+        return self.invalidate()
+
+    def _remove(self, key: SchemaCacheKey):
+        self._entries.pop(key, None)
+        if self._directory is not None:
+            path = self._get_disk_path(key)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _get_disk_path(self, key: SchemaCacheKey) -> str:
+        assert self._directory is not None
+        name = hashlib.sha256(json.dumps(list(key)).encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, f'{name}.json')
+
+    def _read_from_disk(self, key: SchemaCacheKey) -> Optional[Tuple[float, Dict[str, StructuredDtype]]]:
+        if self._directory is None:
+            return None
+        entry = self._read_file(self._get_disk_path(key))
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1], entry[2]
+
+    @staticmethod
+    def _read_file(path: str) -> Optional[Tuple[SchemaCacheKey, float, Dict[str, StructuredDtype]]]:
+        try:
+            with open(path) as file:
+                data = json.load(file)
+            return SchemaCacheKey(*data['key']), data['created'], data['dtypes']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+_schema_cache: Optional[SchemaCache] = SchemaCache()
+
+
+def set_schema_cache(cache: Optional[SchemaCache]):
+    """
+    Set the SchemaCache that get_dtypes_from_table() and get_dtypes_from_model() use. If None, the database
+    is queried every time.
+    """
+    global _schema_cache
+    _schema_cache = cache
+
+
+def get_schema_cache() -> Optional[SchemaCache]:
+    """ Get the SchemaCache that is used, or None if dtypes are not cached. """
+    return _schema_cache
+
+
+def invalidate_table_dtypes(engine: Engine, table_name: str):
+    """ Remove the cached dtypes of the table, if any. Call this after (re)creating a table. """
+    if _schema_cache is not None:
+        _schema_cache.invalidate(engine_url=get_engine_url(engine), table_name=table_name)
+
+
+def get_dtypes_from_model(
+    engine: Engine,
+    node: SqlModel,
+    refresh: bool = False
+) -> Dict[str, StructuredDtype]:
+    """
+    Query the database to get the dtypes of the result of the model.
+
+    The query of the model is executed with `limit 0`, and the dtypes are deduced from the column types
+    that the database describes for the result.
+
+    :param engine: sqlalchemy engine for the database.
+    :param node: model of which to get the dtypes.
+    :param refresh: If True, don't use cached dtypes, but always query the database.
+    :return: Dictionary with as key the column names of the model, and as values the dtype of the column.
+    """
     if not is_postgres(engine):
         message_override = f'We cannot automatically derive dtypes from a SqlModel for database ' \
                            f'dialect "{engine.name}".'
         raise DatabaseNotSupportedException(engine, message_override=message_override)
-    new_node = CustomSqlModelBuilder(sql='select * from {{previous}} limit 0')(previous=node)
-    select_statement = to_sql(dialect=engine.dialect, model=new_node)
-    sql = f"""
-        create temporary table tmp_table_name on commit drop as
-        ({select_statement});
-        select column_name, data_type
-        from information_schema.columns
-        where table_name = 'tmp_table_name'
-        order by ordinal_position;
-    """
-    return _get_dtypes_from_information_schema_query(engine=engine, query=sql)
+    key = SchemaCacheKey(engine_url=get_engine_url(engine), table_name=None, model_hash=node.hash)
+    return _get_cached_dtypes(
+        key=key, refresh=refresh, get_dtypes=lambda: _get_dtypes_from_model_postgres(engine, node)
+    )
 
 
 def get_dtypes_from_table(
     engine: Engine,
     table_name: str,
+    refresh: bool = False
 ) -> Dict[str, StructuredDtype]:
     """
     Query database to get dtypes of the given table.
     :param engine: sqlalchemy engine for the database.
     :param table_name: the table name for which to get the dtypes. Can include project_id and dataset on
         BigQuery, e.g. 'project_id.dataset.table_name'
+    :param refresh: If True, don't use cached dtypes, but always query the database.
     :return: Dictionary with as key the column names of the table, and as values the dtype of the column.
     """
+    key = SchemaCacheKey(engine_url=get_engine_url(engine), table_name=table_name, model_hash=None)
+    return _get_cached_dtypes(
+        key=key, refresh=refresh, get_dtypes=lambda: _get_dtypes_from_table(engine, table_name)
+    )
+
+
+def _get_cached_dtypes(
+        key: SchemaCacheKey,
+        refresh: bool,
+        get_dtypes: Callable[[], Dict[str, StructuredDtype]]
+) -> Dict[str, StructuredDtype]:
+    """ Get the dtypes from the schema cache, or call get_dtypes() and add the result to the cache. """
+    cache = _schema_cache
+    if cache is not None and not refresh:
+        dtypes = cache.get(key)
+        if dtypes is not None:
+            return dtypes
+    dtypes = get_dtypes()
+    if cache is not None:
+        cache.put(key, dtypes)
+    return dtypes
+
+
+def _get_dtypes_from_model_postgres(engine: Engine, node: SqlModel) -> Dict[str, StructuredDtype]:
+    """
+    Execute the query of node with `limit 0`, and get the dtypes from the column types of the result.
+    This is much cheaper than creating a (temporary) table from the query.
+    """
+    new_node = SelectSqlModelBuilder(sql='select * from {{previous}} limit 0')(previous=node)
+    statements = to_sql_statements(dialect=engine.dialect, model=prepare_model(engine=engine, model=new_node))
+    with connect(engine) as conn:
+        transaction = conn.begin()
+        try:
+            # Create the temporary tables that the query depends on, if any
+            for statement in statements[:-1]:
+                conn.execute(escape_parameter_characters(conn, statement.sql))
+            result = conn.execute(escape_parameter_characters(conn, statements[-1].sql))
+            # The cursor description gives the name and the type oid of each result column
+            columns = [(column[0], column[1]) for column in result.cursor.description]
+            result.close()
+            type_oids = ', '.join(sorted({str(int(type_oid)) for _, type_oid in columns}))
+            type_names = {}
+            if type_oids:
+                type_names = dict(conn.execute(
+                    f'select oid, format_type(oid, null) from pg_type where oid in ({type_oids})'
+                ).fetchall())
+        finally:
+            # Drop any created temporary tables again
+            transaction.rollback()
+
+    db_dialect = DBDialect.from_engine(engine)
+    return {name: get_dtype_from_db_dtype(db_dialect, type_names[type_oid]) for name, type_oid in columns}
+
+
+def _get_dtypes_from_table(engine: Engine, table_name: str) -> Dict[str, StructuredDtype]:
+    """ Query the information schema to get the dtypes of the table. """
     if is_postgres(engine):
         meta_data_table = 'INFORMATION_SCHEMA.COLUMNS'
     elif is_bigquery(engine):
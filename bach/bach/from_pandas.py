@@ -1,27 +1,45 @@
 """
 Copyright 2021 Objectiv B.V.
 """
-from typing import Tuple, Dict, Set
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, Set, Callable, Mapping, Optional
 
 import numpy
 import pandas
+from sqlalchemy import inspect
 from sqlalchemy.engine import Engine, Dialect
 
-from bach import DataFrame, get_series_type_from_dtype
+from bach import DataFrame, get_series_type_from_dtype, SeriesTimestamp
+from bach.from_database import invalidate_table_dtypes
+from bach.postgres_copy import supports_copy_from_pandas, copy_from_pandas
 from bach.types import value_to_dtype, DtypeOrAlias, Dtype
 from bach.expression import Expression, join_expressions
-from bach.utils import is_valid_column_name
-from sql_models.model import CustomSqlModelBuilder
+from bach.utils import is_valid_column_name, escape_parameter_characters
+from sql_models.constants import DBDialect
+from sql_models.model import SelectSqlModelBuilder
 from sql_models.util import quote_identifier, DatabaseNotSupportedException, is_postgres, is_bigquery, \
     is_athena
 
+# A TableUploader appends the data of a pandas DataFrame to an existing table. Arguments: engine, pandas
+# DataFrame, table name, and the bach dtype of each column in the DataFrame.
+TableUploader = Callable[[Engine, pandas.DataFrame, str, Mapping[str, Dtype]], None]
+
+# Default number of rows that from_pandas_store_table() uploads per TableUploader call
+DEFAULT_UPLOAD_CHUNKSIZE = 100_000
+# Maximum number of rows per INSERT statement, for databases without a TableUploader. Each row becomes a
+# VALUES tuple with a bound parameter per column, so larger statements can exceed the statement size or
+# parameter limits of the database (e.g. Athena's 256 KB query limit).
+MAX_INSERT_CHUNKSIZE = 1_000
+
 
 def from_pandas(engine: Engine,
                 df: pandas.DataFrame,
                 convert_objects: bool,
                 name: str,
                 materialization: str,
-                if_exists: str = 'fail') -> DataFrame:
+                if_exists: str = 'fail',
+                chunksize: Optional[int] = DEFAULT_UPLOAD_CHUNKSIZE,
+                max_workers: int = 1) -> DataFrame:
     """
     See DataFrame.from_pandas() for docstring.
     """
@@ -33,7 +51,9 @@ def from_pandas(engine: Engine,
             df=df,
             convert_objects=convert_objects,
             table_name=name,
-            if_exists=if_exists
+            if_exists=if_exists,
+            chunksize=chunksize,
+            max_workers=max_workers
         )
     raise ValueError(f'Materialization should either be "cte" or "table", value: {materialization}')
 
@@ -42,12 +62,19 @@ def from_pandas_store_table(engine: Engine,
                             df: pandas.DataFrame,
                             convert_objects: bool,
                             table_name: str,
-                            if_exists: str = 'fail') -> DataFrame:
+                            if_exists: str = 'fail',
+                            chunksize: Optional[int] = DEFAULT_UPLOAD_CHUNKSIZE,
+                            max_workers: int = 1) -> DataFrame:
     """
     Instantiate a new DataFrame based on the content of a Pandas DataFrame. This will first write the
-    data to a database table using pandas' df.to_sql() method.
+    data to a database table.
     Supported dtypes are 'int64', 'float64', 'string', 'datetime64[ns]', 'bool'
 
+    The table is created with the database types of the bach dtypes of the columns, and the data is
+    uploaded with the TableUploader that is registered for the database dialect (see
+    register_table_uploader()). On Postgres the data is uploaded with `COPY FROM STDIN`, on BigQuery with
+    load jobs. For other databases, this falls back to pandas' df.to_sql() method, with multi-row INSERT
+    statements of at most MAX_INSERT_CHUNKSIZE rows.
 
     :param engine: db connection
     :param df: Pandas DataFrame to instantiate as DataFrame
@@ -59,8 +86,18 @@ def from_pandas_store_table(engine: Engine,
         * fail: Raise a ValueError.
         * replace: Drop the table before inserting new values.
         * append: Insert new values to the existing table.
+    :param chunksize: number of rows to upload at a time. If None, all rows are uploaded at once. For
+        databases without a TableUploader, this is capped at MAX_INSERT_CHUNKSIZE.
+    :param max_workers: number of chunks to upload in parallel, each over its own connection.
     """
     # todo add dtypes argument that explicitly let's you set the supported dtypes for pandas columns
+    if if_exists not in ('fail', 'replace', 'append'):
+        raise ValueError(f'if_exists should be one of "fail", "replace", or "append", value: {if_exists}')
+    if chunksize is not None and chunksize <= 0:
+        raise ValueError(f'chunksize must be a positive number or None, value: {chunksize}')
+    if max_workers <= 0:
+        raise ValueError(f'max_workers must be a positive number, value: {max_workers}')
+
     df_copy, index_dtypes, all_dtypes = _from_pd_shared(
         dialect=engine.dialect,
         df=df,
@@ -68,14 +105,158 @@ def from_pandas_store_table(engine: Engine,
         cte=False
     )
 
-    conn = engine.connect()
-    df_copy.to_sql(name=table_name, con=conn, if_exists=if_exists, index=False)
-    conn.close()
+    uploader = get_table_uploader(engine)
+    if uploader is None:
+        insert_chunksize = (
+            MAX_INSERT_CHUNKSIZE if chunksize is None else min(chunksize, MAX_INSERT_CHUNKSIZE)
+        )
+        with engine.begin() as conn:
+            df_copy.to_sql(
+                name=table_name, con=conn, if_exists=if_exists, index=False, chunksize=insert_chunksize,
+                method='multi'
+            )
+    else:
+        created = _create_table(engine=engine, table_name=table_name, dtypes=all_dtypes, if_exists=if_exists)
+        try:
+            _upload_in_chunks(
+                uploader=uploader,
+                engine=engine,
+                df=df_copy,
+                table_name=table_name,
+                dtypes=all_dtypes,
+                chunksize=chunksize,
+                max_workers=max_workers
+            )
+        except Exception:
+            # Don't leave a partially filled table behind, if we created it.
+            if created:
+                _drop_table(engine=engine, table_name=table_name)
+            raise
+    invalidate_table_dtypes(engine=engine, table_name=table_name)
 
     index = list(index_dtypes.keys())
     return DataFrame.from_table(engine=engine, table_name=table_name, index=index, all_dtypes=all_dtypes)
 
 
+def register_table_uploader(db_dialect: DBDialect, uploader: Optional[TableUploader]):
+    """
+    Set the TableUploader that from_pandas_store_table() uses for the given database dialect. If
+    uploader is None, from_pandas_store_table() falls back to pandas' df.to_sql() method for the dialect.
+    """
+    _TABLE_UPLOADERS[db_dialect] = uploader
+
+
+def get_table_uploader(engine: Engine) -> Optional[TableUploader]:
+    """
+    Get the TableUploader that is registered for the engine's database dialect, or None if there is none.
+    """
+    for db_dialect, uploader in _TABLE_UPLOADERS.items():
+        if db_dialect.is_dialect(engine):
+            return uploader
+    return None
+
+
+def _create_table(engine: Engine, table_name: str, dtypes: Mapping[str, Dtype], if_exists: str) -> bool:
+    """
+    Create a table with a column per dtype, of the database type that matches the bach dtype. Behaviour if
+    the table already exists depends on if_exists, see from_pandas_store_table().
+    :return: True if the table was created, False if the table already existed and if_exists='append'.
+    """
+    if inspect(engine).has_table(table_name):
+        if if_exists == 'fail':
+            # Same message as pandas' df.to_sql() gives
+            raise ValueError(f"Table '{table_name}' already exists.")
+        if if_exists == 'append':
+            return False
+        _drop_table(engine=engine, table_name=table_name)
+
+    column_defs = []
+    for name, dtype in dtypes.items():
+        db_dtype = get_series_type_from_dtype(dtype).get_db_dtype(dialect=engine.dialect)
+        column_defs.append(f'{quote_identifier(engine.dialect, name)} {db_dtype}')
+    sql = f'create table {quote_identifier(engine.dialect, table_name)} ({", ".join(column_defs)})'
+    with engine.begin() as conn:
+        conn.execute(escape_parameter_characters(conn, sql))
+    return True
+
+
+def _drop_table(engine: Engine, table_name: str):
+    sql = f'drop table {quote_identifier(engine.dialect, table_name)}'
+    with engine.begin() as conn:
+        conn.execute(escape_parameter_characters(conn, sql))
+
+
+def _upload_in_chunks(
+        uploader: TableUploader,
+        engine: Engine,
+        df: pandas.DataFrame,
+        table_name: str,
+        dtypes: Mapping[str, Dtype],
+        chunksize: Optional[int],
+        max_workers: int
+):
+    """ Upload df in chunks of chunksize rows, of which up to max_workers are uploaded in parallel. """
+    if chunksize is None or len(df) <= chunksize:
+        uploader(engine, df, table_name, dtypes)
+        return
+    chunks = [df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize)]
+    if max_workers == 1:
+        for chunk in chunks:
+            uploader(engine, chunk, table_name, dtypes)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(uploader, engine, chunk, table_name, dtypes) for chunk in chunks]
+        for future in futures:
+            # raises the exception of the upload, if any
+            future.result()
+
+
+def _upload_postgres_copy(engine: Engine, df: pandas.DataFrame, table_name: str, dtypes: Mapping[str, Dtype]):
+    """
+    TableUploader that uses `COPY FROM STDIN`. Falls back to _upload_insert() if COPY is not supported for
+    the engine or dtypes.
+    """
+    if not supports_copy_from_pandas(engine, dtypes.values()):
+        _upload_insert(engine=engine, df=df, table_name=table_name, dtypes=dtypes)
+        return
+    copy_from_pandas(engine=engine, df=df, table_name=table_name, dtypes=dtypes)
+
+
+def _upload_insert(engine: Engine, df: pandas.DataFrame, table_name: str, dtypes: Mapping[str, Dtype]):
+    """ TableUploader that uses multi-row INSERT statements, generated by pandas' df.to_sql() """
+    with engine.begin() as conn:
+        df.to_sql(name=table_name, con=conn, if_exists='append', index=False, method='multi')
+
+
+def _upload_bigquery_load_job(
+        engine: Engine,
+        df: pandas.DataFrame,
+        table_name: str,
+        dtypes: Mapping[str, Dtype]
+):
+    """
+    TableUploader that uses a BigQuery load job. The data is serialized to parquet, which is loaded
+    into the table according to the table's schema.
+    """
+    from google.cloud import bigquery
+    raw_connection = engine.raw_connection()
+    try:
+        # The DBAPI connection of sqlalchemy-bigquery wraps a google.cloud.bigquery Client
+        client = raw_connection.connection._client
+        dataset_id = engine.dialect.dataset_id  # type: ignore
+        table_id = f'{client.project}.{dataset_id}.{table_name}'
+        job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
+        client.load_table_from_dataframe(df, table_id, job_config=job_config).result()
+    finally:
+        raw_connection.close()
+
+
+_TABLE_UPLOADERS: Dict[DBDialect, Optional[TableUploader]] = {
+    DBDialect.POSTGRES: _upload_postgres_copy,
+    DBDialect.BIGQUERY: _upload_bigquery_load_job,
+}
+
+
 def from_pandas_ephemeral(
         engine: Engine,
         df: pandas.DataFrame,
@@ -105,23 +286,7 @@ def from_pandas_ephemeral(
         cte=True
     )
 
-    column_series_type = [get_series_type_from_dtype(dtype) for dtype in all_dtypes.values()]
-
-    per_row_expr = []
-    for row in df_copy.itertuples():
-        per_column_expr = []
-        # Access the columns in `row` by index rather than by name. Because if a name starts with an
-        # underscore (e.g. _index_skating_order) it will not be available as attribute.
-        # so we use `row[i]` instead of getattr(row, column_name).
-        # start=1 is to account for the automatic index that pandas adds
-        for i, series_type in enumerate(column_series_type, start=1):
-            val = row[i]
-            per_column_expr.append(
-                series_type.value_to_expression(dialect=engine.dialect, value=val, dtype=series_type.dtype)
-            )
-        row_expr = Expression.construct('({})', join_expressions(per_column_expr))
-        per_row_expr.append(row_expr)
-    all_values_str = join_expressions(per_row_expr, join_str=',\n').to_sql(engine.dialect)
+    all_values_str = _get_rows_sql(dialect=engine.dialect, df=df_copy, dtypes=all_dtypes)
 
     if is_postgres(engine) or is_athena(engine):
         # We are building sql of the form:
@@ -152,13 +317,112 @@ def from_pandas_ephemeral(
     else:
         raise DatabaseNotSupportedException(engine)
 
-    model_builder = CustomSqlModelBuilder(sql=sql, name=name)
+    model_builder = SelectSqlModelBuilder(sql=sql, name=name)
     sql_model = model_builder()
 
     index = list(index_dtypes.keys())
     return DataFrame.from_model(engine=engine, model=sql_model, index=index, all_dtypes=all_dtypes)
 
 
+def _get_rows_sql(dialect: Dialect, df: pandas.DataFrame, dtypes: Mapping[str, Dtype]) -> str:
+    """
+    Give the sql of all rows of df as a list of tuples of literals, e.g. "(1, 'a'),\n(2, 'b')". The
+    result is the same as joining the expressions that Series.value_to_expression() gives for all values.
+    """
+    if len(df) == 0:
+        return ''
+    sql_columns = [_get_values_sql(dialect=dialect, column=df[name], dtype=dtype)
+                   for name, dtype in dtypes.items()]
+    rows = sql_columns[0].str.cat(sql_columns[1:], sep=', ')
+    return ',\n'.join('(' + rows + ')')
+
+
+def _get_values_sql(dialect: Dialect, column: pandas.Series, dtype: Dtype) -> pandas.Series:
+    """
+    Give the sql of the expression that Series.value_to_expression() gives for each value in column.
+
+    The literals of the most common dtypes are rendered column-wise, which is much faster than
+    constructing an Expression per value. Other values are converted one by one.
+    """
+    series_type = get_series_type_from_dtype(dtype)
+    null_sql = series_type.value_to_expression(dialect=dialect, value=None, dtype=dtype).to_sql(dialect)
+    result = pandas.Series(null_sql, index=column.index, dtype='object')
+
+    not_null = column.notna()
+    values = column[not_null]
+    literals = _get_literals_sql(dialect=dialect, values=values, dtype=dtype)
+    if literals is not None:
+        # The literal is the only variable part of the expression of a non-null value. e.g. for int64 on
+        # Postgres the expression is 'cast({literal} as bigint)'
+        marker = '___bach_literal___'
+        template = series_type.supported_literal_to_expression(
+            dialect=dialect, literal=Expression.raw(marker)
+        ).to_sql(dialect)
+        prefix, suffix = template.split(marker)
+        result[literals.index] = prefix + literals + suffix
+        values = values[values.index.difference(literals.index)]
+
+    for index, value in values.items():
+        result[index] = series_type.value_to_expression(dialect=dialect, value=value, dtype=dtype).to_sql(
+            dialect
+        )
+    return result
+
+
+def _get_literals_sql(dialect: Dialect, values: pandas.Series, dtype: Dtype) -> Optional[pandas.Series]:
+    """
+    Give the sql of the literal that Series.supported_value_to_literal() gives for the values, as far as
+    they can be rendered column-wise. Values that are not in the returned Series, or all values if None is
+    returned, must be converted by Series.value_to_expression().
+
+    :param values: non-null values of a column
+    """
+    if dtype == 'int64':
+        if not pandas.api.types.is_integer_dtype(values) and \
+                pandas.api.types.infer_dtype(values) != 'integer':
+            return None
+        return values.astype(str)
+    if dtype == 'float64':
+        if not pandas.api.types.is_float_dtype(values):
+            values = values.astype('float64')
+        if is_athena(dialect):
+            # Athena has functions for non-finite values, rather than a literal
+            values = values[numpy.isfinite(values)]
+        return _quote_strings(dialect, values.astype(str))
+    if dtype == 'bool':
+        return values.map({True: 'True', False: 'False'})
+    if dtype == 'string':
+        if pandas.api.types.infer_dtype(values) not in ('string', 'empty'):
+            return None
+        return _quote_strings(dialect, values.astype(str))
+    if dtype == 'timestamp':
+        if pandas.api.types.infer_dtype(values) not in ('datetime64', 'datetime', 'empty'):
+            return None
+        try:
+            timestamps = pandas.to_datetime(values)
+        except (ValueError, OverflowError):
+            # e.g. dates that are out of pandas' bounds
+            return None
+        if not pandas.api.types.is_datetime64_dtype(timestamps):
+            # timezone-aware values
+            return None
+        return _quote_strings(dialect, timestamps.dt.strftime(SeriesTimestamp._FINAL_DATE_TIME_FORMAT))
+    return None
+
+
+def _quote_strings(dialect: Dialect, values: pandas.Series) -> pandas.Series:
+    """
+    Quote and escape all string values, like StringValueToken.to_sql() does for a single value.
+    See quote_string() and escape_raw_sql().
+    """
+    if is_bigquery(dialect):
+        escaped = values.str.replace('\\', r'\\', regex=False).str.replace('"', r'\"', regex=False)
+        quoted = '"""' + escaped + '"""'
+    else:
+        quoted = "'" + values.str.replace("'", "''", regex=False) + "'"
+    return quoted.str.replace('{', '{{{{', regex=False).str.replace('}', '}}}}', regex=False)
+
+
 def _assert_column_names_valid(dialect: Dialect, df: pandas.DataFrame):
     """
     Performs three checks on the columns (not on the indices) of the DataFrame:
@@ -4,7 +4,7 @@ Copyright 2021 Objectiv B.V.
 import itertools
 from copy import copy
 from enum import Enum
-from typing import Union, List, Tuple, Optional, Dict, Set, Hashable, cast, NamedTuple, Sequence, Mapping
+from typing import Union, List, Tuple, Optional, Dict, Set, Hashable, cast, NamedTuple, Sequence, Mapping, Any
 
 from sqlalchemy.engine import Dialect
 
@@ -16,7 +16,7 @@ from bach.expression import (
 )
 from bach.utils import ResultSeries, get_result_series_dtype_mapping
 from sql_models.constants import NotSet, not_set
-from sql_models.model import Materialization, CustomSqlModelBuilder, SqlModel, SqlModelSpec
+from sql_models.model import Materialization, SelectSqlModelBuilder, SqlModel, SqlModelSpec
 from bach.sql_model import BachSqlModel, construct_references
 
 
@@ -644,6 +644,22 @@ class MergeSqlModel(BachSqlModel):
     def merge_on(self) -> MergeOn:
         return self._merge_on
 
+    @classmethod
+    def _get_intern_key(cls, kwargs: Mapping[str, Any]) -> Optional[Tuple[Any, ...]]:
+        """ Similar to super class's implementation, but adds merge_on to the key. """
+        kwargs = dict(kwargs)
+        merge_on = kwargs.pop('merge_on', None)
+        key = super()._get_intern_key(kwargs)
+        if key is None or merge_on is None:
+            return None
+        # merge_on contains lists and Series, which are not hashable. The conditional Series only matter
+        # for the on clause, which is already part of the key via the sql of the model_spec.
+        return key + (
+            tuple(merge_on.left),
+            tuple(merge_on.right),
+            tuple(cond.expression.structural_key for cond in merge_on.conditional),
+        )
+
     @classmethod
     def get_instance(
         cls,
@@ -688,7 +704,7 @@ class MergeSqlModel(BachSqlModel):
         )
 
         return MergeSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name=name),
+            model_spec=SelectSqlModelBuilder(sql=sql, name=name),
             placeholders=cls._get_placeholders(dialect, variables, all_expressions),
             references=references,
             materialization=Materialization.CTE,
@@ -715,8 +731,8 @@ class MergeSqlModel(BachSqlModel):
             self.materialization_name if materialization_name is not_set else materialization_name
         )
         return self.__class__(
-            model_spec=self.model_spec if model_spec is None else model_spec,
-            placeholders=self.placeholders if placeholders is None else placeholders,
+            model_spec=self._model_spec if model_spec is None else model_spec,
+            placeholders=self._placeholders if placeholders is None else placeholders,
             references=self.references if references is None else references,
             materialization=self.materialization if materialization is None else materialization,
             materialization_name=materialization_name_value,
@@ -15,7 +15,7 @@ from bach import DataFrame, get_series_type_from_dtype, SeriesAbstractNumeric, S
 from bach.expression import Expression, join_expressions
 from bach.sql_model import BachSqlModel, construct_references
 from bach.utils import ResultSeries, get_result_series_dtype_mapping, get_merged_series_dtype
-from sql_models.model import CustomSqlModelBuilder, Materialization
+from sql_models.model import SelectSqlModelBuilder, Materialization
 
 TDataFrameOrSeries = TypeVar('TDataFrameOrSeries', bound='DataFrameOrSeries')
 
@@ -362,7 +362,7 @@ class ConcatSqlModel(BachSqlModel):
         )
 
         return ConcatSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name=name),
+            model_spec=SelectSqlModelBuilder(sql=sql, name=name),
             placeholders=cls._get_placeholders(dialect, variables, all_series_expressions),
             references=references,
             materialization=Materialization.CTE,
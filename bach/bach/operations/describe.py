@@ -4,13 +4,14 @@ Copyright 2022 Objectiv B.V.
 from abc import abstractmethod
 from collections import abc
 from enum import Enum
-from typing import Optional, Union, Sequence, List, Set, Generic, TypeVar
+from typing import Optional, Union, Sequence, List, Set, Generic, TypeVar, Dict
 
 from bach import (
     DataFrame, SeriesAbstractNumeric, DataFrameOrSeries, get_series_type_from_dtype, Series,
 )
 from bach.operations.concat import DataFrameConcatOperation
 from bach.expression import Expression
+from sql_models.util import is_bigquery
 
 
 class SupportedStats(Enum):
@@ -39,6 +40,7 @@ class DescribeOperation(Generic[TDataFrameOrSeries]):
     datetime_is_numeric: A boolean specifying if datetime series should be treated as numeric columns
         (not supported)
     percentiles: List-like of numbers between 0-1. If nothing is provided, defaults to [.25, .5, .75]
+    approx: A boolean specifying if nunique and the percentiles should be approximated
 
     Child classes are in charge of specifying the correct sorting of final result.
     """
@@ -46,6 +48,7 @@ class DescribeOperation(Generic[TDataFrameOrSeries]):
     series_to_describe: List[str]
     datetime_is_numeric: bool
     percentiles: Sequence[float]
+    approx: bool
 
     STAT_SERIES_NAME = '__stat'
     RESULT_DECIMALS = 2
@@ -57,6 +60,7 @@ class DescribeOperation(Generic[TDataFrameOrSeries]):
         exclude: Optional[Union[str, Sequence[str]]] = None,
         datetime_is_numeric: bool = False,
         percentiles: Optional[Sequence[float]] = None,
+        approx: bool = False,
     ) -> None:
         self.df = obj.copy() if isinstance(obj, DataFrame) else obj.to_frame()
         if not self.df.data:
@@ -66,6 +70,7 @@ class DescribeOperation(Generic[TDataFrameOrSeries]):
 
         self.datetime_is_numeric = datetime_is_numeric
         self.percentiles = percentiles or [0.25, 0.5, 0.75]
+        self.approx = approx
 
         if self.percentiles and any(pt < 0 or pt > 1 for pt in self.percentiles):
             raise ValueError('percentiles should be between 0 and 1.')
@@ -136,20 +141,38 @@ class DescribeOperation(Generic[TDataFrameOrSeries]):
 
     def __call__(self) -> TDataFrameOrSeries:
         """
-        Generates an aggregated dataframe per stat and concatenates all results into a new dataframe
-        containing all descriptive statistics of the dataset.
+        Generates a dataframe containing all descriptive statistics of the dataset.
+
+        All statistics are calculated in a single aggregation over the data. The result of that is a single
+        row, which is then split in a row per stat. On BigQuery the exact percentiles are calculated
+        separately, as those need a window function there.
 
         Values are sorted based on the position of the stat in SupportedStats.
         """
-        all_stats_df = []
-        for pos, stat in enumerate(SupportedStats):
-            stat_df = self._calculate_stat(stat=stat, stat_position=pos)
-            if stat_df:
-                all_stats_df.append(stat_df)
+        aggregated_series = self._get_aggregated_series()
+        if self._has_windowed_percentiles:
+            percentile_series = {}
+        else:
+            percentile_series = self._get_percentile_series()
 
-        percentiles_df = self._calculate_percentiles()
-        if percentiles_df:
-            all_stats_df.append(percentiles_df)
+        all_stats_df = []
+        aggregates_df = self._get_aggregates_df(aggregated_series, percentile_series)
+        if aggregates_df is not None:
+            for pos, stat in enumerate(SupportedStats):
+                if stat in aggregated_series:
+                    stat_df = self._get_row_df(aggregates_df, aggregated_series[stat])
+                    stat_df[self.STAT_SERIES_NAME] = stat.value
+                    stat_df[f'{self.STAT_SERIES_NAME}_position'] = pos
+                    all_stats_df.append(stat_df)
+            for qt, series in percentile_series.items():
+                percentile_df = self._get_row_df(aggregates_df, series)
+                percentile_df[self.STAT_SERIES_NAME] = qt
+                all_stats_df.append(self._add_percentile_position(percentile_df))
+
+        if self._has_windowed_percentiles:
+            percentiles_df = self._calculate_percentiles()
+            if percentiles_df:
+                all_stats_df.append(percentiles_df)
 
         describe_df = DataFrameConcatOperation(objects=all_stats_df)()
         describe_df = describe_df.round(decimals=self.RESULT_DECIMALS)
@@ -157,50 +180,112 @@ class DescribeOperation(Generic[TDataFrameOrSeries]):
 
         return self._get_final_described_result(describe_df)
 
-    def _calculate_stat(
+    @property
+    def _has_windowed_percentiles(self) -> bool:
+        """ True if the percentiles need a window function, and can't be in the single aggregation. """
+        return is_bigquery(self.df.engine) and not self.approx
+
+    def _get_grouped_df(self) -> DataFrame:
+        """ Returns the dataframe to describe without index, grouped to aggregate over all rows. """
+        df = self.df.copy_override(
+            series={s: self.df[s].copy_override(index={}) for s in self.series_to_describe},
+            index={},
+        )
+        return df.groupby()
+
+    def _get_aggregated_series(self) -> Dict[SupportedStats, Dict[str, Series]]:
+        """
+        Returns per stat the aggregated series for all series that support that stat, by series name.
+        Stats that no series supports are left out.
+        """
+        grouped_df = self._get_grouped_df()
+        result: Dict[SupportedStats, Dict[str, Series]] = {}
+        for stat in SupportedStats:
+            for s in self.series_to_describe:
+                # check one: function exists on Series
+                if not hasattr(grouped_df[s], stat.value):
+                    continue
+                # check two: function doesn't raise NotImplementedError
+                try:
+                    kwargs = {'approx': True} if self.approx and stat == SupportedStats.NUNIQUE else {}
+                    applied = grouped_df[s].apply_func(stat.value, grouped_df.group_by, **kwargs)
+                except NotImplementedError:
+                    continue
+                result.setdefault(stat, {})[s] = applied[0]
+        return result
+
+    def _get_percentile_series(self) -> Dict[float, Dict[str, Series]]:
+        """
+        Returns per percentile the aggregated series for all series that support quantiles, by series name.
+        """
+        grouped_df = self._get_grouped_df()
+        series_names = [s for s in self.series_to_describe if hasattr(grouped_df[s], 'quantile')]
+        if not series_names:
+            return {}
+        return {
+            qt: {
+                s: grouped_df[s].apply_func('quantile', grouped_df.group_by, q=qt, approx=self.approx)[0]
+                for s in series_names
+            }
+            for qt in self.percentiles
+        }
+
+    def _get_aggregates_df(
         self,
-        stat: SupportedStats,
-        stat_position: int,
+        aggregated_series: Dict[SupportedStats, Dict[str, Series]],
+        percentile_series: Dict[float, Dict[str, Series]],
     ) -> Optional[DataFrame]:
         """
-        Returns an aggregated dataframe based on the stat to be calculated.
-        :param series_to_aggregate: List of series names that stat supports
-        :param stat: aggregation to be calculated
-        :param stat_position: position of the stat in the final result
+        Returns a materialized dataframe with a single row, with all aggregated series as columns. The
+        columns are renamed to unique names, the series in aggregated_series and percentile_series are
+        updated to refer to those columns.
         """
-        # filter series that can perform the aggregation
-        series_to_aggregate = []
-        for s in self.series_to_describe:
-            # check one: function exists on Series
-            if not hasattr(self.df[s], stat.value):
-                continue
-            # check two: function doesn't raise NotImplementedError
-            try:
-                self.df[s].apply_func(stat.value)
-            except NotImplementedError:
-                continue
-            series_to_aggregate.append(s)
-
-        if not series_to_aggregate:
+        all_series: Dict[str, Series] = {}
+        all_series_per_stat = [*aggregated_series.values(), *percentile_series.values()]
+        for series_per_stat in all_series_per_stat:
+            for name, series in series_per_stat.items():
+                column_name = f'__describe_{len(all_series)}'
+                all_series[column_name] = series.copy_override(name=column_name)
+                series_per_stat[name] = all_series[column_name]
+        if not all_series:
             return None
 
-        stat_df = self.df.copy_override(
-            series={
-                s: self.df[s].copy_override(index={})
-                for s in series_to_aggregate
-            }, index={}
-
+        first_series = list(all_series.values())[0]
+        aggregates_df = self.df.copy_override(
+            base_node=first_series.base_node,
+            index={},
+            group_by=first_series.group_by,
+            series=all_series,
         )
-        original_series_names = stat_df.data_columns
-        stat_df = stat_df.agg(func=stat.value).materialize(node_name='describe_calculate_stat')
+        aggregates_df = aggregates_df.materialize(node_name='describe_aggregates')
+        for series_per_stat in all_series_per_stat:
+            for name, series in series_per_stat.items():
+                series_per_stat[name] = aggregates_df[series.name]
+        return aggregates_df
 
-        # original column names should remain
-        stat_df = stat_df.rename(
-            columns=dict(zip(stat_df.data_columns, original_series_names)),
+    @staticmethod
+    def _get_row_df(aggregates_df: DataFrame, series: Dict[str, Series]) -> DataFrame:
+        """
+        Returns a dataframe with the given columns of aggregates_df, renamed to the original series names.
+        """
+        row_df = aggregates_df[[s.name for s in series.values()]]
+        return row_df.rename(columns={s.name: name for name, s in series.items()})
+
+    def _add_percentile_position(self, percentile_df: DataFrame) -> DataFrame:
+        """
+        Adds the position column to a dataframe with percentiles, based on the percentile in its stat column.
+        """
+        current_position = len(SupportedStats)
+
+        # SeriesFloat64 + int is not supported, need an expression
+        percentile_df[f'{self.STAT_SERIES_NAME}_position'] = (
+            percentile_df[self.STAT_SERIES_NAME].copy_override(
+                expression=Expression.construct(
+                    f'{current_position} + {{}}', percentile_df.all_series[self.STAT_SERIES_NAME],
+                ),
+            )
         )
-        stat_df[self.STAT_SERIES_NAME] = stat.value
-        stat_df[f'{self.STAT_SERIES_NAME}_position'] = stat_position
-        return stat_df
+        return percentile_df
 
     def _calculate_percentiles(self) -> Optional[DataFrame]:
         """
@@ -216,7 +301,7 @@ class DescribeOperation(Generic[TDataFrameOrSeries]):
         percentile_df: DataFrame = self.df.copy_override(series=series_to_aggregate)
         percentile_df = percentile_df.reset_index(drop=True)
 
-        percentile_df = percentile_df.quantile(q=list(self.percentiles))
+        percentile_df = percentile_df.quantile(q=list(self.percentiles), approx=self.approx)
         has_q_index = 'quantile' in percentile_df.all_series
 
         columns_rename = {
@@ -231,18 +316,7 @@ class DescribeOperation(Generic[TDataFrameOrSeries]):
         # original column names should remain
         columns_rename['quantile'] = self.STAT_SERIES_NAME
         percentile_df = percentile_df.rename(columns=columns_rename)
-        current_position = len(SupportedStats)
-
-        # SeriesFloat64 + int is not supported, need an expression
-        percentile_df[f'{self.STAT_SERIES_NAME}_position'] = (
-            percentile_df[self.STAT_SERIES_NAME].copy_override(
-                expression=Expression.construct(
-                    f'{current_position} + {{}}', percentile_df.all_series[self.STAT_SERIES_NAME],
-                ),
-            )
-        )
-
-        return percentile_df
+        return self._add_percentile_position(percentile_df)
 
 
 class DataFrameDescribeOperation(DescribeOperation[DataFrame]):
@@ -0,0 +1,532 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Optimizations of SqlModel graphs, that are applied before generating sql. The optimizations change the
+generated sql, but never the result of the query.
+
+Additionally, plan_materialization() suggests a better materialization of the nodes in a graph. That is
+not applied automatically, but by :py:meth:`bach.DataFrame.optimize()`.
+"""
+import json
+from typing import Dict, Optional, Set, List, TypeVar, Iterable, Hashable, Mapping, Callable, \
+    Union, NamedTuple, Tuple
+
+from sqlalchemy.engine import Dialect, Engine
+from sqlalchemy.exc import DBAPIError
+
+from bach.expression import Expression, ExpressionToken, ColumnReferenceToken, TableColumnReferenceToken, \
+    RawToken
+from bach.sql_model import BachSqlModel, CurrentNodeSqlModel, SelectClauses
+from bach.utils import escape_parameter_characters
+from sql_models.graph_operations import get_graph_index
+from sql_models.model import SqlModel, Materialization
+from sql_models.sql_generator import model_to_name
+from sql_models.util import is_postgres
+
+TSqlModel = TypeVar('TSqlModel', bound=SqlModel)
+
+_push_down_predicates_enabled = True
+
+
+def set_push_down_predicates_enabled(enabled: bool):
+    """
+    Set whether optimize_model() applies push_down_predicates(). Set to False to generate sql with all
+    where-clauses in the nodes that they were created in, e.g. to compare results or query plans.
+    Default is True.
+    """
+    global _push_down_predicates_enabled
+    _push_down_predicates_enabled = enabled
+
+
+def get_push_down_predicates_enabled() -> bool:
+    """ Get whether optimize_model() applies push_down_predicates(). """
+    return _push_down_predicates_enabled
+
+
+def optimize_model(dialect: Dialect, model: TSqlModel) -> TSqlModel:
+    """
+    Apply all enabled optimizations to the graph of model.
+
+    :param dialect: SQL Dialect
+    :param model: model to optimize
+    :return: equivalent model
+    """
+    if _push_down_predicates_enabled:
+        model = push_down_predicates(dialect, model)
+    return prune_unused_columns(dialect, model)
+
+
+def push_down_predicates(dialect: Dialect, model: TSqlModel) -> TSqlModel:
+    """
+    Predicate pushdown: move the where-clause of a node into the node that it selects from, so that rows
+    are filtered as early as possible. This is repeated as long as possible, so a filter that is applied
+    after a number of materializations can end up in the node that selects from the source table.
+
+    Without this, a filter on a materialized DataFrame is applied after all earlier nodes are calculated
+    for all rows. Not all databases push such conditions down through CTEs themselves.
+
+    A where-clause of a CurrentNodeSqlModel is only moved into its previous node if:
+        * the previous node is a CurrentNodeSqlModel that is materialized as CTE,
+        * no other node references the previous node,
+        * the previous node has no limit, no group by, no having clause, and none of its columns contain an
+          aggregation or window function. Filtering before those would change their results,
+        * the condition doesn't contain subqueries, aggregation or window functions,
+        * the condition, and the columns of the previous node that it uses, are deterministic: they contain
+          no NonDeterministicExpression.
+    The column references in the condition are replaced by the expressions of those columns in the
+    previous node. If the previous node has a where-clause already, both conditions are combined.
+
+    :param dialect: SQL Dialect
+    :param model: model to optimize
+    :return: equivalent model. If no conditions can be moved, then this is model itself.
+    """
+    nodes = get_graph_index(model).topological_order(model)
+    reference_counts: Dict[int, int] = {}
+    for node in nodes:
+        for reference in node.references.values():
+            reference_counts[id(reference)] = reference_counts.get(id(reference), 0) + 1
+
+    # Updated select clauses and placeholders per node, identified by id().
+    # Nodes come after their references in `nodes`, so iterating in reverse a condition that is moved into
+    # a node, can be moved further when we get to that node.
+    new_clauses: Dict[int, SelectClauses] = {}
+    new_placeholders: Dict[int, Dict[str, Hashable]] = {}
+    for node in reversed(nodes):
+        if not isinstance(node, CurrentNodeSqlModel) or node.select_clauses is None:
+            continue
+        clauses = new_clauses.get(id(node), node.select_clauses)
+        predicate = _get_where_predicate(clauses)
+        previous = node.references['prev']
+        if (
+                predicate is None
+                or not predicate.data
+                or not isinstance(previous, CurrentNodeSqlModel)
+                or previous.select_clauses is None
+                or reference_counts[id(previous)] != 1
+        ):
+            continue
+        previous_clauses = new_clauses.get(id(previous), previous.select_clauses)
+        previous_predicate = _get_where_predicate(previous_clauses)
+        pushed_predicate = _get_pushed_down_predicate(previous, previous_clauses, predicate)
+        if previous_predicate is None or pushed_predicate is None:
+            continue
+        if previous_predicate.data:
+            pushed_predicate = Expression.construct('({}) and ({})', previous_predicate, pushed_predicate)
+
+        new_clauses[id(previous)] = previous_clauses._replace(
+            where_clause=Expression.construct('where {}', pushed_predicate)
+        )
+        new_clauses[id(node)] = clauses._replace(where_clause=Expression.construct(''))
+        # Values of placeholders that the condition uses. Values of other placeholders are filtered out by
+        # copy_select_clauses()
+        new_placeholders[id(previous)] = {
+            **new_placeholders.get(id(previous), previous.placeholders),
+            **new_placeholders.get(id(node), node.placeholders),
+        }
+
+    def copy_node(node: SqlModel, references: Dict[str, SqlModel]) -> Optional[SqlModel]:
+        if id(node) not in new_clauses:
+            return None
+        assert isinstance(node, CurrentNodeSqlModel)  # help mypy
+        return node.copy_select_clauses(
+            dialect=dialect,
+            select_clauses=new_clauses[id(node)],
+            references=references,
+            placeholders=new_placeholders.get(id(node), node.placeholders)
+        )
+    return _replace_nodes(model, nodes, copy_node)
+
+
+def prune_unused_columns(dialect: Dialect, model: TSqlModel) -> TSqlModel:
+    """
+    Projection pushdown: remove the columns from the nodes in the graph of model, that are not used by any
+    node that references them.
+
+    Without this, every column of a DataFrame is carried through every node of the graph, even if only a
+    few columns are used in the end. E.g. after selecting three columns of a wide DataFrame, the earlier
+    nodes would still calculate all other columns.
+
+    Only columns of nodes that are CurrentNodeSqlModels (i.e. created with
+    :py:meth:`bach.DataFrame.get_current_node()`) that are materialized as CTE are removed. And only if all
+    nodes that reference such a node, are CurrentNodeSqlModels that reference it as their previous node. To
+    not change the result of the query, no columns are removed from:
+        * the given model itself,
+        * nodes that select distinct rows,
+        * nodes that are referenced in another way, e.g. as a subquery in an expression.
+    Columns that are referenced in the where, group by, having, order by, and limit clauses of a node are
+    not removed from that node, nor from the previous node. Removing a column with an aggregation or window
+    function from the selected columns doesn't change the other columns, so such columns can be removed.
+
+    :param dialect: SQL Dialect
+    :param model: model to optimize
+    :return: equivalent model. If no columns can be removed, then this is model itself.
+    """
+    nodes = get_graph_index(model).topological_order(model)
+    # Columns to select per node, identified by id(). None means all columns.
+    # Nodes come after their references in `nodes`, so iterating in reverse we know all uses of a node
+    # before processing it.
+    required_columns: Dict[int, Optional[Set[str]]] = {id(model): None}
+    selected_columns: Dict[int, List[str]] = {}
+    for node in reversed(nodes):
+        select_clauses = node.select_clauses if isinstance(node, CurrentNodeSqlModel) else None
+        if select_clauses is None:
+            for reference in node.references.values():
+                required_columns[id(reference)] = None
+            continue
+        assert isinstance(node, CurrentNodeSqlModel)  # help mypy
+
+        clause_columns = _get_referenced_columns(select_clauses.get_clause_expressions())
+        columns = _get_columns_to_select(node, required_columns[id(node)], clause_columns)
+        selected_columns[id(node)] = columns
+        column_expressions = node.column_expressions
+        used_columns = _get_referenced_columns(column_expressions[name] for name in columns)
+        used_columns |= clause_columns
+        for reference_name, reference in node.references.items():
+            if reference_name == 'prev':
+                _add_required_columns(required_columns, reference, used_columns)
+            else:
+                required_columns[id(reference)] = None
+
+    def copy_node(node: SqlModel, references: Dict[str, SqlModel]) -> Optional[SqlModel]:
+        node_columns = selected_columns.get(id(node))
+        if isinstance(node, CurrentNodeSqlModel) and node_columns and len(node_columns) < len(node.columns):
+            return node.copy_select_columns(dialect, node_columns, references)
+        return None
+    return _replace_nodes(model, nodes, copy_node)
+
+
+def _replace_nodes(
+        model: TSqlModel,
+        nodes: List[SqlModel],
+        copy_node: Callable[[SqlModel, Dict[str, SqlModel]], Optional[SqlModel]]
+) -> TSqlModel:
+    """
+    Give model, with all nodes in its graph replaced by the result of copy_node.
+    :param nodes: all nodes of the graph of model in topological order, as given by
+        GraphIndex.topological_order()
+    :param copy_node: function that is called with a node and its updated references. Should return a
+        replacement for the node, or None if the node doesn't need to change itself.
+    """
+    # Nodes come after their references in `nodes`, so the replacements of a node's references are known
+    # when we get to the node.
+    replacements: Dict[int, SqlModel] = {}
+    for node in nodes:
+        references = node.references
+        new_references = {name: replacements[id(reference)] for name, reference in references.items()}
+        replacement = copy_node(node, new_references)
+        if replacement is not None:
+            replacements[id(node)] = replacement
+        elif any(new_references[name] is not reference for name, reference in references.items()):
+            replacements[id(node)] = node.copy_link(new_references)
+        else:
+            replacements[id(node)] = node
+    # help mypy, replacements of a node always have the same type as the node
+    return replacements[id(model)]  # type: ignore
+
+
+def _get_columns_to_select(
+        node: CurrentNodeSqlModel,
+        required_columns: Optional[Set[str]],
+        clause_columns: Set[str]
+) -> List[str]:
+    """
+    Give the columns of node that should be selected, in the original order.
+    :param required_columns: columns that are used by the nodes that reference node, or None for all.
+    :param clause_columns: columns that are referenced in the clauses of node.
+    """
+    select_clauses = node.select_clauses
+    assert select_clauses is not None  # help mypy
+    if (
+            required_columns is None
+            or select_clauses.distinct
+            or node.materialization != Materialization.CTE
+    ):
+        return list(node.columns)
+    # The order by and having clauses might refer the columns of the node itself, instead of the columns of
+    # the previous node. We keep those to be safe.
+    columns = [name for name in node.columns if name in required_columns or name in clause_columns]
+    if not columns:
+        # A query needs to select at least one column.
+        columns = [node.columns[0]]
+    return columns
+
+
+def _add_required_columns(
+        required_columns: Dict[int, Optional[Set[str]]],
+        node: SqlModel,
+        columns: Set[str]
+) -> None:
+    """ Add columns to the required columns of node. If all columns of node are required, do nothing. """
+    node_id = id(node)
+    if node_id not in required_columns:
+        required_columns[node_id] = set(columns)
+        return
+    node_columns = required_columns[node_id]
+    if node_columns is not None:
+        node_columns.update(columns)
+
+
+def _get_referenced_columns(expressions: Iterable[Expression]) -> Set[str]:
+    """
+    Give the names of all columns that are referenced in the expressions. This includes table-qualified
+    references, which might over-estimate the columns that are used, but never under-estimates them.
+    """
+    result = set()
+    for expression in expressions:
+        for token in expression.get_all_tokens():
+            if isinstance(token, (ColumnReferenceToken, TableColumnReferenceToken)):
+                result.add(token.column_name)
+    return result
+
+
+def _get_where_predicate(select_clauses: SelectClauses) -> Optional[Expression]:
+    """
+    Give the condition of the where-clause, i.e. without the 'where' keyword. Gives an empty Expression if
+    there is no where-clause, and None if the where-clause has an unexpected format.
+    """
+    where_clause = select_clauses.where_clause
+    if where_clause is None or not where_clause.data:
+        return Expression()
+    data = where_clause.data
+    if data[0] != RawToken('where '):
+        return None
+    return Expression(data[1:])
+
+
+def _get_pushed_down_predicate(
+        node: CurrentNodeSqlModel,
+        select_clauses: SelectClauses,
+        predicate: Expression
+) -> Optional[Expression]:
+    """
+    Give the equivalent of predicate, a condition on the columns of node, as a condition on the columns of
+    the previous node of node. Gives None if the condition cannot be moved into node.
+    :param select_clauses: the current select clauses of node
+    """
+    if (
+            node.materialization != Materialization.CTE
+            or select_clauses.group_by_clause is not None
+            or (select_clauses.having_clause is not None and select_clauses.having_clause.data)
+            or select_clauses.limit_clause.data
+            or any(
+                expr.has_aggregate_function or expr.has_windowed_aggregate_function
+                for expr in select_clauses.column_exprs
+            )
+            or predicate.get_references()
+            or predicate.has_aggregate_function
+            or predicate.has_windowed_aggregate_function
+            or predicate.has_multi_level_expressions
+            or predicate.has_non_deterministic_function
+    ):
+        return None
+
+    column_exprs = dict(zip(select_clauses.column_names, select_clauses.column_exprs))
+    replacements: Dict[str, Expression] = {}
+    for token in predicate.get_all_tokens():
+        if isinstance(token, TableColumnReferenceToken) and token.table_name is not None:
+            return None
+        if not isinstance(token, (ColumnReferenceToken, TableColumnReferenceToken)):
+            continue
+        name = token.column_name
+        if name in replacements:
+            continue
+        if name not in column_exprs:
+            return None
+        expression = _get_unaliased_expression(column_exprs[name], name)
+        if (
+                expression is None
+                or expression.has_multi_level_expressions
+                or expression.has_non_deterministic_function
+        ):
+            return None
+        tokens = expression.get_all_tokens()
+        if len(tokens) == 1 and isinstance(tokens[0], (ColumnReferenceToken, TableColumnReferenceToken)):
+            replacements[name] = expression
+        else:
+            replacements[name] = Expression.construct('({})', expression)
+    return _replace_column_references(predicate, replacements)
+
+
+def _get_unaliased_expression(column_expression: Expression, name: str) -> Optional[Expression]:
+    """
+    Give the expression of a column, without the alias. See Expression.construct_expr_as_name()
+    Gives None if the column expression has an unexpected format.
+    """
+    data = column_expression.data
+    if len(data) < 2 or data[-2] != RawToken(' as ') or data[-1] != Expression.identifier(name):
+        return None
+    return Expression(data[:-2])
+
+
+def _replace_column_references(expression: Expression, replacements: Mapping[str, Expression]) -> Expression:
+    """
+    Give a copy of expression, with all (table-)column references replaced by the expressions in
+    replacements. The types of all sub-expressions are kept.
+    """
+    data: List[Union[ExpressionToken, Expression]] = []
+    for item in expression.data:
+        if isinstance(item, Expression):
+            data.append(_replace_column_references(item, replacements))
+        elif isinstance(item, (ColumnReferenceToken, TableColumnReferenceToken)):
+            data.append(replacements[item.column_name])
+        else:
+            data.append(item)
+    return expression.__class__(data)
+
+
+class PlanStep(NamedTuple):
+    """ A decision that plan_materialization() made about a node in the graph. """
+    # Name of the node, as it appears in the generated sql before any changes
+    node_name: str
+    # One of: 'inline', 'temp_table', 'keep'
+    action: str
+    reason: str
+
+
+class MaterializationPlan(NamedTuple):
+    """ Explanation of the changes that plan_materialization() made, and of nodes that it kept as is. """
+    steps: Tuple[PlanStep, ...]
+
+    @property
+    def changed(self) -> bool:
+        """ True if the graph was changed. """
+        return any(step.action != 'keep' for step in self.steps)
+
+    def __str__(self) -> str:
+        if not self.steps:
+            return 'No changes.'
+        return '\n'.join(f'{step.action:<10} {step.node_name}: {step.reason}' for step in self.steps)
+
+
+def plan_materialization(
+        dialect: Dialect,
+        model: TSqlModel,
+        min_references: int = 2,
+        get_cost: Optional[Callable[[SqlModel], Optional[float]]] = None,
+        min_cost: float = 0
+) -> Tuple[TSqlModel, MaterializationPlan]:
+    """
+    Analyse the graph of model, and give an equivalent model with a better materialization of its nodes.
+
+    Two kind of changes are made:
+        1. Nodes that pass all columns of their previous node through unchanged (e.g. the result of
+           calling materialize() twice in a row) are removed. Nodes that reference them, reference the
+           previous node instead. Only CurrentNodeSqlModels that are materialized as CTE are removed.
+        2. Nodes that are materialized as CTE and that are referenced at least min_references times, are
+           materialized as temporary table instead. Some databases calculate a CTE again for each
+           reference. A temporary table is calculated once. Nodes without references of their own, i.e.
+           nodes that select directly from a source table, are never changed, as that would only copy the
+           data. If get_cost is set and gives a cost estimate for a node, the node is only changed if the
+           cost is at least min_cost.
+    The start node itself is never changed.
+
+    :param dialect: SQL Dialect
+    :param model: model to optimize
+    :param min_references: minimum number of references to a node, to materialize it as temporary table.
+    :param get_cost: optional function that gives the cost estimate of querying a node, or None if there
+        is no estimate for a node. See estimate_query_cost().
+    :param min_cost: minimum cost estimate to materialize a node as temporary table.
+    :return: tuple: equivalent model, and the explanation of the changes.
+    """
+    steps: List[PlanStep] = []
+    nodes = get_graph_index(model).topological_order(model)
+
+    def inline_node(node: SqlModel, references: Dict[str, SqlModel]) -> Optional[SqlModel]:
+        if node is model or not _is_pass_through_node(node):
+            return None
+        steps.append(PlanStep(
+            node_name=model_to_name(dialect, node),
+            action='inline',
+            reason=f'selects all columns of {model_to_name(dialect, node.references["prev"])} unchanged.'
+        ))
+        return references['prev']
+    model = _replace_nodes(model, nodes, inline_node)
+
+    nodes = get_graph_index(model).topological_order(model)
+    reference_counts: Dict[int, int] = {}
+    for node in nodes:
+        for reference in node.references.values():
+            reference_counts[id(reference)] = reference_counts.get(id(reference), 0) + 1
+
+    def promote_node(node: SqlModel, references: Dict[str, SqlModel]) -> Optional[SqlModel]:
+        count = reference_counts.get(id(node), 0)
+        if (
+                node is model
+                or count < min_references
+                or node.materialization != Materialization.CTE
+                or not node.references
+        ):
+            return None
+        node_name = model_to_name(dialect, node)
+        cost = get_cost(node) if get_cost is not None else None
+        reason = f'referenced {count} times'
+        if cost is not None:
+            reason += f', estimated cost {cost:.1f}'
+            if cost < min_cost:
+                reason += f', below the minimum of {min_cost}.'
+                steps.append(PlanStep(node_name=node_name, action='keep', reason=reason))
+                return None
+        steps.append(PlanStep(
+            node_name=node_name,
+            action='temp_table',
+            reason=f'{reason}, calculate it once instead of once per reference.'
+        ))
+        return node.copy_link(references).copy_set_materialization(Materialization.TEMP_TABLE)
+    model = _replace_nodes(model, nodes, promote_node)
+
+    return model, MaterializationPlan(steps=tuple(steps))
+
+
+def estimate_query_cost(engine: Engine, sql: str) -> Optional[float]:
+    """
+    Give the cost estimate of the query planner of the database for sql. The unit of the cost depends on
+    the database.
+    Only supported for Postgres, for which this is the total cost as given by `explain`. Gives None for
+    other databases, and if the database cannot explain the sql, e.g. because it consists of multiple
+    statements.
+
+    .. note::
+        This function queries the database.
+    """
+    if not is_postgres(engine):
+        return None
+    with engine.connect() as conn:
+        sql = escape_parameter_characters(conn, f'explain (format json) {sql}')
+        try:
+            plan = conn.execute(sql).scalar()
+        except DBAPIError:
+            return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return float(plan[0]['Plan']['Total Cost'])
+
+
+def _is_pass_through_node(node: SqlModel) -> bool:
+    """
+    Determine whether node is a CTE that selects all columns of its previous node, in the same order and
+    without changing them.
+    """
+    if not isinstance(node, CurrentNodeSqlModel) or node.materialization != Materialization.CTE:
+        return False
+    select_clauses = node.select_clauses
+    previous = node.references['prev']
+    if (
+            select_clauses is None
+            or select_clauses.distinct
+            or len(node.references) != 1
+            or not isinstance(previous, BachSqlModel)
+            or node.columns != previous.columns
+            or any(expr is not None and expr.data for expr in select_clauses.get_clause_expressions())
+    ):
+        return False
+    for name, column_expression in zip(select_clauses.column_names, select_clauses.column_exprs):
+        expression = _get_unaliased_expression(column_expression, name)
+        tokens = expression.get_all_tokens() if expression is not None else []
+        if (
+                len(tokens) != 1
+                or not isinstance(tokens[0], (ColumnReferenceToken, TableColumnReferenceToken))
+                or tokens[0].column_name != name
+                or (isinstance(tokens[0], TableColumnReferenceToken) and tokens[0].table_name is not None)
+        ):
+            return False
+    return True
@@ -1,16 +1,19 @@
 """
 Copyright 2022 Objectiv B.V.
 """
-from typing import TYPE_CHECKING, Optional, Union, List, cast
+from typing import TYPE_CHECKING, Optional, Union, List, Dict, Tuple
 
 import numpy
 import pandas
 
-from bach import SeriesAbstractNumeric, SeriesNumericInterval
+from bach.expression import Expression, join_expressions
+from bach.sql_model import BachSqlModel, construct_references
+from sql_models.model import SelectSqlModelBuilder, Materialization
 from sql_models.util import is_bigquery
 
 if TYPE_CHECKING:
-    from bach.dataframe import DataFrame
+    from bach.dataframe import DataFrame, ColumnFunction
+    from bach.series import Series
 
 
 class PlotHandler(object):
@@ -49,27 +52,24 @@ class PlotHandler(object):
                 "hist method requires numerical columns, nothing to plot."
             )
 
-        freq_df = self._calculate_hist_frequencies(bins, numeric_columns)
+        freq_pdf = self._calculate_hist_frequencies(bins, numeric_columns).to_pandas()
 
         # prepare results for Pandas hist compatibility
-        freq_df['lower_edge'] = cast(SeriesNumericInterval, freq_df['range']).lower
-        freq_pdf = freq_df.to_pandas()
+        edges_pdf = freq_pdf.groupby('bin')[['lower_edge', 'upper_edge']].first().sort_index()
         freq_pdf = freq_pdf.pivot_table(
             columns='column_label',
             values='frequency',
-            index='lower_edge',
+            index='bin',
             dropna=False,
             fill_value=0,
-        )
-        freq_pdf = freq_pdf.reset_index(level=-1, drop=False)
+        ).sort_index()
 
-        # get lower bounds per range and add the last upper bound (last_bin + bin_width)
-        bin_edges = freq_pdf['lower_edge'].to_numpy()
-        bin_width = numpy.ediff1d(bin_edges)[-1]
-        bin_edges = numpy.append(bin_edges, bin_edges[-1] + bin_width)
+        # get lower bounds per bin and add the upper bound of the last bin
+        bin_edges = numpy.append(edges_pdf['lower_edge'].to_numpy(), edges_pdf['upper_edge'].iloc[-1])
 
         # use calculated frequencies as weights, since Pandas will try to recalculate frequencies
-        hist_data = pandas.DataFrame(data={col: freq_pdf['lower_edge'] for col in numeric_columns})
+        lower_edges = edges_pdf['lower_edge'].to_numpy()
+        hist_data = pandas.DataFrame(data={col: lower_edges for col in numeric_columns})
         weights = freq_pdf[numeric_columns].to_numpy()
         return hist_data.plot.hist(bins=bin_edges, weights=weights, **kwargs)
 
@@ -77,32 +77,152 @@ class PlotHandler(object):
         """
         Helper for creating histogram's value frequencies per bin.
 
+        All bins have the same width, and are the same for all columns: from the minimum to the maximum of
+        all values. The first bin includes its lower edge, all bins include their upper edge. The
+        frequencies of all columns are counted in a single aggregation, without stacking the columns. The
+        result of that is a single row, which is unpivoted to a row per column and bin.
+
         returns a DataFrame containing the following data columns:
             * column_label (names of numeric columns)
-            * range (range of each bin)
-            * frequency (number of values the range contains for the column label)
+            * bin (number of the bin, 1 to bins)
+            * lower_edge (lower edge of the bin)
+            * upper_edge (upper edge of the bin)
+            * frequency (number of values in the bin for the column label)
         """
-        from bach.operations.cut import CutOperation
-
+        from bach.series import SeriesInt64
         df = self.df[numeric_columns].reset_index(drop=True)
-        # stack the df in order to have all numeric values in a single series
-        label_values_series = cast(SeriesAbstractNumeric, df.stack())
-        bins_per_col_df = CutOperation(
-            label_values_series,
-            bins=bins,
-            method='bach',
-            include_empty_bins=True,
-            ignore_index=False,
-        )().to_frame().reset_index(drop=False)
-
-        # create frequency distribution dataframe per label (numeric column)
-        # labels are contained in __stacked_index series (result from DataFrame.stack)
-        frequencies = bins_per_col_df.reset_index().groupby(by=['__stacked_index', 'range']).count()
-        frequencies = frequencies.reset_index(drop=False)
-
-        # rename columns to meaningful names
-        frequencies = frequencies.rename(
-            columns={'__stacked_index': 'column_label', '__stacked_count': 'frequency'},
+
+        min_max_df = df.agg(['min', 'max'])
+        min_max_df['hist_min'] = self._get_least_value(
+            [min_max_df[f'{col}_min'] for col in numeric_columns], 'least',
+        )
+        min_max_df['hist_max'] = self._get_least_value(
+            [min_max_df[f'{col}_max'] for col in numeric_columns], 'greatest',
+        )
+        min_max_df['hist_step'] = (min_max_df['hist_max'] - min_max_df['hist_min']) / bins
+        min_max_df = min_max_df[['hist_min', 'hist_step']].materialize(node_name='hist_min_max')
+
+        binned_df = df.merge(min_max_df, how='cross')
+        hist_min = binned_df['hist_min']
+        hist_step = binned_df['hist_step']
+        bin_columns = {}
+        for col_idx, col in enumerate(numeric_columns):
+            value = binned_df[col].astype('float64')
+            # width_bucket, with the first bin including its lower edge and the last bin its upper edge
+            binned_df[f'__hist_bin_{col_idx}'] = value.copy_override(
+                expression=Expression.construct(
+                    f'case when {{}} is null then null when {{}} = 0 then 1 '
+                    f'else least(greatest(cast(ceil(({{}} - {{}}) / {{}}) as bigint), 1), {bins}) end',
+                    value, hist_step, value, hist_min, hist_step,
+                ),
+            ).copy_override_type(SeriesInt64)
+        binned_df = binned_df.materialize(node_name='hist_bins')
+
+        for col_idx, col in enumerate(numeric_columns):
+            bin_series = binned_df[f'__hist_bin_{col_idx}']
+            for bin_nr in range(1, bins + 1):
+                bin_column = f'__hist_{col_idx}_{bin_nr}'
+                binned_df[bin_column] = bin_series.copy_override(
+                    expression=Expression.construct(
+                        f'case when {{}} = {bin_nr} then 1 else 0 end', bin_series,
+                    ),
+                )
+                bin_columns[bin_column] = (col, bin_nr)
+
+        aggregations: Dict[str, 'ColumnFunction'] = {
+            **{bin_column: 'sum' for bin_column in bin_columns},
+            'hist_min': 'min',
+            'hist_step': 'min',
+        }
+        counts_df = binned_df[list(aggregations)].agg(aggregations).materialize(node_name='hist_counts')
+
+        from bach import DataFrame
+        return DataFrame.from_model(
+            engine=self.df.engine,
+            model=_get_unpivot_frequencies_model(counts_df, bin_columns),
+            index=[],
+            all_dtypes={
+                'column_label': 'string',
+                'bin': 'int64',
+                'lower_edge': 'float64',
+                'upper_edge': 'float64',
+                'frequency': 'int64',
+            },
+        )
+
+    @staticmethod
+    def _get_least_value(series: List['Series'], function: str) -> 'Series':
+        """
+        Returns a series with the least (or greatest, depending on function) non-NULL value of the series.
+        """
+        # BigQuery's least/greatest give NULL if any value is NULL
+        all_values_fmt = f'coalesce({", ".join(["{}"] * len(series))})'
+        values_fmt = [f'coalesce({{}}, {all_values_fmt})'] * len(series)
+        return series[0].copy_override(
+            expression=Expression.construct(
+                f'{function}({", ".join(values_fmt)})',
+                *[arg for s in series for arg in [s, *series]],
+            ),
+        ).astype('float64')
+
+
+def _get_unpivot_frequencies_model(
+    counts_df: 'DataFrame', bin_columns: Dict[str, Tuple[str, int]],
+) -> BachSqlModel:
+    """
+    Creates a model that selects a row for each bin column of the single row in counts_df, with the
+    column_label, bin, lower_edge, upper_edge and frequency of the bin.
+    :param bin_columns: mapping of the columns of counts_df with counts to the column label and bin number
+    """
+    label_expr = Expression.identifier(name='column_label')
+    bin_expr = Expression.identifier(name='bin')
+    frequency_expr = Expression.identifier(name='frequency')
+    hist_min = counts_df['hist_min_min']
+    hist_step = counts_df['hist_step_min']
+    rows = [
+        (Expression.string_value(label), Expression.construct(str(bin_nr)), counts_df[f'{bin_column}_sum'])
+        for bin_column, (label, bin_nr) in bin_columns.items()
+    ]
+    if is_bigquery(counts_df.engine):
+        unpivot_expr = Expression.construct(
+            'UNNEST([{}])',
+            join_expressions([
+                Expression.construct(
+                    'STRUCT({} AS {}, {} AS {}, {} AS {})',
+                    label, label_expr, bin_nr, bin_expr, frequency, frequency_expr,
+                )
+                for label, bin_nr, frequency in rows
+            ])
+        )
+    else:
+        unpivot_expr = Expression.construct(
+            'LATERAL (VALUES {}) AS _unpivot({}, {}, {})',
+            join_expressions([Expression.construct('({}, {}, {})', *row) for row in rows]),
+            label_expr, bin_expr, frequency_expr,
         )
-        frequencies['column_label'] = frequencies['column_label'].fillna('empty_bins')
-        return frequencies[['column_label', 'frequency', 'range']]
+
+    column_expressions = {
+        'column_label': label_expr,
+        'bin': bin_expr,
+        'lower_edge': Expression.construct_expr_as_name(
+            Expression.construct('{} + ({} - 1) * {}', hist_min, bin_expr, hist_step), 'lower_edge',
+        ),
+        'upper_edge': Expression.construct_expr_as_name(
+            Expression.construct('{} + {} * {}', hist_min, bin_expr, hist_step), 'upper_edge',
+        ),
+        'frequency': frequency_expr,
+    }
+    sql_exprs = [
+        join_expressions(list(column_expressions.values())),
+        Expression.model_reference(counts_df.base_node),
+        unpivot_expr,
+    ]
+    sql = Expression.construct('SELECT {} FROM {} CROSS JOIN {}', *sql_exprs).to_sql(counts_df.engine.dialect)
+    return BachSqlModel(
+        model_spec=SelectSqlModelBuilder(sql=sql, name='hist_frequencies'),
+        placeholders={},
+        references=construct_references(base_references={}, expressions=sql_exprs),
+        materialization=Materialization.CTE,
+        materialization_name=None,
+        column_expressions=column_expressions,
+    )
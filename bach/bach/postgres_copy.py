@@ -0,0 +1,157 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Transfer of data between Postgres and pandas with `COPY ... TO STDOUT` and `COPY ... FROM STDIN`. For
+large data sets this is much faster and uses much less memory than fetching rows through SQLAlchemy, as
+the data is never converted to Python objects per value, but parsed column by column by pandas' csv parser.
+Similarly uploading data with COPY is much faster than inserting it with (multi-row) INSERT statements.
+"""
+import io
+from typing import Dict, Iterable, List, Mapping
+
+import pandas
+from sqlalchemy.engine import Engine
+
+from bach.session import connect
+from bach.utils import escape_parameter_characters
+from sql_models.util import is_postgres, quote_identifier
+
+# Whether DataFrame.to_pandas() uses copy_to_pandas() when possible. Set to False to always fetch data
+# through SQLAlchemy.
+copy_to_pandas_enabled = True
+
+# Dtypes of which the csv representation is parsed by pandas to the same values as fetching them through
+# SQLAlchemy gives. Other types (e.g. strings, for which csv doesn't distinguish null from an empty string
+# after parsing) always use the SQLAlchemy path.
+_COPY_TO_PANDAS_DTYPES = ('int64', 'float64', 'bool')
+
+
+# Dtypes that copy_from_pandas() can serialize to Postgres' COPY text format
+_COPY_FROM_PANDAS_DTYPES = ('int64', 'float64', 'bool', 'string', 'timestamp')
+
+
+def supports_copy(engine: Engine) -> bool:
+    """
+    Determine whether the engine can execute `COPY` statements with copy_to_pandas() or copy_from_pandas()
+    """
+    # We need the copy_expert() function of psycopg2's cursors
+    return is_postgres(engine) and getattr(engine.dialect, 'driver', None) == 'psycopg2'
+
+
+def supports_copy_to_pandas(engine: Engine, dtypes: Iterable[str]) -> bool:
+    """
+    Determine whether copy_to_pandas() can be used for a query result with columns of the given dtypes.
+    """
+    if not copy_to_pandas_enabled or not supports_copy(engine):
+        return False
+    return all(dtype in _COPY_TO_PANDAS_DTYPES for dtype in dtypes)
+
+
+def supports_copy_from_pandas(engine: Engine, dtypes: Iterable[str]) -> bool:
+    """
+    Determine whether copy_from_pandas() can be used to upload data with columns of the given dtypes.
+    """
+    return supports_copy(engine) and all(dtype in _COPY_FROM_PANDAS_DTYPES for dtype in dtypes)
+
+
+def copy_to_pandas(engine: Engine, statements: List[str], dtypes: Dict[str, str]) -> pandas.DataFrame:
+    """
+    Execute the statements and give the result of the last one, which must be a query, as pandas DataFrame.
+
+    :param engine: Postgres engine, using psycopg2.
+    :param statements: statements to execute in a single transaction. All but the last statement are
+        executed normally, e.g. to create temporary tables. The result of the last statement is copied.
+    :param dtypes: dtype per column of the result. See supports_copy_to_pandas() for supported dtypes.
+    :return: pandas DataFrame with a column per result column, without index.
+    """
+    buffer = io.BytesIO()
+    with connect(engine) as conn:
+        with conn.begin():
+            for statement in statements[:-1]:
+                conn.execute(escape_parameter_characters(conn, statement))
+            cursor = conn.connection.cursor()
+            try:
+                # Make sure floats are written with full precision, also on Postgres versions before 12
+                cursor.execute('set local extra_float_digits = 3')
+                copy_sql = f'copy ({statements[-1]}) to stdout with (format csv, header true)'
+                cursor.copy_expert(copy_sql, buffer)
+            finally:
+                cursor.close()
+    buffer.seek(0)
+
+    pandas_df = pandas.read_csv(
+        buffer,
+        # A null is an empty unquoted value, and 'NaN' is a float that is not a number. Both are NaN in the
+        # result of read_sql_query() too. All other values should be parsed as given.
+        keep_default_na=False,
+        na_values=['', 'NaN'],
+        true_values=['t'],
+        false_values=['f'],
+        dtype={name: 'float64' for name, dtype in dtypes.items() if dtype == 'float64'},
+    )
+    for name in pandas_df.columns:
+        column = pandas_df[name]
+        if column.dtype == 'object' or (len(column) > 0 and column.isna().all()):
+            # A bool column with nulls, or a column with only nulls. read_sql_query() gives objects with None
+            # for the nulls in those, not NaN.
+            pandas_df[name] = column.astype('object').where(column.notna(), None)
+    return pandas_df
+
+
+def copy_from_pandas(engine: Engine, df: pandas.DataFrame, table_name: str, dtypes: Mapping[str, str]):
+    """
+    Append the data of a pandas DataFrame to an existing table, using a single `COPY ... FROM STDIN`
+    statement.
+
+    :param engine: Postgres engine, using psycopg2.
+    :param df: data to upload. Nulls can be represented by either None or NaN.
+    :param table_name: name of the table to append to.
+    :param dtypes: bach dtype per column of df to upload. See supports_copy_from_pandas() for supported
+        dtypes.
+    """
+    column_names = ', '.join(quote_identifier(engine.dialect, name) for name in dtypes.keys())
+    copy_sql = f'copy {quote_identifier(engine.dialect, table_name)} ({column_names}) from stdin'
+    buffer = io.StringIO(_to_copy_text(df, dtypes))
+    with engine.connect() as conn:
+        with conn.begin():
+            cursor = conn.connection.cursor()
+            try:
+                cursor.copy_expert(copy_sql, buffer)
+            finally:
+                cursor.close()
+
+
+def _to_copy_text(df: pandas.DataFrame, dtypes: Mapping[str, str]) -> str:
+    """
+    Serialize the columns of df to Postgres' COPY text format: one line per row, with tab separated
+    values, in which nulls are represented by '\\N'.
+    """
+    if len(df) == 0:
+        return ''
+    text_columns = []
+    for name, dtype in dtypes.items():
+        column = df[name]
+        not_null = column.notna()
+        values = column[not_null]
+        if dtype == 'bool':
+            text_values = values.map({True: 't', False: 'f'})
+        elif dtype == 'float64':
+            # astype(str) gives the shortest representation that round-trips, and 'inf'/'-inf' for infinity
+            text_values = values.astype('float64').astype(str)
+        elif dtype == 'timestamp':
+            text_values = pandas.to_datetime(values).dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+        elif dtype == 'string':
+            text_values = (
+                values.astype(str)
+                .str.replace('\\', '\\\\', regex=False)
+                .str.replace('\t', '\\t', regex=False)
+                .str.replace('\n', '\\n', regex=False)
+                .str.replace('\r', '\\r', regex=False)
+            )
+        else:
+            text_values = values.astype('int64').astype(str)
+        text_column = pandas.Series('\\N', index=column.index, dtype='object')
+        text_column[not_null] = text_values
+        text_columns.append(text_column)
+    rows = text_columns[0].str.cat(text_columns[1:], sep='\t')
+    return '\n'.join(rows) + '\n'
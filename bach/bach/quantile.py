@@ -1,87 +1,201 @@
-from typing import cast, Union, List
+from typing import Union, List, Dict, Optional, TYPE_CHECKING
 
-from bach import SeriesString
 from bach.series import SeriesAbstractNumeric, SeriesTimedelta, Series
-from bach.expression import Expression, AggregateFunctionExpression, WindowFunctionExpression
+from bach.expression import Expression, AggregateFunctionExpression, join_expressions
 from bach.series.series import WrappedPartition
+from bach.sql_model import BachSqlModel, construct_references
+from sql_models.model import SelectSqlModelBuilder, Materialization
 from sql_models.util import is_bigquery
 
+if TYPE_CHECKING:
+    from bach import DataFrame
+
+_QUANTILE_IDENTIFIER_EXPR = Expression.identifier(name='__quantile')
+_VALUE_IDENTIFIER_EXPR = Expression.identifier(name='__quantile_value')
+
+# Number of intervals that approx_quantiles divides the values in on BigQuery. Requested quantiles are
+# rounded to a multiple of 1 / _BIGQUERY_APPROX_QUANTILES_BUCKETS
+_BIGQUERY_APPROX_QUANTILES_BUCKETS = 1000
+
 
 def calculate_quantiles(
     series: Union[SeriesTimedelta, SeriesAbstractNumeric],
     partition: WrappedPartition = None,
     q: Union[float, List[float]] = 0.5,
+    approx: bool = False,
 ) -> Series:
     """
     When q is a float or len(q) == 1, the resultant series index will remain
     In case multiple quantiles are calculated, the resultant series index will have all calculated
     quantiles as index values.
-    """
-    quantiles = [q] if isinstance(q, float) else q
-    quantile_results = []
 
-    partition = partition or series.group_by
-    #  BigQuery requires a window function for quantiles, window frame clause is not allowed
-    window = None
-    if is_bigquery(series.engine):
-        from bach.partitioning import Window, GroupBy
-        group_by = None
-        if partition:
-            group_by = partition if isinstance(partition, GroupBy) else partition.group_by
-        window = Window(
-            dialect=series.engine.dialect,
-            group_by_columns=list(group_by.index.values()) if group_by else [],
-            order_by=[],
-            start_boundary=None,
-            end_boundary=None,
-        )
+    All quantiles are calculated in a single pass over the data: on Postgres with one percentile_cont
+    aggregation that gives an array of all quantiles, on BigQuery with percentile_cont window functions
+    in a single select. The results are then unnested into one row per quantile.
 
+    If approx is True, BigQuery uses a single approx_quantiles aggregation instead, and Postgres
+    calculates the quantiles over a sample of the values (see :py:mod:`bach.approximation`).
+    """
+    quantiles = [q] if isinstance(q, float) else q
     for qt in quantiles:
         if qt < 0 or qt > 1:
             raise ValueError(f'value {qt} should be between 0 and 1.')
 
-        if is_bigquery(series.engine):
-            # BigQuery names should start with a letter or underscore. Dots are not valid
-            q_col_name = f"__q_{str(qt).replace('.', '_')}"
-            agg_result = series.copy_override(name=q_col_name)._derived_agg_func(
-                partition=window,
-                expression=Expression.construct(f'percentile_cont({{}}, {qt})', series),
+    partition = partition or series.group_by
+    if is_bigquery(series.engine) and not approx:
+        quantile_results = _calculate_quantiles_bigquery(series, partition, quantiles)
+        if len(quantile_results) == 1:
+            return quantile_results[0]
+        df = quantile_results[0].to_frame().copy_override(series={s.name: s for s in quantile_results})
+        if not partition:
+            df = df.reset_index(drop=True)
+        # BigQuery returns quantile per row, need to apply distinct
+        df = df.materialize(node_name='quantile', distinct=True)
+        value_exprs = [df.all_series[s.name].expression for s in quantile_results]
+        value_dtype = 'float64'
+    elif is_bigquery(series.engine):
+        quantiles_expr = AggregateFunctionExpression.construct(
+            f'approx_quantiles({{}}, {_BIGQUERY_APPROX_QUANTILES_BUCKETS})', series,
+        )
+        if len(quantiles) == 1:
+            return series.copy_override(name=f"__q_{str(quantiles[0]).replace('.', '_')}")._derived_agg_func(
+                partition=partition,
+                expression=AggregateFunctionExpression.construct(
+                    _get_bigquery_approx_quantile_fmt(quantiles[0]), quantiles_expr,
+                ),
                 dtype='float64',
             )
-        else:
-            agg_result = series.copy_override(name=str(qt))._derived_agg_func(
+        quantiles_series = series.copy_override(name='__quantiles')._derived_agg_func(
+            partition=partition, expression=quantiles_expr,
+        )
+        # The aggregation gives an array. The dtype of the series is not correct, but the series is only
+        # used by the model that unnests it.
+        df = quantiles_series.to_frame().materialize(node_name='quantile')
+        value_exprs = [
+            Expression.construct(_get_bigquery_approx_quantile_fmt(qt), df.all_series['__quantiles'])
+            for qt in quantiles
+        ]
+        value_dtype = 'float64'
+    else:
+        order_by: Union[Series, Expression] = series
+        if approx:
+            from bach.approximation import get_sampled_values_expression
+            order_by = get_sampled_values_expression(series)
+        if len(quantiles) == 1:
+            return series.copy_override(name=str(quantiles[0]))._derived_agg_func(
                 partition=partition,
                 expression=AggregateFunctionExpression.construct(
-                    f'percentile_cont({qt}) within group (order by {{}})', series,
+                    f'percentile_cont({quantiles[0]}) within group (order by {{}})', order_by,
                 ),
             )
-
-        quantile_results.append(agg_result)
-
-    base_q = quantile_results[0]
-    if len(quantile_results) == 1:
-        return base_q
-
-    df = base_q.to_frame().copy_override(series={s.name: s for s in quantile_results})
-    # stack all series into one. q values are in index
-    # should keep q index since multiple quantiles were calculated
-    final_index = (df.index_columns if partition else []) + ['q']
-    df = df.stack().to_frame()
-    df = df.reset_index(drop=False).rename(columns={'__stacked_index': 'q', '__stacked': series.name})
-    df = df[final_index + [series.name]]
-
-    if is_bigquery(series.engine):
-        # TODO: replace with df['q'].str[2:].str.replace('_', '.') when supported
-        df['q'] = df['q'].copy_override(
-            expression=Expression.construct(
-                f"replace({{}}, '_', '.')",
-                df['q'].copy_override_type(SeriesString).str[4:],
+        quantiles_series = series.copy_override(name='__quantiles')._derived_agg_func(
+            partition=partition,
+            expression=AggregateFunctionExpression.construct(
+                f'percentile_cont({_get_postgres_array(quantiles)}) within group (order by {{}})', order_by,
             ),
         )
+        # The aggregation gives an array. The dtype of the series is not correct, but the series is only
+        # used by the model that unnests it.
+        df = quantiles_series.to_frame().materialize(node_name='quantile')
+        value_exprs = [df.all_series['__quantiles'].expression]
+        value_dtype = series.dtype
 
-        # BigQuery returns quantile per row, need to apply distinct
-        df = df.materialize(node_name='quantile', distinct=True)
+    model = _get_unnest_quantiles_model(
+        df=df, quantiles=quantiles, value_exprs=value_exprs, value_name=series.name,
+    )
+    final_index = df.index_columns + ['q']
+    from bach import DataFrame
+    df = DataFrame.from_model(
+        engine=series.engine,
+        model=model,
+        index=final_index,
+        all_dtypes={
+            **{idx.name: idx.dtype for idx in df.index.values()},
+            'q': 'float64',
+            series.name: value_dtype,
+        },
+    )
+    return df[series.name]
+
+
+def _calculate_quantiles_bigquery(
+    series: Union[SeriesTimedelta, SeriesAbstractNumeric],
+    partition: Optional[WrappedPartition],
+    quantiles: List[float],
+) -> List[Series]:
+    """
+    Returns a series per quantile. BigQuery requires a window function for quantiles, window frame
+    clause is not allowed. All series use the same window, so they are calculated in one pass.
+    """
+    from bach.partitioning import Window, GroupBy
+    group_by = None
+    if partition:
+        group_by = partition if isinstance(partition, GroupBy) else partition.group_by
+    window = Window(
+        dialect=series.engine.dialect,
+        group_by_columns=list(group_by.index.values()) if group_by else [],
+        order_by=[],
+        start_boundary=None,
+        end_boundary=None,
+    )
+    result = []
+    for qt in quantiles:
+        # BigQuery names should start with a letter or underscore. Dots are not valid
+        q_col_name = f"__q_{str(qt).replace('.', '_')}"
+        result.append(
+            series.copy_override(name=q_col_name)._derived_agg_func(
+                partition=window,
+                expression=Expression.construct(f'percentile_cont({{}}, {qt})', series),
+                dtype='float64',
+            )
+        )
+    return result
+
+
+def _get_bigquery_approx_quantile_fmt(qt: float) -> str:
+    """ Format string that gives quantile qt from the array of an approx_quantiles aggregation. """
+    return f'cast({{}}[offset({round(qt * _BIGQUERY_APPROX_QUANTILES_BUCKETS)})] as float64)'
+
+
+def _get_postgres_array(quantiles: List[float]) -> str:
+    return f'cast(array[{", ".join(str(qt) for qt in quantiles)}] as double precision[])'
+
+
+def _get_unnest_quantiles_model(
+    df: 'DataFrame', quantiles: List[float], value_exprs: List[Expression], value_name: str,
+) -> BachSqlModel:
+    """
+    Creates a model that selects a row per quantile for each row of the materialized df. The quantile is
+    selected as column 'q', and its value as column value_name.
+    On Postgres value_exprs is the column with the array of all quantiles, on BigQuery it has a column
+    per quantile.
+    """
+    from_model_expr = Expression.model_reference(df.base_node)
+    if is_bigquery(df.engine):
+        structs = [
+            Expression.construct(f'STRUCT({float(qt)} AS {{}}, {{}} AS {{}})',
+                                 _QUANTILE_IDENTIFIER_EXPR, value_expr, _VALUE_IDENTIFIER_EXPR)
+            for qt, value_expr in zip(quantiles, value_exprs)
+        ]
+        unnest_expr = Expression.construct('UNNEST([{}])', join_expressions(structs))
+    else:
+        unnest_expr = Expression.construct(
+            f'unnest({_get_postgres_array(quantiles)}, {{}}) AS _unnested({{}}, {{}})',
+            value_exprs[0], _QUANTILE_IDENTIFIER_EXPR, _VALUE_IDENTIFIER_EXPR,
+        )
 
-    # q values should be numeric
-    df['q'] = df['q'].astype(float)
-    return df.set_index(final_index)[series.name]
+    column_expressions: Dict[str, Expression] = {
+        **{idx.name: idx.expression for idx in df.index.values()},
+        'q': Expression.construct_expr_as_name(expr=_QUANTILE_IDENTIFIER_EXPR, name='q'),
+        value_name: Expression.construct_expr_as_name(expr=_VALUE_IDENTIFIER_EXPR, name=value_name),
+    }
+    sql_exprs = [join_expressions(list(column_expressions.values())), from_model_expr, unnest_expr]
+    sql = Expression.construct('SELECT {} FROM {} CROSS JOIN {}', *sql_exprs).to_sql(df.engine.dialect)
+    return BachSqlModel(
+        model_spec=SelectSqlModelBuilder(sql=sql, name='unnest_quantiles'),
+        placeholders={},
+        references=construct_references(base_references={}, expressions=sql_exprs),
+        materialization=Materialization.CTE,
+        materialization_name=None,
+        column_expressions=column_expressions,
+    )
@@ -0,0 +1,397 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Opt-in cache of query results. Notebooks often run the same query over an unchanged DataFrame multiple
+times, e.g. when cells are re-run. With a ResultCache set (see set_result_cache()), DataFrame.to_pandas()
+and everything that is built on it (e.g. head(), Series.value) only query the database if the result is
+not in the cache.
+
+The cache has two tiers: an in-memory LRU cache, and an optional on-disk cache with a parquet file per
+result. Cached results are identified by the engine url, the dialect, the hash of the final SqlModel (which
+uniquely identifies the generated sql), and the limit.
+
+Cached results are never refreshed automatically. A result expires after `ttl` seconds, or after the
+freshness window of any of the source tables that the query reads from. Results can also be invalidated
+explicitly with ResultCache.invalidate() and ResultCache.clear().
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Mapping, Tuple, Iterable, Dict, List, Union
+
+import pandas
+from sqlalchemy.engine import Engine
+
+from sql_models.graph_operations import find_nodes
+from sql_models.model import SqlModel, Materialization
+
+
+# Dtypes of which the values are read back unchanged from a parquet file. Results with columns of other
+# dtypes (e.g. json) are only cached in memory.
+_DISK_CACHE_DTYPES = ('int64', 'float64', 'bool', 'string', 'timestamp', 'date', 'timedelta')
+
+
+class CacheKey(NamedTuple):
+    engine_url: str
+    dialect: str
+    model_hash: str
+    limit: str
+
+
+class CacheStats(NamedTuple):
+    """ Statistics of a ResultCache, since its creation or since the last call to reset_stats() """
+    hits: int
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    # Number of results that were found, but had expired
+    expired: int
+    # Number of results that were removed from a tier to stay within its size limits
+    evictions: int
+    memory_entries: int
+    memory_bytes: int
+    disk_entries: int
+    disk_bytes: int
+
+
+class _CacheEntry(NamedTuple):
+    df: pandas.DataFrame
+    created: float
+    source_tables: Tuple[str, ...]
+    nbytes: int
+
+
+class ResultCache:
+    """
+    Cache of query results, with an in-memory LRU tier and an optional on-disk parquet tier.
+
+    All methods are thread-safe.
+    """
+    def __init__(
+            self,
+            max_memory_entries: int = 128,
+            max_memory_bytes: int = 512 * 1024 ** 2,
+            directory: str = None,
+            max_disk_bytes: int = 4 * 1024 ** 3,
+            ttl: float = None,
+            source_freshness: Mapping[str, float] = None
+    ):
+        """
+        :param max_memory_entries: maximum number of results in the memory tier.
+        :param max_memory_bytes: maximum total size of the results in the memory tier, as given by
+            pandas.DataFrame.memory_usage(deep=True).
+        :param directory: directory of the disk tier. If None, results are only cached in memory.
+        :param max_disk_bytes: maximum total size of the parquet files in the disk tier.
+        :param ttl: number of seconds after which a result expires. If None, results don't expire, unless
+            they read from a table in source_freshness.
+        :param source_freshness: maps names of source tables to the number of seconds that a result that
+            reads from that table remains valid. Use this for tables that get new data regularly.
+        """
+        if max_memory_entries < 0 or max_memory_bytes < 0 or max_disk_bytes < 0:
+            raise ValueError('Cache size limits must be non-negative.')
+        self._max_memory_entries = max_memory_entries
+        self._max_memory_bytes = max_memory_bytes
+        self._directory = directory
+        self._max_disk_bytes = max_disk_bytes
+        self._ttl = ttl
+        self._source_freshness = dict(source_freshness) if source_freshness else {}
+
+        self._lock = threading.RLock()
+        self._memory: 'OrderedDict[CacheKey, _CacheEntry]' = OrderedDict()
+        self._memory_bytes = 0
+        self._counters: Dict[str, int] = {}
+        self.reset_stats()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            disk_files = self._get_disk_files()
+            return CacheStats(
+                hits=self._counters['hits'],
+                memory_hits=self._counters['memory_hits'],
+                disk_hits=self._counters['disk_hits'],
+                misses=self._counters['misses'],
+                expired=self._counters['expired'],
+                evictions=self._counters['evictions'],
+                memory_entries=len(self._memory),
+                memory_bytes=self._memory_bytes,
+                disk_entries=len(disk_files),
+                disk_bytes=sum(size for _, size, _ in disk_files)
+            )
+
+    def reset_stats(self):
+        """ Set all hit, miss, expiration and eviction counters to zero. """
+        with self._lock:
+            self._counters = {
+                'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0
+            }
+
+    def get(self, key: CacheKey) -> Optional[pandas.DataFrame]:
+        """
+        Get the cached result for key, or None if there is no valid result in the cache.
+        The returned DataFrame is a copy, modifying it doesn't affect the cache.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._is_expired(entry):
+                    self._counters['expired'] += 1
+                    self._remove_from_memory(key)
+                    self._remove_from_disk(key)
+                else:
+                    self._memory.move_to_end(key)
+                    self._counters['hits'] += 1
+                    self._counters['memory_hits'] += 1
+                    return entry.df.copy()
+
+            entry = self._read_from_disk(key)
+            if entry is not None:
+                self._counters['hits'] += 1
+                self._counters['disk_hits'] += 1
+                self._add_to_memory(key, entry)
+                return entry.df.copy()
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(
+            self,
+            key: CacheKey,
+            df: pandas.DataFrame,
+            source_tables: Iterable[str] = tuple(),
+            persist: bool = True
+    ):
+        """
+        Add a result to the cache.
+
+        :param key: key of the result
+        :param df: result. A copy is stored.
+        :param source_tables: names of the source tables that the query of the result reads from.
+        :param persist: If False, the result is only cached in memory. See supports_disk_cache().
+        """
+        df = df.copy()
+        entry = _CacheEntry(
+            df=df,
+            created=time.time(),
+            source_tables=tuple(source_tables),
+            nbytes=int(df.memory_usage(deep=True, index=True).sum())
+        )
+        with self._lock:
+            self._remove_from_memory(key)
+            self._add_to_memory(key, entry)
+            if persist:
+                self._write_to_disk(key, entry)
+
+    def invalidate(self, engine_url: str = None, source_table: str = None) -> int:
+        """
+        Remove results from the cache. If both engine_url and source_table are None, all results are removed.
+
+        :param engine_url: Only remove the results of queries on the database with this url, see
+            get_cache_key().
+        :param source_table: Only remove the results of queries that read from this source table.
+        :return: number of removed results.
+        """
+        def matches(entry_engine_url: str, entry_source_tables: Iterable[str]) -> bool:
+            return (
+                (engine_url is None or entry_engine_url == engine_url) and
+                (source_table is None or source_table in entry_source_tables)
+            )
+
+        with self._lock:
+            removed = set()
+            for key, entry in list(self._memory.items()):
+                if matches(key.engine_url, entry.source_tables):
+                    self._remove_from_memory(key)
+                    removed.add(key)
+            for path, _, _ in self._get_disk_files():
+                metadata = self._read_metadata(path)
+                if metadata is None:
+                    continue
+                key = CacheKey(*metadata['key'])
+                if matches(key.engine_url, metadata['source_tables']):
+                    self._remove_from_disk(key)
+                    removed.add(key)
+            return len(removed)
+
+    def clear(self) -> int:
+        """ Remove all results from the cache. Returns the number of removed results. """
+        return self.invalidate()
+
+    def _is_expired(self, entry: Union[_CacheEntry, 'dict']) -> bool:
+        """ Check whether the entry, or the metadata of a disk entry, is expired. """
+        if isinstance(entry, dict):
+            created, source_tables = entry['created'], entry['source_tables']
+        else:
+            created, source_tables = entry.created, entry.source_tables
+        age = time.time() - created
+        if self._ttl is not None and age > self._ttl:
+            return True
+        return any(
+            age > self._source_freshness[table] for table in source_tables if table in self._source_freshness
+        )
+
+    def _add_to_memory(self, key: CacheKey, entry: _CacheEntry):
+        if entry.nbytes > self._max_memory_bytes or self._max_memory_entries == 0:
+            return
+        self._memory[key] = entry
+        self._memory_bytes += entry.nbytes
+        while len(self._memory) > self._max_memory_entries or self._memory_bytes > self._max_memory_bytes:
+            oldest_key = next(iter(self._memory))
+            self._remove_from_memory(oldest_key)
+            self._counters['evictions'] += 1
+
+    def _remove_from_memory(self, key: CacheKey):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry.nbytes
+
+    def _get_disk_path(self, key: CacheKey) -> str:
+        assert self._directory is not None
+        name = hashlib.sha256(json.dumps(list(key)).encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, f'{name}.parquet')
+
+    def _get_disk_files(self) -> List[Tuple[str, int, float]]:
+        """ Give path, size, and modification time of all parquet files in the disk tier. """
+        if self._directory is None:
+            return []
+        result = []
+        for file_name in os.listdir(self._directory):
+            if not file_name.endswith('.parquet'):
+                continue
+            path = os.path.join(self._directory, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            result.append((path, stat.st_size, stat.st_mtime))
+        return result
+
+    @staticmethod
+    def _read_metadata(path: str) -> Optional[dict]:
+        try:
+            with open(f'{path}.json') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _read_from_disk(self, key: CacheKey) -> Optional[_CacheEntry]:
+        if self._directory is None:
+            return None
+        path = self._get_disk_path(key)
+        metadata = self._read_metadata(path)
+        if metadata is None or not os.path.exists(path):
+            return None
+        if self._is_expired(metadata):
+            self._counters['expired'] += 1
+            self._remove_from_disk(key)
+            return None
+        try:
+            df = pandas.read_parquet(path)
+        except Exception:
+            # Unreadable file, e.g. partially written or pyarrow isn't available
+            self._remove_from_disk(key)
+            return None
+        # Update the modification time, so least recently used files get evicted first
+        os.utime(path)
+        return _CacheEntry(
+            df=df,
+            created=metadata['created'],
+            source_tables=tuple(metadata['source_tables']),
+            nbytes=int(df.memory_usage(deep=True, index=True).sum())
+        )
+
+    def _write_to_disk(self, key: CacheKey, entry: _CacheEntry):
+        if self._directory is None:
+            return
+        path = self._get_disk_path(key)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            entry.df.to_parquet(temp_path)
+        except Exception:
+            # Data that cannot be stored as parquet, or pyarrow isn't available. Only cache in memory.
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        with open(f'{path}.json', 'w') as file:
+            metadata = {'key': list(key), 'created': entry.created, 'source_tables': entry.source_tables}
+            json.dump(metadata, file)
+        os.replace(temp_path, path)
+        self._evict_from_disk()
+
+    def _remove_from_disk(self, key: CacheKey):
+        if self._directory is None:
+            return
+        path = self._get_disk_path(key)
+        for file_path in (path, f'{path}.json'):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def _evict_from_disk(self):
+        """ Remove the least recently used files until the disk tier is within max_disk_bytes. """
+        disk_files = sorted(self._get_disk_files(), key=lambda disk_file: disk_file[2])
+        total_bytes = sum(size for _, size, _ in disk_files)
+        for path, size, _ in disk_files:
+            if total_bytes <= self._max_disk_bytes:
+                break
+            for file_path in (path, f'{path}.json'):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            total_bytes -= size
+            self._counters['evictions'] += 1
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def set_result_cache(cache: Optional[ResultCache]):
+    """
+    Set the ResultCache that DataFrame.to_pandas() uses. If None (the default), no results are cached.
+    """
+    global _result_cache
+    _result_cache = cache
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """ Get the ResultCache that DataFrame.to_pandas() uses, or None if no results are cached. """
+    return _result_cache
+
+
+def get_engine_url(engine: Engine) -> str:
+    """ Give the url of the engine, without password. """
+    url = engine.url
+    if hasattr(url, 'render_as_string'):
+        return url.render_as_string(hide_password=True)
+    return str(url)
+
+
+def get_cache_key(engine: Engine, model: SqlModel, limit: Union[int, slice, None]) -> CacheKey:
+    """
+    Give the key of the result of the query of the model.
+
+    :param engine: engine that the query is executed on.
+    :param model: final model of the query, with all placeholder values set.
+    :param limit: the limit that was applied to the query.
+    """
+    return CacheKey(
+        engine_url=get_engine_url(engine),
+        dialect=engine.dialect.name,
+        model_hash=model.hash,
+        limit=repr(limit)
+    )
+
+
+def get_source_tables(model: SqlModel) -> List[str]:
+    """ Give the names of all source tables that the query of the model reads from. """
+    found_nodes = find_nodes(model, lambda node: node.materialization == Materialization.SOURCE)
+    return sorted({found_node.model.materialization_name for found_node in found_nodes
+                   if found_node.model.materialization_name is not None})
+
+
+def supports_disk_cache(dtypes: Iterable[str]) -> bool:
+    """ Determine whether a result with columns of the given dtypes can be cached on disk. """
+    return all(dtype in _DISK_CACHE_DTYPES for dtype in dtypes)
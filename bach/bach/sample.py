@@ -7,7 +7,7 @@ from bach import DataFrame
 from bach.dataframe import escape_parameter_characters
 from bach.sql_model import SampleSqlModel
 from sql_models.graph_operations import find_node, replace_node_in_graph
-from sql_models.model import CustomSqlModelBuilder, Materialization
+from sql_models.model import SelectSqlModelBuilder, Materialization
 from sql_models.sql_generator import to_sql
 from sql_models.util import quote_identifier, is_postgres, is_bigquery, DatabaseNotSupportedException
 
@@ -58,7 +58,7 @@ def get_sample(df: DataFrame,
             # 2. Get SqlModel that queries that temporary table with `tablesample`
             # 3. Build a new DataFrame that uses the model from step 2 as base_node.
             temp_table_model = original_node.copy_set_materialization(Materialization.TEMP_TABLE)
-            model_builder = CustomSqlModelBuilder(
+            model_builder = SelectSqlModelBuilder(
                 sql='select * from {{table}} tablesample bernoulli({sample_percentage}) repeatable ({seed})',
                 name='get_sample'
             )
@@ -8,7 +8,7 @@ from sqlalchemy.engine import Engine, Dialect
 
 from bach import DataFrame
 from bach.sql_model import BachSqlModel
-from sql_models.model import Materialization, SqlModel, CustomSqlModelBuilder
+from sql_models.model import Materialization, SqlModel, SelectSqlModelBuilder
 from sql_models.sql_generator import to_sql_materialized_nodes, GeneratedSqlStatement
 from sql_models.util import quote_identifier
 
@@ -288,7 +288,7 @@ def _get_virtual_node(references: Dict[str, BachSqlModel]) -> SqlModel:
     # reference_sql is of form "{{ref_0}}, {{1}}, ..., {{n}}"
     reference_sql = ', '.join(f'{{{{{ref_name}}}}}' for ref_name in references.keys())
     sql = f'select * from {reference_sql}'
-    return CustomSqlModelBuilder(name='virtual_node', sql=sql)\
+    return SelectSqlModelBuilder(name='virtual_node', sql=sql)\
         .set_materialization(Materialization.VIRTUAL_NODE)\
         .set_values(**references)\
         .instantiate()
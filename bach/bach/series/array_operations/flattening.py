@@ -3,7 +3,7 @@ from typing import TypeVar, Dict, Tuple, cast
 
 from bach.expression import Expression, join_expressions
 from bach.sql_model import BachSqlModel, construct_references
-from sql_models.model import CustomSqlModelBuilder, Materialization
+from sql_models.model import SelectSqlModelBuilder, Materialization
 
 from bach.series import SeriesJson, SeriesInt64
 
@@ -90,7 +90,7 @@ class ArrayFlattening(ABC):
         sql = Expression.construct('SELECT {} FROM {} CROSS JOIN {}', *sql_exprs).to_sql(dialect)
 
         return BachSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name='unnest_array'),
+            model_spec=SelectSqlModelBuilder(sql=sql, name='unnest_array'),
             placeholders={},
             references=construct_references(base_references={}, expressions=sql_exprs),
             materialization=Materialization.CTE,
@@ -26,7 +26,7 @@ from bach.utils import (
 )
 from sql_models.constants import NotSet, not_set, DBDialect
 from sql_models.model import Materialization
-from sql_models.util import is_bigquery, DatabaseNotSupportedException
+from sql_models.util import is_bigquery, is_athena, DatabaseNotSupportedException
 
 if TYPE_CHECKING:
     from bach.partitioning import GroupBy, Window, WindowFunction
@@ -597,6 +597,7 @@ class Series(ABC):
         level: Union[int, str] = -1,
         fill_value: Optional[Union[int, float, str, UUID]] = None,
         aggregation: str = 'max',
+        categories: Optional[Sequence[Union[int, float, str, UUID]]] = None,
     ) -> 'DataFrame':
         """
         Pivot a level of the index labels.
@@ -611,13 +612,17 @@ class Series(ABC):
             series that is unstacked.
         :param aggregation: method of aggregation, in case of duplicate index values. Supports all aggregation
             methods that :py:meth:`aggregate` supports.
+        :param categories: the values of the unstacked index to create columns for. Rows with other values
+            are ignored. If not set, the unique values of the unstacked index are used.
 
         :returns: DataFrame
 
         .. note::
-            This function queries the database.
+            This function queries the database to get the unique values of the unstacked index, unless
+            `categories` is set or the values are cached by a category cache that has been set. See
+            :py:mod:`bach.categories`.
         """
-        result = self.to_frame().unstack(level, fill_value, aggregation)
+        result = self.to_frame().unstack(level, fill_value, aggregation, categories)
         return result.rename(columns={col: col.replace(f'__{self.name}', '') for col in result.data_columns})
 
     def get_column_expression(self, table_alias: Optional[str] = None) -> Expression:
@@ -1608,19 +1613,39 @@ class Series(ABC):
         )
         return cast(SeriesSubType, result)
 
-    def nunique(self, partition: WrappedPartition = None, skipna: bool = True) -> 'SeriesInt64':
+    def nunique(
+        self, partition: WrappedPartition = None, skipna: bool = True, approx: bool = False,
+    ) -> 'SeriesInt64':
         """
         Returns the amount of unique values in each partition or for all values if none is given.
 
         :param partition: The partition or window to apply
         :param skipna: only ``skipna=True`` supported. This means NULL values are ignored.
+        :param approx: if True, an approximation of the amount of unique values is calculated, which is
+            faster on large datasets.
         :returns: a new Series with the aggregation applied
+
+        .. note::
+            With ``approx=True``, BigQuery uses ``APPROX_COUNT_DISTINCT`` and Athena ``APPROX_DISTINCT``.
+            Postgres counts the unique values in a sample of the values, and scales that up. See
+            :py:mod:`bach.approximation` for the sample rate, and the error bound of the result.
         """
         from bach.partitioning import Window
         partition = self._check_unwrap_groupby(partition, notin=(Window, ))
+        expression = AggregateFunctionExpression.construct('count(distinct {})', self)
+        if approx and is_bigquery(self.engine):
+            expression = AggregateFunctionExpression.construct('approx_count_distinct({})', self)
+        elif approx and is_athena(self.engine):
+            expression = AggregateFunctionExpression.construct('approx_distinct({})', self)
+        elif approx:
+            from bach.approximation import get_sampled_values_expression, get_approx_sample_rate
+            expression = AggregateFunctionExpression.construct(
+                f'cast(round(count(distinct {{}}) / {get_approx_sample_rate()}) as bigint)',
+                get_sampled_values_expression(self, by_value=True),
+            )
         result = self._derived_agg_func(
             partition=partition, dtype='int64',
-            expression=AggregateFunctionExpression.construct('count(distinct {})', self),
+            expression=expression,
             skipna=skipna)
 
         return cast('SeriesInt64', result)
@@ -1871,17 +1896,19 @@ class Series(ABC):
         self,
         percentiles: Optional[Sequence[float]] = None,
         datetime_is_numeric: bool = False,
+        approx: bool = False,
     ) -> 'Series':
         """
         Returns descriptive statistics, it will vary based on what is provided
 
         :param percentiles: list of percentiles to be calculated. Values must be between 0 and 1.
         :param datetime_is_numeric: not supported
+        :param approx: if True, nunique and the percentiles are approximated. See :py:meth:`nunique`.
         :returns: a new Series with the descriptive statistics
         """
         from bach.operations.describe import SeriesDescribeOperation
         return SeriesDescribeOperation(
-            obj=self, datetime_is_numeric=datetime_is_numeric, percentiles=percentiles,
+            obj=self, datetime_is_numeric=datetime_is_numeric, percentiles=percentiles, approx=approx,
         )()
 
     def drop_duplicates(self: SeriesSubType, keep: Union[str, bool] = 'first') -> SeriesSubType:
@@ -1921,6 +1948,7 @@ class Series(ABC):
         ascending: bool = False,
         bins: Optional[int] = None,
         method: str = 'pandas',
+        approx: bool = False,
     ) -> 'Series':
         """
         Returns a series containing counts per unique value
@@ -1938,6 +1966,10 @@ class Series(ABC):
                 - "bach": No bound adjustments are performed. Instead, first interval includes both
                   lower and upper bounds.
 
+        :param approx: if True, the counts are estimated from a sample of the rows, which is faster on
+            large datasets. Values that are not in the sample are left out. See
+            :py:meth:`DataFrame.value_counts`.
+
         :return: a series containing all counts per unique row.
         """
         from bach.series.series_numeric import SeriesAbstractNumeric
@@ -1945,7 +1977,9 @@ class Series(ABC):
             raise ValueError('Cannot calculate bins for non numeric series.')
 
         if not bins:
-            return self.to_frame().value_counts(normalize=normalize, sort=sort, ascending=ascending)
+            return self.to_frame().value_counts(
+                normalize=normalize, sort=sort, ascending=ascending, approx=approx,
+            )
 
         from bach.operations.cut import CutOperation, CutMethod
         if not any(method == valid_method.value for valid_method in CutMethod):
@@ -1960,7 +1994,7 @@ class Series(ABC):
 
         # count only the bins that actually have value in the series
         # sort is not needed since final result is sorted after appending empty bins
-        value_counts_result = bins_w_values_df.value_counts(normalize=normalize, sort=False)
+        value_counts_result = bins_w_values_df.value_counts(normalize=normalize, sort=False, approx=approx)
 
         assert isinstance(empty_bins_df, DataFrame)
         empty_bins_df['value_counts'] = 0
@@ -908,22 +908,24 @@ class SeriesTimedelta(SeriesAbstractDateTime):
         )
 
     def quantile(
-        self, partition: WrappedPartition = None, q: Union[float, List[float]] = 0.5,
+        self, partition: WrappedPartition = None, q: Union[float, List[float]] = 0.5, approx: bool = False,
     ) -> 'SeriesTimedelta':
         """
         When q is a float or len(q) == 1, the resultant series index will remain
         In case multiple quantiles are calculated, the resultant series index will have all calculated
         quantiles as index values.
+
+        :param approx: if True, approximate quantiles are calculated. See :py:meth:`SeriesFloat64.quantile`.
         """
         from bach.quantile import calculate_quantiles
 
         if not is_bigquery(self.engine):
             return (
-                calculate_quantiles(series=self.copy(), partition=partition, q=q)
+                calculate_quantiles(series=self.copy(), partition=partition, q=q, approx=approx)
                 .copy_override_type(SeriesTimedelta)
             )
 
-        result = calculate_quantiles(series=self.dt.total_seconds, partition=partition, q=q)
+        result = calculate_quantiles(series=self.dt.total_seconds, partition=partition, q=q, approx=approx)
         # result must be a timedelta
         return self._convert_total_seconds_to_timedelta(result.copy_override_type(SeriesFloat64))
 
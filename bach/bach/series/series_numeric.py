@@ -10,7 +10,7 @@ from sqlalchemy.engine import Dialect
 
 from bach import DataFrameOrSeries
 from bach.series import Series
-from bach.expression import Expression, AggregateFunctionExpression
+from bach.expression import Expression, AggregateFunctionExpression, NonDeterministicExpression
 from bach.series.series import WrappedPartition
 from bach.types import StructuredDtype
 from sql_models.constants import DBDialect
@@ -167,7 +167,11 @@ class SeriesAbstractNumeric(Series, ABC):
         )
 
     def quantile(
-        self, partition: WrappedPartition = None, q: Union[float, List[float]] = 0.5, **kwargs
+        self,
+        partition: WrappedPartition = None,
+        q: Union[float, List[float]] = 0.5,
+        approx: bool = False,
+        **kwargs
     ) -> 'SeriesFloat64':
         """
         When q is a float or len(q) == 1, the resultant series index will remain
@@ -176,9 +180,15 @@ class SeriesAbstractNumeric(Series, ABC):
 
         :param partition: The partition or window to apply
         :param q: A quantile or list of quantiles to be calculated
+        :param approx: if True, approximate quantiles are calculated, which is faster on large datasets.
+
+        .. note::
+            With ``approx=True``, BigQuery uses ``APPROX_QUANTILES``. Postgres calculates the quantiles
+            over a sample of the values. See :py:mod:`bach.approximation` for the sample rate, and the
+            error bound of the result.
         """
         from bach.quantile import calculate_quantiles
-        result = calculate_quantiles(self, partition=partition, q=q)
+        result = calculate_quantiles(self, partition=partition, q=q, approx=approx)
         return cast('SeriesFloat64', result)
 
     def var(self, partition: WrappedPartition = None, skipna: bool = True, ddof: int = None, **kwargs):
@@ -450,7 +460,7 @@ class SeriesFloat64(SeriesAbstractNumeric):
             base_node=base.base_node,
             index=base.index,
             name='random',
-            expression=Expression.construct(expr_str),
+            expression=NonDeterministicExpression.construct(expr_str),
             group_by=None,
             order_by=[],
             instance_dtype=cls.dtype
@@ -8,7 +8,7 @@ from sqlalchemy.engine import Dialect
 
 from bach import DataFrameOrSeries
 from bach.series import Series, value_to_series
-from bach.expression import Expression
+from bach.expression import Expression, NonDeterministicExpression
 from bach.series.series import WrappedPartition, ToPandasInfo
 from bach.types import StructuredDtype
 from sql_models.constants import DBDialect
@@ -128,7 +128,7 @@ class SeriesUuid(Series):
             base_node=base.base_node,
             index=base.index,
             name='random',
-            expression=Expression.construct(expr_str),
+            expression=NonDeterministicExpression.construct(expr_str),
             group_by=None,
             order_by=[],
             instance_dtype=cls.dtype
@@ -0,0 +1,180 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+A Session pins a single database connection. Within a session, all queries that bach runs on the session's
+engine use that connection.
+
+Without a session, the temporary tables of DataFrames that are materialized with
+materialization='temp_table' are created anew for every query, as every query runs on a new connection.
+Within a session, a temporary table is created the first time a query needs it. Later queries in the same
+session that need a temporary table with the same model hash reuse it. The temporary tables are dropped
+when the session is closed. Example::
+
+    with bach.Session(engine):
+        sessionized = expensive_df.materialize(materialization='temp_table')
+        sessionized.to_pandas()  # creates the temporary table
+        sessionized.groupby('user_id').count().to_pandas()  # reads from the existing temporary table
+
+Reusing temporary tables is only supported on Postgres. On other databases queries do use the pinned
+connection, but temporary tables are still created for every query.
+"""
+import contextlib
+from typing import Dict, List, Optional, Iterator
+
+from sqlalchemy.engine import Engine, Connection
+
+from sql_models.model import SqlModel, Materialization, SourceTableModelBuilder
+from sql_models.sql_generator import to_sql, model_to_name
+from sql_models.util import is_postgres, quote_identifier
+from bach.utils import escape_parameter_characters
+
+
+class Session:
+    """
+    Context manager that pins a connection of the engine, and reuses temporary tables between queries.
+    See the module documentation.
+
+    A session is not thread-safe, it should only be used from the thread that opened it.
+    """
+    def __init__(self, engine: Engine):
+        self._engine = engine
+        self._connection: Optional[Connection] = None
+        # model hash -> name of the temporary table that was created for the model
+        self._temp_tables: Dict[str, str] = {}
+
+    @property
+    def engine(self) -> Engine:
+        return self._engine
+
+    @property
+    def connection(self) -> Connection:
+        """ The pinned connection. Raises an exception if the session is closed. """
+        if self._connection is None:
+            raise Exception('Session is not open.')
+        return self._connection
+
+    @property
+    def temp_tables(self) -> Dict[str, str]:
+        """ Temporary tables that exist in this session: model hash -> table name. """
+        return dict(self._temp_tables)
+
+    def __enter__(self) -> 'Session':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """ Pin a connection and make this the active session for the engine. """
+        if self._connection is not None:
+            raise Exception('Session is already open.')
+        self._connection = self._engine.connect()
+        _active_sessions.append(self)
+
+    def close(self):
+        """ Drop all temporary tables of this session, and close the pinned connection. """
+        if self._connection is None:
+            return
+        try:
+            if self._temp_tables and not self._connection.closed:
+                with self._connection.begin():
+                    for table_name in self._temp_tables.values():
+                        self._connection.execute(
+                            f'drop table if exists {quote_identifier(self._engine.dialect, table_name)}'
+                        )
+        finally:
+            self._temp_tables = {}
+            self._connection.close()
+            self._connection = None
+            _active_sessions.remove(self)
+
+    def prepare_model(self, model: SqlModel) -> SqlModel:
+        """
+        Create the temporary tables that model depends on, if they don't exist in this session yet.
+
+        :return: a copy of model in which all references to temporary tables are replaced by references to
+            the existing tables, so that the sql of the returned model doesn't create temporary tables. On
+            databases other than Postgres model is returned unchanged.
+        """
+        if not is_postgres(self._engine):
+            return model
+        return self._replace_temp_tables(node=model, replaced={})
+
+    def _replace_temp_tables(self, node: SqlModel, replaced: Dict[str, SqlModel]) -> SqlModel:
+        """
+        Return a copy of node, in which all referenced temporary table nodes are replaced.
+        :param replaced: model hash -> replacement, for the nodes that are already handled.
+        """
+        new_references = {}
+        for ref_name, reference in node.references.items():
+            if reference.hash not in replaced:
+                if reference.materialization == Materialization.TEMP_TABLE:
+                    replaced[reference.hash] = self._get_temp_table_model(reference, replaced)
+                else:
+                    replaced[reference.hash] = self._replace_temp_tables(reference, replaced)
+            new_references[ref_name] = replaced[reference.hash]
+        if all(new_references[ref_name] is reference for ref_name, reference in node.references.items()):
+            return node
+        return node.copy_link(new_references=new_references)
+
+    def _get_temp_table_model(self, node: SqlModel, replaced: Dict[str, SqlModel]) -> SqlModel:
+        """
+        Create the temporary table for node if it doesn't exist yet, and return a model that refers to it.
+        """
+        dialect = self._engine.dialect
+        table_name = model_to_name(dialect, node)
+        if node.hash not in self._temp_tables:
+            query_model = self._replace_temp_tables(node, replaced).copy_set_materialization(
+                Materialization.QUERY
+            )
+            statements = [f'create temporary table {quote_identifier(dialect, table_name)} as '
+                          f'{to_sql(dialect=dialect, model=query_model)}']
+            # A temporary table with a fixed name might exist already, but for a different model.
+            previous = [model_hash for model_hash, name in self._temp_tables.items() if name == table_name]
+            if previous:
+                statements.insert(0, f'drop table if exists {quote_identifier(dialect, table_name)}')
+            conn = self.connection
+            with conn.begin():
+                for statement in statements:
+                    conn.execute(escape_parameter_characters(conn, statement))
+            for model_hash in previous:
+                del self._temp_tables[model_hash]
+            self._temp_tables[node.hash] = table_name
+        return SourceTableModelBuilder(table_name)()
+
+
+_active_sessions: List[Session] = []
+
+
+def get_active_session(engine: Engine) -> Optional[Session]:
+    """ Get the most recently opened session for engine that is still open, or None if there is none. """
+    for session in reversed(_active_sessions):
+        if session.engine is engine:
+            return session
+    return None
+
+
+@contextlib.contextmanager
+def connect(engine: Engine) -> Iterator[Connection]:
+    """
+    Context manager that gives the connection of the active session for engine, or a new connection if
+    there is no active session. Only a new connection is closed when the context is exited.
+    """
+    session = get_active_session(engine)
+    if session is not None:
+        yield session.connection
+    else:
+        with engine.connect() as conn:
+            yield conn
+
+
+def prepare_model(engine: Engine, model: SqlModel) -> SqlModel:
+    """
+    If there is an active session for engine, create the temporary tables that model needs in that session,
+    and return a model that uses those. Otherwise return model unchanged. See Session.prepare_model().
+    """
+    session = get_active_session(engine)
+    if session is None:
+        return model
+    return session.prepare_model(model)
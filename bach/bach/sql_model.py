@@ -2,14 +2,15 @@
 Copyright 2021 Objectiv B.V.
 """
 import typing
-from typing import Dict, TypeVar, Tuple, List, Optional, Mapping, Hashable, Union
+from typing import Dict, TypeVar, Tuple, List, Optional, Mapping, Hashable, Union, Any, NamedTuple, \
+    Sequence
 
 from sqlalchemy.engine import Dialect
 
 from bach.expression import Expression, get_variable_tokens, VariableToken
 from bach.types import value_to_dtype, get_series_type_from_dtype
 from sql_models.util import quote_identifier
-from sql_models.model import CustomSqlModelBuilder, SqlModel, Materialization, SqlModelSpec
+from sql_models.model import SelectSqlModelBuilder, SqlModel, Materialization, SqlModelSpec
 from sql_models.constants import NotSet, not_set
 
 T = TypeVar('T', bound='SqlModelSpec')
@@ -53,6 +54,19 @@ class BachSqlModel(SqlModel[T]):
             materialization_name=materialization_name,
         )
 
+    @classmethod
+    def _get_intern_key(cls, kwargs: Mapping[str, Any]) -> Optional[Tuple[Any, ...]]:
+        """
+        Similar to super class's implementation, but adds the column_expressions to the key. Expressions
+        compare equal regardless of their (sub)classes, so we use their structural_key instead.
+        """
+        kwargs = dict(kwargs)
+        column_expressions = kwargs.pop('column_expressions', None)
+        key = super()._get_intern_key(kwargs)
+        if key is None or column_expressions is None:
+            return None
+        return key + (tuple((name, expr.structural_key) for name, expr in column_expressions.items()), )
+
     @property
     def columns(self) -> Tuple[str, ...]:
         """ Columns returned by the query of this model, in order."""
@@ -80,8 +94,8 @@ class BachSqlModel(SqlModel[T]):
             self.materialization_name if materialization_name is not_set else materialization_name
         )
         return self.__class__(
-            model_spec=self.model_spec if model_spec is None else model_spec,
-            placeholders=self.placeholders if placeholders is None else placeholders,
+            model_spec=self._model_spec if model_spec is None else model_spec,
+            placeholders=self._placeholders if placeholders is None else placeholders,
             references=self.references if references is None else references,
             materialization=self.materialization if materialization is None else materialization,
             materialization_name=materialization_name_value,
@@ -143,6 +157,16 @@ class SampleSqlModel(BachSqlModel):
             column_expressions=column_expressions,
         )
 
+    @classmethod
+    def _get_intern_key(cls, kwargs: Mapping[str, Any]) -> Optional[Tuple[Any, ...]]:
+        """ Similar to super class's implementation, but adds previous to the key. """
+        kwargs = dict(kwargs)
+        previous = kwargs.pop('previous', None)
+        key = super()._get_intern_key(kwargs)
+        if key is None or previous is None:
+            return None
+        return key + (id(previous), )
+
     def copy_override(
         self: 'SampleSqlModel',
         *,
@@ -160,8 +184,8 @@ class SampleSqlModel(BachSqlModel):
         materialization_name_value = \
             self.materialization_name if materialization_name is not_set else materialization_name
         return self.__class__(
-            model_spec=self.model_spec if model_spec is None else model_spec,
-            placeholders=self.placeholders if placeholders is None else placeholders,
+            model_spec=self._model_spec if model_spec is None else model_spec,
+            placeholders=self._placeholders if placeholders is None else placeholders,
             references=self.references if references is None else references,
             materialization=self.materialization if materialization is None else materialization,
             materialization_name=materialization_name_value,
@@ -181,7 +205,7 @@ class SampleSqlModel(BachSqlModel):
         """ Helper function to instantiate a SampleSqlModel """
         sql = 'SELECT * FROM {table_name}'
         return SampleSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name=name),
+            model_spec=SelectSqlModelBuilder(sql=sql, name=name),
             placeholders={'table_name': quote_identifier(dialect, table_name)},
             references={},
             materialization=Materialization.CTE,
@@ -191,7 +215,197 @@ class SampleSqlModel(BachSqlModel):
         )
 
 
+class SelectClauses(NamedTuple):
+    """
+    The parts of the select query of a CurrentNodeSqlModel. Together with the referenced models, these
+    fully determine the sql of such a model.
+    """
+    column_names: Tuple[str, ...]
+    column_exprs: Tuple[Expression, ...]
+    distinct: bool
+    where_clause: Optional[Expression]
+    group_by_clause: Optional[Expression]
+    having_clause: Optional[Expression]
+    order_by_clause: Optional[Expression]
+    limit_clause: Expression
+
+    def get_clause_expressions(self) -> List[Expression]:
+        """ Give the expressions of all clauses that are set, excluding the column expressions. """
+        clauses = [self.where_clause, self.group_by_clause, self.having_clause, self.order_by_clause,
+                   self.limit_clause]
+        return [expr for expr in clauses if expr is not None]
+
+    def to_sql(self, dialect: Dialect) -> str:
+        columns_str = ', '.join(expr.to_sql(dialect) for expr in self.column_exprs)
+        distinct_stmt = ' distinct ' if self.distinct else ''
+        where_str = self.where_clause.to_sql(dialect) if self.where_clause else ''
+        group_by_str = self.group_by_clause.to_sql(dialect) if self.group_by_clause else ''
+        having_str = self.having_clause.to_sql(dialect) if self.having_clause else ''
+        order_by_str = self.order_by_clause.to_sql(dialect) if self.order_by_clause else ''
+        limit_str = self.limit_clause.to_sql(dialect) if self.limit_clause else ''
+
+        return (
+            f"select {distinct_stmt}{columns_str} \n"
+            f"from {{{{prev}}}} \n"
+            f"{where_str} \n"
+            f"{group_by_str} \n"
+            f"{having_str} \n"
+            f"{order_by_str} \n"
+            f"{limit_str} \n"
+        )
+
+
 class CurrentNodeSqlModel(BachSqlModel):
+    """
+    BachSqlModel that selects from a single previous node, as created by
+    :py:meth:`bach.DataFrame.get_current_node()`.
+
+    In addition to the sql, this keeps the clauses of the select query. That makes it possible to construct an
+    equivalent model that selects only some of the columns, see :py:meth:`copy_select_columns()`, or a model
+    with different clauses, see :py:meth:`copy_select_clauses()`.
+    """
+    def __init__(
+        self,
+        model_spec: T,
+        placeholders: Mapping[str, Hashable],
+        references: Mapping[str, 'SqlModel'],
+        materialization: Materialization,
+        materialization_name: Optional[str],
+        column_expressions: Dict[str, Expression],
+        select_clauses: Optional[SelectClauses] = None,
+    ) -> None:
+        """
+        Similar to :py:meth:`BachSqlModel.__init__()`. With one additional parameter: select_clauses, the
+        parts of the sql of model_spec. If not set, then :py:meth:`copy_select_columns()` is not supported.
+        """
+        self._select_clauses = select_clauses
+        super().__init__(
+            model_spec=model_spec,
+            placeholders=placeholders,
+            references=references,
+            materialization=materialization,
+            materialization_name=materialization_name,
+            column_expressions=column_expressions,
+        )
+
+    @classmethod
+    def _get_intern_key(cls, kwargs: Mapping[str, Any]) -> Optional[Tuple[Any, ...]]:
+        """
+        Similar to super class's implementation, but adds select_clauses to the key. As for the
+        column_expressions, we use the structural_key of the expressions in the select_clauses.
+        """
+        kwargs = dict(kwargs)
+        select_clauses: Optional[SelectClauses] = kwargs.pop('select_clauses', None)
+        key = super()._get_intern_key(kwargs)
+        if key is None:
+            return None
+        if select_clauses is None:
+            return key + (None, )
+        clauses_key = tuple(
+            tuple(expr.structural_key for expr in value) if name == 'column_exprs'
+            else value.structural_key if isinstance(value, Expression)
+            else value
+            for name, value in select_clauses._asdict().items()
+        )
+        return key + (clauses_key, )
+
+    @property
+    def select_clauses(self) -> Optional[SelectClauses]:
+        return self._select_clauses
+
+    def copy_override(
+        self: 'CurrentNodeSqlModel',
+        *,
+        model_spec: T = None,
+        placeholders: Mapping[str, Hashable] = None,
+        references: Mapping[str, 'SqlModel'] = None,
+        materialization: Materialization = None,
+        materialization_name: Union[Optional[str], NotSet] = not_set,
+        column_expressions: Dict[str, Expression] = None
+    ) -> 'CurrentNodeSqlModel':
+        """
+        Similar to super class's implementation, but keeps the select_clauses, unless the model_spec or
+        column_expressions are overridden.
+        """
+        materialization_name_value = \
+            self.materialization_name if materialization_name is not_set else materialization_name
+        keep_select_clauses = model_spec is None and column_expressions is None
+        return self.__class__(
+            model_spec=self._model_spec if model_spec is None else model_spec,
+            placeholders=self._placeholders if placeholders is None else placeholders,
+            references=self.references if references is None else references,
+            materialization=self.materialization if materialization is None else materialization,
+            materialization_name=materialization_name_value,
+            column_expressions=self.column_expressions if column_expressions is None else column_expressions,
+            select_clauses=self._select_clauses if keep_select_clauses else None,
+        )
+
+    def copy_select_columns(
+        self,
+        dialect: Dialect,
+        column_names: Sequence[str],
+        references: Mapping[str, 'SqlModel']
+    ) -> 'CurrentNodeSqlModel':
+        """
+        Create a copy that only selects the given columns. All other clauses of the query are unchanged.
+
+        :param dialect: SQL Dialect
+        :param column_names: names of the columns to select, must be a subset of this model's columns.
+        :param references: references to use instead of the current references. Must contain at least the
+            references that the remaining columns and clauses use, other references are ignored.
+        :return: new model
+        :raises ValueError: if the select_clauses of this model are not known
+        """
+        if self._select_clauses is None:
+            raise ValueError(f'Cannot select columns of {self.generic_name}, its select clauses are unknown.')
+        column_exprs = self.column_expressions
+        select_clauses = self._select_clauses._replace(
+            column_names=tuple(column_names),
+            column_exprs=tuple(column_exprs[name] for name in column_names),
+        )
+        return self.copy_select_clauses(
+            dialect=dialect,
+            select_clauses=select_clauses,
+            references=references,
+            placeholders=self.placeholders
+        )
+
+    def copy_select_clauses(
+        self,
+        dialect: Dialect,
+        select_clauses: SelectClauses,
+        references: Mapping[str, 'SqlModel'],
+        placeholders: Mapping[str, Hashable]
+    ) -> 'CurrentNodeSqlModel':
+        """
+        Create a copy with the given select clauses, instead of the current select query.
+
+        :param dialect: SQL Dialect
+        :param select_clauses: clauses of the select query of the new model.
+        :param references: references to use instead of the current references. Must contain at least the
+            references that select_clauses use, other references are ignored.
+        :param placeholders: placeholders to use instead of the current placeholders. Must contain at least
+            the placeholders of the variables that select_clauses use, other placeholders are ignored.
+        :return: new model
+        """
+        all_expressions = list(select_clauses.column_exprs) + select_clauses.get_clause_expressions()
+        reference_names = construct_references({'prev': references['prev']}, all_expressions).keys()
+        placeholder_names = {
+            VariableToken.dtype_name_to_placeholder_name(dtype=token.dtype, name=token.name)
+            for token in get_variable_tokens(all_expressions)
+        }
+        return CurrentNodeSqlModel(
+            model_spec=SelectSqlModelBuilder(sql=select_clauses.to_sql(dialect), name=self.generic_name),
+            placeholders={
+                name: value for name, value in placeholders.items() if name in placeholder_names
+            },
+            references={name: references[name] for name in reference_names},
+            materialization=self.materialization,
+            materialization_name=self.materialization_name,
+            column_expressions=dict(zip(select_clauses.column_names, select_clauses.column_exprs)),
+            select_clauses=select_clauses,
+        )
+
     @staticmethod
     def get_instance(
         *,
@@ -208,37 +422,29 @@ class CurrentNodeSqlModel(BachSqlModel):
         previous_node: BachSqlModel,
         variables: Dict['DtypeNamePair', Hashable],
     ) -> 'CurrentNodeSqlModel':
-
-        columns_str = ', '.join(expr.to_sql(dialect) for expr in column_exprs)
-        distinct_stmt = ' distinct ' if distinct else ''
-        where_str = where_clause.to_sql(dialect) if where_clause else ''
-        group_by_str = group_by_clause.to_sql(dialect) if group_by_clause else ''
-        having_str = having_clause.to_sql(dialect) if having_clause else ''
-        order_by_str = order_by_clause.to_sql(dialect) if order_by_clause else ''
-        limit_str = limit_clause.to_sql(dialect) if limit_clause else ''
-
-        sql = (
-            f"select {distinct_stmt}{columns_str} \n"
-            f"from {{{{prev}}}} \n"
-            f"{where_str} \n"
-            f"{group_by_str} \n"
-            f"{having_str} \n"
-            f"{order_by_str} \n"
-            f"{limit_str} \n"
+        select_clauses = SelectClauses(
+            column_names=column_names,
+            column_exprs=tuple(column_exprs),
+            distinct=distinct,
+            where_clause=where_clause,
+            group_by_clause=group_by_clause,
+            having_clause=having_clause,
+            order_by_clause=order_by_clause,
+            limit_clause=limit_clause,
         )
 
         # Add all references found in the Expressions to self.references
-        nullable_expressions = [where_clause, group_by_clause, having_clause, order_by_clause, limit_clause]
-        all_expressions = column_exprs + [expr for expr in nullable_expressions if expr is not None]
+        all_expressions = column_exprs + select_clauses.get_clause_expressions()
         references = construct_references({'prev': previous_node}, all_expressions)
 
         return CurrentNodeSqlModel(
-            model_spec=CustomSqlModelBuilder(sql=sql, name=name),
+            model_spec=SelectSqlModelBuilder(sql=select_clauses.to_sql(dialect), name=name),
             placeholders=BachSqlModel._get_placeholders(dialect, variables, all_expressions),
             references=references,
             materialization=Materialization.CTE,
             materialization_name=None,
             column_expressions={name: expr for name, expr in zip(column_names, column_exprs)},
+            select_clauses=select_clauses,
         )
 
 
@@ -31,6 +31,197 @@ class FoundNode(NamedTuple):
     reference_path: RefPath
 
 
+class GraphIndex:
+    """
+    Memoized results of traversing the graph that can be reached from a start node.
+
+    Models are immutable, so the graph that can be reached from a model never changes. This makes it
+    possible to cache traversal results on the model itself. Use :py:func:`get_graph_index` to get the index
+    of a model. Each part of the index is only calculated when it's first needed.
+
+    To prevent a reference cycle between a model and its index, the index does not refer to the start node.
+    Methods that need the start node take it as a parameter.
+    """
+
+    def __init__(self, start_node: SqlModel):
+        self._start_node_id = id(start_node)
+        self._references: Mapping[str, SqlModel] = start_node.references
+        self._placeholders: Mapping[str, Hashable] = start_node.placeholders
+        # All nodes, except the start node, in breadth-first order. With the shortest respectively longest
+        # reference path to the nodes. See find_nodes() for details.
+        self._found_nodes_first: Optional[List[FoundNode]] = None
+        self._found_nodes_last: Optional[List[FoundNode]] = None
+        # All nodes, except the start node, such that a node comes after all nodes that it references.
+        self._topological_order: Optional[List[SqlModel]] = None
+        # Maps id() of a node, to the id() of the nodes that directly reference it.
+        self._referencing_ids: Optional[Dict[int, Set[int]]] = None
+        self._all_placeholders: Optional[Dict[str, Dict[RefPath, Hashable]]] = None
+        self._depth: Optional[int] = None
+
+    def find_nodes(
+            self,
+            start_node: SqlModel,
+            function: Callable[[SqlModel], bool],
+            first_instance: bool
+    ) -> List[FoundNode]:
+        """ See :py:func:`find_nodes`. """
+        if first_instance:
+            if self._found_nodes_first is None:
+                self._found_nodes_first = self._breadth_first_search(first_instance=True)
+            found_nodes = self._found_nodes_first
+        else:
+            if self._found_nodes_last is None:
+                self._found_nodes_last = self._breadth_first_search(first_instance=False)
+            found_nodes = self._found_nodes_last
+        # The queue of the breadth-first search doesn't depend on function, so filtering the complete result
+        # gives the same nodes, in the same order, as applying function during the search.
+        # The start node is always encountered first, and only once.
+        result = [FoundNode(start_node, tuple())] if function(start_node) else []
+        result.extend(found_node for found_node in found_nodes if function(found_node.model))
+        return result
+
+    def _breadth_first_search(self, first_instance: bool) -> List[FoundNode]:
+        # result_nodes maps the id of the found objects to a FoundNode object
+        result_nodes: Dict[int, FoundNode] = {}
+        # discovered maps the id of all models that are processed or are queued to be processed to the
+        # length of the reference path to get to them. Depending on the value of first_instance, this is the
+        # length of the longest or shortest reference path.
+        discovered: Dict[int, int] = {}
+        # queue contains the queue of items that have been discovered but not yet processed.
+        queue: Deque[Tuple[SqlModel, RefPath]] = deque()
+        for reference_name, reference in self._references.items():
+            discovered[id(reference)] = 1
+            queue.append((reference, (reference_name, )))
+        while queue:
+            node, path = queue.popleft()
+            current_id = id(node)
+            if current_id in result_nodes:
+                if first_instance:
+                    continue
+                # We found a longer path to a node we already found earlier.
+                # we rely on the fact that python 3.7+ will keep the insertion order. So we'll have to
+                # remove and reinsert the item to get it in the right position in the returned result.
+                del result_nodes[current_id]
+            result_nodes[current_id] = FoundNode(node, path)
+            for next_path_step, next_node in node.references.items():
+                next_id = id(next_node)
+                next_path = path + (next_path_step,)
+                len_next_path = len(next_path)
+                if next_id in discovered:
+                    # If there is already a path to next_node that's equally long or short (depending on
+                    # first_instance), then we don't add next_node to the queue.
+                    if first_instance and discovered[next_id] <= len_next_path:
+                        continue
+                    if (not first_instance) and discovered[next_id] >= len_next_path:
+                        continue
+                discovered[next_id] = len_next_path
+                queue.append((next_node, next_path))
+        return list(result_nodes.values())
+
+    def topological_order(self, start_node: SqlModel) -> List[SqlModel]:
+        """
+        Give all nodes in the graph, such that each node comes after all nodes that it references. The start
+        node is always the last node.
+        """
+        return self._get_topological_order() + [start_node]
+
+    def _get_topological_order(self) -> List[SqlModel]:
+        """ Similar to topological_order(), but without the start node. """
+        if self._topological_order is None:
+            order: List[SqlModel] = []
+            visited: Set[int] = set()
+            # stack contains the nodes to process, and whether their references have been processed already
+            stack: List[Tuple[SqlModel, bool]] = [
+                (reference, False) for reference in reversed(list(self._references.values()))
+            ]
+            while stack:
+                node, references_done = stack.pop()
+                if references_done:
+                    order.append(node)
+                    continue
+                if id(node) in visited:
+                    continue
+                visited.add(id(node))
+                stack.append((node, True))
+                stack.extend(
+                    (reference, False) for reference in reversed(list(node.references.values()))
+                    if id(reference) not in visited
+                )
+            self._topological_order = order
+        return self._topological_order
+
+    @property
+    def depth(self) -> int:
+        """ Number of references on the longest reference path from the start node. """
+        if self._depth is None:
+            depths: Dict[int, int] = {}
+            for node in self._get_topological_order():
+                depths[id(node)] = max((depths[id(ref)] + 1 for ref in node.references.values()), default=0)
+            depth = max((depths[id(ref)] + 1 for ref in self._references.values()), default=0)
+            self._depth = depth
+            return depth
+        return self._depth
+
+    def get_dependent_model_ids(self, model: SqlModel) -> Set[int]:
+        """
+        Get the id() of all nodes that recursively refer the given model, and of the given model itself.
+
+        Python's id() uniquely identifies an object during it's lifetime [1]. So the results of this function
+        can be used to identify dependent models in a graph, but only as long as all model instances in the
+        graph still exist.
+
+        [1] https://docs.python.org/3/library/functions.html#id
+        """
+        if self._referencing_ids is None:
+            referencing_ids: Dict[int, Set[int]] = {}
+            for node in self._get_topological_order():
+                for reference in node.references.values():
+                    referencing_ids.setdefault(id(reference), set()).add(id(node))
+            for reference in self._references.values():
+                referencing_ids.setdefault(id(reference), set()).add(self._start_node_id)
+            self._referencing_ids = referencing_ids
+        dependent_ids: Set[int] = {id(model)}
+        todo = [id(model)]
+        while todo:
+            for referencing_id in self._referencing_ids.get(todo.pop(), set()):
+                if referencing_id not in dependent_ids:
+                    dependent_ids.add(referencing_id)
+                    todo.append(referencing_id)
+        return dependent_ids
+
+    def get_all_placeholders(self) -> Dict[str, Dict[RefPath, Hashable]]:
+        """
+        See :py:func:`get_all_placeholders`. The returned dictionaries are part of the index, and should not
+        be modified.
+        """
+        if self._all_placeholders is None:
+            # Fill the indices of the referenced nodes first, this prevents deep recursion on deep graphs.
+            for node in self._get_topological_order():
+                get_graph_index(node).get_all_placeholders()
+            result: Dict[str, Dict[RefPath, Hashable]] = {
+                name: {tuple(): value} for name, value in self._placeholders.items()
+            }
+            for reference_name, reference in self._references.items():
+                for name, path_values in get_graph_index(reference).get_all_placeholders().items():
+                    result_paths = result.setdefault(name, {})
+                    for path, value in path_values.items():
+                        result_paths[(reference_name, *path)] = value
+            self._all_placeholders = result
+        return self._all_placeholders
+
+
+def get_graph_index(start_node: SqlModel) -> GraphIndex:
+    """
+    Get the GraphIndex of the graph that can be reached from start_node. The index is created on first
+    use, and stored on start_node.
+    """
+    index = start_node._graph_index
+    if index is None:
+        index = GraphIndex(start_node)
+        start_node._graph_index = index
+    return index
+
+
 def get_graph_nodes_info(start_node: SqlModel) -> List[NodeInfo]:
     """
     Build a list of NodeInfo objects from the final node of the graph backwards.
@@ -135,44 +326,7 @@ def find_nodes(
         The returned nodes are in the order in which they were encountered. As a result the reference_path
         of the returned tuples monotonically increases when iterating the list.
     """
-    # result_nodes maps the id of the found objects to a FoundNode object
-    result_nodes: Dict[int, FoundNode] = {}
-    # discovered maps the id of all models that are processed or are queued to be processed to the length of
-    # the reference path to get to them. Depending on the value of first_instance, this is the length of the
-    # longest or shortest reference path.
-    discovered: Dict[int, int] = {}
-    # queue contains the queue of items that have been discovered but not yet processed.
-    queue: Deque[Tuple[SqlModel, RefPath]] = deque()
-
-    discovered[id(start_node)] = 0
-    queue.append((start_node, tuple()))
-    while queue:
-        node, path = queue.popleft()
-        current_id = id(node)
-        if function(node):
-            if current_id not in result_nodes:
-                result_nodes[current_id] = FoundNode(node, path)
-            elif current_id in result_nodes and not first_instance:
-                # We found a longer path to a node we already found earlier.
-                # we rely on the fact that python 3.7+ will keep the insertion order. So we'll have to
-                # remove and reinsert the item to get it in the right position in the returned result.
-                del result_nodes[current_id]
-                result_nodes[current_id] = FoundNode(node, path)
-        for next_path_step, next_node in node.references.items():
-            next_id = id(next_node)
-            next_path = path + (next_path_step,)
-            len_next_path = len(next_path)
-            if next_id in discovered:
-                # If there is already a path to next_node that's equally long or short (depending on
-                # first_instance), then we don't add next_node to the queue.
-                if first_instance and discovered[next_id] <= len_next_path:
-                    continue
-                if (not first_instance) and discovered[next_id] >= len_next_path:
-                    continue
-            discovered[next_id] = len_next_path
-            next_tuple = (next_node, next_path)
-            queue.append(next_tuple)
-    return list(result_nodes.values())
+    return get_graph_index(start_node).find_nodes(start_node, function, first_instance)
 
 
 def find_node(
@@ -196,17 +350,8 @@ def get_all_placeholders(start_node: SqlModel) -> Dict[str, Dict[RefPath, Hashab
     :return: Dict, keys: placeholder name, values: dictionary. The values sub-dictionary has as key the path
         to all nodes that use the placeholder, and as values the value in that node.
     """
-    return _get_all_placeholders_recursive(start_node, tuple())
-
-
-def _get_all_placeholders_recursive(start_node: SqlModel, path_so_far: RefPath):
-    result = {name: {path_so_far: value} for name, value in start_node.placeholders.items()}
-    for reference_name, reference in start_node.references.items():
-        _next_reference_path = (*path_so_far, reference_name)
-        result_ref = _get_all_placeholders_recursive(reference, _next_reference_path)
-        for name, path_values in result_ref.items():
-            result.setdefault(name, {}).update(path_values)
-    return result
+    all_placeholders = get_graph_index(start_node).get_all_placeholders()
+    return {name: dict(path_values) for name, path_values in all_placeholders.items()}
 
 
 def update_placeholders_in_graph(
@@ -265,15 +410,17 @@ def replace_node_in_graph(
     if reference_path == tuple():
         return replacement_model
 
-    selected_node = get_node_info_selected_node(start_node, reference_path)
-    dependent_model_ids = _get_all_dependent_node_model_ids(selected_node)
+    model_to_replace = get_node(start_node, reference_path)
+    if model_to_replace is replacement_model:
+        return start_node
+    dependent_model_ids = get_graph_index(start_node).get_dependent_model_ids(model_to_replace)
     # the dependent_model_ids are guaranteed to uniquely identify python objects as long as those objects
     # exist. We still have a reference to the start node here, so all objects that are being replaced are
     # guaranteed to still exist at the end of this function, ergo we can safely use dependent_model_ids to
     # identify python objects.
     return _replace_model_in_graph_recursively(
         current_node=start_node,
-        model_to_replace=selected_node.model,
+        model_to_replace=model_to_replace,
         replacement_node=replacement_model,
         dependent_model_ids=dependent_model_ids,
         replaced_models={}
@@ -301,12 +448,14 @@ def replace_non_start_node_in_graph(
     """
     if reference_path == tuple():
         raise ValueError(f'reference path cannot be empty, use replace_node_in_graph() instead.')
-    selected_node = get_node_info_selected_node(start_node, reference_path)
-    dependent_model_ids = _get_all_dependent_node_model_ids(selected_node)
+    model_to_replace = get_node(start_node, reference_path)
+    if model_to_replace is replacement_model:
+        return start_node
+    dependent_model_ids = get_graph_index(start_node).get_dependent_model_ids(model_to_replace)
     # See replace_node_in_graph() for more comments on the implementation
     return _replace_model_in_graph_recursively(
         current_node=start_node,
-        model_to_replace=selected_node.model,
+        model_to_replace=model_to_replace,
         replacement_node=replacement_model,
         dependent_model_ids=dependent_model_ids,
         replaced_models={}
@@ -366,28 +515,6 @@ def _replace_model_in_graph_recursively(
     return current_node.copy_link(new_references=new_references)
 
 
-def _get_all_dependent_node_model_ids(node: NodeInfo) -> Set[int]:
-    """
-    Get all nodes that recursively refer the given node, and the given node itself.
-    The returned nodes are identified by the id() of the their model.
-
-    Python's id() uniquely identifies an object during it's lifetime [1]. So the results of this function
-    can be used to identify dependent models in a graph, but only as long as all model instances in the
-    graph still exist.
-
-    [1] https://docs.python.org/3/library/functions.html#id
-    """
-    dependent_ids: Set[int] = {id(node.model)}
-    out_edges: List[NodeInfo] = node.out_edges
-    while out_edges:
-        out_edge = out_edges.pop()
-        model_id = id(out_edge.model)
-        if model_id not in dependent_ids:
-            dependent_ids.add(model_id)
-            out_edges.extend(out_edge.out_edges)
-    return dependent_ids
-
-
 def _add_node_to_node_list(node_list: List[NodeInfo], node: NodeInfo):
     """ Add node to node_list, if there is no node yet with the same node-id. """
     if all(id(node) != id(list_entry) for list_entry in node_list):
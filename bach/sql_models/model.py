@@ -9,20 +9,28 @@ Models:
   extend this class and not the SqlModel class.
 * `CustomSqlModelBuilder`: Utility child of SqlModelSpec that can be used to add a node with custom sql to a
   model graph.
+* `SelectSqlModelBuilder`: Utility child of CustomSqlModelBuilder for generated sql, of which the common
+  table expressions are known without parsing the sql.
 * `Materialization`: Specifies what kind of SQL should be generated: a query or a specific create statement
 
 """
 import collections
 import hashlib
+import weakref
 from abc import abstractmethod, ABCMeta
 from copy import deepcopy
 from enum import Enum
+from functools import lru_cache
 from typing import TypeVar, Generic, Dict, Any, Set, Tuple, Type, Union, Hashable, NamedTuple, Optional, \
-    Mapping, MutableMapping, cast
+    Mapping, MutableMapping, cast, Sequence, TYPE_CHECKING
 
 from sql_models.constants import not_set, NotSet
+from sql_models.sql_query_parser import CteTuple
 from sql_models.util import extract_format_fields
 
+if TYPE_CHECKING:
+    from sql_models.graph_operations import GraphIndex
+
 
 class MaterializationType(NamedTuple):
     """
@@ -135,6 +143,15 @@ class SqlModelSpec:
         """ Must be implemented by child class. Return value should typically be a constant. """
         raise NotImplementedError()
 
+    @property
+    def ctes(self) -> Optional[Tuple[CteTuple, ...]]:
+        """
+        The sql split into its common table expressions and final select, in the same format as returned by
+        sql_query_parser.raw_sql_to_selects(). None if that structure is not known, in which case the sql
+        generator will parse the sql. Can be overridden by subclasses. Must be a constant.
+        """
+        return None
+
     @property
     @abstractmethod
     def spec_references(self) -> Set[str]:
@@ -351,7 +368,35 @@ class SqlModelBuilder(SqlModelSpec, metaclass=ABCMeta):
         self.assert_adheres_to_spec(references=self.references, placeholders=self.placeholders)
 
 
-class SqlModel(Generic[T]):
+@lru_cache(maxsize=1024)
+def _get_sql_digest(generic_name: str, sql: str) -> 'hashlib._Hash':
+    """
+    Give the md5 state of a model hash after the generic_name and sql, see SqlModel._calculate_hash().
+    The returned object is shared, callers must copy() it before updating it.
+    """
+    return hashlib.md5(f"{{'generic_name': {generic_name!r}, 'sql': {sql!r}, ".encode('utf-8'))
+
+
+class _InterningMeta(type):
+    """
+    Metaclass that hash-conses SqlModels: creating a model with the same arguments as an existing model
+    returns that existing model. See :py:meth:`SqlModel._get_intern_key` for what 'the same' means.
+    """
+    # Weak values: a model is only kept in the table as long as it's used elsewhere.
+    _interned: 'weakref.WeakValueDictionary[Hashable, SqlModel]' = weakref.WeakValueDictionary()
+
+    def __call__(cls, *args, **kwargs):
+        key = None if args else cls._get_intern_key(kwargs)  # type: ignore
+        if key is None:
+            return super().__call__(*args, **kwargs)
+        instance = _InterningMeta._interned.get(key)
+        if instance is None:
+            instance = super().__call__(*args, **kwargs)
+            _InterningMeta._interned[key] = instance
+        return instance
+
+
+class SqlModel(Generic[T], metaclass=_InterningMeta):
     """
     An Immutable Sql Model consists of a sql select query, placeholder values and references to other
     Sql models.
@@ -373,7 +418,14 @@ class SqlModel(Generic[T]):
         * All references have to be set at initialization, the referenced objects have to be already
             initialized models, and references are unidirectional, therefore it is not possible to create
             cycles in the graph.
+        * Models are hash-consed: instantiating a model with the same spec, placeholders, materialization
+            and references as an existing model, returns the existing model. Equal sub-graphs that are
+            built independently are thus shared, and the hash of such a model is not calculated again.
     """
+    _INTERN_ARGUMENTS = {
+        'model_spec', 'placeholders', 'references', 'materialization', 'materialization_name'
+    }
+
     def __init__(self,
                  model_spec: T,
                  placeholders: Mapping[str, Hashable],
@@ -396,6 +448,7 @@ class SqlModel(Generic[T]):
         self._model_spec = model_spec
         self._generic_name = model_spec.generic_name
         self._sql = model_spec.sql
+        self._ctes = model_spec.ctes
         self._references: Mapping[str, 'SqlModel'] = references
         self._placeholders: Mapping[str, Any] = placeholders
         self._materialization = materialization
@@ -407,6 +460,48 @@ class SqlModel(Generic[T]):
                                                 placeholders=self.placeholders)
         # Calculate unique hash for this model's sql, placeholder values, materialization and references
         self._hash = self._calculate_hash()
+        # Memoized traversal results of this model's graph. Built lazily by graph_operations.get_graph_index()
+        self._graph_index: Optional['GraphIndex'] = None
+
+    @classmethod
+    def _get_intern_key(cls, kwargs: Mapping[str, Any]) -> Optional[Tuple[Any, ...]]:
+        """
+        Give the key under which an instance, created with the given keyword arguments, is interned. Returns
+        None if the instance cannot be interned.
+
+        The key consists of the class, the parts of the spec that are used for sql generation, the
+        placeholder values, the materialization, and the identity of the referenced models. As the referenced
+        models are hash-consed too, equal sub-graphs have identical referenced models.
+
+        Subclasses that add state must override this, and add that state to the key. For arguments that
+        are not known here, None is returned, so subclasses that don't override this are never interned.
+        """
+        if not kwargs.keys() <= cls._INTERN_ARGUMENTS or 'model_spec' not in kwargs:
+            return None
+        model_spec: SqlModelSpec = kwargs['model_spec']
+        try:
+            # Include the type of the values: e.g. 1 == True, but they give different sql.
+            placeholders = tuple(
+                (name, value.__class__, value) for name, value in sorted(kwargs['placeholders'].items())
+            )
+            key = (
+                cls,
+                model_spec.__class__,
+                model_spec.generic_name,
+                model_spec.sql,
+                model_spec.ctes,
+                model_spec.placeholders_to_sql,
+                placeholders,
+                kwargs['materialization'],
+                kwargs.get('materialization_name'),
+                # The interned model keeps references to its referenced models, so these ids stay valid
+                tuple((name, id(reference)) for name, reference in kwargs['references'].items()),
+            )
+            hash(key)
+        except (KeyError, TypeError):
+            # Missing arguments, or placeholder values that are not hashable. Let __init__ handle this.
+            return None
+        return key
 
     def _calculate_hash(self) -> str:
         """
@@ -421,21 +516,25 @@ class SqlModel(Generic[T]):
             5. references, and recursively their generic_name, sql, placeholder values, materialization,
                 materialization_name, and recursive references
             6. materialization_name
+
+        The hash is built incrementally: the md5 state after the generic_name and sql is shared by all
+        models with the same sql (see _get_sql_digest()), and referenced models are included through their
+        hashes. So only the placeholder values, materialization and the hashes of the references are
+        serialized for a new model with known sql. The result is the md5 of repr() of a dictionary with the
+        attributes.
         :return: 32 character string representation of md5 hash
         """
-        data = {
-            'generic_name': self.generic_name,
-            'sql': self.sql,
-            'properties': self.placeholders_formatted,
-            'materialization': self.materialization.type_name,
-            'references': {
-                ref_name: model.hash for ref_name, model in self.references.items()
-            }
-        }
+        digest = _get_sql_digest(self.generic_name, self.sql).copy()
+        references = {ref_name: model.hash for ref_name, model in self._references.items()}
+        data = (
+            f"'properties': {self.placeholders_formatted!r}, "
+            f"'materialization': {self.materialization.type_name!r}, "
+            f"'references': {references!r}"
+        )
         if self.materialization_name is not None:
-            data['materialization_name'] = self.materialization_name
-        data_bytes = repr(data).encode('utf-8')
-        return hashlib.md5(data_bytes).hexdigest()
+            data += f", 'materialization_name': {self.materialization_name!r}"
+        digest.update(f'{data}}}'.encode('utf-8'))
+        return digest.hexdigest()
 
     @property
     def model_spec(self):
@@ -455,6 +554,11 @@ class SqlModel(Generic[T]):
     def sql(self) -> str:
         return self._sql
 
+    @property
+    def ctes(self) -> Optional[Tuple[CteTuple, ...]]:
+        """ The structure of the sql, if known. See :py:attr:`SqlModelSpec.ctes` """
+        return self._ctes
+
     @property
     def references(self) -> MutableMapping[str, 'SqlModel']:
         # return shallow-copy of the dictionary.
@@ -505,9 +609,9 @@ class SqlModel(Generic[T]):
         materialization_name_value = \
             self.materialization_name if materialization_name is not_set else materialization_name
         return self.__class__(
-            model_spec=self.model_spec if model_spec is None else model_spec,
-            placeholders=self.placeholders if placeholders is None else placeholders,
-            references=self.references if references is None else references,
+            model_spec=self._model_spec if model_spec is None else model_spec,
+            placeholders=self._placeholders if placeholders is None else placeholders,
+            references=self._references if references is None else references,
             materialization=self.materialization if materialization is None else materialization,
             materialization_name=materialization_name_value
         )
@@ -728,6 +832,34 @@ class CustomSqlModelBuilder(SqlModelBuilder):
         return self._generic_name
 
 
+class SelectSqlModelBuilder(CustomSqlModelBuilder):
+    """
+    Builder that instantiates a SqlModel for sql of which the structure is known upfront: zero or more
+    common table expressions and a final select statement. Code that generates sql should use this instead
+    of CustomSqlModelBuilder, as the sql generator can then assemble the final query without having to parse
+    the sql again.
+    """
+
+    def __init__(self, sql: str, name: str = None, ctes: Sequence[Tuple[str, str]] = ()):
+        """
+        :param sql: final select statement of the model, without common table expressions.
+        :param name: optional override of the generic name (default: 'CustomSqlModel')
+        :param ctes: optional list of tuples (name, select statement) of common table expressions that sql
+            can select from. Names should be unquoted.
+        """
+        self._ctes = tuple(
+            CteTuple(name=cte_name, select_sql=cte_sql) for cte_name, cte_sql in ctes
+        ) + (CteTuple(name=None, select_sql=sql),)
+        if ctes:
+            with_clause = ',\n'.join(f'{cte_name} as ({cte_sql})' for cte_name, cte_sql in ctes)
+            sql = f'with {with_clause}\n{sql}'
+        super().__init__(sql=sql, name=name)
+
+    @property
+    def ctes(self) -> Tuple[CteTuple, ...]:
+        return self._ctes
+
+
 def escape_raw_sql(sql: str) -> str:
     """
     Take any raw sql that will be used in a model and escape all '{' and '}'. This prevents the sql_generator
@@ -7,7 +7,7 @@ from sqlalchemy.engine import Dialect
 
 from sql_models.graph_operations import find_nodes, FoundNode
 from sql_models.model import SqlModel, REFERENCE_UNIQUE_FIELD, Materialization
-from sql_models.sql_query_parser import raw_sql_to_selects
+from sql_models.sql_query_parser import raw_sql_to_selects, CteTuple
 from sql_models.util import quote_identifier, is_postgres, is_bigquery, DatabaseNotSupportedException
 
 
@@ -39,6 +39,23 @@ def to_sql(dialect: Dialect, model: SqlModel) -> str:
     :param model: model to convert to sql
     :return: executable SQL statement
     """
+    statements = to_sql_statements(dialect=dialect, model=model)
+    sql = ';\n'.join(sql_stat.sql for sql_stat in statements)
+    return sql
+
+
+def to_sql_statements(dialect: Dialect, model: SqlModel) -> List[GeneratedSqlStatement]:
+    """
+    Give the statements that to_sql() combines into a single sql string, as separate statements.
+
+    This is useful for executing the statements one by one, e.g. to first create all temporary tables and
+    then execute the final query with a server-side cursor.
+
+    :param dialect: SQL Dialect
+    :param model: model to convert to sql
+    :return: list of generated sql statements. The last statement is the one for model itself, earlier
+        statements create the temporary tables that later statements use.
+    """
     # Find all nodes that are a statement (e.g. create a temporary table), but exclude nodes that have a
     # lasting effect (e.g. creating a regular table). Always include the start node
     # Make sure we get the longest possible path to a node (use_last_found_instance=True). That way we can
@@ -55,9 +72,7 @@ def to_sql(dialect: Dialect, model: SqlModel) -> str:
     )
 
     models = [fn.model for fn in reversed(materialized_found_nodes)]
-    statements = _to_sql_list_models(dialect=dialect, models=models)
-    sql = ';\n'.join(sql_stat.sql for sql_stat in statements)
-    return sql
+    return _to_sql_list_models(dialect=dialect, models=models)
 
 
 def to_sql_materialized_nodes(
@@ -310,17 +325,31 @@ def _single_model_to_sql(dialect: Dialect,
         compiler_cache[model.hash] = result
         return result
 
-    # If there are any format strings in the placeholder values that need escaping, they should have been
-    # escaped by now.
-    # Otherwise, this will cause trouble the next time we call format() below for the references
-    sql = _format_sql(sql=sql, values=model.placeholders_formatted, model=model)
+    placeholder_values = model.placeholders_formatted
     # {{id}} (==REFERENCE_UNIQUE_FIELD) is a special placeholder that gets the unique model identifier,
     # which can be used in templates to make sure that if a model gets used multiple times,
     # the cte-names are still unique.
     _reference_names = dict(**reference_names)
     _reference_names[REFERENCE_UNIQUE_FIELD] = model.hash
-    sql = _format_sql(sql=sql, values=_reference_names, model=model)
-    ctes = raw_sql_to_selects(sql)
+
+    def _format(_sql: str) -> str:
+        # If there are any format strings in the placeholder values that need escaping, they should have
+        # been escaped by now.
+        # Otherwise, this will cause trouble the next time we call format() below for the references
+        _sql = _format_sql(sql=_sql, values=placeholder_values, model=model)
+        return _format_sql(sql=_sql, values=_reference_names, model=model)
+
+    if model.ctes is None:
+        # The structure of the sql is unknown (e.g. hand-written sql), parse it to find the CTEs.
+        ctes = raw_sql_to_selects(_format(sql))
+    else:
+        ctes = [
+            CteTuple(
+                name=None if cte.name is None else _format(cte.name),
+                select_sql=_format(cte.select_sql)
+            )
+            for cte in model.ctes
+        ]
 
     for cte in ctes[:-1]:
         # For all CTEs the name should be set. Only for the final select (== cte[-1]) it will be None.
@@ -0,0 +1,107 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Benchmark of DataFrame.describe() on a wide numeric DataFrame. describe() calculates all stats in a single
+aggregation. For comparison, the same stats are also calculated with an aggregation per stat, that are
+concatenated. This is how describe() used to calculate them.
+
+The size of the generated sql and the number of times it reads the data are always reported. If --db-url
+is given, the queries are also executed on that Postgres database, on a benchmark table that is created if
+it doesn't exist yet.
+
+Usage (from the bach directory):
+    python -m tests.benchmark.benchmark_describe --columns 50 --rows 1000000 --db-url postgresql://...
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Any, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.engine import Engine
+
+from bach import DataFrame
+from bach.operations.concat import DataFrameConcatOperation
+from bach.operations.describe import SupportedStats
+from sql_models.sql_generator import to_sql, model_to_quoted_name
+from tests.unit.bach.util import get_fake_df
+
+
+def create_table(engine: Engine, rows: int, columns: int) -> str:
+    """ Create the benchmark table if it doesn't exist, and return its name. """
+    table_name = f'benchmark_describe_{rows}x{columns}'
+    column_exprs = [
+        f'(i * {i + 1}) % 1000 as c{i}' if i % 2 == 0 else f'i / {i + 0.5} as c{i}' for i in range(columns)
+    ]
+    with engine.connect() as conn:
+        conn.execute(
+            f'create table if not exists {table_name} as '
+            f'select i, {", ".join(column_exprs)} from generate_series(1, {rows}) as i'
+        )
+    return table_name
+
+
+def describe_per_stat(df: DataFrame) -> DataFrame:
+    """ Calculate the stats of describe() with a separate aggregation per stat, and concatenate those. """
+    all_stats_df = []
+    for pos, stat in enumerate(SupportedStats):
+        stat_df = df.reset_index(drop=True).agg(func=stat.value).materialize()
+        stat_df = stat_df.rename(columns=dict(zip(stat_df.data_columns, df.data_columns)))
+        stat_df['__stat'] = stat.value
+        stat_df['__stat_position'] = pos
+        all_stats_df.append(stat_df)
+    percentiles_df = df.reset_index(drop=True).quantile(q=[0.25, 0.5, 0.75]).reset_index(drop=False)
+    percentiles_df = percentiles_df.rename(
+        columns={**{f'{name}_quantile': name for name in df.data_columns}, 'quantile': '__stat'}
+    )
+    all_stats_df.append(percentiles_df)
+    return DataFrameConcatOperation(objects=all_stats_df)().set_index('__stat')
+
+
+def time_function(function: Callable[[], Any], repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def run(columns: int, rows: int, repeat: int, db_url: Optional[str]):
+    if db_url:
+        engine = create_engine(db_url)
+        df = DataFrame.from_table(engine=engine, table_name=create_table(engine, rows, columns), index=['i'])
+    else:
+        dialect = PGDialect()
+        df = get_fake_df(dialect=dialect, index_names=['i'], data_names=[f'c{i}' for i in range(columns)])
+        engine = df.engine
+
+    methods = {
+        'describe()': df.describe(),
+        'aggregation per stat': describe_per_stat(df),
+    }
+    print(f'describe() of {columns} numeric columns')
+    # Number of times the data is read: the number of selects from the node of df
+    from_base_node = f'from {model_to_quoted_name(engine.dialect, df.base_node)}'
+    print(f'{"method":<22} {"sql size":>10} {"scans":>6} {"query time":>12}')
+    for name, result in methods.items():
+        sql = to_sql(dialect=engine.dialect, model=result._get_view_sql_model())
+        scans = sql.lower().count(from_base_node.lower())
+        elapsed = f'{time_function(result.to_pandas, repeat):>10.2f} s' if db_url else f'{"-":>12}'
+        print(f'{name:<22} {len(sql):>10} {scans:>6} {elapsed}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DataFrame.describe() on a wide numeric frame')
+    parser.add_argument('--columns', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--db-url', type=str, default=None,
+                        help='Postgres database to run the queries on. If not set, only sql sizes are given')
+    args = parser.parse_args(sys.argv[1:])
+    run(columns=args.columns, rows=args.rows, repeat=args.repeat, db_url=args.db_url)
+
+
+if __name__ == '__main__':
+    main()
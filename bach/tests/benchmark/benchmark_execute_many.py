@@ -0,0 +1,89 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Benchmark of bach.execute_many() against calling DataFrame.to_pandas() on each DataFrame. The DataFrames are
+several aggregations over the same expensive base DataFrame, as in a notebook that computes multiple
+metrics: the base assigns a session id to each event with window functions.
+
+The benchmark table is created if it doesn't exist yet.
+
+Usage (from the bach directory):
+    python -m tests.benchmark.benchmark_execute_many --rows 1000000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Callable, Any
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from bach import DataFrame, execute_many
+
+
+def create_table(engine: Engine, rows: int) -> str:
+    """ Create the benchmark table with events of users if it doesn't exist, and return its name. """
+    table_name = f'benchmark_execute_many_{rows}'
+    with engine.connect() as conn:
+        conn.execute(
+            f'create table if not exists {table_name} as '
+            f'select i as event_id, i % 1000 as user_id, '
+            f"timestamp '2022-01-01' + (i * interval '7 seconds') + (i % 13) * interval '1 hour' as moment "
+            f'from generate_series(1, {rows}) as i'
+        )
+    return table_name
+
+
+def get_dataframes(engine: Engine, table_name: str) -> List[DataFrame]:
+    df = DataFrame.from_table(engine=engine, table_name=table_name, index=['event_id'])
+    # A new session starts after 30 minutes of inactivity of a user
+    window = df.sort_values(['user_id', 'moment']).groupby('user_id').window()
+    df['is_start'] = (df.moment - df.moment.window_lag(window=window)).fillna(df.moment - df.moment) \
+        > '30 minutes'
+    df = df.materialize()
+    df['session_start'] = df.is_start.astype('int64')
+    df = df.materialize()
+    window = df.sort_values(['user_id', 'moment']).groupby('user_id').window()
+    df['session_id'] = df.session_start.sum(partition=window)
+    base = df.materialize()
+    return [
+        base.groupby('user_id')[['session_id']].nunique(),
+        base.groupby('session_id')[['moment']].count(),
+        base[['user_id', 'session_id']].nunique(),
+        base.groupby(['user_id', 'session_id'])[['moment']].max(),
+    ]
+
+
+def time_function(function: Callable[[], Any], repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bach.execute_many() on Postgres')
+    parser.add_argument('--db-url', type=str,
+                        default=os.environ.get('OBJ_DB_PG_TEST_URL',
+                                               'postgresql://objectiv:@localhost:5432/objectiv'))
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(sys.argv[1:])
+
+    engine = create_engine(args.db_url, pool_size=args.max_workers)
+    table_name = create_table(engine, args.rows)
+    dfs = get_dataframes(engine, table_name)
+    print(f'{len(dfs)} DataFrames over {args.rows} rows, best of {args.repeat} runs')
+    sequential = time_function(lambda: [df.to_pandas() for df in dfs], args.repeat)
+    print(f'{"to_pandas() per DataFrame":<30} {sequential:>8.2f} s')
+    for max_workers in sorted({1, args.max_workers}):
+        elapsed = time_function(lambda: execute_many(dfs, max_workers=max_workers), args.repeat)
+        print(f'{f"execute_many({max_workers} workers)":<30} {elapsed:>8.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Benchmark of DataFrame.from_pandas(materialization='cte') for pandas DataFrames of different sizes, with
+int, float, string, bool, and timestamp columns. The sql of the values is rendered both column-wise (as
+from_pandas does) and per value with Series.value_to_expression(), for comparison. No database is needed.
+
+Usage (from the bach directory):
+    python -m tests.benchmark.benchmark_from_pandas --rows 1000 10000 100000 --repeat 3
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List, Any
+
+import numpy
+import pandas
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.engine import Dialect
+
+from bach import DataFrame, get_series_type_from_dtype
+from bach.expression import Expression, join_expressions
+from bach.from_pandas import _from_pd_shared, _get_rows_sql
+from tests.unit.bach.util import FakeEngine
+
+
+def get_pandas_df(rows: int) -> pandas.DataFrame:
+    rng = numpy.random.default_rng(0)
+    floats = rng.normal(size=rows)
+    floats[::10] = numpy.nan
+    return pandas.DataFrame({
+        'int_column': rng.integers(0, 1_000_000, size=rows),
+        'float_column': floats,
+        'string_column': [f"city {i} 'quoted'" if i % 7 else None for i in range(rows)],
+        'bool_column': rng.integers(0, 2, size=rows) == 1,
+        'timestamp_column': pandas.Timestamp('2022-01-01') + pandas.to_timedelta(
+            rng.integers(0, 10**9, size=rows), unit='s'
+        ),
+    })
+
+
+def get_rows_sql_per_value(dialect: Dialect, pdf: pandas.DataFrame) -> str:
+    """ Render the sql of all values by constructing an Expression per value and per row. """
+    df_copy, _, all_dtypes = _from_pd_shared(dialect=dialect, df=pdf, convert_objects=True, cte=True)
+    column_series_type = [get_series_type_from_dtype(dtype) for dtype in all_dtypes.values()]
+    per_row_expr = []
+    for row in df_copy.itertuples():
+        per_column_expr = [
+            series_type.value_to_expression(dialect=dialect, value=row[i], dtype=series_type.dtype)
+            for i, series_type in enumerate(column_series_type, start=1)
+        ]
+        per_row_expr.append(Expression.construct('({})', join_expressions(per_column_expr)))
+    return join_expressions(per_row_expr, join_str=',\n').to_sql(dialect)
+
+
+def get_rows_sql_column_wise(dialect: Dialect, pdf: pandas.DataFrame) -> str:
+    df_copy, _, all_dtypes = _from_pd_shared(dialect=dialect, df=pdf, convert_objects=True, cte=True)
+    return _get_rows_sql(dialect=dialect, df=df_copy, dtypes=all_dtypes)
+
+
+def time_function(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    durations: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return {'min_ms': min(durations) * 1000, 'mean_ms': sum(durations) / len(durations) * 1000}
+
+
+def run(rows: List[int], repeat: int) -> Dict[str, Dict[str, float]]:
+    dialect = PGDialect()
+    engine = FakeEngine(dialect=dialect)
+    results = {}
+    for row_count in rows:
+        pdf = get_pandas_df(row_count)
+        assert get_rows_sql_column_wise(dialect, pdf) == get_rows_sql_per_value(dialect, pdf)
+        results[f'{row_count} rows: from_pandas'] = time_function(
+            lambda: DataFrame.from_pandas(engine=engine, df=pdf, convert_objects=True), repeat
+        )
+        results[f'{row_count} rows: values sql, column-wise'] = time_function(
+            lambda: get_rows_sql_column_wise(dialect, pdf), repeat
+        )
+        results[f'{row_count} rows: values sql, per value'] = time_function(
+            lambda: get_rows_sql_per_value(dialect, pdf), repeat
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DataFrame.from_pandas() with cte materialization')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(sys.argv[1:])
+
+    results = run(rows=args.rows, repeat=args.repeat)
+    print(f'{"benchmark":<45} {"min ms":>10} {"mean ms":>10}')
+    for name, stats in results.items():
+        print(f'{name:<45} {stats["min_ms"]:>10.1f} {stats["mean_ms"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
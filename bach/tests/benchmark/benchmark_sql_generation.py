@@ -0,0 +1,126 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Benchmark of building DataFrame graphs and generating sql, for wide DataFrames (many columns), deep
+DataFrames (many nodes), and a pipeline of filters, aggregations and merges of a size similar to the
+graphs that modelhub builds. No database is needed.
+
+Usage (from the bach directory):
+    python -m tests.benchmark.benchmark_sql_generation --columns 500 --depth 50 --steps 10 --repeat 5
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List, Any
+
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.engine import Dialect
+
+from bach import DataFrame
+from sql_models.model import Materialization
+from sql_models.sql_generator import to_sql
+from tests.unit.bach.util import get_fake_df
+
+
+def build_wide_df(dialect: Dialect, columns: int) -> DataFrame:
+    """ DataFrame with `columns` data columns, a sort, updated columns, filters and materializations. """
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=[f'c{i}' for i in range(columns)])
+    df = df.sort_values('c1')
+    for i in range(0, columns, 5):
+        df[f'c{i}'] = df[f'c{i}'] + 1
+    for _ in range(3):
+        df = df.materialize()
+        df = df[df.c2 > 2]
+    return df
+
+
+def build_deep_df(dialect: Dialect, depth: int) -> DataFrame:
+    """ DataFrame with a chain of `depth` materialized nodes. """
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=[f'c{i}' for i in range(20)])
+    for i in range(depth):
+        df['c1'] = df['c1'] + df['c2']
+        df = df.materialize(node_name=f'node_{i}')
+    return df
+
+
+def build_pipeline_df(dialect: Dialect, steps: int) -> DataFrame:
+    """
+    DataFrame with a graph similar to a modelhub pipeline: each step filters, aggregates, and merges the
+    aggregated result back. This gives a graph with about four nodes per step.
+    """
+    df = get_fake_df(
+        dialect=dialect,
+        index_names=['event_id'],
+        data_names=['user_id', 'session_id', 'moment', 'value', 'event_type', 'location'],
+        dtype={'event_id': 'int64', 'user_id': 'int64', 'session_id': 'int64', 'moment': 'timestamp',
+               'value': 'float64', 'event_type': 'string', 'location': 'string'}
+    )
+    for i in range(steps):
+        filtered = df[df.value > i]
+        aggregated = filtered.groupby('user_id')[['value']].sum()
+        aggregated = aggregated.rename(columns={'value_sum': f'value_sum_{i}'})
+        df = df.merge(aggregated, how='left', left_on='user_id', right_index=True)
+        df = df[['user_id', 'session_id', 'moment', 'value', 'event_type', 'location']]
+        df['value'] = df['value'] + 1
+        df = df.materialize(node_name=f'step_{i}')
+    return df
+
+
+def generate_sql(df: DataFrame) -> str:
+    """ The sql generation of DataFrame.view_sql(), without the formatting with sqlparse. """
+    model = df.get_current_node('view_sql', construct_multi_levels=True)
+    model = model.copy_set_materialization(Materialization.QUERY)
+    return to_sql(dialect=df.engine.dialect, model=model)
+
+
+def render_expressions(df: DataFrame) -> int:
+    """ Render the sql of all column expressions, as is done for every new node. """
+    dialect = df.engine.dialect
+    return sum(len(series.expression.to_sql(dialect)) for series in df.all_series.values())
+
+
+def time_function(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    durations: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return {'min_ms': min(durations) * 1000, 'mean_ms': sum(durations) / len(durations) * 1000}
+
+
+def run(columns: int, depth: int, steps: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    dialect = PGDialect()
+    wide_df = build_wide_df(dialect, columns)
+    deep_df = build_deep_df(dialect, depth)
+    pipeline_df = build_pipeline_df(dialect, steps)
+    return {
+        f'wide ({columns} columns): build graph':
+            time_function(lambda: build_wide_df(dialect, columns), repeat),
+        f'wide ({columns} columns): generate sql': time_function(lambda: generate_sql(wide_df), repeat),
+        f'wide ({columns} columns): render expressions':
+            time_function(lambda: render_expressions(wide_df), repeat),
+        f'deep ({depth} nodes): build graph': time_function(lambda: build_deep_df(dialect, depth), repeat),
+        f'deep ({depth} nodes): generate sql': time_function(lambda: generate_sql(deep_df), repeat),
+        f'pipeline ({steps} steps): build graph':
+            time_function(lambda: build_pipeline_df(dialect, steps), repeat),
+        f'pipeline ({steps} steps): generate sql':
+            time_function(lambda: generate_sql(pipeline_df), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DataFrame graph building and sql generation')
+    parser.add_argument('--columns', type=int, default=500, help='Number of columns of the wide DataFrame')
+    parser.add_argument('--depth', type=int, default=50, help='Number of nodes of the deep DataFrame')
+    parser.add_argument('--steps', type=int, default=10, help='Number of steps of the pipeline DataFrame')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(sys.argv[1:])
+
+    results = run(columns=args.columns, depth=args.depth, steps=args.steps, repeat=args.repeat)
+    print(f'{"benchmark":<45} {"min ms":>10} {"mean ms":>10}')
+    for name, stats in results.items():
+        print(f'{name:<45} {stats["min_ms"]:>10.1f} {stats["mean_ms"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
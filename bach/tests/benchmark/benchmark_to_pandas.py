@@ -0,0 +1,97 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Benchmark of DataFrame.to_pandas() on Postgres: fetching the result with COPY against fetching it through
+SQLAlchemy. Each method runs in a separate process, so that the peak memory usage of the processes can be
+compared.
+
+The benchmark table is created if it doesn't exist yet. It has int64, float64, and bool columns.
+
+Usage (from the bach directory):
+    python -m tests.benchmark.benchmark_to_pandas --rows 1000000 --columns 20 --repeat 3
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from sqlalchemy import create_engine
+
+from bach import DataFrame
+
+_METHODS = ('sqlalchemy', 'copy')
+
+
+def create_table(db_url: str, rows: int, columns: int) -> str:
+    """ Create the benchmark table if it doesn't exist, and return its name. """
+    table_name = f'benchmark_to_pandas_{rows}x{columns}'
+    column_exprs = []
+    for i in range(columns):
+        if i % 4 == 0:
+            column_exprs.append(f'i * {i + 1} as c{i}')
+        elif i % 4 == 3:
+            column_exprs.append(f'(i % {i + 2}) = 0 as c{i}')
+        else:
+            column_exprs.append(f'i / {i + 0.5} as c{i}')
+    engine = create_engine(db_url)
+    with engine.connect() as conn:
+        conn.execute(
+            f'create table if not exists {table_name} as '
+            f'select {", ".join(column_exprs)} from generate_series(1, {rows}) as i'
+        )
+    return table_name
+
+
+def run_method(db_url: str, table_name: str, method: str) -> None:
+    """ Run to_pandas() once with the given method, and print the results as json. """
+    import bach.postgres_copy
+    bach.postgres_copy.copy_to_pandas_enabled = method == 'copy'
+    engine = create_engine(db_url)
+    df = DataFrame.from_table(engine=engine, table_name=table_name, index=[])
+    start = time.perf_counter()
+    pdf = df.to_pandas()
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'elapsed_s': elapsed, 'peak_mb': peak_mb, 'shape': list(pdf.shape)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DataFrame.to_pandas() on Postgres')
+    parser.add_argument('--db-url', type=str,
+                        default=os.environ.get('OBJ_DB_PG_TEST_URL',
+                                               'postgresql://objectiv:@localhost:5432/objectiv'))
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    # internal: run a single method in this process
+    parser.add_argument('--run-method', choices=_METHODS, help=argparse.SUPPRESS)
+    parser.add_argument('--table-name', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.run_method:
+        run_method(args.db_url, args.table_name, args.run_method)
+        return
+
+    table_name = create_table(args.db_url, args.rows, args.columns)
+    print(f'to_pandas() of {args.rows} rows x {args.columns} columns, best of {args.repeat} runs')
+    print(f'{"method":<12} {"wall time":>12} {"peak memory":>14}')
+    for method in _METHODS:
+        results = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, '-m', 'tests.benchmark.benchmark_to_pandas', '--db-url', args.db_url,
+                 '--run-method', method, '--table-name', table_name],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        elapsed = min(result['elapsed_s'] for result in results)
+        peak_mb = min(result['peak_mb'] for result in results)
+        print(f'{method:<12} {elapsed:>10.2f} s {peak_mb:>11.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
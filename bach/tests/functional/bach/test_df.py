@@ -4,7 +4,8 @@ Copyright 2021 Objectiv B.V.
 import numpy as np
 import pandas as pd
 import pytest
-from bach import DataFrame, SeriesBoolean
+from bach import DataFrame, SeriesBoolean, Session, execute_many
+from bach.result_cache import ResultCache, set_result_cache
 from tests.functional.bach.test_data_and_utils import assert_equals_data, get_df_with_test_data
 
 
@@ -40,6 +41,110 @@ def test_head(engine):
     pd.testing.assert_frame_equal(result, expected_df)
 
 
+def test_iter_pandas(engine):
+    bt = get_df_with_test_data(engine, full_data_set=True)
+    bt = bt.sort_index()
+    expected_df = bt.to_pandas()
+
+    chunks = list(bt.iter_pandas(chunksize=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 3]
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected_df)
+
+    chunks = list(bt.to_pandas(chunksize=20))
+    assert len(chunks) == 1
+    pd.testing.assert_frame_equal(chunks[0], expected_df)
+
+    # Temporary tables are created before the query is executed
+    bt_temp = bt.materialize(materialization='temp_table').sort_index()
+    pd.testing.assert_frame_equal(pd.concat(bt_temp.iter_pandas(chunksize=5)), expected_df)
+
+    # Without index, the rows are numbered as to_pandas() does
+    bt_no_index = bt.reset_index(drop=True).sort_values('skating_order')
+    pd.testing.assert_frame_equal(pd.concat(bt_no_index.iter_pandas(chunksize=4)), bt_no_index.to_pandas())
+
+    with pytest.raises(ValueError, match='chunksize must be a positive number'):
+        list(bt.iter_pandas(chunksize=0))
+
+
+def test_to_parquet(engine, tmp_path):
+    bt = get_df_with_test_data(engine, full_data_set=True)
+    bt = bt.sort_index()
+    path = str(tmp_path / 'data.parquet')
+    bt.to_parquet(path, chunksize=4)
+    pd.testing.assert_frame_equal(pd.read_parquet(path), bt.to_pandas())
+
+
+@pytest.mark.skip_bigquery
+@pytest.mark.skip_athena
+def test_to_pandas_copy(engine, monkeypatch):
+    bt = get_df_with_test_data(engine, full_data_set=True)[['inhabitants', 'founding']]
+    bt['big_city'] = bt.inhabitants > 10000
+    bt['density'] = bt.inhabitants / bt.founding
+    # A left join gives columns with nulls
+    old_cities = bt[bt.founding < 1400][['founding', 'big_city']]
+    old_cities = old_cities.rename(columns={'founding': 'nullable_int', 'big_city': 'nullable_bool'})
+    bt = bt.merge(old_cities, how='left', left_index=True, right_index=True)
+    bt = bt.sort_index()
+
+    # Only int64, float64, and bool columns, so the result is fetched with COPY
+    result = bt.to_pandas()
+    monkeypatch.setattr('bach.postgres_copy.copy_to_pandas_enabled', False)
+    expected = bt.to_pandas()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_to_pandas_result_cache(engine, monkeypatch):
+    cache = ResultCache()
+    monkeypatch.setattr('bach.result_cache._result_cache', cache)
+    bt = get_df_with_test_data(engine, full_data_set=True)[['city', 'inhabitants']].sort_index()
+
+    expected = bt.to_pandas()
+    assert cache.stats.misses == 1
+    pd.testing.assert_frame_equal(bt.to_pandas(), expected)
+    pd.testing.assert_frame_equal(bt.head(2), expected.head(2))
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+
+    # The result doesn't change when the cache is not used
+    set_result_cache(None)
+    pd.testing.assert_frame_equal(bt.to_pandas(), expected)
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+
+
+@pytest.mark.skip_bigquery
+@pytest.mark.skip_athena
+def test_session_temp_tables(engine):
+    bt = get_df_with_test_data(engine, full_data_set=True)[['municipality', 'inhabitants']]
+    bt = bt.materialize(materialization='temp_table')
+    bt_grouped = bt.groupby('municipality').sum().sort_index()
+    expected = bt.sort_index().to_pandas()
+    expected_grouped = bt_grouped.to_pandas()
+
+    with Session(engine) as session:
+        pd.testing.assert_frame_equal(bt.sort_index().to_pandas(), expected)
+        assert len(session.temp_tables) == 1
+        # The temporary table is reused by the other queries in the session
+        pd.testing.assert_frame_equal(bt_grouped.to_pandas(), expected_grouped)
+        pd.testing.assert_frame_equal(pd.concat(bt_grouped.iter_pandas(chunksize=2)), expected_grouped)
+        assert len(session.temp_tables) == 1
+    assert session.temp_tables == {}
+
+
+def test_execute_many(engine):
+    bt = get_df_with_test_data(engine, full_data_set=True)
+    bt = bt[bt.inhabitants > 1000].materialize()
+    dfs = [
+        bt.groupby('municipality')[['inhabitants']].sum().sort_index(),
+        bt.groupby('municipality')[['founding']].min().sort_index(),
+        bt[['city', 'founding']].sort_index(),
+    ]
+    expected = [df.to_pandas() for df in dfs]
+    results = execute_many(dfs, max_workers=2)
+    assert len(results) == 3
+    for result, expected_df in zip(results, expected):
+        pd.testing.assert_frame_equal(result, expected_df)
+    assert execute_many([]) == []
+
+
 def test_del_item(engine):
     bt = get_df_with_test_data(engine)
 
@@ -10,6 +10,7 @@ import pytest
 from sqlalchemy.engine import Engine
 
 from bach import DataFrame
+from bach.from_database import get_dtypes_from_table
 from sql_models.model import CustomSqlModelBuilder, SqlModel, Materialization
 from sql_models.sql_generator import to_sql
 from sql_models.util import is_postgres, is_bigquery
@@ -129,6 +130,23 @@ def test_from_table_column_ordering(engine, unique_table_test_name):
     assert df == df_all_dtypes
 
 
+def test_from_table_schema_cache(engine, unique_table_test_name):
+    table_name = unique_table_test_name
+    _create_test_table(engine, table_name)
+    expected_dtypes = {
+        'a': 'int64', 'b': 'string', 'c': 'float64', 'd': 'date', 'e': 'timestamp', 'f': 'bool'
+    }
+    assert get_dtypes_from_table(engine, table_name) == expected_dtypes
+
+    # Changes to the table that bach doesn't know about are only seen when refreshing the cached dtypes
+    with engine.connect() as conn:
+        conn.execute(f'alter table {table_name} add column g bigint')
+    assert get_dtypes_from_table(engine, table_name) == expected_dtypes
+    assert get_dtypes_from_table(engine, table_name, refresh=True) == {**expected_dtypes, 'g': 'int64'}
+    df = DataFrame.from_table(engine=engine, table_name=table_name, index=['a'])
+    assert 'g' in df.data_columns
+
+
 @pytest.mark.skip_bigquery_todo()
 def test_from_model_column_ordering(engine, unique_table_test_name):
     # This is essentially the same test as test_from_table_model_ordering(), but tests creating the dataframe with
@@ -92,6 +92,44 @@ def test_from_pandas_table_injection(engine, unique_table_test_name):
         raise Exception()
 
 
+def test_from_pandas_table_chunks(engine, unique_table_test_name):
+    pdf = get_pandas_df(TEST_DATA_CITIES, CITIES_COLUMNS)
+    pdf['density'] = [1.5, np.nan, 0.1]
+    bt = DataFrame.from_pandas(
+        engine=engine,
+        df=pdf,
+        convert_objects=True,
+        name=unique_table_test_name,
+        materialization='table',
+        if_exists='replace',
+        chunksize=1,
+        max_workers=2
+    )
+    expected_data = [row + [density] for row, density in zip(EXPECTED_DATA, [1.5, None, 0.1])]
+    assert_equals_data(bt, expected_columns=EXPECTED_COLUMNS + ['density'], expected_data=expected_data)
+
+    # The table's column types are based on the bach dtypes, so the dtypes that are queried from the
+    # database should match them.
+    bt_from_table = DataFrame.from_table(
+        engine=engine, table_name=unique_table_test_name, index=['_index_skating_order']
+    )
+    assert bt_from_table.dtypes == bt.dtypes
+
+    DataFrame.from_pandas(
+        engine=engine,
+        df=pdf.iloc[:1],
+        convert_objects=True,
+        name=unique_table_test_name,
+        materialization='table',
+        if_exists='append',
+    )
+    assert_equals_data(
+        bt.sort_index(),
+        expected_columns=EXPECTED_COLUMNS + ['density'],
+        expected_data=expected_data[:1] + expected_data
+    )
+
+
 def test_from_pandas_ephemeral_basic(engine):
     pdf = get_pandas_df(TEST_DATA_CITIES, CITIES_COLUMNS)
     bt = DataFrame.from_pandas(
@@ -0,0 +1,48 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+from typing import Callable
+
+import pytest
+from sqlalchemy.engine import Engine
+
+from bach import DataFrame
+from tests.functional.bach.test_data_and_utils import get_df_with_test_data, df_to_list
+
+
+def _filter_after_materialize(df: DataFrame) -> DataFrame:
+    df['name_length'] = df.city.str.len()
+    df = df.materialize(node_name='node1')
+    df = df.materialize(node_name='node2')
+    df = df[df.name_length > 5]
+    return df[df.founding < 1400]
+
+
+def _filter_after_limit(df: DataFrame) -> DataFrame:
+    df = df.sort_values('skating_order').materialize(node_name='node1', limit=5)
+    return df[df.inhabitants > 10000]
+
+
+def _filter_after_window(df: DataFrame) -> DataFrame:
+    df['next_founding'] = df.founding.window_lead(window=df.sort_values('skating_order').window())
+    df = df.materialize(node_name='node1')
+    return df[df.founding > 1300]
+
+
+def _filter_after_group_by(df: DataFrame) -> DataFrame:
+    df = df.groupby('municipality')[['inhabitants']].sum()
+    df = df.materialize(node_name='node1')
+    return df[df.inhabitants_sum > 10000]
+
+
+@pytest.mark.parametrize('build_df', [
+    _filter_after_materialize, _filter_after_limit, _filter_after_window, _filter_after_group_by
+])
+def test_push_down_predicates_result(engine: Engine, monkeypatch, build_df: Callable[[DataFrame], DataFrame]):
+    df = build_df(get_df_with_test_data(engine, full_data_set=True)).sort_index()
+
+    result = df_to_list(df.to_pandas())
+    monkeypatch.setattr('bach.optimizations._push_down_predicates_enabled', False)
+    expected = df_to_list(df.to_pandas())
+    assert result == expected
+    assert len(expected) > 0
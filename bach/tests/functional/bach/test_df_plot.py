@@ -1,13 +1,9 @@
 """
 Copyright 2022 Objectiv B.V.
 """
-from decimal import Decimal
-
 import pytest
 from matplotlib.testing.decorators import check_figures_equal
-from psycopg2._range import NumericRange
 
-from sql_models.util import is_bigquery, is_postgres
 from tests.functional.bach.test_data_and_utils import get_df_with_test_data, assert_equals_data
 
 pytestmark = pytest.mark.skip_athena_todo()  # TODO: Athena
@@ -29,50 +25,22 @@ def test_plot_hist_basic(engine, fig_test, fig_ref) -> None:
     result_calc_bins = bt.plot._calculate_hist_frequencies(
         bins=10, numeric_columns=['skating_order', 'inhabitants', 'founding'],
     )
-    if is_postgres(engine):
-        bins_1 = NumericRange(lower=Decimal('1.'),  upper=Decimal('9349.4'), bounds='[]')
-        bins_2 = NumericRange(lower=Decimal('9349.4'),  upper=Decimal('18697.8'), bounds='(]')
-        bins_3 = NumericRange(lower=Decimal('18697.8'),  upper=Decimal('28046.2'), bounds='(]')
-        bins_4 = NumericRange(lower=Decimal('28046.2'),  upper=Decimal('37394.6'), bounds='(]')
-        bins_5 = NumericRange(lower=Decimal('37394.6'),  upper=Decimal('46743.'), bounds='(]')
-        bins_6 = NumericRange(lower=Decimal('46743.'),  upper=Decimal('56091.4'), bounds='(]')
-        bins_7 = NumericRange(lower=Decimal('56091.4'),  upper=Decimal('65439.8'), bounds='(]')
-        bins_8 = NumericRange(lower=Decimal('65439.8'),  upper=Decimal('74788.2'), bounds='(]')
-        bins_9 = NumericRange(lower=Decimal('74788.2'),  upper=Decimal('84136.6'), bounds='(]')
-        bins_10 = NumericRange(lower=Decimal('84136.6'),  upper=Decimal('93485.'), bounds='(]')
-
-    elif is_bigquery(engine):
-        bins_1 = {'lower': 1.,  'upper': 9349.4, 'bounds': '[]'}
-        bins_2 = {'lower': 9349.4,  'upper': 18697.8, 'bounds': '(]'}
-        bins_3 = {'lower': 18697.8,  'upper': 28046.199999999997, 'bounds': '(]'}
-        bins_4 = {'lower': 28046.199999999997,  'upper': 37394.6, 'bounds': '(]'}
-        bins_5 = {'lower': 37394.6,  'upper': 46743., 'bounds': '(]'}
-        bins_6 = {'lower': 46743.,  'upper': 56091.399999999994, 'bounds': '(]'}
-        bins_7 = {'lower': 56091.399999999994,  'upper': 65439.799999999996, 'bounds': '(]'}
-        bins_8 = {'lower': 65439.799999999996,  'upper': 74788.2, 'bounds': '(]'}
-        bins_9 = {'lower': 74788.2,  'upper': 84136.59999999999, 'bounds': '(]'}
-        bins_10 = {'lower': 84136.59999999999, 'upper': 93485., 'bounds': '(]'}
-    else:
-        raise Exception()
-
+    # all columns share the same bins: from 1 to 93485, with a width of 9348.4
+    frequencies = {
+        'founding': {1: 3},
+        'inhabitants': {1: 1, 4: 1, 10: 1},
+        'skating_order': {1: 3},
+    }
     assert_equals_data(
         result_calc_bins,
-        expected_columns=['column_label',  'frequency', 'range'],
-        order_by=['column_label', 'range'],
+        expected_columns=['column_label', 'bin', 'lower_edge', 'upper_edge', 'frequency'],
+        order_by=['column_label', 'bin'],
         expected_data=[
-            ['empty_bins', 0, bins_2],
-            ['empty_bins', 0, bins_3],
-            ['empty_bins', 0, bins_5],
-            ['empty_bins', 0, bins_6],
-            ['empty_bins', 0, bins_7],
-            ['empty_bins', 0, bins_8],
-            ['empty_bins', 0, bins_9],
-            ['founding',   3, bins_1],
-            ['inhabitants', 1, bins_1],
-            ['inhabitants', 1, bins_4],
-            ['inhabitants', 1, bins_10],
-            ['skating_order', 3, bins_1],
+            [label, bin_nr, 1 + (bin_nr - 1) * 9348.4, 1 + bin_nr * 9348.4, label_frequencies.get(bin_nr, 0)]
+            for label, label_frequencies in frequencies.items()
+            for bin_nr in range(1, 11)
         ],
+        round_decimals=True,
     )
 
 
@@ -90,32 +58,16 @@ def test_plot_hist_bins(engine, fig_test, fig_ref) -> None:
     result_calc_bins = bt.plot._calculate_hist_frequencies(
         bins=5, numeric_columns=['inhabitants'],
     )
-    if is_postgres(engine):
-        bins_1 = NumericRange(lower=Decimal('700.'),  upper=Decimal('19257.'), bounds='[]')
-        bins_2 = NumericRange(lower=Decimal('19257.'),  upper=Decimal('37814.'), bounds='(]')
-        bins_3 = NumericRange(lower=Decimal('37814.'),  upper=Decimal('56371.'), bounds='(]')
-        bins_4 = NumericRange(lower=Decimal('56371.'),  upper=Decimal('74928.'), bounds='(]')
-        bins_5 = NumericRange(lower=Decimal('74928.'),  upper=Decimal('93485.'), bounds='(]')
-    elif is_bigquery(engine):
-        bins_1 = {'lower': 700., 'upper': 19257., 'bounds': '[]'}
-        bins_2 = {'lower': 19257., 'upper': 37814., 'bounds': '(]'}
-        bins_3 = {'lower': 37814., 'upper': 56371., 'bounds': '(]'}
-        bins_4 = {'lower': 56371., 'upper': 74928., 'bounds': '(]'}
-        bins_5 = {'lower': 74928., 'upper': 93485., 'bounds': '(]'}
-    else:
-        raise Exception()
-
     assert_equals_data(
         result_calc_bins,
-        expected_columns=['column_label', 'frequency', 'range'],
-        order_by=['column_label', 'range'],
+        expected_columns=['column_label', 'bin', 'lower_edge', 'upper_edge', 'frequency'],
+        order_by=['column_label', 'bin'],
         expected_data=[
-            ['empty_bins', 0, bins_3],
-            ['empty_bins', 0, bins_4],
-            ['inhabitants', 9, bins_1],
-            ['inhabitants', 1, bins_2],
-            ['inhabitants', 1, bins_5],
+            ['inhabitants', 1, 700., 19257., 9],
+            ['inhabitants', 2, 19257., 37814., 1],
+            ['inhabitants', 3, 37814., 56371., 0],
+            ['inhabitants', 4, 56371., 74928., 0],
+            ['inhabitants', 5, 74928., 93485., 1],
         ],
         round_decimals=True,
     )
-
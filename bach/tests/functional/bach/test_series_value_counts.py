@@ -4,6 +4,7 @@ from decimal import Decimal
 import pytest
 from psycopg2._range import NumericRange
 
+from bach.approximation import get_approx_sample_rate, set_approx_sample_rate
 from sql_models.util import is_postgres, is_bigquery
 from tests.functional.bach.test_data_and_utils import assert_equals_data, \
     get_df_with_railway_data, get_df_with_test_data
@@ -43,6 +44,27 @@ def test_value_counts_basic(engine):
     )
 
 
+@pytest.mark.skip_athena_todo()  # TODO: Athena
+def test_value_counts_approx(engine):
+    bt = get_df_with_test_data(engine)['municipality']
+    original_sample_rate = get_approx_sample_rate()
+    try:
+        # With all rows in the sample, the approximation gives the exact counts
+        set_approx_sample_rate(1)
+        result = bt.value_counts(approx=True)
+        assert_equals_data(
+            result.to_frame(),
+            expected_columns=['municipality', 'value_counts'],
+            expected_data=[
+                ['Súdwest-Fryslân', 2],
+                ['Leeuwarden', 1]
+            ],
+        )
+        assert bt.nunique(approx=True).value == 2
+    finally:
+        set_approx_sample_rate(original_sample_rate)
+
+
 @pytest.mark.skip_athena_todo()  # TODO: Athena
 def test_value_counts_w_bins(engine) -> None:
     bins = 4
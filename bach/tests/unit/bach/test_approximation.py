@@ -0,0 +1,82 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+import pytest
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.engine.default import DefaultDialect
+
+from bach.approximation import set_approx_sample_rate, get_approx_sample_rate, get_count_error_bound, \
+    get_quantile_error_bound, get_sample_condition
+from sql_models.sql_generator import to_sql
+from sql_models.util import is_bigquery
+from tests.unit.bach.util import get_fake_df
+
+
+@pytest.fixture()
+def sample_rate():
+    original = get_approx_sample_rate()
+    set_approx_sample_rate(0.1)
+    yield 0.1
+    set_approx_sample_rate(original)
+
+
+@pytest.mark.db_independent
+def test_set_approx_sample_rate(sample_rate):
+    assert get_approx_sample_rate() == sample_rate
+    for invalid in (0, -0.1, 1.5):
+        with pytest.raises(ValueError, match='sample_rate should be'):
+            set_approx_sample_rate(invalid)
+    assert get_approx_sample_rate() == sample_rate
+
+
+@pytest.mark.db_independent
+def test_error_bounds():
+    # 10_000 sampled values at rate 0.01: bound is 1.96 * sqrt(1_000_000 * 0.99 / 0.01)
+    assert get_count_error_bound(1_000_000, sample_rate=0.01) == pytest.approx(19501.75, abs=0.01)
+    assert get_count_error_bound(1_000_000, sample_rate=1) == 0
+    assert get_quantile_error_bound(0.5, count=1_000_000, sample_rate=0.01) == pytest.approx(0.0098)
+    assert get_quantile_error_bound(0, count=1_000_000) == 0
+
+
+@pytest.mark.db_independent
+def test_get_sample_condition(sample_rate):
+    class AthenaDialect(DefaultDialect):
+        name = 'awsathena'
+
+    class BigQueryDialect(DefaultDialect):
+        name = 'bigquery'
+
+    assert get_sample_condition(PGDialect()).to_sql(PGDialect()) == 'random() < 0.1'
+    assert get_sample_condition(AthenaDialect()).to_sql(AthenaDialect()) == 'rand() < 0.1'
+    assert get_sample_condition(BigQueryDialect()).to_sql(BigQueryDialect()) == 'rand() < 0.1'
+    assert get_sample_condition(PGDialect()).has_non_deterministic_function
+
+
+def test_approx_sql(dialect, sample_rate):
+    df = get_fake_df(dialect=dialect, index_names=['a'], data_names=['b', 'c'], dtype='int64')
+
+    def get_sql(result) -> str:
+        return to_sql(dialect=dialect, model=result.to_frame()._get_view_sql_model())
+
+    nunique_sql = get_sql(df.b.nunique(approx=True))
+    quantile_sql = get_sql(df.groupby('c').b.quantile(q=[0.25, 0.75], approx=True))
+    value_counts_sql = get_sql(df.b.value_counts(approx=True))
+    if is_bigquery(dialect):
+        assert 'approx_count_distinct(`b`)' in nunique_sql
+        assert 'approx_quantiles(`b`, 1000)' in quantile_sql
+        assert '[offset(250)]' in quantile_sql and '[offset(750)]' in quantile_sql
+        assert 'where rand() < 0.1' in value_counts_sql
+    else:
+        assert 'count(distinct case when abs(cast(hashtext(cast("b" as text)) as bigint)) < 214748364 ' \
+               'then "b" end) / 0.1' in nunique_sql
+        assert 'within group (order by case when random() < 0.1 then "b" end)' in quantile_sql
+        assert 'where random() < 0.1' in value_counts_sql
+
+
+@pytest.mark.db_independent
+def test_describe_approx(sample_rate):
+    df = get_fake_df(dialect=PGDialect(), index_names=['a'], data_names=['b', 'c'], dtype='int64')
+    sql = to_sql(dialect=df.engine.dialect, model=df.describe(approx=True)._get_view_sql_model())
+    assert 'count(distinct' in sql and 'hashtext' in sql
+    assert 'random() < 0.1' in sql
+    assert 'hashtext' not in to_sql(dialect=df.engine.dialect, model=df.describe()._get_view_sql_model())
@@ -0,0 +1,115 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+import pytest
+
+from bach.categories import CategoryCache, CategoryCacheKey, get_categories, get_category_cache
+from tests.unit.bach.util import get_fake_df_test_data
+
+
+@pytest.fixture
+def queried(monkeypatch):
+    """ Replace the querying of categories, and give the labels of the DataFrames of each query. """
+    monkeypatch.setattr('bach.categories._category_cache', CategoryCache())
+    queries = []
+
+    def query_categories(dfs):
+        queries.append([label for label, _ in dfs])
+        return {label: [f'value_{label}', None] for label, _ in dfs}
+
+    monkeypatch.setattr('bach.categories._query_categories', query_categories)
+    return queries
+
+
+@pytest.mark.db_independent
+def test_category_cache(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('bach.categories.time.time', lambda: now[0])
+    cache = CategoryCache(ttl=60)
+    key_a = CategoryCacheKey(engine_url='postgresql://db1', model_hash='1234')
+    key_b = CategoryCacheKey(engine_url='postgresql://db2', model_hash='1234')
+
+    assert cache.get(key_a) is None
+    cache.put(key_a, ['a', 'b'])
+    cache.put(key_b, [1, None])
+    assert cache.get(key_a) == ['a', 'b']
+    assert cache.get(key_b) == [1, None]
+
+    assert cache.invalidate(engine_url='postgresql://db1') == 1
+    assert cache.get(key_a) is None
+    assert cache.get(key_b) == [1, None]
+
+    # entries expire after ttl seconds
+    now[0] += 61
+    assert cache.get(key_b) is None
+
+
+def test_get_categories(dialect, queried):
+    df = get_fake_df_test_data(dialect)
+    series = [df['city'], df['municipality'], df['skating_order']]
+
+    # series with the same dtype are queried at once
+    assert get_categories(series) == [['value_0', None], ['value_1', None], ['value_2', None]]
+    assert sorted(queried) == [[0, 1], [2]]
+
+    # categories are cached by the model of the series, not by its name
+    renamed = df.rename(columns={'city': 'town'})
+    assert get_categories([renamed['town'], df['founding']]) == [['value_0', None], ['value_1', None]]
+    assert sorted(queried) == [[0, 1], [1], [2]]
+
+    filtered = df[df['skating_order'] > 3]
+    get_categories([filtered['city'], df['city']])
+    assert queried[-1] == [0]
+
+    get_categories([df['city']], refresh=True)
+    assert queried[-1] == [0]
+
+
+def test_get_categories_not_cached_by_default(dialect, monkeypatch):
+    assert get_category_cache() is None
+    city_values = [['Leeuwarden', 'Sneek']]
+
+    def query_categories(dfs):
+        return {label: list(city_values[-1]) for label, _ in dfs}
+
+    monkeypatch.setattr('bach.categories._query_categories', query_categories)
+    df = get_fake_df_test_data(dialect)[['city', 'municipality', 'inhabitants']]
+    df = df.set_index(['city', 'municipality'])
+    assert get_categories([df.index['city']]) == [['Leeuwarden', 'Sneek']]
+
+    # a city is inserted in the source table: without a category cache it's picked up right away
+    city_values.append(['Leeuwarden', 'Sneek', 'Drylts'])
+    assert get_categories([df.index['city']]) == [['Leeuwarden', 'Sneek', 'Drylts']]
+    result = df.unstack()
+    assert result.data_columns == ['Leeuwarden__inhabitants', 'Sneek__inhabitants', 'Drylts__inhabitants']
+
+
+def test_unstack_categories(dialect, queried):
+    df = get_fake_df_test_data(dialect)[['city', 'municipality', 'inhabitants']]
+    df = df.set_index(['city', 'municipality'])
+
+    result = df.unstack(categories=['Leeuwarden', 'Sneek'])
+    assert result.data_columns == ['Leeuwarden__inhabitants', 'Sneek__inhabitants']
+    assert queried == []
+
+    result = df['inhabitants'].unstack(level='city', categories=['Drylts'])
+    assert result.data_columns == ['Drylts']
+    assert queried == []
+
+    with pytest.raises(ValueError, match=r'index contains empty values'):
+        df.unstack(categories=['Sneek', None])
+
+
+def test_get_dummies_categories(dialect, queried):
+    df = get_fake_df_test_data(dialect)[['city', 'municipality', 'inhabitants']]
+
+    result = df.get_dummies(categories={'city': ['Sneek', 'Drylts'], 'municipality': ['Súdwest-Fryslân']})
+    assert result.data_columns == ['inhabitants', 'city_Sneek', 'city_Drylts', 'municipality_Súdwest-Fryslân']
+    assert queried == []
+
+    # categories of all other series are queried at once
+    result = df.get_dummies(categories={'municipality': ['Súdwest-Fryslân']}, dummy_na=True)
+    assert result.data_columns == [
+        'inhabitants', 'city_value_0', 'municipality_Súdwest-Fryslân', 'municipality_nan'
+    ]
+    assert queried == [[0]]
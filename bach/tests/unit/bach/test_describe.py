@@ -1,9 +1,13 @@
 """
 Copyright 2022 Objectiv B.V.
 """
+import re
+
 import pytest
+from sqlalchemy.dialects.postgresql.base import PGDialect
 
 from bach.operations.describe import DescribeOperation
+from sql_models.sql_generator import to_sql
 from tests.unit.bach.util import get_fake_df
 
 
@@ -110,3 +114,21 @@ def test_include_exclude(dialect) -> None:
             datetime_is_numeric=False,
             percentiles=None,
         )
+
+
+@pytest.mark.db_independent
+def test_describe_single_aggregation() -> None:
+    df = get_fake_df(
+        dialect=PGDialect(),
+        index_names=['i'],
+        data_names=['a', 'b', 'c'],
+        dtype={'i': 'int64', 'a': 'string', 'b': 'int64', 'c': 'float64'}
+    )
+    result = df.describe(include='all', percentiles=[0.25, 0.5, 0.75])
+    sql = to_sql(dialect=df.engine.dialect, model=result._get_view_sql_model())
+    # All stats and percentiles are calculated in a single aggregation over the data
+    assert len(re.findall(r'from "base___\w+"', sql)) == 1
+    assert sql.count('percentile_cont') == 6
+    assert sql.count('count(distinct') == 3
+    assert result.dtypes == {'a': 'string', 'b': 'float64', 'c': 'float64'}
+    assert result.index_dtypes == {'__stat': 'string'}
@@ -1,9 +1,15 @@
 """
 Copyright 2022 Objectiv B.V.
 """
+import datetime
+
+import numpy as np
+import pandas as pd
 import pytest
 
-from bach.from_pandas import _assert_column_names_valid
+from bach import get_series_type_from_dtype
+from bach.expression import Expression, join_expressions
+from bach.from_pandas import _assert_column_names_valid, _from_pd_shared, _get_rows_sql
 from tests.unit.bach.test_utils import ColNameValid
 from tests.unit.bach.util import get_pandas_df
 
@@ -53,3 +59,27 @@ def test__assert_column_names_valid_db_specific(dialect):
         else:
             with pytest.raises(ValueError, match='Invalid column names: .* for SQL dialect'):
                 _assert_column_names_valid(dialect=dialect, df=pdf)
+
+
+def test__get_rows_sql(dialect):
+    # The column-wise rendered values must be exactly the same as rendering each value as expression
+    pdf = pd.DataFrame({
+        'i': [1, -2**62, 3],
+        'f': [0.1, np.nan, float('-inf')],
+        's': ["a'b", None, 'x"y{z}\\'],
+        'b': [True, None, False],
+        't': [pd.Timestamp('2021-01-01 10:00:00.123456789'), pd.NaT, pd.Timestamp('1970-01-01')],
+        'dt': [datetime.datetime(1200, 1, 1), None, datetime.datetime(2022, 2, 2, 2, 2, 2)],
+        'd': [datetime.date(2021, 1, 1), None, datetime.date(2022, 1, 1)],
+    }, index=pd.Index(['k{1}', "k'2", 'k3'], name='key'))
+    df_copy, _, all_dtypes = _from_pd_shared(dialect=dialect, df=pdf, convert_objects=True, cte=True)
+
+    rows = []
+    for _, row in df_copy.iterrows():
+        values = [
+            get_series_type_from_dtype(dtype).value_to_expression(dialect, value=row[name], dtype=dtype)
+            for name, dtype in all_dtypes.items()
+        ]
+        rows.append(Expression.construct('({})', join_expressions(values)))
+    expected = join_expressions(rows, join_str=',\n').to_sql(dialect)
+    assert _get_rows_sql(dialect=dialect, df=df_copy, dtypes=all_dtypes) == expected
@@ -3,6 +3,7 @@ Copyright 2022 Objectiv B.V.
 """
 import pytest
 
+from sql_models.sql_generator import to_sql
 from tests.unit.bach.util import get_fake_df_test_data
 
 
@@ -18,3 +19,15 @@ def test_df_plot_hist_by_error(dialect):
 
     with pytest.raises(NotImplementedError, match=r'currently not supported'):
         bt.plot.hist(by='city')
+
+
+def test_df_plot_hist_frequencies_sql(dialect):
+    bt = get_fake_df_test_data(dialect)
+    result = bt.plot._calculate_hist_frequencies(bins=10, numeric_columns=['skating_order', 'inhabitants'])
+    assert result.data_columns == ['column_label', 'bin', 'lower_edge', 'upper_edge', 'frequency']
+
+    sql = to_sql(dialect=dialect, model=result._get_view_sql_model()).lower()
+    # columns are not stacked, and all frequencies are counted in a single aggregation
+    assert 'union all' not in sql
+    assert sql.count('sum(case when') == 20
+    assert sql.count(' group by ') == 0
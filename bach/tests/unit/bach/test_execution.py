@@ -0,0 +1,72 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+import contextlib
+from typing import List
+
+import pytest
+from sqlalchemy.dialects.postgresql.base import PGDialect
+
+from bach.execution import get_shared_nodes, _replace_shared_nodes
+from sql_models.sql_generator import to_sql
+from tests.unit.bach.util import get_fake_df
+
+
+class FakeRecordingEngine:
+    """ Engine of which the connections record all executed sql. """
+    def __init__(self):
+        self.dialect = PGDialect()
+        self.name = self.dialect.name
+        self.executed: List[str] = []
+
+    @contextlib.contextmanager
+    def connect(self):
+        yield self
+
+    def execute(self, sql: str):
+        self.executed.append(sql)
+
+
+@pytest.mark.db_independent
+def test_get_shared_nodes():
+    df = get_fake_df(dialect=PGDialect(), index_names=['a'], data_names=['b', 'c'])
+    df['d'] = df.b + df.c
+    base = df.materialize()
+    filtered = base[base.b > 3].materialize()
+    sum_b = filtered.groupby('b').sum()._get_view_sql_model(optimize=False)
+    count_c = filtered.groupby('c').count()._get_view_sql_model(optimize=False)
+    count_base = base.groupby('c').count()._get_view_sql_model(optimize=False)
+
+    assert get_shared_nodes([sum_b, count_c]) == {filtered.base_node.hash}
+    assert get_shared_nodes([sum_b, count_base]) == {base.base_node.hash}
+    # base is used by filtered and by count_base
+    assert get_shared_nodes([sum_b, count_c, count_base]) == {filtered.base_node.hash, base.base_node.hash}
+    assert get_shared_nodes([sum_b, count_c, count_base], min_references=3) == {base.base_node.hash}
+    assert get_shared_nodes([sum_b]) == set()
+
+
+@pytest.mark.db_independent
+def test__replace_shared_nodes():
+    engine = FakeRecordingEngine()
+    df = get_fake_df(dialect=engine.dialect, index_names=['a'], data_names=['b', 'c'])
+    base = df[df.b > 3].materialize()
+    sum_b = base.groupby('b').sum()._get_view_sql_model(optimize=False)
+    count_c = base.groupby('c').count()._get_view_sql_model(optimize=False)
+
+    replaced = {}  # type: ignore
+    created_tables: List[str] = []
+    shared_hashes = {base.base_node.hash}
+    new_models = [
+        _replace_shared_nodes(engine, model, shared_hashes, replaced, created_tables)  # type: ignore
+        for model in (sum_b, count_c)
+    ]
+
+    # The shared node is created once, and both queries select from it
+    assert len(created_tables) == 1
+    table_name = created_tables[0]
+    assert table_name.startswith('bach_shared_')
+    assert engine.executed == [f'create table "{table_name}" as {to_sql(engine.dialect, base.base_node)}']
+    for model in new_models:
+        sql = to_sql(engine.dialect, model)
+        assert f'from "{table_name}"' in sql
+        assert 'from x' not in sql
@@ -5,7 +5,7 @@ import pytest
 
 from bach.expression import RawToken, ColumnReferenceToken, StringValueToken, Expression, \
     ConstValueExpression, AggregateFunctionExpression, WindowFunctionExpression, SingleValueExpression, \
-    NonAtomicExpression, TableColumnReferenceToken
+    NonAtomicExpression, TableColumnReferenceToken, NonDeterministicExpression
 from sql_models.util import is_bigquery
 from tests.unit.bach.util import get_fake_df
 
@@ -263,3 +263,59 @@ def test_has_table_column_reference() -> None:
 
     expr2 = Expression.column_reference('city')
     assert not expr2.has_table_column_references
+
+
+def test_to_sql_memoized(dialect) -> None:
+    inner = Expression.construct('{} + 1', Expression.column_reference('city'))
+    expr = Expression.construct('sum({})', inner)
+    if not is_bigquery(dialect):
+        assert expr.to_sql(dialect) == 'sum("city" + 1)'
+        assert expr.to_sql(dialect, 'tab') == 'sum("tab"."city" + 1)'
+    else:
+        assert expr.to_sql(dialect) == 'sum(`city` + 1)'
+        assert expr.to_sql(dialect, 'tab') == 'sum(`tab`.`city` + 1)'
+    # memoized per table name, and sub-expressions are memoized too
+    assert expr.to_sql(dialect) is expr.to_sql(dialect)
+    assert expr.to_sql(dialect, 'tab') is expr.to_sql(dialect, 'tab')
+    assert inner.to_sql(dialect, 'tab') in expr.to_sql(dialect, 'tab')
+    assert len(inner._sql_cache) == 2
+    # resolving without any column references to resolve, gives the same instance with its memoized sql
+    resolved = expr.resolve_column_references(dialect, 'tab')
+    assert resolved == Expression.construct('sum({})', Expression.construct(
+        '{} + 1', Expression.table_column_reference('tab', 'city')
+    ))
+    assert resolved.resolve_column_references(dialect, 'other') is resolved
+
+
+@pytest.mark.db_independent
+def test_tokens_interned() -> None:
+    expr1 = Expression.construct('cast({} as text)', Expression.identifier('a'))
+    expr2 = Expression.construct('cast({} as text)', Expression.identifier('a'))
+    assert expr1 == expr2
+    assert all(token1 is token2 for token1, token2 in zip(expr1.get_all_tokens(), expr2.get_all_tokens()))
+    assert hash(expr1) == hash(expr2)
+    assert Expression.raw('x').data[0] is Expression.raw('x').data[0]
+
+
+@pytest.mark.db_independent
+def test_structural_key() -> None:
+    expr1 = Expression.construct('cast({} as text)', Expression.identifier('a'))
+    expr2 = Expression.construct('cast({} as text)', Expression.identifier('a'))
+    assert expr1.structural_key == expr2.structural_key
+    assert hash(expr1.structural_key) == hash(expr2.structural_key)
+    # unlike equality, the key takes the class of the (sub)expressions into account
+    aggregate = AggregateFunctionExpression(Expression.identifier('a').data)
+    expr3 = Expression.construct('cast({} as text)', aggregate)
+    assert expr3 == expr1
+    assert expr3.structural_key != expr1.structural_key
+    assert AggregateFunctionExpression(expr1.data).structural_key != expr1.structural_key
+
+
+@pytest.mark.db_independent
+def test_has_non_deterministic_function() -> None:
+    random_expr = NonDeterministicExpression.construct('random()')
+    assert random_expr.has_non_deterministic_function
+    assert Expression.construct('cast({} as text)', random_expr).has_non_deterministic_function
+    assert Expression.construct_expr_as_name(random_expr, 'x').has_non_deterministic_function
+    # identifiers that look like a function call are not function calls
+    assert not Expression.identifier('random()').has_non_deterministic_function
@@ -3,7 +3,8 @@ Copyright 2022 Objectiv B.V.
 """
 import pytest
 
-from bach.from_database import _get_bq_meta_data_table_from_table_name
+from bach.from_database import _get_bq_meta_data_table_from_table_name, SchemaCache, SchemaCacheKey, \
+    _get_cached_dtypes, set_schema_cache
 
 
 @pytest.mark.db_independent('Function under test always assumes BQ; does not need dialect or engine param')
@@ -15,3 +16,63 @@ def test__get_bq_meta_data_table_from_table_name():
            ('project_id.dataset.INFORMATION_SCHEMA.COLUMNS', 'test_table')
     assert _get_bq_meta_data_table_from_table_name('objectiv-production.a-dataset.a_table') == \
            ('objectiv-production.a-dataset.INFORMATION_SCHEMA.COLUMNS', 'a_table')
+
+
+@pytest.mark.db_independent
+def test_schema_cache(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('bach.from_database.time.time', lambda: now[0])
+    cache = SchemaCache(ttl=60)
+    key_a = SchemaCacheKey(engine_url='postgresql://db1', table_name='a', model_hash=None)
+    key_b = SchemaCacheKey(engine_url='postgresql://db2', table_name='a', model_hash=None)
+    key_model = SchemaCacheKey(engine_url='postgresql://db1', table_name=None, model_hash='1234')
+
+    assert cache.get(key_a) is None
+    cache.put(key_a, {'x': 'int64'})
+    cache.put(key_b, {'x': 'string'})
+    cache.put(key_model, {'y': {'a': 'int64'}})
+    assert cache.get(key_a) == {'x': 'int64'}
+    assert cache.get(key_b) == {'x': 'string'}
+    assert cache.get(key_model) == {'y': {'a': 'int64'}}
+
+    assert cache.invalidate(engine_url='postgresql://db1', table_name='a') == 1
+    assert cache.get(key_a) is None
+    assert cache.get(key_b) == {'x': 'string'}
+
+    # entries expire after ttl seconds
+    now[0] += 61
+    assert cache.get(key_b) is None
+    assert cache.get(key_model) is None
+
+
+@pytest.mark.db_independent
+def test_schema_cache_directory(tmp_path):
+    key = SchemaCacheKey(engine_url='postgresql://db1', table_name='a', model_hash=None)
+    SchemaCache(directory=str(tmp_path)).put(key, {'x': 'int64', 'y': ['string']})
+
+    # Another cache with the same directory, e.g. in another process, finds the dtypes
+    cache = SchemaCache(directory=str(tmp_path))
+    assert cache.get(key) == {'x': 'int64', 'y': ['string']}
+    assert cache.clear() == 1
+    assert SchemaCache(directory=str(tmp_path)).get(key) is None
+
+
+@pytest.mark.db_independent
+def test__get_cached_dtypes(monkeypatch):
+    monkeypatch.setattr('bach.from_database._schema_cache', SchemaCache())
+    key = SchemaCacheKey(engine_url='postgresql://db1', table_name='a', model_hash=None)
+    queried = []
+
+    def get_dtypes():
+        queried.append(key)
+        return {'x': 'int64'}
+
+    assert _get_cached_dtypes(key=key, refresh=False, get_dtypes=get_dtypes) == {'x': 'int64'}
+    assert _get_cached_dtypes(key=key, refresh=False, get_dtypes=get_dtypes) == {'x': 'int64'}
+    assert len(queried) == 1
+    assert _get_cached_dtypes(key=key, refresh=True, get_dtypes=get_dtypes) == {'x': 'int64'}
+    assert len(queried) == 2
+
+    set_schema_cache(None)
+    _get_cached_dtypes(key=key, refresh=False, get_dtypes=get_dtypes)
+    assert len(queried) == 3
@@ -0,0 +1,266 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+from typing import Dict, Tuple
+
+import pytest
+
+from bach import SeriesFloat64
+from bach.optimizations import prune_unused_columns, push_down_predicates, optimize_model, \
+    plan_materialization, _get_referenced_columns
+from bach.sql_model import BachSqlModel, CurrentNodeSqlModel
+from sql_models.graph_operations import get_graph_index
+from sql_models.model import Materialization
+from sql_models.sql_generator import model_to_name
+from tests.unit.bach.util import get_fake_df
+
+
+def _get_columns_per_node(model: BachSqlModel) -> Dict[str, Tuple[str, ...]]:
+    """ Give the columns of all CurrentNodeSqlModels in the graph, by generic name. """
+    return {
+        node.generic_name: node.columns
+        for node in get_graph_index(model).topological_order(model)
+        if isinstance(node, CurrentNodeSqlModel)
+    }
+
+
+def _get_where_columns_per_node(model: BachSqlModel) -> Dict[str, Tuple[str, ...]]:
+    """ Give the columns that the where clauses of all CurrentNodeSqlModels use, by generic name. """
+    result = {}
+    for node in get_graph_index(model).topological_order(model):
+        if isinstance(node, CurrentNodeSqlModel):
+            where_clause = node.select_clauses.where_clause
+            result[node.generic_name] = tuple(sorted(_get_referenced_columns([where_clause])))
+    return result
+
+
+def test_prune_unused_columns(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b', 'c', 'd'])
+    df['e'] = df.a + df.b
+    df = df.materialize(node_name='node1')
+    df = df[df.c > 3]
+    df['f'] = df.e * 2
+    df = df.materialize(node_name='node2')
+    model = df[['f']].get_current_node('final')
+
+    result = prune_unused_columns(dialect, model)
+    assert _get_columns_per_node(result) == {
+        # e is calculated from a and b, those are not needed anymore after node1.
+        # c is used in the where clause of the node that filters on it.
+        'node1': ('i', 'c', 'e'),
+        'getitem_where_boolean': ('i', 'c', 'e'),
+        'node2': ('i', 'f'),
+        'final': ('i', 'f'),
+    }
+    assert _get_columns_per_node(model) == {
+        'node1': ('i', 'a', 'b', 'c', 'd', 'e'),
+        'getitem_where_boolean': ('i', 'a', 'b', 'c', 'd', 'e'),
+        'node2': ('i', 'a', 'b', 'c', 'd', 'e', 'f'),
+        'final': ('i', 'f'),
+    }
+    # Nothing left to prune
+    assert prune_unused_columns(dialect, result) is result
+
+
+def test_prune_unused_columns_group_by(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b', 'c'])
+    df = df.materialize(node_name='node1')
+    df = df.groupby('a')[['b']].sum()
+    model = df.materialize(node_name='node2').get_current_node('final')
+
+    result = prune_unused_columns(dialect, model)
+    # The group-by column is kept, and only the aggregated column is calculated.
+    assert _get_columns_per_node(result) == {
+        'node1': ('a', 'b'),
+        'node2': ('a', 'b_sum'),
+        'final': ('a', 'b_sum'),
+    }
+
+
+def test_prune_unused_columns_not_pruned(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b', 'c'])
+    df = df.materialize(node_name='distinct_node', distinct=True)
+    df = df.materialize(node_name='temp_table_node', materialization=Materialization.TEMP_TABLE)
+    model = df[['a']].get_current_node('final')
+
+    result = prune_unused_columns(dialect, model)
+    # The columns of a distinct node and of a temporary table are all kept.
+    assert _get_columns_per_node(result) == {
+        'distinct_node': ('i', 'a', 'b', 'c'),
+        'temp_table_node': ('i', 'a', 'b', 'c'),
+        'final': ('i', 'a'),
+    }
+    assert result is model
+
+
+def test_prune_unused_columns_in_view_sql(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b'])
+    df['c'] = df.a * 2
+    df = df.materialize(node_name='node1')
+    sql = df[['a']].view_sql()
+    assert '"c"' not in sql
+
+
+def test_push_down_predicates(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b', 'c'])
+    df['x'] = df.a + df.b
+    df = df.materialize(node_name='node1')
+    df = df.materialize(node_name='node2')
+    df = df[df.x > 3]
+    df = df[df.c == 5]
+    model = df.get_current_node('final')
+
+    result = push_down_predicates(dialect, model)
+    # Both conditions end up in the first node, with x replaced by its expression.
+    assert _get_where_columns_per_node(result) == {
+        'node1': ('a', 'b', 'c'),
+        'node2': (),
+        'getitem_where_boolean': (),
+        'final': (),
+    }
+    assert _get_where_columns_per_node(model) == {
+        'node1': (),
+        'node2': (),
+        'getitem_where_boolean': ('c',),
+        'final': (),
+    }
+    # Nothing left to push down
+    assert push_down_predicates(dialect, result) is result
+
+
+@pytest.mark.parametrize(
+    'operation', ['limit', 'window', 'group_by', 'random', 'random_condition', 'temp_table']
+)
+def test_push_down_predicates_not_pushed(dialect, operation: str):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b', 'c'])
+    if operation == 'limit':
+        df = df.materialize(node_name='node1', limit=10)
+    elif operation == 'window':
+        df['a'] = df.a.window_lag(window=df.sort_values('b').window())
+        df = df.materialize(node_name='node1')
+    elif operation == 'group_by':
+        df = df.groupby('b').sum()
+        df = df.rename(columns={'a_sum': 'a'})
+        df = df.materialize(node_name='node1')
+    elif operation == 'random':
+        df['a'] = SeriesFloat64.random(df)
+        df = df.materialize(node_name='node1')
+    elif operation == 'random_condition':
+        df = df.materialize(node_name='node1')
+    elif operation == 'temp_table':
+        df = df.materialize(node_name='node1', materialization='temp_table')
+    df = df[SeriesFloat64.random(df) < 0.5 if operation == 'random_condition' else df.a > 3]
+    model = df.get_current_node('final')
+
+    # Filtering before the limit, window function, etc. would change the result
+    assert push_down_predicates(dialect, model) is model
+
+
+def test_push_down_predicates_not_pushed_multiple_references(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b'])
+    df = df.materialize(node_name='node1')
+    filtered = df[df.a > 3]
+    model = filtered.merge(df, on='i').get_current_node('final')
+
+    # node1 is also used without the filter
+    assert push_down_predicates(dialect, model) is model
+
+
+def test_push_down_predicates_switch(dialect, monkeypatch):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b'])
+    df = df.materialize(node_name='node1')
+    model = df[df.a > 3].get_current_node('final')
+
+    assert _get_where_columns_per_node(optimize_model(dialect, model)) == {
+        'node1': ('a',),
+        'getitem_where_boolean': (),
+        'final': (),
+    }
+    monkeypatch.setattr('bach.optimizations._push_down_predicates_enabled', False)
+    assert _get_where_columns_per_node(optimize_model(dialect, model)) == {
+        'node1': (),
+        'getitem_where_boolean': ('a',),
+        'final': (),
+    }
+
+
+def _get_materialization_per_node(model: BachSqlModel) -> Dict[str, Materialization]:
+    """ Give the materialization of all nodes in the graph, by generic name. """
+    nodes = get_graph_index(model).topological_order(model)
+    return {node.generic_name: node.materialization for node in nodes}
+
+
+def test_plan_materialization(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b'])
+    df['c'] = df.a + 1
+    df = df.materialize(node_name='node1').materialize(node_name='node2')
+    model = df.merge(df, on='i').base_node
+    node1 = model.references['left_node'].references['prev']
+
+    result, plan = plan_materialization(dialect, model)
+    # node2 passes through all columns of node1. After removing node2, node1 is referenced twice.
+    assert _get_materialization_per_node(result) == {
+        'base': Materialization.CTE,
+        'node1': Materialization.TEMP_TABLE,
+        'merge_sql': Materialization.CTE,
+    }
+    assert [(step.node_name, step.action) for step in plan.steps] == [
+        (model_to_name(dialect, model.references['left_node']), 'inline'),
+        (model_to_name(dialect, node1), 'temp_table'),
+    ]
+    assert plan.changed
+    assert str(plan).startswith('inline ')
+
+    # Nothing left to change
+    result_again, plan = plan_materialization(dialect, result)
+    assert result_again is result
+    assert not plan.changed
+    assert str(plan) == 'No changes.'
+
+
+def test_plan_materialization_cost(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b'])
+    df['c'] = df.a + 1
+    df = df.materialize(node_name='node1')
+    model = df.merge(df, on='i').base_node
+
+    result, plan = plan_materialization(dialect, model, get_cost=lambda node: 10, min_cost=100)
+    assert result is model
+    assert [step.action for step in plan.steps] == ['keep']
+    assert not plan.changed
+
+    result, plan = plan_materialization(dialect, model, get_cost=lambda node: 1000, min_cost=100)
+    assert _get_materialization_per_node(result)['node1'] == Materialization.TEMP_TABLE
+    assert 'estimated cost 1000.0' in plan.steps[0].reason
+
+    # Nodes that are only used once are never changed
+    result, plan = plan_materialization(dialect, df.base_node, get_cost=lambda node: 1000)
+    assert result is df.base_node
+    assert plan.steps == ()
+
+
+def test_plan_materialization_source_node(dialect):
+    # The base node selects directly from the source table. Materializing it would only copy the table.
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b'])
+    model = df.merge(df, on='i').base_node
+    result, plan = plan_materialization(dialect, model)
+    assert result is model
+    assert not plan.changed
+
+
+def test_df_optimize(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['i'], data_names=['a', 'b'])
+    df['c'] = df.a + 1
+    df = df.materialize(node_name='node1').materialize(node_name='node2')
+    df = df.merge(df, on='i')
+
+    result, plan = df.optimize()
+    assert plan.changed
+    assert _get_materialization_per_node(result.base_node)['node1'] == Materialization.TEMP_TABLE
+    assert 'node2' not in _get_materialization_per_node(result.base_node)
+    assert result.data_columns == df.data_columns
+    assert result.index_columns == df.index_columns
+    assert 'TEMPORARY TABLE' in result.view_sql().upper()
+
+    result, plan = df.optimize(min_references=3)
+    assert [step.action for step in plan.steps] == ['inline']
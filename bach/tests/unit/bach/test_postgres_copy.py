@@ -0,0 +1,138 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+import contextlib
+from typing import List
+
+import pandas as pd
+import pytest
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+
+from bach.postgres_copy import supports_copy_to_pandas, copy_to_pandas, supports_copy_from_pandas, \
+    copy_from_pandas
+from tests.unit.bach.util import FakeEngine
+
+
+pytestmark = [pytest.mark.db_independent]
+
+
+class FakeCopyCursor:
+    """
+    Cursor that gives a fixed csv result for copy_expert(), and records all executed sql and all data that
+    is copied to the database.
+    """
+    def __init__(self, csv: bytes, executed: List[str]):
+        self.csv = csv
+        self.executed = executed
+
+    def execute(self, sql: str):
+        self.executed.append(sql)
+
+    def copy_expert(self, sql: str, file):
+        self.executed.append(sql)
+        if sql.endswith('from stdin'):
+            self.executed.append(file.read())
+        else:
+            file.write(self.csv)
+
+    def close(self):
+        pass
+
+
+class FakeCopyEngine:
+    """ Engine of which the connections use FakeCopyCursors. """
+    def __init__(self, csv: bytes = b''):
+        self.dialect = PGDialect_psycopg2()
+        self.name = self.dialect.name
+        self.csv = csv
+        self.executed: List[str] = []
+
+    @contextlib.contextmanager
+    def connect(self):
+        yield FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, engine: FakeCopyEngine):
+        self.engine = engine
+        self.dialect = engine.dialect
+        # the DBAPI connection
+        self.connection = self
+
+    def begin(self):
+        return contextlib.nullcontext()
+
+    def execute(self, sql: str):
+        self.engine.executed.append(sql)
+
+    def cursor(self) -> FakeCopyCursor:
+        return FakeCopyCursor(self.engine.csv, self.engine.executed)
+
+
+def test_supports_copy_to_pandas(monkeypatch):
+    engine = FakeEngine(dialect=PGDialect_psycopg2())
+    assert supports_copy_to_pandas(engine, ['int64', 'float64', 'bool'])
+    assert not supports_copy_to_pandas(engine, ['int64', 'string'])
+    assert not supports_copy_to_pandas(FakeEngine(dialect=PGDialect()), ['int64'])
+    monkeypatch.setattr('bach.postgres_copy.copy_to_pandas_enabled', False)
+    assert not supports_copy_to_pandas(engine, ['int64'])
+
+
+def test_copy_to_pandas():
+    engine = FakeCopyEngine(
+        b'i,f,b,b_null,i_null,only_null\n'
+        b'1,1.5,t,t,1,\n'
+        b'2,NaN,f,,,\n'
+        b'3,-Infinity,t,f,3,\n'
+    )
+    result = copy_to_pandas(
+        engine=engine,
+        statements=['create temp table x as select 1', 'select * from x'],
+        dtypes={'i': 'int64', 'f': 'float64', 'b': 'bool', 'b_null': 'bool', 'i_null': 'int64',
+                'only_null': 'int64'}
+    )
+    # The same values and dtypes that read_sql_query() gives for this data
+    expected = pd.DataFrame({
+        'i': [1, 2, 3],
+        'f': [1.5, float('nan'), float('-inf')],
+        'b': [True, False, True],
+        'b_null': [True, None, False],
+        'i_null': [1.0, float('nan'), 3.0],
+        'only_null': [None, None, None],
+    })
+    pd.testing.assert_frame_equal(result, expected)
+    assert engine.executed == [
+        'create temp table x as select 1',
+        'set local extra_float_digits = 3',
+        'copy (select * from x) to stdout with (format csv, header true)',
+    ]
+
+
+def test_supports_copy_from_pandas():
+    engine = FakeEngine(dialect=PGDialect_psycopg2())
+    assert supports_copy_from_pandas(engine, ['int64', 'float64', 'bool', 'string', 'timestamp'])
+    assert not supports_copy_from_pandas(engine, ['int64', 'json'])
+    assert not supports_copy_from_pandas(FakeEngine(dialect=PGDialect()), ['int64'])
+
+
+def test_copy_from_pandas():
+    engine = FakeCopyEngine()
+    pdf = pd.DataFrame({
+        'i': [1, 2],
+        's': ['a\tb\\c', None],
+        'f': [0.1, float('-inf')],
+        'b': [True, None],
+        't': [pd.Timestamp('2022-01-01 12:30:00.000123'), None],
+    })
+    copy_from_pandas(
+        engine=engine,
+        df=pdf,
+        table_name='te"st',
+        dtypes={'i': 'int64', 's': 'string', 'f': 'float64', 'b': 'bool', 't': 'timestamp'}
+    )
+    assert engine.executed == [
+        'copy "te""st" ("i", "s", "f", "b", "t") from stdin',
+        '1\ta\\tb\\\\c\t0.1\tt\t2022-01-01 12:30:00.000123\n'
+        '2\t\\N\t-inf\t\\N\t\\N\n'
+    ]
@@ -0,0 +1,133 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+import pandas as pd
+import pytest
+from sqlalchemy.dialects.postgresql.base import PGDialect
+
+from bach import DataFrame
+from bach.result_cache import ResultCache, CacheKey, get_cache_key, get_source_tables
+from tests.unit.bach.util import FakeEngine, get_fake_df
+
+
+pytestmark = [pytest.mark.db_independent]
+
+
+def _key(name: str, engine_url: str = 'postgresql://user@host:5432/db') -> CacheKey:
+    return CacheKey(engine_url=engine_url, dialect='postgresql', model_hash=name, limit='None')
+
+
+def _pandas_df(rows: int = 3) -> pd.DataFrame:
+    return pd.DataFrame({'a': range(rows), 'b': [float(i) for i in range(rows)]})
+
+
+def test_result_cache_memory_lru():
+    cache = ResultCache(max_memory_entries=2)
+    assert cache.get(_key('x')) is None
+    cache.put(_key('x'), _pandas_df())
+    cache.put(_key('y'), _pandas_df())
+
+    result = cache.get(_key('x'))
+    pd.testing.assert_frame_equal(result, _pandas_df())
+    # The returned DataFrame is a copy
+    result['a'] = 0
+    pd.testing.assert_frame_equal(cache.get(_key('x')), _pandas_df())
+
+    # y is the least recently used, so it gets evicted
+    cache.put(_key('z'), _pandas_df())
+    assert cache.get(_key('y')) is None
+    assert cache.get(_key('x')) is not None
+    assert cache.get(_key('z')) is not None
+
+    stats = cache.stats
+    assert (stats.hits, stats.memory_hits, stats.disk_hits, stats.misses) == (4, 4, 0, 2)
+    assert (stats.evictions, stats.memory_entries, stats.disk_entries) == (1, 2, 0)
+    assert stats.memory_bytes == 2 * _pandas_df().memory_usage(deep=True, index=True).sum()
+    cache.reset_stats()
+    assert cache.stats.hits == 0
+
+
+def test_result_cache_memory_bytes():
+    nbytes = _pandas_df().memory_usage(deep=True, index=True).sum()
+    cache = ResultCache(max_memory_bytes=int(nbytes * 1.5))
+    cache.put(_key('x'), _pandas_df())
+    cache.put(_key('y'), _pandas_df())
+    assert cache.get(_key('x')) is None
+    assert cache.get(_key('y')) is not None
+    # Results that are bigger than the limit are not cached
+    cache.put(_key('big'), _pandas_df(rows=100))
+    assert cache.get(_key('big')) is None
+    assert cache.get(_key('y')) is not None
+
+
+def test_result_cache_expiration(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr('bach.result_cache.time.time', lambda: now)
+    cache = ResultCache(ttl=60, source_freshness={'events': 10})
+    cache.put(_key('x'), _pandas_df(), source_tables=['events', 'users'])
+    cache.put(_key('y'), _pandas_df(), source_tables=['users'])
+    now += 30
+    # x reads from 'events', of which the data is only considered fresh for 10 seconds
+    assert cache.get(_key('x')) is None
+    assert cache.get(_key('y')) is not None
+    now += 31
+    assert cache.get(_key('y')) is None
+    assert cache.stats.expired == 2
+    assert cache.stats.memory_entries == 0
+
+
+def test_result_cache_invalidate():
+    cache = ResultCache()
+    cache.put(_key('x'), _pandas_df(), source_tables=['events'])
+    cache.put(_key('y'), _pandas_df(), source_tables=['users'])
+    cache.put(_key('z', engine_url='bigquery://project/dataset'), _pandas_df(), source_tables=['events'])
+
+    assert cache.invalidate(source_table='events', engine_url='bigquery://project/dataset') == 1
+    assert cache.get(_key('z', engine_url='bigquery://project/dataset')) is None
+    assert cache.invalidate(source_table='events') == 1
+    assert cache.get(_key('x')) is None
+    assert cache.get(_key('y')) is not None
+    assert cache.clear() == 1
+    assert cache.get(_key('y')) is None
+
+
+def test_result_cache_disk(tmp_path):
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        pytest.skip('pyarrow is needed for the disk tier')
+    cache = ResultCache(max_memory_entries=0, directory=str(tmp_path))
+    cache.put(_key('x'), _pandas_df())
+    cache.put(_key('json'), pd.DataFrame({'a': [{'x': 1}, {'y': 2}]}), persist=False)
+    assert cache.stats.disk_entries == 1
+
+    # A new cache on the same directory finds the results
+    cache = ResultCache(directory=str(tmp_path))
+    pd.testing.assert_frame_equal(cache.get(_key('x')), _pandas_df())
+    assert cache.get(_key('json')) is None
+    assert (cache.stats.disk_hits, cache.stats.memory_entries) == (1, 1)
+
+    cache = ResultCache(directory=str(tmp_path), max_disk_bytes=cache.stats.disk_bytes)
+    cache.put(_key('y'), _pandas_df())
+    assert cache.stats.disk_entries == 1
+    assert cache.stats.evictions == 1
+    assert cache.invalidate() == 1
+    assert cache.stats.disk_entries == 0
+
+
+def test_get_cache_key_and_source_tables():
+    dialect = PGDialect()
+    engine = FakeEngine(dialect=dialect)
+    df = DataFrame.from_table(
+        engine=engine, table_name='events', index=['a'], all_dtypes={'a': 'int64', 'b': 'int64'}
+    )
+    df = df.merge(get_fake_df(dialect=dialect, index_names=['a'], data_names=['c']), on='a')
+    model = df._get_view_sql_model()
+    assert get_source_tables(model) == ['events']
+
+    key = get_cache_key(engine=engine, model=model, limit=10)
+    assert key == CacheKey(
+        engine_url='postgresql://user@host:5432/db', dialect='postgresql', model_hash=model.hash, limit='10'
+    )
+    assert get_cache_key(engine=engine, model=df[df.b > 1]._get_view_sql_model(), limit=10) != key
+    assert get_cache_key(engine=engine, model=model, limit=slice(2, 4)) != key
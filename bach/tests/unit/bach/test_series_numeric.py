@@ -1,9 +1,13 @@
 """
 Copyright 2022 Objectiv B.V.
 """
+import re
+
 import pytest
 
-from tests.unit.bach.util import get_fake_df_test_data
+from sql_models.sql_generator import to_sql
+from sql_models.util import is_bigquery
+from tests.unit.bach.util import get_fake_df_test_data, get_fake_df
 
 
 def test_dataframe_agg_dd_parameter(dialect):
@@ -33,3 +37,20 @@ def test_dataframe_agg_skipna_parameter(dialect):
         with pytest.raises(AttributeError):
             # methods not present at all, so needs to raise
             bt.agg(agg, skipna=False)
+
+
+def test_quantile_single_pass(dialect):
+    df = get_fake_df(dialect=dialect, index_names=['a'], data_names=['b', 'c'], dtype='float64')
+    quantiles = [i / 100 for i in range(100)]
+    result = df.groupby('c').b.quantile(q=quantiles)
+    assert list(result.index.keys()) == ['c', 'q']
+    assert result.index['q'].dtype == 'float64'
+
+    sql = to_sql(dialect=dialect, model=result.to_frame()._get_view_sql_model())
+    # all quantiles are calculated in a single select from the base node, and then unnested
+    assert len(re.findall(r'from [`"]base___', sql)) == 1
+    assert sql.lower().count('unnest(') == 1
+    if is_bigquery(dialect):
+        assert sql.count('percentile_cont(') == 100
+    else:
+        assert sql.count('percentile_cont(') == 1
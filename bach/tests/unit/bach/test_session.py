@@ -0,0 +1,78 @@
+"""
+Copyright 2022 Objectiv B.V.
+"""
+import contextlib
+from typing import List
+
+import pytest
+from sqlalchemy.dialects.postgresql.base import PGDialect
+
+from bach import Session
+from bach.session import get_active_session, prepare_model
+from sql_models.model import Materialization
+from sql_models.sql_generator import to_sql
+from tests.unit.bach.util import get_fake_df
+
+
+class FakeSessionConnection:
+    """ Connection that records all executed sql. """
+    def __init__(self):
+        self.executed: List[str] = []
+        self.closed = False
+
+    def begin(self):
+        return contextlib.nullcontext()
+
+    def execute(self, sql: str):
+        self.executed.append(sql)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSessionEngine:
+    def __init__(self):
+        self.dialect = PGDialect()
+        self.name = self.dialect.name
+        self.connections: List[FakeSessionConnection] = []
+
+    def connect(self) -> FakeSessionConnection:
+        self.connections.append(FakeSessionConnection())
+        return self.connections[-1]
+
+
+@pytest.mark.db_independent
+def test_session_reuses_temp_tables():
+    engine = FakeSessionEngine()
+    df = get_fake_df(dialect=engine.dialect, index_names=['a'], data_names=['b', 'c'])
+    df = df.materialize(materialization='temp_table')
+    temp_model = df.base_node
+    df_sum = df.groupby('b').sum()
+    model = df._get_view_sql_model()
+    model_sum = df_sum._get_view_sql_model()
+    assert temp_model.materialization == Materialization.TEMP_TABLE
+    temp_table_name = temp_model.materialization_name or f'{temp_model.generic_name}___{temp_model.hash}'
+
+    assert prepare_model(engine=engine, model=model) is model  # type: ignore
+    with Session(engine) as session:  # type: ignore
+        assert get_active_session(engine) is session  # type: ignore
+        conn = engine.connections[0]
+
+        prepared_model = session.prepare_model(model)
+        assert len(conn.executed) == 1
+        assert conn.executed[0].startswith(f'create temporary table "{temp_table_name}" as ')
+        assert session.temp_tables == {temp_model.hash: temp_table_name}
+        sql = to_sql(dialect=engine.dialect, model=prepared_model)
+        assert 'create temporary table' not in sql
+        assert f'from "{temp_table_name}"' in sql
+
+        # the temporary table is reused by other queries
+        prepared_sum_model = session.prepare_model(model_sum)
+        assert len(conn.executed) == 1
+        assert f'from "{temp_table_name}"' in to_sql(dialect=engine.dialect, model=prepared_sum_model)
+
+    assert conn.executed[1:] == [f'drop table if exists "{temp_table_name}"']
+    assert conn.closed
+    assert len(engine.connections) == 1
+    assert get_active_session(engine) is None  # type: ignore
+    assert session.temp_tables == {}
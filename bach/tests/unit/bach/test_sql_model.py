@@ -3,9 +3,10 @@ Copyright 2022 Objectiv B.V.
 """
 import pytest
 
-from bach.expression import Expression
-from bach.sql_model import BachSqlModel
+from bach.expression import Expression, AggregateFunctionExpression
+from bach.sql_model import BachSqlModel, CurrentNodeSqlModel
 from sql_models.model import CustomSqlModelBuilder, Materialization
+from tests.unit.bach.util import get_fake_df_test_data
 
 
 @pytest.mark.db_independent
@@ -33,3 +34,91 @@ def test_bach_sql_model_copy():
     model = model.set(tuple(), val=345)
     assert model.placeholders == {'val': 345}
     assert model.__class__ == BachSqlModel
+
+
+@pytest.mark.db_independent
+def test_bach_sql_model_hash_consing():
+    column_expressions = {
+        'a': Expression.column_reference('a'),
+        'b': Expression.column_reference('b'),
+    }
+
+    def get_model(val: int, column_expressions_value):
+        return BachSqlModel(
+            model_spec=CustomSqlModelBuilder(sql='SELECT * FROM test where b = {val}', name='test'),
+            placeholders={'val': val},
+            references={},
+            materialization=Materialization.CTE,
+            materialization_name=None,
+            column_expressions=column_expressions_value,
+        )
+
+    model = get_model(123, column_expressions)
+    assert get_model(123, dict(column_expressions)) is model
+    assert model.copy_set({'val': 234}) is get_model(234, column_expressions)
+    assert model.copy_set({'val': 234}).copy_set({'val': 123}) is model
+    # column expressions are part of the key, based on their structure
+    equal_column_expressions = {
+        'a': Expression.column_reference('a'),
+        'b': Expression.column_reference('b'),
+    }
+    assert get_model(123, equal_column_expressions) is model
+    # expressions that only differ in their class compare equal, but are not the same
+    other_column_expressions = {
+        'a': Expression.column_reference('a'),
+        'b': AggregateFunctionExpression(Expression.column_reference('b').data),
+    }
+    assert other_column_expressions == column_expressions
+    assert get_model(123, other_column_expressions) is not model
+    assert get_model(123, other_column_expressions) == model
+    assert model.copy_override(column_expressions={'a': column_expressions['a']}).columns == ('a', )
+    assert model.columns == ('a', 'b')
+
+
+def test_current_node_sql_model_hash_consing(dialect):
+    previous = BachSqlModel(
+        model_spec=CustomSqlModelBuilder(sql='SELECT a FROM test', name='test'),
+        placeholders={},
+        references={},
+        materialization=Materialization.CTE,
+        materialization_name=None,
+        column_expressions={'a': Expression.column_reference('a')},
+    )
+
+    def get_model(where_clause: Expression) -> CurrentNodeSqlModel:
+        return CurrentNodeSqlModel.get_instance(
+            dialect=dialect,
+            name='current',
+            column_names=('a', ),
+            column_exprs=[Expression.column_reference('a')],
+            distinct=False,
+            where_clause=where_clause,
+            group_by_clause=None,
+            having_clause=None,
+            order_by_clause=None,
+            limit_clause=Expression.construct(''),
+            previous_node=previous,
+            variables={},
+        )
+
+    where_clause = Expression.construct('where a > 1')
+    model = get_model(where_clause)
+    assert get_model(where_clause) is model
+    assert get_model(Expression.construct('where a > 1')) is model
+    # expressions in the select clauses are part of the key based on their structure, as expressions that
+    # only differ in their class compare equal
+    other_where_clause = AggregateFunctionExpression.construct('where a > 1')
+    assert other_where_clause == where_clause
+    other_model = get_model(other_where_clause)
+    assert other_model is not model
+    assert other_model.select_clauses.where_clause is other_where_clause
+
+
+def test_dataframe_sub_graphs_shared(dialect):
+    df = get_fake_df_test_data(dialect)
+    # equal operations on a DataFrame, that are built independently, give the same nodes
+    node = df.materialize(node_name='x').base_node
+    assert df.materialize(node_name='x').base_node is node
+    filtered = df[df['skating_order'] > 3].materialize()
+    assert df[df['skating_order'] > 3].materialize().base_node is filtered.base_node
+    assert df.materialize(node_name='y').base_node is not node
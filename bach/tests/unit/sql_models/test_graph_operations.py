@@ -6,7 +6,7 @@ from typing import List
 import pytest
 
 from sql_models.graph_operations import get_graph_nodes_info, get_node, get_node_info_selected_node, \
-    find_nodes, find_node, FoundNode, get_all_placeholders, update_placeholders_in_graph
+    find_nodes, find_node, FoundNode, get_all_placeholders, update_placeholders_in_graph, get_graph_index
 from sql_models.model import RefPath, SqlModel
 from tests.unit.sql_models.util import ValueModel, RefModel, JoinModel, RefValueModel
 
@@ -178,12 +178,18 @@ def test_find_nodes():
 def test_find_nodes_duplicates():
     vm1 = ValueModel.build(key='a', val=1)
     vm2 = ValueModel.build(key='a', val=1)
+    # models are hash-consed, so vm1 and vm2 are the same instance
+    assert vm1 is vm2
     graph = JoinModel.build(ref_left=vm1, ref_right=vm2)
     result = find_nodes(graph, lambda node: node.generic_name == 'ValueModel')
-    assert len(result) == 2
+    assert result == [FoundNode(model=vm1, reference_path=('ref_left',))]
+
+    vm3 = ValueModel.build(key='a', val=2)
+    graph = JoinModel.build(ref_left=vm1, ref_right=vm3)
+    result = find_nodes(graph, lambda node: node.generic_name == 'ValueModel')
     assert result == [
         FoundNode(model=vm1, reference_path=('ref_left',)),
-        FoundNode(model=vm2, reference_path=('ref_right',))
+        FoundNode(model=vm3, reference_path=('ref_right',))
     ]
 
 
@@ -273,6 +279,48 @@ def test_find_nodes_long_and_short_path_performance():
     assert result == [FoundNode(model=vm, reference_path=expected_path)]
 
 
+def test_graph_index():
+    # Graph:
+    #
+    #   vm1 <-- rm1 <---------------+
+    #      \                         +-- graph
+    #       +-- jm1 <-- rm2 <-------+
+    #      /
+    #   vm2
+    vm1 = ValueModel.build(key='a', val=1)
+    vm2 = ValueModel.build(key='a', val=2)
+    rm1 = RefModel.build(ref=vm1)
+    jm1 = JoinModel.build(ref_left=vm1, ref_right=vm2)
+    rm2 = RefModel.build(ref=jm1)
+    graph = JoinModel.build(ref_left=rm1, ref_right=rm2)
+
+    index = get_graph_index(graph)
+    assert get_graph_index(graph) is index
+    assert get_graph_index(rm1) is not index
+
+    order = index.topological_order(graph)
+    assert order == [vm1, rm1, vm2, jm1, rm2, graph]
+    for position, node in enumerate(order):
+        assert all(order.index(ref) < position for ref in node.references.values())
+
+    assert index.depth == 3
+    assert get_graph_index(rm1).depth == 1
+    assert get_graph_index(vm1).depth == 0
+
+    assert index.get_dependent_model_ids(vm1) == {id(vm1), id(rm1), id(jm1), id(rm2), id(graph)}
+    assert index.get_dependent_model_ids(vm2) == {id(vm2), id(jm1), id(rm2), id(graph)}
+    assert index.get_dependent_model_ids(graph) == {id(graph)}
+
+    # Repeated queries use the cached search, but still apply the filter function
+    result = find_nodes(graph, function=lambda n: n is vm1, first_instance=False)
+    assert result == [FoundNode(model=vm1, reference_path=('ref_right', 'ref', 'ref_left'))]
+    result = find_nodes(graph, function=lambda n: n.generic_name == 'RefModel', first_instance=False)
+    assert result == [FoundNode(model=rm1, reference_path=('ref_left',)),
+                      FoundNode(model=rm2, reference_path=('ref_right',))]
+    result = find_nodes(graph, function=lambda n: n is vm1, first_instance=True)
+    assert result == [FoundNode(model=vm1, reference_path=('ref_left', 'ref'))]
+
+
 def test_get_all_placeholders():
     graph = JoinModel.build(
         ref_left=RefValueModel(
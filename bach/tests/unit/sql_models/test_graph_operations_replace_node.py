@@ -114,8 +114,8 @@ def test_replace_node_in_graph_simple_duplicate_paths():
     assert graph.hash != new_graph1.hash
 
     # Assert that the alternative new graph, built using the other reference path has the same structure
-    #  and data, but is a different copy
-    assert new_graph1 is not new_graph2
+    #  and data. As models are hash-consed, it is the same instance
+    assert new_graph1 is new_graph2
     assert len(get_graph_nodes_info(new_graph2)) == 3
     assert new_graph1.hash == new_graph2.hash
 
@@ -142,13 +142,14 @@ def test_replace_node_in_graph_duplicate_paths2():
     info = get_graph_nodes_info(graph)
     new_info = get_graph_nodes_info(new_graph1)
 
-    assert len(info) == 5
+    assert rm2 is rm3  # models are hash-consed
+    assert len(info) == 4
     # two paths to same node
     assert get_node(graph, ('ref_left', 'ref', 'ref')) is get_node(graph, ('ref_right', 'ref', 'ref'))
     assert get_node(graph, ('ref_left', 'ref', 'ref')).placeholders['val'] == 1
     assert get_node(graph, ('ref_right', 'ref', 'ref')).placeholders['val'] == 1
 
-    assert len(new_info) == 5  # All nodes should be replaced one on one with new nodes
+    assert len(new_info) == 4  # All nodes should be replaced one on one with new nodes
     new_node_left = get_node(new_graph1, ('ref_left', 'ref', 'ref'))
     new_node_right = get_node(new_graph1, ('ref_right', 'ref', 'ref'))
     assert new_node_left.placeholders['val'] == 99
@@ -158,9 +159,9 @@ def test_replace_node_in_graph_duplicate_paths2():
     assert graph.hash != new_graph1.hash
 
     # Assert that the alternative new graph, built using the other reference path has the same structure
-    #  and data, but is a different copy
-    assert new_graph1 is not new_graph2
-    assert len(get_graph_nodes_info(new_graph2)) == 5
+    #  and data. As models are hash-consed, it is the same instance
+    assert new_graph1 is new_graph2
+    assert len(get_graph_nodes_info(new_graph2)) == 4
     assert new_graph1.hash == new_graph2.hash
 
 
@@ -187,7 +188,8 @@ def test_replace_node_in_graph_non_leaf_node():
     info = get_graph_nodes_info(graph)
     new_info = get_graph_nodes_info(new_graph1)
 
-    assert len(info) == 7
+    assert rm2 is rm3  # models are hash-consed
+    assert len(info) == 6
     # two paths to node that we replace.
     # Check that both nodes are the same, have the same values, and same tail node
     node_left = get_node(graph, ('ref_left', 'ref', 'ref'))
@@ -197,7 +199,7 @@ def test_replace_node_in_graph_non_leaf_node():
     assert node_right.placeholders['val'] == 10
     assert get_node(node_left, ('ref', )) is get_node(node_right, ('ref', ))
 
-    assert len(new_info) == 7  # Number of nodes shouldn't change
+    assert len(new_info) == 6  # Number of nodes shouldn't change
     new_node_left = get_node(new_graph1, ('ref_left', 'ref', 'ref'))
     new_node_right = get_node(new_graph1, ('ref_right', 'ref', 'ref'))
     assert new_node_left.placeholders['val'] == 1337
@@ -208,9 +210,9 @@ def test_replace_node_in_graph_non_leaf_node():
     assert graph.hash != new_graph1.hash
 
     # Assert that the alternative new graph, built using the other reference path has the same structure
-    #  and data, but is a different copy
-    assert new_graph1 is not new_graph2
-    assert len(get_graph_nodes_info(new_graph2)) == 7
+    #  and data. As models are hash-consed, it is the same instance
+    assert new_graph1 is new_graph2
+    assert len(get_graph_nodes_info(new_graph2)) == 6
     assert new_graph1.hash == new_graph2.hash
 
 
@@ -265,12 +267,12 @@ def test_replace_node_in_graph_complex1():
     assert graph.hash != new_graph1.hash
 
     # Assert that the alternative new graph, built using the other reference path has the same structure
-    #  and data, but is a different copy
-    assert new_graph1 is not new_graph2
+    #  and data. As models are hash-consed, it is the same instance
+    assert new_graph1 is new_graph2
     assert len(get_graph_nodes_info(new_graph2)) == 9
     assert new_graph1.hash == new_graph2.hash
-    # The nodes that are changed in both graph should be different instances
-    assert get_node(new_graph1, ('ref_left',)) is not get_node(new_graph2, ('ref_left',))
+    # The nodes that are changed in both graph are equal, and thus the same instances
+    assert get_node(new_graph1, ('ref_left',)) is get_node(new_graph2, ('ref_left',))
     # The nodes that are un-changed in both graphs should be the same instances
     assert get_node(new_graph1, ('ref_left', 'ref_left')) is get_node(new_graph2, ('ref_left', 'ref_left'))
 
@@ -334,17 +336,15 @@ def test_replace_node_in_graph_complex2():
     assert graph.hash != new_graph1.hash
 
     # Assert that the alternative new graphs, built using the other reference paths have the same structure
-    #  and data, but are different copies
-    assert new_graph1 is not new_graph2
-    assert new_graph1 is not new_graph3
-    assert new_graph2 is not new_graph3
+    #  and data. As models are hash-consed, they are the same instance
+    assert new_graph1 is new_graph2
+    assert new_graph1 is new_graph3
     assert len(get_graph_nodes_info(new_graph2)) == 9
     assert len(get_graph_nodes_info(new_graph3)) == 9
     assert new_graph1.hash == new_graph2.hash == new_graph3.hash
-    # The nodes that are changed in the graphs should be different instances
-    assert get_node(new_graph1, ('ref_left',)) is not get_node(new_graph2, ('ref_left',))
-    assert get_node(new_graph1, ('ref_left',)) is not get_node(new_graph3, ('ref_left',))
-    assert get_node(new_graph2, ('ref_left',)) is not get_node(new_graph3, ('ref_left',))
+    # The nodes that are changed in the graphs are equal, and thus the same instances
+    assert get_node(new_graph1, ('ref_left',)) is get_node(new_graph2, ('ref_left',))
+    assert get_node(new_graph1, ('ref_left',)) is get_node(new_graph3, ('ref_left',))
     # The nodes that are un-changed in the graphs should be the same instances in all three graphs
     assert get_node(new_graph1, ('ref_left', 'ref_left', 'ref_left')) is \
            get_node(new_graph2, ('ref_left', 'ref_left', 'ref_left'))
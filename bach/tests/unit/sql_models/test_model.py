@@ -1,6 +1,7 @@
 """
 Copyright 2021 Objectiv B.V.
 """
+import hashlib
 import re
 from typing import List
 
@@ -44,6 +45,53 @@ def test_equality_base_cases():
     assert graph1 != rm
 
 
+@pytest.mark.db_independent
+def test_hash_consing():
+    vm1 = ValueModel.build(key='X', val=1)
+    vm2 = ValueModel.build(key='X', val=1)
+    assert vm1 is vm2
+    # equal, but different types of placeholder values give different sql
+    assert ValueModel.build(key='X', val=True) is not vm1
+    assert ValueModel.build(key='X', val=1.0) is not vm1
+
+    # independently built equal graphs are the same instance
+    graph1 = JoinModel.build(ref_left=RefModel.build(ref=vm1), ref_right=ValueModel.build(key='Y', val=2))
+    graph2 = JoinModel.build(ref_left=RefModel.build(ref=vm2), ref_right=ValueModel.build(key='Y', val=2))
+    assert graph1 is graph2
+    named_graph = graph1.set_materialization_name(tuple(), 'name')
+    assert named_graph is graph2.set_materialization_name(tuple(), 'name')
+    assert graph1.set_materialization_name(tuple(), 'name') is not graph1
+    assert graph1.copy_set_materialization(Materialization.TABLE) is not graph1
+
+    # a different spec or materialization gives a different instance
+    csm = CustomSqlModelBuilder(sql="select '{key}' as key, {val} as value")(key='X', val=1)
+    assert csm is not vm1
+    assert csm is CustomSqlModelBuilder(sql="select '{key}' as key, {val} as value")(key='X', val=1)
+
+
+@pytest.mark.db_independent
+def test_hash_incremental():
+    # The hash is built incrementally from the sql and the hashes of the references, but must be the md5 of
+    # the repr of all attributes, as it was calculated before
+    def get_hash(model: SqlModel) -> str:
+        data = {
+            'generic_name': model.generic_name,
+            'sql': model.sql,
+            'properties': model.placeholders_formatted,
+            'materialization': model.materialization.type_name,
+            'references': {ref_name: ref.hash for ref_name, ref in model.references.items()}
+        }
+        if model.materialization_name is not None:
+            data['materialization_name'] = model.materialization_name
+        return hashlib.md5(repr(data).encode('utf-8')).hexdigest()
+
+    vm = ValueModel.build(key="X'", val=1)
+    graph = JoinModel.build(ref_left=RefModel.build(ref=vm), ref_right=ValueModel.build(key='Y', val=2))
+    named = graph.set_materialization_name(tuple(), 'name').copy_set_materialization(Materialization.TABLE)
+    for model in vm, graph, named, named.references['ref_left']:
+        assert model.hash == get_hash(model)
+
+
 @pytest.mark.db_independent
 def test_equality_different_classes():
     vm1 = ValueModel.build(key='X', val=1)
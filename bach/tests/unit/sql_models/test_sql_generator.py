@@ -3,7 +3,7 @@ Copyright 2021 Objectiv B.V.
 """
 import pytest
 
-from sql_models.model import SqlModelBuilder, CustomSqlModelBuilder
+from sql_models.model import SqlModelBuilder, CustomSqlModelBuilder, SelectSqlModelBuilder
 from sql_models.sql_generator import to_sql
 from sql_models.util import is_bigquery
 from tests.unit.sql_models.test_graph_operations import get_simple_test_graph
@@ -152,6 +152,32 @@ def test_model_thrice_simple(dialect):
     assert_roughly_equal_sql(result, expected)
 
 
+def test_select_sql_model_builder(dialect):
+    # SelectSqlModelBuilder carries the structure of the sql, so the generator doesn't need to parse the
+    # sql. The result must be the same as for a CustomSqlModelBuilder with the same sql.
+    source = CustomSqlModelBuilder('select {a} from x')(a="'{{y}}'")
+    select_builder = SelectSqlModelBuilder(
+        sql='select a from {{source}} join "inner_{{id}}" using (a) where a != {value}',
+        ctes=[('inner_{{id}}', 'select {value} as a from {{source}}')],
+        name='Select'
+    )
+    assert select_builder.sql == \
+        'with inner_{{id}} as (select {value} as a from {{source}})\n' \
+        'select a from {{source}} join "inner_{{id}}" using (a) where a != {value}'
+    assert [cte.name for cte in select_builder.ctes] == ['inner_{{id}}', None]
+    custom_builder = CustomSqlModelBuilder(sql=select_builder.sql, name='Select')
+
+    select_model = select_builder(source=source, value="'{z}'")
+    custom_model = custom_builder(source=source, value="'{z}'")
+    assert select_model.ctes is not None
+    assert custom_model.ctes is None
+    assert select_model.hash == custom_model.hash
+    result = to_sql(dialect=dialect, model=select_model)
+    assert result == to_sql(dialect=dialect, model=custom_model)
+    assert f'inner_{select_model.hash}' in result
+    assert "where a != '{z}'" in result
+
+
 def test_model_duplicate_no_id(dialect):
     # Test that the sql-generation correctly detects duplicate CTE-names with non-duplicate sql
     # In the future we might do some automagical rewriting, for  now we mainly expect an error to be raised
@@ -21,9 +21,23 @@ SCHEMA_VALIDATION_ERROR_REPORTING = os.environ.get('SCHEMA_VALIDATION_ERROR_REPO
 # Number of ms before an event is considered too old. set to 0 to disable
 MAX_DELAYED_EVENTS_MILLIS = 1000 * 3600
 
+# Hashing of properties in anonymous mode. Without a secret, properties are hashed with plain md5. With a
+# secret a keyed hash is used, such that the hashes cannot be reversed by hashing known values.
+# Supported algorithms: md5, blake2b, hmac-sha256. If a secret is set the default is blake2b.
+_ANONYMOUS_MODE_HASH_SECRET = os.environ.get('ANONYMOUS_MODE_HASH_SECRET', '')
+_ANONYMOUS_MODE_HASH_ALGORITHM = os.environ.get('ANONYMOUS_MODE_HASH_ALGORITHM',
+                                                'blake2b' if _ANONYMOUS_MODE_HASH_SECRET else 'md5')
+
 # Whether to run in sync mode (default) or async-mode.
 _ASYNC_MODE = os.environ.get('ASYNC_MODE', '') == 'true'
 
+# Implementation of the Postgres queues, only relevant in async mode. Either 'delete' (default): events are
+# deleted from the queue table when they are picked up. Or 'ring': events are written to a ring of partition
+# tables, that are truncated once all events in them have been picked up.
+# If set to 'ring', run db_init to create the partition tables.
+_QUEUE_BACKEND = os.environ.get('QUEUE_BACKEND', 'delete')
+_QUEUE_RING_PARTITIONS = int(os.environ.get('QUEUE_RING_PARTITIONS', 4))
+
 # ### Postgres values.
 # We define some default values here. DO NOT put actual passwords in here
 _OUTPUT_ENABLE_PG = os.environ.get('OUTPUT_ENABLE_PG', 'true') == 'true'
@@ -84,7 +98,15 @@ WORKER_SLEEP_SECONDS = 5
 
 
 class AnonymousModeConfig(NamedTuple):
+    # mapping from context-type to the set of properties of that context that should be hashed
     to_hash: dict
+    # one of HASH_ALGORITHMS
+    hash_algorithm: str = 'md5'
+    # secret for the keyed hash algorithms (blake2b, hmac-sha256)
+    hash_secret: str = ''
+
+
+HASH_ALGORITHMS = ('md5', 'blake2b', 'hmac-sha256')
 
 
 class AwsOutputConfig(NamedTuple):
@@ -146,6 +168,13 @@ class CookieConfig(NamedTuple):
     secure: bool = False
 
 
+class QueueConfig(NamedTuple):
+    # 'delete' or 'ring'
+    backend: str
+    # number of partition tables per queue, only used by the 'ring' backend
+    ring_partitions: int
+
+
 class TimestampValidationConfig(NamedTuple):
     max_delay: int
 
@@ -158,17 +187,26 @@ class CollectorConfig(NamedTuple):
     output: OutputConfig
     event_schema: EventSchema
     event_list_schema: EventListSchema
+    queue: QueueConfig
 
 
 def get_config_anonymous_mode() -> AnonymousModeConfig:
-    return AnonymousModeConfig({
-        'to_hash': {
+    if _ANONYMOUS_MODE_HASH_ALGORITHM not in HASH_ALGORITHMS:
+        raise ValueError(f'ANONYMOUS_MODE_HASH_ALGORITHM must be one of {HASH_ALGORITHMS}, '
+                         f'got: {_ANONYMOUS_MODE_HASH_ALGORITHM}')
+    if _ANONYMOUS_MODE_HASH_ALGORITHM != 'md5' and not _ANONYMOUS_MODE_HASH_SECRET:
+        raise ValueError(f'ANONYMOUS_MODE_HASH_ALGORITHM = {_ANONYMOUS_MODE_HASH_ALGORITHM}, but '
+                         f'ANONYMOUS_MODE_HASH_SECRET not specified.')
+    return AnonymousModeConfig(
+        to_hash={
             'HttpContext': {
                 'remote_address',
                 'user_agent'
             }
-        }
-    })
+        },
+        hash_algorithm=_ANONYMOUS_MODE_HASH_ALGORITHM,
+        hash_secret=_ANONYMOUS_MODE_HASH_SECRET
+    )
 
 
 def get_config_output_aws() -> Optional[AwsOutputConfig]:
@@ -302,6 +340,14 @@ def get_config_event_list_schema() -> EventListSchema:
     return get_event_list_schema()
 
 
+def get_config_queue() -> QueueConfig:
+    if _QUEUE_BACKEND not in ('delete', 'ring'):
+        raise ValueError(f'QUEUE_BACKEND must be either "delete" or "ring", got: {_QUEUE_BACKEND}')
+    if _QUEUE_RING_PARTITIONS < 2:
+        raise ValueError(f'QUEUE_RING_PARTITIONS must be at least 2, got: {_QUEUE_RING_PARTITIONS}')
+    return QueueConfig(backend=_QUEUE_BACKEND, ring_partitions=_QUEUE_RING_PARTITIONS)
+
+
 def get_config_timestamp_validation() -> TimestampValidationConfig:
     return TimestampValidationConfig(max_delay=MAX_DELAYED_EVENTS_MILLIS)
 
@@ -321,7 +367,8 @@ def init_collector_config():
         error_reporting=SCHEMA_VALIDATION_ERROR_REPORTING,
         output=get_config_output(),
         event_schema=get_config_event_schema(),
-        event_list_schema=get_config_event_list_schema()
+        event_list_schema=get_config_event_list_schema(),
+        queue=get_config_queue()
     )
 
 
@@ -332,3 +379,12 @@ def get_collector_config() -> CollectorConfig:
         init_collector_config()
         assert _CACHED_COLLECTOR_CONFIG is not None  # help out mypy
     return _CACHED_COLLECTOR_CONFIG
+
+
+def set_collector_config(config: CollectorConfig):
+    """
+    Replace the cached Collector Configuration. Useful for tools and tests that need a configuration that
+    cannot be expressed with environment variables, e.g. one without any outputs.
+    """
+    global _CACHED_COLLECTOR_CONFIG
+    _CACHED_COLLECTOR_CONFIG = config
@@ -4,20 +4,22 @@ from datetime import datetime
 import flask
 import time
 from urllib.parse import urlparse, parse_qs
-from typing import List, Callable
+from typing import List, Callable, Dict, FrozenSet, Optional, Set, Tuple
 import hashlib
+import hmac
 import psycopg2
 from flask import Response, Request
 
 from objectiv_backend.common.config import get_collector_config, AnonymousModeConfig
-from objectiv_backend.common.types import EventData, EventDataList, EventList
+from objectiv_backend.common.types import EventData, EventDataList, EventList, ContextData
 from objectiv_backend.common.db import get_db_connection
-from objectiv_backend.common.event_utils import add_global_context_to_event, get_contexts
+from objectiv_backend.common.event_utils import add_global_context_to_event, get_contexts, \
+    get_global_contexts, get_location_stack
 from objectiv_backend.end_points.common import get_json_response, get_cookie_id_context
 from objectiv_backend.end_points.extra_output import events_to_json, write_data_to_fs_if_configured, \
     write_data_to_s3_if_configured, write_data_to_snowplow_if_configured
 from objectiv_backend.schema.validate_events import validate_structure_event_list, EventError
-from objectiv_backend.workers.pg_queues import PostgresQueues, ProcessingStage
+from objectiv_backend.workers.pg_queues import get_pg_queues, ProcessingStage
 from objectiv_backend.workers.pg_storage import insert_events_into_nok_data
 from objectiv_backend.workers.worker_entry import process_events_entry
 from objectiv_backend.workers.worker_finalize import insert_events_into_data
@@ -85,19 +87,104 @@ def hash_property(property_to_hash: str) -> str:
     return hashlib.md5(str(property_to_hash).encode()).hexdigest()
 
 
-def anonymize_events(events: EventDataList, config: AnonymousModeConfig, hash_method: Callable = hash_property):
+def get_hash_method(config: AnonymousModeConfig) -> Callable[[str], str]:
+    """
+    Give the hash method as configured in the AnonymousModeConfig.
+    The keyed hashes have the same length as the md5 hashes: 32 hexadecimal characters.
+    """
+    if config.hash_algorithm == 'md5':
+        return hash_property
+    key = config.hash_secret.encode()
+    if config.hash_algorithm == 'blake2b':
+        # blake2b supports keys of at most 64 bytes
+        key = hashlib.sha256(key).digest() if len(key) > 64 else key
+        return lambda value: hashlib.blake2b(str(value).encode(), key=key, digest_size=16).hexdigest()
+    if config.hash_algorithm == 'hmac-sha256':
+        # the keyed state is computed once, and copied for every value
+        keyed_hmac = hmac.new(key, digestmod=hashlib.sha256)
+
+        def hash_hmac(value: str) -> str:
+            value_hmac = keyed_hmac.copy()
+            value_hmac.update(str(value).encode())
+            return value_hmac.hexdigest()[:32]
+        return hash_hmac
+    raise ValueError(f'Unsupported hash algorithm: {config.hash_algorithm}')
+
+
+class AnonymizationPlan:
+    """
+    Anonymization plan, compiled once from an AnonymousModeConfig.
+
+    For each context-type the plan knows which properties to hash, so anonymizing an event is a single pass
+    over its contexts. Within a call to anonymize_events(), hashed values are memoized, as the same values
+    (e.g. user agents and ip addresses) occur many times within a single request.
+    """
+
+    def __init__(self, config: AnonymousModeConfig, hash_method: Callable[[str], str] = None):
+        """
+        :param config: AnonymousModeConfig
+        :param hash_method: Callable to hash property with. If not set, the hash method is determined by the
+            hash_algorithm and hash_secret in the config
+        """
+        self.hash_method = hash_method if hash_method is not None else get_hash_method(config)
+        self.to_hash: Dict[str, FrozenSet[str]] = {
+            context_type: frozenset(properties) for context_type, properties in config.to_hash.items()
+        }
+
+    def _get_properties(self, context: ContextData) -> Set[str]:
+        """ Give the properties of the context that should be hashed. """
+        properties = set(self.to_hash.get(str(context.get('_type')), ()))
+        # Also consider the parent types, if the context types are already hydrated.
+        for context_type in context.get('_types', ()):  # type: ignore
+            properties |= self.to_hash.get(context_type, frozenset())
+        return properties
+
+    def anonymize_events(self, events: EventDataList):
+        """
+        Modify events in the list, by hashing the fields as specified in the plan.
+        :param events: List of events to anonymize
+        """
+        if not self.to_hash:
+            return
+        hashed_values: Dict[str, str] = {}
+        for event in events:
+            for context in get_global_contexts(event) + get_location_stack(event):
+                for context_property in self._get_properties(context):
+                    if context_property not in context:
+                        continue
+                    value = str(context[context_property])
+                    if value not in hashed_values:
+                        hashed_values[value] = self.hash_method(value)
+                    context[context_property] = hashed_values[value]
+
+
+# Compiling a plan is cheap, but there is no point in doing it for every request. As the collector config
+# is cached, the plan for the last seen AnonymousModeConfig is cached here too.
+_CACHED_ANONYMIZATION_PLAN: Optional[Tuple[AnonymousModeConfig, AnonymizationPlan]] = None
+
+
+def get_anonymization_plan(config: AnonymousModeConfig) -> AnonymizationPlan:
+    """ Get the AnonymizationPlan for the given config. """
+    global _CACHED_ANONYMIZATION_PLAN
+    if _CACHED_ANONYMIZATION_PLAN is None or _CACHED_ANONYMIZATION_PLAN[0] is not config:
+        _CACHED_ANONYMIZATION_PLAN = (config, AnonymizationPlan(config))
+    return _CACHED_ANONYMIZATION_PLAN[1]
+
+
+def anonymize_events(events: EventDataList, config: AnonymousModeConfig, hash_method: Callable = None):
     """
     Modify events in the list, by hashing the fields as specified in the config
     :param events: List of events to anonymize
     :param config: AnonymousModeConfig,
-    :param hash_method: Callable to hash property with
+    :param hash_method: Callable to hash property with. If not set, the hash method is determined by the
+        hash_algorithm and hash_secret in the config
     :return:
     """
-    for event in events:
-        for context_type in config.to_hash:
-            for context in get_contexts(event, context_type):
-                for context_property in config.to_hash[context_type]:
-                    context[context_property] = hash_method(context[context_property])
+    if hash_method is None:
+        plan = get_anonymization_plan(config)
+    else:
+        plan = AnonymizationPlan(config, hash_method=hash_method)
+    plan.anonymize_events(events)
 
 
 def _get_event_data(request: Request) -> EventList:
@@ -388,7 +475,7 @@ def write_async_events(events: EventDataList):
         connection = get_db_connection(output_config.postgres)
         try:
             with connection:
-                pg_queue = PostgresQueues(connection=connection)
+                pg_queue = get_pg_queues(connection=connection)
                 pg_queue.put_events(queue=ProcessingStage.ENTRY, events=events)
         finally:
             connection.close()
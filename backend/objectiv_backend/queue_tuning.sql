@@ -0,0 +1,31 @@
+-- Indexes and storage settings for the queue tables. All statements are idempotent, so this can be run on
+-- both new and existing databases. Run by objectiv_backend/tools/db_init/db_init.py after create_tables.sql
+
+-- PostgresQueues.get_events() picks the oldest events with `order by insert_order limit N`, and then deletes
+-- them with `where event_id in (...)`. Without these indexes both are sequential scans of the queue.
+-- The indexes are created concurrently, so the collector and workers can keep using the queue tables while
+-- they are built. This can't run in a transaction, so db_init executes these statements one by one. If a
+-- concurrent build fails, the index is left invalid and must be dropped before running this again.
+create index concurrently if not exists queue_entry_insert_order_idx on queue_entry(insert_order);
+create index concurrently if not exists queue_entry_event_id_idx on queue_entry(event_id);
+create index concurrently if not exists queue_finalize_insert_order_idx on queue_finalize(insert_order);
+create index concurrently if not exists queue_finalize_event_id_idx on queue_finalize(event_id);
+
+-- Every row in the queue tables is inserted once and deleted soon after, so these tables are mostly dead
+-- tuples. The default autovacuum settings are based on a fraction of the table size (20%), which for these
+-- tables means that they are vacuumed too late, or not at all while they're small but busy. Instead we
+-- vacuum after a fixed number of deleted rows, without throttling.
+alter table queue_entry set (
+    autovacuum_vacuum_scale_factor = 0,
+    autovacuum_vacuum_threshold = 5000,
+    autovacuum_vacuum_cost_delay = 0,
+    autovacuum_analyze_scale_factor = 0,
+    autovacuum_analyze_threshold = 5000
+);
+alter table queue_finalize set (
+    autovacuum_vacuum_scale_factor = 0,
+    autovacuum_vacuum_threshold = 5000,
+    autovacuum_vacuum_cost_delay = 0,
+    autovacuum_analyze_scale_factor = 0,
+    autovacuum_analyze_threshold = 5000
+);
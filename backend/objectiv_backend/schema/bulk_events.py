@@ -0,0 +1,274 @@
+"""
+Bulk validation and hydration of large event files.
+
+Unlike validate_events.main() and hydrate_events.main(), this does not read whole files into memory and
+does not process files serially. Input files are streamed, either as newline delimited JSON (one event per
+line) or as a JSON array of events. Events are validated and hydrated in chunks, spread over a pool of
+worker processes that each load the event schema once. Valid, hydrated events are written as newline
+delimited JSON, and invalid events are written to an error report, also as newline delimited JSON.
+
+Copyright 2022 Objectiv B.V.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent import futures
+from typing import Iterator, List, Optional, TextIO, Tuple, Dict, NamedTuple
+
+from objectiv_backend.common.types import EventData
+from objectiv_backend.schema.event_schemas import EventSchema, get_event_schema
+from objectiv_backend.schema.hydrate_events import hydrate_types_into_event
+from objectiv_backend.schema.validate_events import validate_event_adheres_to_schema, \
+    validate_structure_event_list, ErrorInfo
+
+DEFAULT_CHUNK_SIZE = 1000
+_READ_BUFFER_SIZE = 1024 * 1024
+
+# Schema of the current worker process, set by _init_worker()
+_WORKER_EVENT_SCHEMA: Optional[EventSchema] = None
+
+
+class ChunkResult(NamedTuple):
+    # hydrated events, serialized as json
+    ok_lines: List[str]
+    # error reports, serialized as json
+    error_lines: List[str]
+
+
+def iter_events(file: TextIO) -> Iterator[EventData]:
+    """
+    Stream events from a file. The file can either contain newline delimited JSON, with one event per line,
+    or a JSON array of events. The format is determined by the first non-whitespace character.
+    """
+    buffer = ''
+    while True:
+        chunk = file.read(_READ_BUFFER_SIZE)
+        buffer += chunk
+        if buffer.lstrip() or not chunk:
+            break
+    buffer = buffer.lstrip()
+    if not buffer:
+        return
+    if buffer[0] == '[':
+        yield from _iter_json_array(file, buffer[1:])
+    else:
+        yield from _iter_ndjson(file, buffer)
+
+
+def _iter_ndjson(file: TextIO, buffer: str) -> Iterator[EventData]:
+    line_number = 0
+    while True:
+        lines = buffer.split('\n')
+        # the last part might be an incomplete line, keep it in the buffer
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield _parse_line(line, line_number)
+        chunk = file.read(_READ_BUFFER_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+    if buffer.strip():
+        yield _parse_line(buffer, line_number + 1)
+
+
+def _parse_line(line: str, line_number: int) -> EventData:
+    try:
+        return json.loads(line)
+    except ValueError as exc:
+        raise ValueError(f'Invalid JSON on line {line_number}: {exc}') from exc
+
+
+def _iter_json_array(file: TextIO, buffer: str) -> Iterator[EventData]:
+    decoder = json.JSONDecoder()
+    position = 0
+    expect_value = True
+    while True:
+        # skip whitespace and separators
+        while position < len(buffer) and buffer[position] in ' \t\r\n':
+            position += 1
+        if position < len(buffer):
+            char = buffer[position]
+            if char == ']':
+                return
+            if char == ',' and not expect_value:
+                expect_value = True
+                position += 1
+                continue
+            if expect_value:
+                try:
+                    event, end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    # the value might continue in the next part of the file
+                    end = -1
+                if end != -1 and end < len(buffer):
+                    yield event
+                    position = end
+                    expect_value = False
+                    continue
+            else:
+                raise ValueError(f'Expected "," or "]" in JSON array, found {char!r}')
+        chunk = file.read(_READ_BUFFER_SIZE)
+        if not chunk:
+            raise ValueError('Invalid JSON, or unexpected end of file, in JSON array')
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_chunks(events: Iterator[EventData], chunk_size: int) -> Iterator[List[EventData]]:
+    chunk: List[EventData] = []
+    for event in events:
+        chunk.append(event)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(schema_extensions_directory: Optional[str]):
+    """ Load the schema once per worker process. """
+    global _WORKER_EVENT_SCHEMA
+    _WORKER_EVENT_SCHEMA = get_event_schema(schema_extensions_directory=schema_extensions_directory)
+
+
+def process_chunk(events: List[EventData], filename: str) -> ChunkResult:
+    """
+    Validate and hydrate a chunk of events, using the schema of the current worker process.
+    :return: ChunkResult with hydrated ok events and error reports for nok events, both as json strings.
+    """
+    event_schema = _WORKER_EVENT_SCHEMA
+    assert event_schema is not None  # _init_worker() has been called
+
+    structure_errors: Dict[int, List[ErrorInfo]] = {}
+    if validate_structure_event_list({'events': events, 'transport_time': 0}):
+        # Something in this chunk has the wrong structure. Check each event to find out which ones.
+        for index, event in enumerate(events):
+            errors = validate_structure_event_list({'events': [event], 'transport_time': 0})
+            if errors:
+                structure_errors[index] = errors
+
+    ok_lines = []
+    error_lines = []
+    for index, event in enumerate(events):
+        errors = structure_errors.get(index, [])
+        if not errors:
+            try:
+                errors = validate_event_adheres_to_schema(event_schema=event_schema, event=event)
+            except (KeyError, TypeError) as exc:
+                # The structure check doesn't check the fields of events. Handle it here instead of
+                # failing the whole run on a single malformed event.
+                errors = [ErrorInfo(event, f'Event does not have the required structure: {exc!r}')]
+        if errors:
+            error_lines.append(json.dumps({
+                'file': filename,
+                'event_id': event.get('id') if isinstance(event, dict) else None,
+                'errors': [error.info for error in errors]
+            }))
+        else:
+            ok_lines.append(json.dumps(hydrate_types_into_event(event_schema=event_schema, event=event)))
+    return ChunkResult(ok_lines=ok_lines, error_lines=error_lines)
+
+
+def process_files(filenames: List[str],
+                  output: Optional[TextIO],
+                  error_report: TextIO,
+                  schema_extensions_directory: Optional[str],
+                  workers: Optional[int],
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[int, int]:
+    """
+    Validate and hydrate all events in the given files.
+
+    Output order is the same as the input order. At most two chunks per worker are in flight at any time,
+    which bounds memory usage regardless of the input size.
+
+    :param filenames: files to process
+    :param output: file to write hydrated events to, or None to only validate.
+    :param error_report: file to write the error reports for invalid events to.
+    :param schema_extensions_directory: optional directory with schema extensions.
+    :param workers: number of worker processes, None for the number of cpus.
+    :param chunk_size: number of events per chunk that is sent to a worker.
+    :return: tuple: number of processed events, number of invalid events
+    """
+    event_count = 0
+    error_count = 0
+    start = time.time()
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    with futures.ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_worker,
+                                     initargs=(schema_extensions_directory,)) as executor:
+        for filename in filenames:
+            with open(filename) as file:
+                in_flight: List[futures.Future] = []
+                chunks = iter_chunks(iter_events(file), chunk_size)
+                while True:
+                    for chunk in chunks:
+                        event_count += len(chunk)
+                        in_flight.append(executor.submit(process_chunk, chunk, filename))
+                        if len(in_flight) >= max_in_flight:
+                            break
+                    if not in_flight:
+                        break
+                    result: ChunkResult = in_flight.pop(0).result()
+                    error_count += len(result.error_lines)
+                    if output is not None:
+                        output.writelines(f'{line}\n' for line in result.ok_lines)
+                    error_report.writelines(f'{line}\n' for line in result.error_lines)
+            elapsed = time.time() - start
+            print(f'{filename}: done. Total: {event_count} events, {error_count} errors, '
+                  f'{event_count / elapsed if elapsed else 0:.0f} events/s', file=sys.stderr)
+    return event_count, error_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate and hydrate large event files in parallel')
+    parser.add_argument('--schema-extensions-directory', type=str)
+    parser.add_argument('--output', type=str,
+                        help='Write hydrated valid events as newline delimited JSON to this file. '
+                             'Use "-" for stdout. If not set, events are only validated.')
+    parser.add_argument('--error-report', type=str, default='-',
+                        help='Write errors as newline delimited JSON to this file. Default: stdout')
+    parser.add_argument('--workers', type=int, help='Number of worker processes. Default: number of cpus')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Number of events that is sent to a worker at once')
+    parser.add_argument('filenames', type=str, nargs='+',
+                        help='Files with newline delimited JSON events, or with a JSON array of events')
+    args = parser.parse_args(sys.argv[1:])
+
+    def _open(path: Optional[str]) -> Optional[TextIO]:
+        if path is None:
+            return None
+        if path == '-':
+            return sys.stdout
+        return open(path, 'w')
+
+    output = _open(args.output)
+    error_report = _open(args.error_report)
+    assert error_report is not None
+    start = time.time()
+    try:
+        event_count, error_count = process_files(
+            filenames=args.filenames,
+            output=output,
+            error_report=error_report,
+            schema_extensions_directory=args.schema_extensions_directory,
+            workers=args.workers,
+            chunk_size=args.chunk_size
+        )
+    finally:
+        for file in output, error_report:
+            if file is not None and file is not sys.stdout:
+                file.close()
+    elapsed = time.time() - start
+    print(f'\nSummary: {event_count} events in {len(args.filenames)} file(s), {error_count} error(s). '
+          f'{elapsed:.1f} s, {event_count / elapsed if elapsed else 0:.0f} events/s', file=sys.stderr)
+    if error_count:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,14 @@ Copyright 2021 Objectiv B.V.
 import argparse
 import json
 import sys
-from typing import List, Any, Dict, NamedTuple, Set
+from typing import List, Any, Dict, NamedTuple, Set, Optional, Tuple
 import uuid
 import re
+from weakref import WeakKeyDictionary
 
 import jsonschema
 from jsonschema import ValidationError
+from jsonschema.exceptions import best_match
 
 from objectiv_backend.schema.event_schemas import EventSchema, get_event_schema
 from objectiv_backend.common.config import \
@@ -75,6 +77,39 @@ def get_event_list_schema() -> Dict[str, Any]:
     return event_list_schema
 
 
+# Compiled json-schema validators per EventSchema, keyed by ('event'|'context', type).
+# Checking and compiling a json-schema is much more expensive than validating an instance against it, so we
+# only want to do that once per type. EventSchemas are immutable, so the cached validators never get stale.
+_VALIDATORS: 'WeakKeyDictionary[EventSchema, Dict[Tuple[str, str], Any]]' = WeakKeyDictionary()
+
+
+def _get_validator(event_schema: EventSchema, kind: str, type_name: str) -> Optional[Any]:
+    """
+    Get a compiled json-schema validator for the given event or context type.
+    :param kind: 'event' or 'context'
+    :return: validator, or None if the type is not in the event_schema
+    """
+    validators = _VALIDATORS.setdefault(event_schema, {})
+    key = (kind, type_name)
+    if key not in validators:
+        if kind == 'event':
+            schema = event_schema.get_event_schema(event_type=type_name)
+        else:
+            schema = event_schema.get_context_schema(context_type=type_name)
+        validator = None
+        if schema is not None:
+            validator_class = jsonschema.validators.validator_for(schema)
+            validator_class.check_schema(schema)
+            validator = validator_class(schema)
+        validators[key] = validator
+    return validators[key]
+
+
+def _validate_instance(validator: Any, instance: Any) -> Optional[ValidationError]:
+    """ Give the same error that jsonschema.validate() would raise, or None if the instance is valid. """
+    return best_match(validator.iter_errors(instance))
+
+
 def validate_structure_event_list(event_data: Any) -> List[ErrorInfo]:
     """
     Checks that event_data is a list of events, that each event has the required fields, and that all
@@ -204,24 +239,22 @@ def _validate_context_item(event_schema: EventSchema, context) -> List[ErrorInfo
     context_type = context['_type']
     # theoretically we could generate some json schema with if-then that we could just validate, without
     # having to select the right sub-schema here, but that would be very complex and not very readable.
-    schema = event_schema.get_context_schema(context_type)
-    if not schema:
+    validator = _get_validator(event_schema, 'context', context_type)
+    if not validator:
         print(f'Unknown context {context_type}, ignoring')
         return []
-    try:
-        jsonschema.validate(instance=context, schema=schema)
-    except ValidationError as exc:
-        return [ErrorInfo(context, f'context validation failed: {exc}')]
+    error = _validate_instance(validator, context)
+    if error is not None:
+        return [ErrorInfo(context, f'context validation failed: {error}')]
     return []
 
 
 def _validate_event_item(event_schema: EventSchema, event) -> List[ErrorInfo]:
     event_type = event['_type']
-    schema = event_schema.get_event_schema(event_type=event_type)
-    try:
-        jsonschema.validate(instance=event, schema=schema)
-    except ValidationError as exc:
-        return [ErrorInfo(event, f'event validation failed {exc}')]
+    validator = _get_validator(event_schema, 'event', event_type)
+    error = _validate_instance(validator, event)
+    if error is not None:
+        return [ErrorInfo(event, f'event validation failed {error}')]
 
     return []
 
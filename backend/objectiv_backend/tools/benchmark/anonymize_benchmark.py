@@ -0,0 +1,90 @@
+"""
+Benchmark anonymization of events: the compiled AnonymizationPlan against the previous implementation,
+that looped over all configured context-types and properties per event and hashed every value again.
+
+Usage:
+    python -m objectiv_backend.tools.benchmark.anonymize_benchmark --batches 200 --batch-size 100
+
+Copyright 2022 Objectiv B.V.
+"""
+import argparse
+import copy
+import sys
+import time
+from typing import Callable, List
+
+from objectiv_backend.common.config import get_collector_config, AnonymousModeConfig
+from objectiv_backend.common.event_utils import get_contexts
+from objectiv_backend.common.types import EventDataList
+from objectiv_backend.end_points.collector import AnonymizationPlan, hash_property
+from objectiv_backend.tools.benchmark.event_generator import EventGenerator, GeneratorConfig
+
+_TO_HASH = {'HttpContext': {'remote_address', 'user_agent'}}
+
+
+def anonymize_events_reference(events: EventDataList, config: AnonymousModeConfig):
+    """ The implementation of anonymize_events() before the AnonymizationPlan was introduced. """
+    for event in events:
+        for context_type in config.to_hash:
+            for context in get_contexts(event, context_type):
+                for context_property in config.to_hash[context_type]:
+                    context[context_property] = hash_property(str(context[context_property]))
+
+
+def _add_http_contexts(batches: List[EventDataList], distinct_agents: int):
+    """ Give each event a HttpContext, as the collector would do, with a limited set of user agents. """
+    for batch_index, events in enumerate(batches):
+        for event_index, event in enumerate(events):
+            event['global_contexts'] = [c for c in event['global_contexts'] if c['_type'] != 'HttpContext']
+            agent = (batch_index + event_index) % distinct_agents
+            event['global_contexts'].append({
+                '_type': 'HttpContext',
+                'id': 'http_context',
+                'remote_address': f'10.0.{agent // 256}.{agent % 256}',
+                'referrer': '',
+                'user_agent': f'Mozilla/5.0 (benchmark; agent {agent}) AppleWebKit/537.36 Chrome/100.0'
+            })
+
+
+def _time(function: Callable[[EventDataList], None], batches: List[EventDataList]) -> float:
+    batches = copy.deepcopy(batches)
+    start = time.perf_counter()
+    for events in batches:
+        function(events)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark anonymization of events')
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--distinct-agents', type=int, default=5,
+                        help='Number of distinct user agents and ip addresses in the data')
+    args = parser.parse_args(sys.argv[1:])
+
+    generator = EventGenerator(get_collector_config().event_schema,
+                               GeneratorConfig(batch_size=args.batch_size, seed=0))
+    batches = [batch['events'] for batch in generator.generate_batches(args.batches)]
+    _add_http_contexts(batches, args.distinct_agents)
+    event_count = args.batches * args.batch_size
+
+    md5_config = AnonymousModeConfig(to_hash=_TO_HASH)
+    candidates = {
+        'reference (md5)': lambda events: anonymize_events_reference(events, md5_config),
+        'plan (md5)': AnonymizationPlan(md5_config).anonymize_events,
+    }
+    for algorithm in 'blake2b', 'hmac-sha256':
+        config = AnonymousModeConfig(to_hash=_TO_HASH, hash_algorithm=algorithm, hash_secret='benchmark')
+        candidates[f'plan ({algorithm})'] = AnonymizationPlan(config).anonymize_events
+
+    print(f'{event_count} events, {args.distinct_agents} distinct user agents')
+    reference_elapsed = None
+    for name, function in candidates.items():
+        elapsed = _time(function, batches)
+        reference_elapsed = reference_elapsed or elapsed
+        print(f'{name:<22} {elapsed:8.3f} s {event_count / elapsed:12.0f} events/s '
+              f'{reference_elapsed / elapsed:6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
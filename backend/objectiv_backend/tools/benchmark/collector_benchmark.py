@@ -0,0 +1,304 @@
+"""
+Benchmark harness for the collector.
+
+Generates synthetic tracker batches (see event_generator.py) and uses them to:
+ 1. time the individual processing stages of the collector (parse, enrich, validate, hydrate, write)
+ 2. measure end-to-end throughput and latency, either in-process through the flask test client, or
+    over HTTP against a running collector.
+
+The results are printed, and can be saved as JSON with --output, so that runs of different versions can be
+compared with --compare.
+
+Usage examples:
+    # stage timings and in-process end-to-end numbers, without writing to a database
+    python -m objectiv_backend.tools.benchmark.collector_benchmark --sink stub --batches 200
+    # the same, but writing to the Postgres database as configured with the POSTGRES_* env variables
+    python -m objectiv_backend.tools.benchmark.collector_benchmark --sink postgres --output pg.json
+    # end-to-end numbers for a collector running on localhost
+    python -m objectiv_backend.tools.benchmark.collector_benchmark --mode http --url http://localhost:5000/
+
+Copyright 2022 Objectiv B.V.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import time
+import urllib.request
+from concurrent import futures
+from datetime import datetime
+from typing import List, Dict, Any, NamedTuple, Callable, Optional
+
+import flask
+
+from objectiv_backend import __version__
+from objectiv_backend.app import create_app
+from objectiv_backend.common.config import get_collector_config, set_collector_config, OutputConfig
+from objectiv_backend.common.types import EventList
+from objectiv_backend.end_points.collector import _get_event_data, add_enriched_contexts, set_time_in_events, \
+    anonymize_events, write_sync_events, write_async_events
+from objectiv_backend.schema.hydrate_events import hydrate_types_into_event
+from objectiv_backend.schema.validate_events import validate_event_adheres_to_schema, validate_event_time
+from objectiv_backend.tools.benchmark.event_generator import EventGenerator, GeneratorConfig, parse_event_mix
+
+STAGES = ['parse', 'enrich', 'validate', 'hydrate', 'write']
+
+
+class TimingStats(NamedTuple):
+    requests: int
+    total_s: float
+    mean_ms: float
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+
+    @classmethod
+    def from_durations(cls, durations: List[float]) -> 'TimingStats':
+        """ Create TimingStats from a list of durations in seconds. """
+        if not durations:
+            return cls(requests=0, total_s=0, mean_ms=0, p50_ms=0, p99_ms=0, max_ms=0)
+        total = sum(durations)
+        return cls(
+            requests=len(durations),
+            total_s=total,
+            mean_ms=total / len(durations) * 1000,
+            p50_ms=percentile(durations, 50) * 1000,
+            p99_ms=percentile(durations, 99) * 1000,
+            max_ms=max(durations) * 1000
+        )
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """ Nearest-rank percentile of values. """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def use_stub_sink():
+    """
+    Configure the collector to not write data anywhere. This measures the collector's own overhead, and
+    does not require a database.
+    """
+    config = get_collector_config()
+    set_collector_config(config._replace(
+        output=OutputConfig(postgres=None, aws=None, file_system=None, snowplow=None)
+    ))
+
+
+def run_stages(app: flask.Flask, payloads: List[bytes], anonymous_mode: bool) -> Dict[str, TimingStats]:
+    """
+    Run the collector's processing stages one by one for each payload, timing each stage separately.
+    This follows the same steps as collector.collect(), but calls them directly.
+    """
+    durations: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    config = get_collector_config()
+    event_schema = config.event_schema
+    for payload in payloads:
+        with app.test_request_context('/', method='POST', data=payload):
+            current_millis = round(time.time() * 1000)
+
+            start = time.perf_counter()
+            event_data: EventList = _get_event_data(flask.request)
+            events = event_data['events']
+            durations['parse'].append(time.perf_counter() - start)
+
+            # EventGenerator sets a client_session_id in every request
+            client_session_id = event_data.get('client_session_id')
+            assert client_session_id is not None
+
+            start = time.perf_counter()
+            add_enriched_contexts(events, anonymous_mode=anonymous_mode, client_session_id=client_session_id)
+            set_time_in_events(events, current_millis, event_data['transport_time'])
+            if anonymous_mode:
+                anonymize_events(events, config.anonymous_mode)
+            durations['enrich'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            validated = [
+                (event,
+                 validate_event_adheres_to_schema(event_schema=event_schema, event=event) +
+                 validate_event_time(event=event, current_millis=current_millis))
+                for event in events
+            ]
+            ok_events = [event for event, errors in validated if not errors]
+            nok_events = [event for event, errors in validated if errors]
+            durations['validate'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            ok_events = [hydrate_types_into_event(event_schema=event_schema, event=event) for event in ok_events]
+            durations['hydrate'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            if config.async_mode:
+                write_async_events(events=events)
+            else:
+                write_sync_events(ok_events=ok_events, nok_events=nok_events)
+            durations['write'].append(time.perf_counter() - start)
+    return {stage: TimingStats.from_durations(durations[stage]) for stage in STAGES}
+
+
+def _post_in_process(app: flask.Flask, path: str) -> Callable[[bytes], bool]:
+    client = app.test_client()
+
+    def post(payload: bytes) -> bool:
+        response = client.post(path, data=payload, content_type='application/json')
+        data = response.get_json()
+        return response.status_code == 200 and data is not None and data['error_count'] == 0
+    return post
+
+
+def _post_http(url: str) -> Callable[[bytes], bool]:
+    def post(payload: bytes) -> bool:
+        request = urllib.request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return response.status == 200 and json.loads(response.read())['error_count'] == 0
+    return post
+
+
+def run_end_to_end(post: Callable[[bytes], bool],
+                   payloads: List[bytes],
+                   events_per_payload: int,
+                   concurrency: int) -> Dict[str, Any]:
+    """
+    Post all payloads, with `concurrency` requests in flight at the same time. Returns throughput and
+    latency statistics.
+    """
+    def timed_post(payload: bytes):
+        start = time.perf_counter()
+        ok = post(payload)
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        results = [timed_post(payload) for payload in payloads]
+    else:
+        with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed_post, payloads))
+    elapsed = time.perf_counter() - start
+
+    latencies = [duration for duration, _ in results]
+    stats = TimingStats.from_durations(latencies)
+    return {
+        'requests': len(payloads),
+        'events': len(payloads) * events_per_payload,
+        'failed_requests': len([ok for _, ok in results if not ok]),
+        'elapsed_s': elapsed,
+        'requests_per_s': len(payloads) / elapsed if elapsed else 0,
+        'events_per_s': len(payloads) * events_per_payload / elapsed if elapsed else 0,
+        'latency': stats._asdict()
+    }
+
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    """ Print results, and if a baseline is given the relative change against that baseline. """
+    def _change(new: float, old: Optional[float]) -> str:
+        if not old:
+            return ''
+        return f' ({(new - old) / old * 100:+.1f}%)'
+
+    baseline = baseline or {}
+    if results.get('stages'):
+        print(f'\n{"stage":<10} {"mean ms":>10} {"p50 ms":>10} {"p99 ms":>10}')
+        for stage, stats in results['stages'].items():
+            old_mean = baseline.get('stages', {}).get(stage, {}).get('mean_ms')
+            print(f'{stage:<10} {stats["mean_ms"]:>10.3f} {stats["p50_ms"]:>10.3f} {stats["p99_ms"]:>10.3f}'
+                  f'{_change(stats["mean_ms"], old_mean)}')
+    if results.get('end_to_end'):
+        e2e = results['end_to_end']
+        old_e2e = baseline.get('end_to_end', {})
+        print(f'\nend-to-end ({results["config"]["mode"]}): {e2e["requests"]} requests, '
+              f'{e2e["failed_requests"]} failed')
+        print(f'  requests/s: {e2e["requests_per_s"]:.1f}'
+              f'{_change(e2e["requests_per_s"], old_e2e.get("requests_per_s"))}')
+        print(f'  events/s:   {e2e["events_per_s"]:.1f}'
+              f'{_change(e2e["events_per_s"], old_e2e.get("events_per_s"))}')
+        for key in 'p50_ms', 'p99_ms':
+            old = old_e2e.get('latency', {}).get(key)
+            print(f'  {key}:     {e2e["latency"][key]:.3f}{_change(e2e["latency"][key], old)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the collector with synthetic tracker data')
+    parser.add_argument('--mode', choices=['in-process', 'http'], default='in-process',
+                        help='in-process: time stages and use the flask test client. '
+                             'http: post to a running collector at --url.')
+    parser.add_argument('--url', type=str, default='http://localhost:5000/')
+    parser.add_argument('--sink', choices=['stub', 'postgres'], default='stub',
+                        help='Only for in-process mode. stub: do not write data. '
+                             'postgres: write to the database configured with the POSTGRES_* env variables')
+    parser.add_argument('--anonymous', action='store_true', help='Use the anonymous mode endpoint')
+    parser.add_argument('--batches', type=int, default=100, help='Number of requests')
+    parser.add_argument('--batch-size', type=int, default=10, help='Number of events per request')
+    parser.add_argument('--global-contexts', type=int, default=3, help='Global contexts per event')
+    parser.add_argument('--location-depth', type=int, default=3, help='Location stack depth per event')
+    parser.add_argument('--event-mix', type=str, default='',
+                        help='Weighted event types, e.g. "PressEvent=5,VisibleEvent=1". Default: all uniform')
+    parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight at the same time')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, help='Write results as JSON to this file')
+    parser.add_argument('--compare', type=str, help='JSON results of an earlier run to compare with')
+    args = parser.parse_args(sys.argv[1:])
+
+    generator_config = GeneratorConfig(
+        event_mix=parse_event_mix(args.event_mix),
+        batch_size=args.batch_size,
+        global_context_count=args.global_contexts,
+        location_stack_depth=args.location_depth,
+        seed=args.seed
+    )
+    generator = EventGenerator(get_collector_config().event_schema, generator_config)
+    results: Dict[str, Any] = {
+        'version': __version__,
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'config': {
+            'mode': args.mode,
+            'sink': args.sink if args.mode == 'in-process' else 'remote',
+            'anonymous': args.anonymous,
+            'batches': args.batches,
+            'concurrency': args.concurrency,
+            'generator': generator_config._asdict()
+        }
+    }
+    path = '/anonymous' if args.anonymous else '/'
+
+    if args.mode == 'in-process':
+        app = create_app()
+        if args.sink == 'stub':
+            use_stub_sink()
+        # The collector prints a line per request. We don't want to benchmark our terminal.
+        with contextlib.redirect_stdout(io.StringIO()):
+            payloads = [json.dumps(batch).encode() for batch in generator.generate_batches(args.batches)]
+            results['stages'] = {
+                stage: stats._asdict()
+                for stage, stats in run_stages(app, payloads, anonymous_mode=args.anonymous).items()
+            }
+            # new event ids, otherwise all events are duplicates of the ones written by run_stages()
+            payloads = [json.dumps(batch).encode() for batch in generator.generate_batches(args.batches)]
+            results['end_to_end'] = run_end_to_end(
+                _post_in_process(app, path), payloads, args.batch_size, args.concurrency
+            )
+    else:
+        payloads = [json.dumps(batch).encode() for batch in generator.generate_batches(args.batches)]
+        url = args.url.rstrip('/') + path
+        results['end_to_end'] = run_end_to_end(_post_http(url), payloads, args.batch_size, args.concurrency)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+        print(f'\nResults written to {os.path.abspath(args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Generate synthetic, but schema-valid, tracker batches for benchmarking.
+
+All events and contexts are derived from an EventSchema, so the generated data follows the base schema
+and any loaded schema extensions. The generator is deterministic for a given seed.
+
+Copyright 2022 Objectiv B.V.
+"""
+import random
+import time
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Any
+
+from objectiv_backend.common.types import EventData, EventList, EventType, ContextType, ContextData
+from objectiv_backend.schema.event_schemas import EventSchema
+
+# Contexts that are added by the collector itself. The tracker never sends these, so neither do we.
+COLLECTOR_CONTEXT_TYPES = {'CookieIdContext'}
+
+
+class GeneratorConfig(NamedTuple):
+    # Relative weight per event type. If empty, all concrete event types are picked with equal weight.
+    event_mix: Dict[EventType, float] = {}
+    # Number of events per batch (i.e. per http request)
+    batch_size: int = 10
+    # Number of global contexts per event. Required global contexts are always added, even if that
+    # exceeds this number.
+    global_context_count: int = 3
+    # Depth of the location stack per event. Required location contexts are always added, even if that
+    # exceeds this number.
+    location_stack_depth: int = 3
+    # Fraction of PathContexts that get utm parameters in the query string, triggering the creation of a
+    # MarketingContext in the collector.
+    utm_fraction: float = 0.1
+    seed: Optional[int] = None
+
+
+class EventGenerator:
+    """
+    Generates tracker batches (EventLists) for a given EventSchema and GeneratorConfig.
+    """
+
+    def __init__(self, event_schema: EventSchema, config: GeneratorConfig):
+        self.event_schema = event_schema
+        self.config = config
+        self._random = random.Random(config.seed)
+
+        all_event_types = event_schema.list_event_types()
+        concrete_event_types = _get_concrete_types(
+            all_event_types, lambda et: event_schema.get_all_parent_event_types(et)
+        )
+        if config.event_mix:
+            unknown = set(config.event_mix.keys()) - set(all_event_types)
+            if unknown:
+                raise ValueError(f'Unknown event types in event mix: {sorted(unknown)}')
+            self._event_types = list(config.event_mix.keys())
+            self._event_weights = [config.event_mix[et] for et in self._event_types]
+        else:
+            self._event_types = concrete_event_types
+            self._event_weights = [1.0] * len(concrete_event_types)
+
+        self._concrete_context_types = [
+            ct for ct in event_schema.list_context_types() if not ct.startswith('Abstract')
+        ]
+        self._global_context_types = [
+            ct for ct in self._concrete_context_types
+            if self._is_global(ct) and ct not in COLLECTOR_CONTEXT_TYPES
+        ]
+        self._location_context_types = [
+            ct for ct in self._concrete_context_types
+            if self._is_location(ct) and ct != 'RootLocationContext'
+        ]
+
+    def _is_global(self, context_type: ContextType) -> bool:
+        return 'AbstractGlobalContext' in self.event_schema.get_all_parent_context_types(context_type)
+
+    def _is_location(self, context_type: ContextType) -> bool:
+        return 'AbstractLocationContext' in self.event_schema.get_all_parent_context_types(context_type)
+
+    def generate_batches(self, count: int) -> List[EventList]:
+        """ Generate a list of `count` batches. """
+        return [self.generate_batch() for _ in range(count)]
+
+    def generate_batch(self) -> EventList:
+        """ Generate a single batch, as the tracker would send it to the collector. """
+        now = round(time.time() * 1000)
+        events = [self.generate_event(now) for _ in range(self.config.batch_size)]
+        return {
+            'events': events,
+            'transport_time': now,
+            'client_session_id': str(uuid.UUID(int=self._random.getrandbits(128), version=4))
+        }
+
+    def generate_event(self, now: int) -> EventData:
+        event_type = self._random.choices(self._event_types, weights=self._event_weights)[0]
+        required_contexts = self._resolve_required_contexts(
+            self.event_schema.get_all_required_contexts_for_event(event_type)
+        )
+
+        location_required = [ct for ct in required_contexts if self._is_location(ct)]
+        global_required = [ct for ct in required_contexts if not self._is_location(ct)]
+
+        # The location stack goes from generic to specific: root first, required contexts last.
+        location_types = ['RootLocationContext']
+        while len(location_types) + len(location_required) < self.config.location_stack_depth:
+            location_types.append(self._random.choice(self._location_context_types))
+        location_types.extend(ct for ct in location_required if ct != 'RootLocationContext')
+
+        global_types = list(global_required)
+        while len(global_types) < self.config.global_context_count:
+            global_types.append(self._random.choice(self._global_context_types))
+
+        # The randomly picked contexts might require other contexts in turn.
+        chosen_types = location_types + global_types
+        extra_required = set()
+        for context_type in chosen_types:
+            extra_required |= self.event_schema.get_all_required_contexts_for_context(context_type)
+        for context_type in self._resolve_required_contexts(extra_required):
+            if context_type in chosen_types:
+                continue
+            if self._is_location(context_type):
+                location_types.insert(1, context_type)
+            else:
+                global_types.append(context_type)
+
+        event: EventData = {
+            '_type': event_type,
+            'id': str(uuid.UUID(int=self._random.getrandbits(128), version=4)),
+            'time': now - self._random.randint(0, 1000),
+            'location_stack': [self._generate_context(ct) for ct in location_types],
+            'global_contexts': [self._generate_context(ct) for ct in global_types],
+        }
+        event_schema = self.event_schema.get_event_schema(event_type) or {}
+        for property_name, property_data in event_schema.get('properties', {}).items():
+            if property_name not in event:
+                event[property_name] = self._generate_value(property_name, property_data)
+        return event
+
+    def _resolve_required_contexts(self, required: set) -> List[ContextType]:
+        """
+        Turn a set of required (possibly abstract) context types into a sorted list of concrete context
+        types, including the contexts that those contexts require in turn.
+        """
+        result: List[ContextType] = []
+        todo = sorted(required)
+        while todo:
+            context_type = todo.pop(0)
+            if context_type not in self._concrete_context_types:
+                children = sorted(
+                    ct for ct in self.event_schema.get_all_child_context_types(context_type)
+                    if ct in self._concrete_context_types and ct not in COLLECTOR_CONTEXT_TYPES
+                )
+                if any(ct in result for ct in children):
+                    continue
+                context_type = self._random.choice(children)
+            if context_type in result:
+                continue
+            result.append(context_type)
+            todo.extend(sorted(self.event_schema.get_all_required_contexts_for_context(context_type)))
+        return result
+
+    def _generate_context(self, context_type: ContextType) -> ContextData:
+        context: ContextData = {'_type': context_type, 'id': self._generate_id(context_type)}
+        context_schema = self.event_schema.get_context_schema(context_type) or {}
+        for property_name, property_data in context_schema.get('properties', {}).items():
+            if property_name not in context:
+                context[property_name] = self._generate_value(property_name, property_data)
+        return context
+
+    def _generate_id(self, context_type: ContextType) -> str:
+        if context_type == 'PathContext':
+            url = f'https://example.com/page-{self._random.randint(0, 100)}'
+            if self._random.random() < self.config.utm_fraction:
+                url += '?utm_source=benchmark&utm_medium=cpc&utm_campaign=campaign'
+            return url
+        return f'{context_type[:-len("Context")].lower()}-{self._random.randint(0, 100)}'
+
+    def _generate_value(self, name: str, property_data: Dict[str, Any]) -> Any:
+        property_type = property_data.get('type')
+        if isinstance(property_type, list):
+            property_type = [pt for pt in property_type if pt != 'null'][0]
+        if property_type == 'integer':
+            return self._random.randint(0, 1000)
+        if property_type == 'array':
+            return []
+        return f'{name}-{self._random.randint(0, 100)}'
+
+
+def _get_concrete_types(all_types: List[str], get_parents) -> List[str]:
+    """ Give the types that are not abstract, and that are not a parent of any other type. """
+    parent_types = set()
+    for type_name in all_types:
+        parent_types |= get_parents(type_name) - {type_name}
+    return [
+        type_name for type_name in all_types
+        if not type_name.startswith('Abstract') and type_name not in parent_types
+    ]
+
+
+def parse_event_mix(event_mix: str) -> Dict[EventType, float]:
+    """
+    Parse an event mix string of the form 'PressEvent=5,VisibleEvent=1' into a dictionary.
+    Event types without a weight get weight 1.
+    """
+    result: Dict[EventType, float] = {}
+    for item in event_mix.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        event_type, _, weight = item.partition('=')
+        result[event_type.strip()] = float(weight) if weight else 1.0
+    return result
@@ -1,7 +1,10 @@
 """
 Tool that connects to the database and creates the needed tables as defined in create_table.sql
 If a duplicate-table error is encounterd, then the script will assume that the databse is already
-initialized correctly and exit successfully.
+initialized correctly.
+In both cases the indexes and storage settings of the queue tables, as defined in queue_tuning.sql, are
+applied afterwards. If QUEUE_BACKEND is set to 'ring', the partition tables for the ring queues are created
+too. Those statements are idempotent.
 
 This assumes that the user and database already exist.
 
@@ -11,24 +14,48 @@ import argparse
 import os
 import sys
 from time import sleep
+from typing import List
 
 import psycopg2
 
-from objectiv_backend.common.config import get_config_postgres
+from objectiv_backend.common.config import get_config_postgres, get_config_queue
 from objectiv_backend.common.db import get_db_connection
+from objectiv_backend.workers.pg_queues import PostgresRingQueues
 
 _MAX_RETRIES = 5
 _POSTGRES_DUPLICATE_TABLE_ERROR = '42P07'
 
 
-def get_sql() -> str:
-    """ get content of ../../create_tables.sql as string """
+def _read_sql_file(name: str) -> str:
     dirname = os.path.dirname(__file__)
-    filename = os.path.join(dirname, '../../create_tables.sql')
+    filename = os.path.join(dirname, '../..', name)
     with open(filename) as f:
         return f.read()
 
 
+def get_sql() -> str:
+    """ get content of ../../create_tables.sql as string """
+    return _read_sql_file('create_tables.sql')
+
+
+def get_queue_tuning_sql() -> str:
+    """ get content of ../../queue_tuning.sql as string """
+    return _read_sql_file('queue_tuning.sql')
+
+
+def get_queue_tuning_statements() -> List[str]:
+    """
+    get the statements of ../../queue_tuning.sql, to be executed one by one. The statements should not be
+    run in a transaction, as `create index concurrently` doesn't support that.
+    """
+    statements = []
+    for statement in get_queue_tuning_sql().split(';'):
+        lines = [line for line in statement.splitlines() if line.strip() and not line.startswith('--')]
+        if lines:
+            statements.append('\n'.join(lines) + ';')
+    return statements
+
+
 def get_connection_with_retries(retry: bool):
     """ Connect to database. If retry set will attempt multiple times"""
     pg_config = get_config_postgres()
@@ -56,9 +83,16 @@ def main():
                         help="Instead of running sql to setup schema, print it to stdout")
     args = parser.parse_args(sys.argv[1:])
     sql = get_sql()
+    queue_tuning_statements = get_queue_tuning_statements()
+    queue_config = get_config_queue()
+    ring_sql = ''
+    if queue_config.backend == 'ring':
+        ring_sql = PostgresRingQueues.get_create_tables_sql(partitions=queue_config.ring_partitions)
 
     if args.print:
         print(sql)
+        print('\n'.join(queue_tuning_statements))
+        print(ring_sql)
         exit(0)
 
     connection = get_connection_with_retries(args.retry)
@@ -67,10 +101,21 @@ def main():
             cursor.execute(sql)
             print('Succesfully initialized database.')
         except psycopg2.Error as error:
-            if error.pgcode == _POSTGRES_DUPLICATE_TABLE_ERROR:
-                print('Got "duplicate table error", assuming database is already initialized')
-                exit(0)
-            raise
+            if error.pgcode != _POSTGRES_DUPLICATE_TABLE_ERROR:
+                raise
+            print('Got "duplicate table error", assuming database is already initialized')
+            connection.rollback()
+
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        for statement in queue_tuning_statements:
+            cursor.execute(statement)
+    connection.autocommit = False
+    if ring_sql:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(ring_sql)
+    print('Succesfully applied queue indexes and settings.')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,47 @@
+"""
+Tool that prints statistics of the event queues in Postgres: depth, age of the oldest event, and the
+number of live and dead tuples of the queue tables.
+
+Copyright 2022 Objectiv B.V.
+"""
+import argparse
+import sys
+import time
+
+from objectiv_backend.common.config import get_config_postgres
+from objectiv_backend.common.db import get_db_connection
+from objectiv_backend.workers.pg_queues import get_pg_queues, ProcessingStage, QueueStats
+
+
+def format_queue_stats(stats: QueueStats) -> str:
+    oldest = f'{stats.oldest_age_seconds:.1f} s' if stats.oldest_age_seconds is not None else '-'
+    return f'{stats.queue.value:<10} depth: {stats.depth:>10}  oldest: {oldest:>12}  ' \
+           f'live tuples: {stats.live_tuples:>10}  dead tuples: {stats.dead_tuples:>10}  ' \
+           f'last autovacuum: {stats.last_autovacuum or "-"}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print statistics of the event queues in Postgres')
+    parser.add_argument('--loop', type=float, metavar='SECONDS',
+                        help='Keep printing the statistics, every SECONDS seconds')
+    args = parser.parse_args(sys.argv[1:])
+
+    pg_config = get_config_postgres()
+    if pg_config is None:
+        raise Exception('Missing Postgres configuration')
+    connection = get_db_connection(pg_config)
+    try:
+        while True:
+            with connection:
+                pg_queues = get_pg_queues(connection=connection)
+                for queue in ProcessingStage:
+                    print(format_queue_stats(pg_queues.get_queue_stats(queue)))
+            if not args.loop:
+                break
+            time.sleep(args.loop)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,16 @@
 Copyright 2021 Objectiv B.V.
 """
 import json
+import time
 import uuid
+from datetime import datetime
 from enum import Enum
-from typing import List, Tuple
+from typing import List, Tuple, NamedTuple, Optional
 
 import psycopg2
 from psycopg2.extras import execute_values
 
+from objectiv_backend.common.config import get_collector_config
 from objectiv_backend.common.types import EventDataList
 
 
@@ -17,6 +20,19 @@ class ProcessingStage(Enum):
     FINALIZE = "finalize"
 
 
+class QueueStats(NamedTuple):
+    queue: ProcessingStage
+    # number of events in the queue
+    depth: int
+    # age in seconds of the oldest event in the queue, based on the time the collector received it.
+    # None if the queue is empty
+    oldest_age_seconds: Optional[float]
+    # statistics of the table, as estimated by postgres (pg_stat_user_tables)
+    live_tuples: int
+    dead_tuples: int
+    last_autovacuum: Optional[datetime]
+
+
 class PostgresQueues:
     """
     Class to interact with the event queues in Postgres.
@@ -66,7 +82,8 @@ class PostgresQueues:
         '''
         with self.connection.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor) as cursor:
             cursor.execute(query, (max_items, ))
-            events_with_id: EventDataList = cursor.fetchall()
+            rows = cursor.fetchall()
+        events_with_id: EventDataList = [row.value for row in rows]
         return events_with_id
 
     def put_events(self,
@@ -89,3 +106,300 @@ class PostgresQueues:
         values: List[Tuple[uuid.UUID, str]] = [(event['id'], json.dumps(event)) for event in events]
         with self.connection.cursor() as cursor:
             execute_values(cursor, insert_query, values, template=None, page_size=100)
+
+    def get_queue_stats(self, queue: ProcessingStage) -> QueueStats:
+        """
+        Get statistics on a queue: its depth, the age of the oldest event, and the number of live and dead
+        tuples in the queue table. A large number of dead tuples indicates that vacuum doesn't keep up.
+
+        :param queue: Queue to get the statistics of
+        """
+        table_name = self._queue_to_table(queue)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'select count(*) from {table_name}')
+            depth = cursor.fetchone()[0]
+            # uses the index on insert_order, so this is cheap even for a large queue
+            cursor.execute(f'''
+                select (value->>'collector_time')::bigint
+                from {table_name}
+                order by insert_order asc
+                limit 1
+            ''')
+            row = cursor.fetchone()
+            cursor.execute('''
+                select n_live_tup, n_dead_tup, last_autovacuum
+                from pg_stat_user_tables
+                where relname = %s
+            ''', (table_name, ))
+            table_stats = cursor.fetchone() or (0, 0, None)
+
+        oldest_age_seconds = None
+        if row is not None and row[0] is not None:
+            oldest_age_seconds = max(0.0, time.time() - row[0] / 1000)
+        return QueueStats(
+            queue=queue,
+            depth=depth,
+            oldest_age_seconds=oldest_age_seconds,
+            live_tuples=table_stats[0],
+            dead_tuples=table_stats[1],
+            last_autovacuum=table_stats[2]
+        )
+
+
+class PostgresRingQueues(PostgresQueues):
+    """
+    Alternative implementation of the event queues in Postgres, in which picked up events are not deleted.
+
+    Each queue is a ring of partition tables, e.g. queue_entry_ring_0 .. queue_entry_ring_3. The table
+    queue_ring_state tracks the state of each partition:
+        * 'write': the single partition that new events are written to
+        * 'sealed': no new events are written to it, events are picked up in insert order. read_position is
+            the insert_order of the last event that has been picked up.
+        * 'empty': all events have been picked up, and the partition has been truncated.
+
+    If get_events() finds no sealed partition, it rotates the ring: the write partition is sealed, and the
+    next partition, if it's empty, becomes the write partition. That call returns no events, the next call
+    will pick up the events of the sealed partition. A consumer locks a sealed partition for the duration of
+    its transaction, so multiple consumers work on different partitions. Once a partition has been read
+    completely, it is truncated instead of having its rows deleted. Truncating doesn't leave dead tuples
+    behind, so the queue tables stay small without depending on vacuum.
+
+    At-least-once semantics are the same as for PostgresQueues: the read position is updated and the
+    partition is truncated in the transaction of the caller. If that transaction is rolled back, the events
+    will be picked up again.
+
+    Like PostgresQueues this does not do any transaction management, and assumes that the postgres
+    connection has the isolation level ISOLATION_LEVEL_READ_COMMITTED set.
+    """
+
+    def __init__(self, connection, partitions: int = 4):
+        """
+        Create a new PostgresRingQueues object
+        :param connection: psycopg2 database connection, must have ISOLATION_LEVEL_READ_COMMITTED set.
+        :param partitions: number of partitions per queue. Must match the tables created with
+            get_create_tables_sql()
+        """
+        super().__init__(connection=connection)
+        self.partitions = partitions
+
+    @classmethod
+    def _partition_table(cls, queue: ProcessingStage, partition: int) -> str:
+        return f'{cls._queue_to_table(queue)}_ring_{int(partition)}'
+
+    @classmethod
+    def get_create_tables_sql(cls, partitions: int) -> str:
+        """
+        Give the sql to create the partition tables and state table for all queues. The statements are
+        idempotent. Increasing the number of partitions of an existing ring is supported, decreasing it is not.
+        """
+        statements = ['''
+            create table if not exists queue_ring_state (
+                queue text not null,
+                partition integer not null,
+                state text not null,
+                read_position bigint not null default 0,
+                sealed_at timestamp,
+                primary key(queue, partition)
+            );
+            grant select on queue_ring_state to obj_collector_role;
+            grant select, update on queue_ring_state to obj_worker_role;
+        ''']
+        for queue in ProcessingStage:
+            table_name = cls._queue_to_table(queue)
+            writer_role = 'obj_collector_role' if queue == ProcessingStage.ENTRY else 'obj_worker_role'
+            statements.append(f'''
+                create sequence if not exists {table_name}_ring_seq;
+                grant usage on sequence {table_name}_ring_seq to {writer_role};
+            ''')
+            for partition in range(partitions):
+                partition_table = cls._partition_table(queue, partition)
+                initial_state = 'write' if partition == 0 else 'empty'
+                statements.append(f'''
+                    create table if not exists {partition_table} (
+                        event_id uuid not null,
+                        insert_order bigint not null default nextval('{table_name}_ring_seq'),
+                        value json not null
+                    );
+                    create index if not exists {partition_table}_insert_order_idx
+                        on {partition_table}(insert_order);
+                    grant insert on {partition_table} to {writer_role};
+                    grant select, truncate on {partition_table} to obj_worker_role;
+                    insert into queue_ring_state(queue, partition, state)
+                    values ('{queue.value}', {partition}, '{initial_state}')
+                    on conflict do nothing;
+                ''')
+        return '\n'.join(statements)
+
+    def _get_write_partition(self, queue: ProcessingStage) -> int:
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "select partition from queue_ring_state where queue = %s and state = 'write'",
+                (queue.value, )
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise Exception(f'No write partition for queue {queue.value}. Has db_init been run?')
+        return row[0]
+
+    def rotate(self, queue: ProcessingStage) -> bool:
+        """
+        Seal the current write partition, and make the next partition the write partition. Only rotates if
+        the write partition contains events and the next partition is empty.
+
+        Producers only see the new write partition after the calling transaction has committed, so the
+        calling transaction should be short.
+        :return: True if the ring was rotated
+        """
+        write_partition = self._get_write_partition(queue)
+        next_partition = (write_partition + 1) % self.partitions
+        with self.connection.cursor() as cursor:
+            # skip locked: if another worker is rotating the same partitions, we don't need to.
+            cursor.execute('''
+                select partition, state
+                from queue_ring_state
+                where queue = %s and partition in (%s, %s)
+                for update skip locked
+            ''', (queue.value, write_partition, next_partition))
+            states = dict(cursor.fetchall())
+            if states.get(write_partition) != 'write' or states.get(next_partition) != 'empty':
+                return False
+            cursor.execute(f'select exists(select from {self._partition_table(queue, write_partition)})')
+            if not cursor.fetchone()[0]:
+                return False
+            cursor.execute('''
+                update queue_ring_state
+                set state = case when partition = %s then 'sealed' else 'write' end,
+                    sealed_at = case when partition = %s then now() at time zone 'utc' else null end
+                where queue = %s and partition in (%s, %s)
+            ''', (write_partition, write_partition, queue.value, write_partition, next_partition))
+        return True
+
+    def get_events(self, queue: ProcessingStage, max_items: int) -> EventDataList:
+        """
+        Get a list of events from a queue for processing.
+
+        Events are picked from the oldest sealed partition that is not locked by another consumer. If there
+        is no such partition, the ring is rotated and an empty list is returned.
+
+        :param queue: Queue from which to pick events
+        :param max_items: maximum number of items to pick from the queue.
+        :return: list of events with id, at most max_items, but can be less.
+        """
+        with self.connection.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor) as cursor:
+            cursor.execute('''
+                select partition, read_position
+                from queue_ring_state
+                where queue = %s and state = 'sealed'
+                order by sealed_at asc
+                limit 1
+                for update skip locked
+            ''', (queue.value, ))
+            sealed = cursor.fetchone()
+            if sealed is None:
+                self.rotate(queue)
+                return []
+
+            partition_table = self._partition_table(queue, sealed.partition)
+            # A producer that read the write partition just before it got sealed might still be inserting
+            # into it. This lock waits for such inserts to finish, and blocks new ones. All later inserts
+            # get a higher insert_order, so they will not be skipped by read_position.
+            cursor.execute(f'lock table {partition_table} in exclusive mode')
+            cursor.execute(f'''
+                select insert_order, value
+                from {partition_table}
+                where insert_order > %s
+                order by insert_order asc
+                limit %s
+            ''', (sealed.read_position, max_items))
+            rows = cursor.fetchall()
+
+            if len(rows) < max_items:
+                # We have read all events in this partition
+                cursor.execute(f'truncate {partition_table}')
+                cursor.execute('''
+                    update queue_ring_state
+                    set state = 'empty', read_position = 0, sealed_at = null
+                    where queue = %s and partition = %s
+                ''', (queue.value, sealed.partition))
+            else:
+                cursor.execute('''
+                    update queue_ring_state
+                    set read_position = %s
+                    where queue = %s and partition = %s
+                ''', (rows[-1].insert_order, queue.value, sealed.partition))
+        events_with_id: EventDataList = [row.value for row in rows]
+        return events_with_id
+
+    def put_events(self,
+                   queue: ProcessingStage,
+                   events: EventDataList):
+        """
+        Put events on a queue, by writing them to the current write partition of the queue.
+
+        :param queue: Which queue to put the event on
+        :param events: list of events with ids
+        """
+        if not events:
+            return
+        partition_table = self._partition_table(queue, self._get_write_partition(queue))
+        insert_query = f'''
+            insert into
+            {partition_table}(event_id, value)
+            values %s
+            '''
+        values: List[Tuple[uuid.UUID, str]] = [(event['id'], json.dumps(event)) for event in events]
+        with self.connection.cursor() as cursor:
+            execute_values(cursor, insert_query, values, template=None, page_size=100)
+
+    def get_queue_stats(self, queue: ProcessingStage) -> QueueStats:
+        """
+        Get statistics on a queue, summed over all its partitions. See PostgresQueues.get_queue_stats()
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'select partition, read_position from queue_ring_state where queue = %s',
+                (queue.value, )
+            )
+            read_positions = cursor.fetchall()
+            depth = 0
+            oldest_collector_time = None
+            for partition, read_position in read_positions:
+                partition_table = self._partition_table(queue, partition)
+                cursor.execute(f'''
+                    select count(*), min((value->>'collector_time')::bigint)
+                    from {partition_table}
+                    where insert_order > %s
+                ''', (read_position, ))
+                count, collector_time = cursor.fetchone()
+                depth += count
+                if collector_time is not None:
+                    oldest_collector_time = min(collector_time, oldest_collector_time or collector_time)
+            cursor.execute('''
+                select coalesce(sum(n_live_tup), 0), coalesce(sum(n_dead_tup), 0), max(last_autovacuum)
+                from pg_stat_user_tables
+                where relname like %s
+            ''', (f'{self._queue_to_table(queue)}\\_ring\\_%', ))
+            live_tuples, dead_tuples, last_autovacuum = cursor.fetchone()
+
+        oldest_age_seconds = None
+        if oldest_collector_time is not None:
+            oldest_age_seconds = max(0.0, time.time() - oldest_collector_time / 1000)
+        return QueueStats(
+            queue=queue,
+            depth=depth,
+            oldest_age_seconds=oldest_age_seconds,
+            live_tuples=int(live_tuples),
+            dead_tuples=int(dead_tuples),
+            last_autovacuum=last_autovacuum
+        )
+
+
+def get_pg_queues(connection) -> PostgresQueues:
+    """
+    Give the queue implementation as configured with QUEUE_BACKEND: PostgresQueues or PostgresRingQueues.
+    :param connection: psycopg2 database connection, must have ISOLATION_LEVEL_READ_COMMITTED set.
+    """
+    queue_config = get_collector_config().queue
+    if queue_config.backend == 'ring':
+        return PostgresRingQueues(connection=connection, partitions=queue_config.ring_partitions)
+    return PostgresQueues(connection=connection)
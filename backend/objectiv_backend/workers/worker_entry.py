@@ -8,7 +8,7 @@ from typing import List, Tuple
 from objectiv_backend.common.config import WORKER_BATCH_SIZE, get_collector_config
 from objectiv_backend.schema.hydrate_events import hydrate_types_into_event
 from objectiv_backend.schema.validate_events import validate_event_adheres_to_schema, validate_event_time, EventError
-from objectiv_backend.workers.pg_queues import PostgresQueues, ProcessingStage
+from objectiv_backend.workers.pg_queues import get_pg_queues, ProcessingStage
 from objectiv_backend.workers.pg_storage import insert_events_into_nok_data
 from objectiv_backend.workers.util import worker_main
 from objectiv_backend.common.types import EventDataList
@@ -20,7 +20,7 @@ def main_entry(connection) -> int:
     :return number of processed events
     """
     with connection:
-        pg_queues = PostgresQueues(connection=connection)
+        pg_queues = get_pg_queues(connection=connection)
         events: EventDataList = pg_queues.get_events(queue=ProcessingStage.ENTRY,
                                                      max_items=WORKER_BATCH_SIZE)
         print(f'event-ids: {sorted(event["id"] for event in events)}')
@@ -0,0 +1,47 @@
+import json
+
+from objectiv_backend.app import create_app
+from objectiv_backend.common.config import get_collector_config, set_collector_config
+from objectiv_backend.schema.validate_events import validate_structure_event_list, validate_event_adheres_to_schema
+from objectiv_backend.tools.benchmark.collector_benchmark import run_stages, use_stub_sink, percentile, STAGES
+from objectiv_backend.tools.benchmark.event_generator import EventGenerator, GeneratorConfig, parse_event_mix
+
+
+def test_generated_events_validate():
+    event_schema = get_collector_config().event_schema
+    for seed in range(5):
+        config = GeneratorConfig(batch_size=20, global_context_count=seed, location_stack_depth=seed, seed=seed)
+        batch = EventGenerator(event_schema, config).generate_batch()
+        assert len(batch['events']) == 20
+        assert validate_structure_event_list(batch) == []
+        for event in batch['events']:
+            assert validate_event_adheres_to_schema(event_schema=event_schema, event=event) == []
+
+
+def test_generator_event_mix():
+    event_schema = get_collector_config().event_schema
+    config = GeneratorConfig(event_mix=parse_event_mix('PressEvent=2, VisibleEvent'), batch_size=50, seed=1)
+    batch = EventGenerator(event_schema, config).generate_batch()
+    assert {event['_type'] for event in batch['events']} == {'PressEvent', 'VisibleEvent'}
+    assert parse_event_mix('PressEvent=2, VisibleEvent') == {'PressEvent': 2.0, 'VisibleEvent': 1.0}
+
+
+def test_run_stages_stub_sink():
+    original_config = get_collector_config()
+    app = create_app()
+    use_stub_sink()
+    try:
+        batches = EventGenerator(original_config.event_schema, GeneratorConfig(seed=1)).generate_batches(3)
+        payloads = [json.dumps(batch).encode() for batch in batches]
+        stats = run_stages(app, payloads, anonymous_mode=False)
+        assert list(stats.keys()) == STAGES
+        assert all(stage_stats.requests == 3 for stage_stats in stats.values())
+    finally:
+        set_collector_config(original_config)
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3
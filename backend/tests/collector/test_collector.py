@@ -5,7 +5,7 @@ import flask
 from objectiv_backend.app import create_app
 
 from objectiv_backend.end_points.collector import add_http_context_to_event, add_marketing_context_to_event, \
-    get_cookie_id_context, anonymize_events, hash_property
+    get_cookie_id_context, anonymize_events, hash_property, AnonymizationPlan, get_hash_method
 from objectiv_backend.end_points.common import get_json_response
 from objectiv_backend.common.event_utils import add_global_context_to_event, get_contexts
 from objectiv_backend.common.config import AnonymousModeConfig
@@ -275,3 +275,55 @@ def test_anonymous_mode_anonymization():
     # check if we have indeed properly hashed the vars
     assert http_context['user_agent'] == '49901a043486b776d3e9e0aa2b6bf1c1'
     assert hash_property(context_vars['user_agent']) == '49901a043486b776d3e9e0aa2b6bf1c1'
+
+
+def _get_event_with_http_context(**context_vars):
+    context = make_context(**{'_type': 'HttpContext', 'id': 'http_context', 'referrer': 'test-referrer',
+                              **context_vars})
+    event = make_event_from_dict(json.loads(CLICK_EVENT_JSON)['events'][0])
+    add_global_context_to_event(event, context)
+    return event
+
+
+def test_anonymization_plan_keyed_hash():
+    to_hash = {'HttpContext': {'remote_address', 'user_agent'}}
+    md5_config = AnonymousModeConfig(to_hash=to_hash)
+    blake_config = AnonymousModeConfig(to_hash=to_hash, hash_algorithm='blake2b', hash_secret='secret')
+    hmac_config = AnonymousModeConfig(to_hash=to_hash, hash_algorithm='hmac-sha256', hash_secret='secret')
+    other_secret_config = blake_config._replace(hash_secret='other-secret')
+
+    hashes = set()
+    for config in md5_config, blake_config, hmac_config, other_secret_config:
+        event = _get_event_with_http_context(remote_address='test-address', user_agent='test-user_agent')
+        AnonymizationPlan(config).anonymize_events([event])
+        http_context = get_contexts(event, 'HttpContext')[0]
+        assert http_context['user_agent'] == get_hash_method(config)('test-user_agent')
+        assert len(http_context['user_agent']) == 32
+        assert http_context['referrer'] == 'test-referrer'
+        hashes.add(http_context['user_agent'])
+    # all algorithms and secrets give different hashes
+    assert len(hashes) == 4
+
+
+def test_anonymization_plan_single_pass():
+    hashed = []
+
+    def hash_method(value):
+        hashed.append(value)
+        return f'hashed-{value}'
+
+    config = AnonymousModeConfig(to_hash={'HttpContext': {'remote_address', 'user_agent'},
+                                          'AbstractGlobalContext': {'user_agent'}})
+    events = [_get_event_with_http_context(user_agent='agent') for _ in range(5)]
+    events.append(_get_event_with_http_context(user_agent='other-agent', remote_address='address'))
+    # the hydrated parent types are taken into account too
+    for event in events:
+        get_contexts(event, 'HttpContext')[0]['_types'] = ['AbstractGlobalContext', 'HttpContext']
+
+    AnonymizationPlan(config, hash_method=hash_method).anonymize_events(events)
+    # each distinct value is hashed once, and each property only once, even if it matches multiple types
+    # make_context() sets a missing optional remote_address to None, that is hashed as 'None'
+    assert sorted(hashed) == ['None', 'address', 'agent', 'other-agent']
+    http_context = get_contexts(events[-1], 'HttpContext')[0]
+    assert http_context['user_agent'] == 'hashed-other-agent'
+    assert http_context['remote_address'] == 'hashed-address'
@@ -0,0 +1,76 @@
+import io
+import json
+
+import pytest
+
+from objectiv_backend.schema import bulk_events
+from objectiv_backend.schema.bulk_events import iter_events, iter_chunks, process_chunk, process_files, \
+    _init_worker
+from tests.schema.test_schema import CLICK_EVENT_JSON
+
+EVENTS = [
+    {'id': f'event-{i}', 'nested': {'list': [1, 2, {'x': 'a,]}'}]}, 'text': 'with\\nnewline'}
+    for i in range(20)
+]
+
+
+@pytest.mark.parametrize('buffer_size', [1, 7, 1024 * 1024])
+def test_iter_events_json_array(monkeypatch, buffer_size):
+    monkeypatch.setattr(bulk_events, '_READ_BUFFER_SIZE', buffer_size)
+    assert list(iter_events(io.StringIO(json.dumps(EVENTS)))) == EVENTS
+    assert list(iter_events(io.StringIO(json.dumps(EVENTS, indent=4)))) == EVENTS
+    assert list(iter_events(io.StringIO('  [ ]  '))) == []
+
+
+@pytest.mark.parametrize('buffer_size', [1, 7, 1024 * 1024])
+def test_iter_events_ndjson(monkeypatch, buffer_size):
+    monkeypatch.setattr(bulk_events, '_READ_BUFFER_SIZE', buffer_size)
+    data = '\n'.join(json.dumps(event) for event in EVENTS)
+    assert list(iter_events(io.StringIO(data))) == EVENTS
+    assert list(iter_events(io.StringIO(data + '\n\n'))) == EVENTS
+    assert list(iter_events(io.StringIO(''))) == []
+
+
+def test_iter_events_invalid():
+    with pytest.raises(ValueError, match='line 2'):
+        list(iter_events(io.StringIO('{"a": 1}\n{"a": \n')))
+    with pytest.raises(ValueError):
+        list(iter_events(io.StringIO('[{"a": 1} {"a": 2}]')))
+    with pytest.raises(ValueError):
+        list(iter_events(io.StringIO('[{"a": 1}, {"a": 2}')))
+
+
+def test_iter_chunks():
+    chunks = list(iter_chunks(iter(range(7)), 3))
+    assert chunks == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_process_chunk():
+    _init_worker(schema_extensions_directory=None)
+    event = json.loads(CLICK_EVENT_JSON)['events'][0]
+    unknown_event = dict(event, _type='UnknownEvent')
+    result = process_chunk([event, unknown_event, {'no': 'type'}], filename='test.json')
+    assert len(result.ok_lines) == 1
+    assert json.loads(result.ok_lines[0])['_types'] == ['AbstractEvent', 'InteractiveEvent', 'PressEvent']
+    errors = [json.loads(line) for line in result.error_lines]
+    assert [error['event_id'] for error in errors] == [event['id'], None]
+    assert errors[0]['errors'] == ['Unknown event: UnknownEvent']
+
+
+def test_process_files(tmp_path):
+    event = json.loads(CLICK_EVENT_JSON)['events'][0]
+    input_path = tmp_path / 'events.ndjson'
+    input_path.write_text('\n'.join([json.dumps(event), json.dumps(dict(event, _type='UnknownEvent'))]))
+    output = io.StringIO()
+    error_report = io.StringIO()
+    event_count, error_count = process_files(
+        filenames=[str(input_path)],
+        output=output,
+        error_report=error_report,
+        schema_extensions_directory=None,
+        workers=1,
+        chunk_size=1
+    )
+    assert (event_count, error_count) == (2, 1)
+    assert len(output.getvalue().splitlines()) == 1
+    assert len(error_report.getvalue().splitlines()) == 1
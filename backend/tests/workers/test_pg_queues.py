@@ -0,0 +1,140 @@
+import time
+from collections import namedtuple
+
+from objectiv_backend.common.config import get_collector_config, set_collector_config, QueueConfig
+from objectiv_backend.tools.db_init.db_init import get_queue_tuning_sql, get_queue_tuning_statements
+from objectiv_backend.workers.pg_queues import PostgresQueues, ProcessingStage, PostgresRingQueues, \
+    get_pg_queues
+
+
+class FakeCursor:
+    """ Cursor that returns the given results for consecutive queries. """
+    def __init__(self, results):
+        self.results = list(results)
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def executed(self, fragment):
+        return [query for query, _ in self.queries if fragment in query]
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, **kwargs):
+        return self._cursor
+
+
+def test_get_queue_stats():
+    collector_time = round((time.time() - 60) * 1000)
+    cursor = FakeCursor([(42,), (collector_time,), (40, 1000, None)])
+    stats = PostgresQueues(connection=FakeConnection(cursor)).get_queue_stats(ProcessingStage.FINALIZE)
+    assert stats.queue == ProcessingStage.FINALIZE
+    assert stats.depth == 42
+    assert 59 < stats.oldest_age_seconds < 70
+    assert (stats.live_tuples, stats.dead_tuples, stats.last_autovacuum) == (40, 1000, None)
+    assert all('queue_finalize' in query or params == ('queue_finalize', ) for query, params in cursor.queries)
+
+
+def test_get_queue_stats_empty_queue():
+    cursor = FakeCursor([(0,), None, None])
+    stats = PostgresQueues(connection=FakeConnection(cursor)).get_queue_stats(ProcessingStage.ENTRY)
+    assert stats.depth == 0
+    assert stats.oldest_age_seconds is None
+    assert (stats.live_tuples, stats.dead_tuples) == (0, 0)
+
+
+def test_queue_tuning_sql():
+    sql = get_queue_tuning_sql()
+    for table in 'queue_entry', 'queue_finalize':
+        for column in 'insert_order', 'event_id':
+            assert f'create index concurrently if not exists {table}_{column}_idx on {table}({column});' in sql
+        assert f'alter table {table} set (' in sql
+
+
+def test_queue_tuning_statements():
+    statements = get_queue_tuning_statements()
+    assert len(statements) == 6
+    assert all(statement.startswith(('create index concurrently', 'alter table')) for statement in statements)
+    assert all(statement.count(';') == 1 for statement in statements)
+
+
+Sealed = namedtuple('Sealed', ['partition', 'read_position'])
+Row = namedtuple('Row', ['insert_order', 'value'])
+
+
+def test_ring_get_events_rotates_if_nothing_sealed():
+    cursor = FakeCursor([
+        None,  # no sealed partition
+        (2, ),  # write partition
+        [(2, 'write'), (3, 'empty')],  # locked states
+        (True, ),  # write partition contains events
+    ])
+    queues = PostgresRingQueues(connection=FakeConnection(cursor), partitions=4)
+    assert queues.get_events(ProcessingStage.ENTRY, max_items=10) == []
+    update = cursor.executed('update queue_ring_state')
+    assert len(update) == 1
+    assert cursor.queries[-1][1] == (2, 2, 'entry', 2, 3)
+
+
+def test_ring_no_rotation_if_next_partition_not_empty():
+    cursor = FakeCursor([None, (3, ), [(3, 'write'), (0, 'sealed')]])
+    queues = PostgresRingQueues(connection=FakeConnection(cursor), partitions=4)
+    assert queues.get_events(ProcessingStage.ENTRY, max_items=10) == []
+    assert cursor.executed('update queue_ring_state') == []
+
+
+def test_ring_get_events_truncates_read_partition():
+    cursor = FakeCursor([Sealed(1, 5), [Row(6, {'id': 'a'}), Row(8, {'id': 'b'})]])
+    queues = PostgresRingQueues(connection=FakeConnection(cursor), partitions=4)
+    events = queues.get_events(ProcessingStage.FINALIZE, max_items=10)
+    assert events == [{'id': 'a'}, {'id': 'b'}]
+    assert cursor.executed('lock table queue_finalize_ring_1 in exclusive mode')
+    assert cursor.executed('truncate queue_finalize_ring_1')
+    assert "state = 'empty'" in cursor.executed('update queue_ring_state')[0]
+
+
+def test_ring_get_events_advances_read_position():
+    cursor = FakeCursor([Sealed(0, 5), [Row(6, {'id': 'a'}), Row(8, {'id': 'b'})]])
+    queues = PostgresRingQueues(connection=FakeConnection(cursor), partitions=4)
+    events = queues.get_events(ProcessingStage.ENTRY, max_items=2)
+    assert events == [{'id': 'a'}, {'id': 'b'}]
+    assert cursor.executed('truncate') == []
+    assert cursor.queries[-1][1] == (8, 'entry', 0)
+
+
+def test_ring_create_tables_sql():
+    sql = PostgresRingQueues.get_create_tables_sql(partitions=3)
+    for table in 'queue_entry', 'queue_finalize':
+        for partition in range(3):
+            assert f'create table if not exists {table}_ring_{partition} (' in sql
+        assert f'create table if not exists {table}_ring_3 (' not in sql
+    assert "values ('entry', 0, 'write')" in sql
+    assert "values ('finalize', 2, 'empty')" in sql
+
+
+def test_get_pg_queues():
+    original_config = get_collector_config()
+    try:
+        assert type(get_pg_queues(connection=None)) == PostgresQueues
+        set_collector_config(original_config._replace(queue=QueueConfig(backend='ring', ring_partitions=6)))
+        queues = get_pg_queues(connection=None)
+        assert isinstance(queues, PostgresRingQueues)
+        assert queues.partitions == 6
+    finally:
+        set_collector_config(original_config)
@@ -30,13 +30,14 @@ class Aggregate:
                              data: bach.DataFrame,
                              groupby: Union[List[Union[str, Series]], str, Series],
                              column: str,
-                             name: str):
+                             name: str,
+                             approx: bool = False):
 
         data = check_groupby(data=data,
                              groupby=groupby,
                              not_allowed_in_groupby=column)
 
-        series = data[column].nunique()
+        series = data[column].nunique(approx=approx)
         return series.copy_override(name=name)
 
     @use_only_required_objectiv_series(
@@ -44,7 +45,8 @@ class Aggregate:
     )
     def unique_users(self,
                      data: bach.DataFrame,
-                     groupby: GroupByType = not_set) -> bach.SeriesInt64:
+                     groupby: GroupByType = not_set,
+                     approx: bool = False) -> bach.SeriesInt64:
         """
         Calculate the unique users in the Objectiv ``data``.
 
@@ -53,6 +55,8 @@ class Aggregate:
 
             - if not_set it defaults to using :py:attr:`ModelHub.time_agg`.
             - if None it aggregates over all data.
+        :param approx: if True, the number of unique users is approximated, which is faster on large
+            datasets. See :py:meth:`bach.Series.nunique`.
         :returns: series with results.
         """
 
@@ -61,14 +65,16 @@ class Aggregate:
         return self._generic_aggregation(data=data,
                                          groupby=groupby,
                                          column='user_id',
-                                         name='unique_users')
+                                         name='unique_users',
+                                         approx=approx)
 
     @use_only_required_objectiv_series(
         required_series=['session_id', 'moment'], include_series_from_params=['groupby'],
     )
     def unique_sessions(self,
                         data: bach.DataFrame,
-                        groupby: GroupByType = not_set) -> bach.SeriesInt64:
+                        groupby: GroupByType = not_set,
+                        approx: bool = False) -> bach.SeriesInt64:
         """
         Calculate the unique sessions in the Objectiv ``data``.
 
@@ -77,6 +83,8 @@ class Aggregate:
 
             - if not_set it defaults to using :py:attr:`ModelHub.time_agg`.
             - if None it aggregates over all data.
+        :param approx: if True, the number of unique sessions is approximated, which is faster on large
+            datasets. See :py:meth:`bach.Series.nunique`.
         :returns: series with results.
         """
 
@@ -85,7 +93,8 @@ class Aggregate:
         return self._generic_aggregation(data=data,
                                          groupby=groupby,
                                          column='session_id',
-                                         name='unique_sessions')
+                                         name='unique_sessions',
+                                         approx=approx)
 
     @use_only_required_objectiv_series(
         required_series=['session_id', 'moment'], include_series_from_params=['groupby']
@@ -0,0 +1,109 @@
+"""
+Copyright 2022 Objectiv B.V.
+
+Benchmark of removing unused columns from the generated sql (see bach.optimizations), on the sessionized
+data pipeline. The pipeline is run on a wide frame, after which only a few columns are selected. For both
+the unoptimized and optimized graph the size of the sql and the time to generate it are reported.
+
+If --db-url is given, the pipeline runs on the objectiv data in that database and the query time of both
+queries is reported too. Otherwise the pipeline runs on a fake DataFrame and no database is needed.
+
+Usage (from the modelhub directory):
+    PYTHONPATH=.:../bach python -m tests_modelhub.benchmark.benchmark_column_pruning --extra-columns 50
+    PYTHONPATH=.:../bach python -m tests_modelhub.benchmark.benchmark_column_pruning \
+        --db-url postgresql://objectiv:@localhost:5432/objectiv
+"""
+import argparse
+import sys
+import time
+from typing import List, Optional
+
+import bach
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.engine import Dialect
+
+from bach.optimizations import prune_unused_columns
+from bach.sql_model import BachSqlModel
+from modelhub import SessionizedDataPipeline
+from modelhub.pipelines.util import get_objectiv_data
+from modelhub.util import get_supported_dtypes_per_objectiv_column
+from sql_models.model import Materialization
+from sql_models.sql_generator import to_sql
+from tests.unit.bach.util import get_fake_df
+
+SELECTED_COLUMNS = ['user_id', 'session_id', 'moment']
+
+
+def build_fake_df(dialect: Dialect) -> bach.DataFrame:
+    """ Fake DataFrame with the columns of the result of the extracted contexts pipeline. """
+    dtypes = get_supported_dtypes_per_objectiv_column(with_identity_resolution=False)
+    data_names = ['event_id', 'day', 'moment', 'user_id', 'location_stack', 'event_type', 'stack_event_types']
+    return get_fake_df(dialect=dialect, index_names=[], data_names=data_names, dtype=dtypes)
+
+
+def build_sessionized_df(df: bach.DataFrame, extra_columns: int) -> bach.DataFrame:
+    """
+    Add extra columns with json extractions, as modelhub does for global contexts, and run the sessionized
+    data pipeline. All columns are carried through all nodes of the pipeline.
+    """
+    df = df.copy()
+    for i in range(extra_columns):
+        df[f'location_{i}'] = df.location_stack.json[i]
+    df = df.materialize(node_name='extra_columns')
+    return SessionizedDataPipeline(session_gap_seconds=1800)(extracted_contexts_df=df)
+
+
+def get_model(df: bach.DataFrame) -> BachSqlModel:
+    """ Model for the query of df[SELECTED_COLUMNS], as DataFrame.view_sql() creates it. """
+    model = df[SELECTED_COLUMNS].get_current_node('view_sql', construct_multi_levels=True)
+    return model.copy_set_materialization(Materialization.QUERY)
+
+
+def time_query(engine, sql: str, repeat: int) -> float:
+    durations: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with engine.connect() as conn:
+            conn.execute(bach.utils.escape_parameter_characters(conn, sql)).fetchall()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def run(extra_columns: int, repeat: int, db_url: Optional[str], table_name: str):
+    if db_url:
+        engine = create_engine(db_url)
+        dialect = engine.dialect
+        df = get_objectiv_data(engine=engine, table_name=table_name, set_index=False,
+                               with_sessionized_data=False)
+    else:
+        dialect = PGDialect()
+        df = build_fake_df(dialect)
+    df = build_sessionized_df(df, extra_columns)
+    model = get_model(df)
+    pruned_model = prune_unused_columns(dialect, model)
+
+    print(f'sessionized data: {len(df.all_series)} columns, selecting {SELECTED_COLUMNS}')
+    print(f'{"":<12} {"sql chars":>12} {"generate ms":>12} {"query ms":>12}')
+    for name, query_model in ('unpruned', model), ('pruned', pruned_model):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            sql = to_sql(dialect=dialect, model=query_model)
+        generate_ms = (time.perf_counter() - start) / repeat * 1000
+        query_ms = f'{time_query(df.engine, sql, repeat) * 1000:>12.1f}' if db_url else f'{"-":>12}'
+        print(f'{name:<12} {len(sql):>12} {generate_ms:>12.1f} {query_ms}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark removing unused columns from generated sql')
+    parser.add_argument('--extra-columns', type=int, default=50,
+                        help='Number of extra json-extracted columns to add to the sessionized data')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--db-url', type=str, help='Run the queries against this database')
+    parser.add_argument('--table-name', type=str, default='data', help='Table with objectiv data')
+    args = parser.parse_args(sys.argv[1:])
+    run(extra_columns=args.extra_columns, repeat=args.repeat, db_url=args.db_url, table_name=args.table_name)
+
+
+if __name__ == '__main__':
+    main()